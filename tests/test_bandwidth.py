@@ -0,0 +1,143 @@
+import socket
+import threading
+import time
+from unittest.mock import MagicMock
+import pytest
+from tk3u8.session.bandwidth import MIN_ALLOCATION_BPS, BandwidthLimiter, HostCoordinatorClient, TokenBucket, allocate_bandwidth
+
+
+def get_free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_clock():
+    clock = MagicMock()
+    clock.monotonic.return_value = 100.0
+    return clock
+
+
+def test_allocate_bandwidth_unlimited():
+    assert allocate_bandwidth(None, {"a": 100, "b": 0}) == {"a": None, "b": None}
+
+
+def test_allocate_bandwidth_minimums_then_even_split():
+    assert allocate_bandwidth(10_000, {"a": 4_000, "b": 0, "c": 0}) == {"a": 6_000, "b": 2_000, "c": 2_000}
+
+
+def test_allocate_bandwidth_splits_the_rest_by_weight():
+    assert allocate_bandwidth(10_000, {"a": 2_000, "b": 0, "c": 0}, {"a": 2, "c": 1}) == {"a": 6_000, "b": 2_000, "c": 2_000}
+
+
+def test_allocate_bandwidth_scales_minimums_when_oversubscribed():
+    assert allocate_bandwidth(6_000, {"a": 6_000, "b": 3_000}) == {"a": 4_000, "b": 2_000}
+
+
+def test_allocate_bandwidth_throttles_recordings_without_minimum_when_oversubscribed():
+    allocations = allocate_bandwidth(1_000, {"a": 1_000, "b": 0})
+    assert allocations == {"a": 992, "b": MIN_ALLOCATION_BPS}
+
+    clock = make_clock()
+    bucket = TokenBucket(allocations["b"], clock=clock)
+
+    bucket.consume(1_000_000)
+    assert clock.sleep.call_args[0][0] > 900_000
+
+
+def test_allocate_bandwidth_weighs_minimums_when_oversubscribed():
+    assert allocate_bandwidth(6_000, {"a": 3_000, "b": 3_000}, {"a": 2}) == {"a": 4_000, "b": 2_000}
+
+
+def test_allocate_bandwidth_never_allocates_zero():
+    assert allocate_bandwidth(0, {"a": 0, "b": 0}) == {"a": MIN_ALLOCATION_BPS, "b": MIN_ALLOCATION_BPS}
+
+
+def test_token_bucket_waits_for_deficit():
+    clock = make_clock()
+    bucket = TokenBucket(rate_bps=8_000, clock=clock)  # 1000 bytes per second
+
+    bucket.consume(1_000)
+    clock.sleep.assert_not_called()
+
+    bucket.consume(500)
+    assert clock.sleep.call_args[0][0] == pytest.approx(0.5)
+
+    # The deficit is refilled on the clock
+    clock.monotonic.return_value = 101.5
+    bucket.consume(1_000)
+    assert clock.sleep.call_count == 1
+
+
+def test_token_bucket_unlimited_never_waits():
+    clock = make_clock()
+    bucket = TokenBucket(clock=clock)
+
+    bucket.consume(10_000_000)
+    clock.sleep.assert_not_called()
+
+
+def test_limiter_rebalances_on_register_and_unregister():
+    limiter = BandwidthLimiter()
+    limiter.set_total(9_000)
+
+    bucket_a = limiter.register("a", min_bps=3_000)
+    assert bucket_a.get_rate() == 9_000
+
+    bucket_b = limiter.register("b")
+    assert bucket_a.get_rate() == 6_000
+    assert bucket_b.get_rate() == 3_000
+
+    limiter.unregister("b")
+    assert limiter.get_allocations() == {"a": 9_000}
+
+
+def test_limiter_without_a_cap_is_unlimited_again():
+    limiter = BandwidthLimiter()
+    limiter.set_total(9_000)
+    bucket = limiter.register("a")
+
+    limiter.set_total(None)
+    assert bucket.get_rate() is None
+
+
+def test_slow_coordinator_does_not_hold_up_the_buckets():
+    limiter = BandwidthLimiter()
+    bucket = limiter.register("a")
+    synced = threading.Event()
+    release = threading.Event()
+
+    class SlowClient:
+        def sync(self, total_bps, recordings, weights=None):
+            synced.set()
+            release.wait(5)
+            return {recording_id: 8_000 for recording_id in recordings}
+
+    limiter._client = SlowClient()
+    registering = threading.Thread(target=limiter.register, args=("b",))
+    registering.start()
+    assert synced.wait(5)
+
+    # The limiter is still usable while the coordinator is being reached
+    started_at = time.monotonic()
+    bucket.consume(1_000)
+    assert limiter.get_allocations() == {"a": None, "b": None}
+    assert time.monotonic() - started_at < 1
+
+    release.set()
+    registering.join()
+    assert limiter.get_allocations() == {"a": 8_000, "b": 8_000}
+
+
+def test_host_coordinator_shares_budget_between_processes():
+    port = get_free_port()
+    first = HostCoordinatorClient(port)
+    second = HostCoordinatorClient(port)
+
+    try:
+        assert first.sync(8_000, {"a": 0}) == {"a": 8_000}
+        assert second.sync(None, {"b": 0, "c": 0}) == {"b": 2_666, "c": 2_666}
+        assert first.sync(None, {"a": 0}) == {"a": 2_666}
+    finally:
+        first.close()
+        second.close()
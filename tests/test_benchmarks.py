@@ -0,0 +1,120 @@
+import os
+import pytest
+from tk3u8.constants import LiveStatus
+from tk3u8.core.extractor import APIExtractor, WebpageExtractor
+from tk3u8.core.helper import get_link_expiry, is_user_exists
+from tk3u8.testing.benchmarks import (
+    DEFAULT_BASELINE_PATH,
+    BenchmarkResult,
+    PayloadRequestHandler,
+    build_corpus,
+    compare_results,
+    get_cases,
+    load_baseline,
+    load_corpus,
+    main,
+    run_benchmark,
+    save_corpus
+)
+from tk3u8.testing.payloads import build_api_payload, build_webpage_payload
+
+
+@pytest.mark.parametrize("extractor_class,build_payload", [
+    (APIExtractor, build_api_payload),
+    (WebpageExtractor, build_webpage_payload)
+])
+def test_payloads_are_parsed_by_extractors(extractor_class, build_payload):
+    payload = build_payload("testuser", LiveStatus.LIVE, start_time=1700000000, expire=1700600000)
+    extractor = extractor_class("testuser", PayloadRequestHandler(payload))
+    source_data = extractor.get_source_data()
+
+    assert is_user_exists(extractor_class, source_data)
+    assert extractor.get_live_status(source_data) == LiveStatus.LIVE
+    assert extractor.get_start_time(source_data) == 1700000000
+
+    stream_links = extractor.get_stream_links(extractor.get_stream_data(source_data))
+    assert set(stream_links) == {"original", "uhd_60", "uhd", "hd_60", "hd", "ld", "sd"}
+    assert get_link_expiry(stream_links["original"]["h265"]) == 1700600000
+
+
+@pytest.mark.parametrize("extractor_class,build_payload,get_live_room", [
+    (APIExtractor, build_api_payload, lambda source_data: source_data["data"]["liveRoom"]),
+    (WebpageExtractor, build_webpage_payload, lambda source_data: source_data["LiveRoom"]["liveRoomUserInfo"]["liveRoom"])
+])
+def test_rooms_without_h265_only_have_h264_links(extractor_class, build_payload, get_live_room):
+    extractor = extractor_class("testuser", PayloadRequestHandler(build_payload("testuser", LiveStatus.LIVE)))
+    source_data = extractor.get_source_data()
+    del get_live_room(source_data)["hevcStreamData"]
+
+    stream_links = extractor.get_stream_links(extractor.get_stream_data(source_data))
+    assert stream_links["original"].keys() == {"h264"}
+    assert stream_links["original"]["h264"]
+
+
+@pytest.mark.parametrize("extractor_class,build_payload", [
+    (APIExtractor, build_api_payload),
+    (WebpageExtractor, build_webpage_payload)
+])
+def test_payloads_of_offline_and_nonexistent_users(extractor_class, build_payload):
+    offline_extractor = extractor_class("testuser", PayloadRequestHandler(build_payload("testuser", LiveStatus.OFFLINE)))
+    source_data = offline_extractor.get_source_data()
+    assert offline_extractor.get_live_status(source_data) == LiveStatus.OFFLINE
+
+    not_found_extractor = extractor_class("testuser", PayloadRequestHandler(build_payload("testuser", exists=False)))
+    assert not is_user_exists(extractor_class, not_found_extractor.get_source_data())
+
+
+def test_corpus_has_realistic_sizes_and_round_trips(tmp_path):
+    corpus = build_corpus()
+    assert len(corpus["api-live"]) > 20_000
+    assert len(corpus["webpage-live"]) > 250_000
+
+    save_corpus(corpus, str(tmp_path))
+    assert load_corpus(str(tmp_path)) == corpus
+
+
+def test_cases_only_extract_stream_data_of_live_users():
+    cases = get_cases(build_corpus())
+
+    assert "get_stream_links[api-live]" in cases
+    assert "get_stream_data[webpage-live]" in cases
+    assert "get_stream_data[api-offline]" not in cases
+    assert "is_user_exists[webpage-not_found]" in cases
+
+
+def test_run_benchmark_measures_time_and_allocations():
+    result = run_benchmark("allocate", lambda: bytearray(100_000), repeat=1)
+
+    assert result.ops_per_second > 0
+    assert result.seconds_per_op == pytest.approx(1 / result.ops_per_second)
+    assert result.peak_bytes_per_op >= 100_000
+
+
+def test_compare_results_reports_regressions_beyond_tolerance():
+    baseline = {
+        "fast": BenchmarkResult("fast", 1000, 0.001, 1000),
+        "lean": BenchmarkResult("lean", 1000, 0.001, 1000)
+    }
+    results = [
+        BenchmarkResult("fast", 500, 0.002, 1000),
+        BenchmarkResult("lean", 1000, 0.001, 1100),
+        BenchmarkResult("new", 1, 1.0, 10 ** 9)
+    ]
+
+    regressions = compare_results(results, baseline, tolerance=0.25)
+
+    assert len(regressions) == 1
+    assert regressions[0].startswith("fast:")
+
+
+def test_baseline_covers_every_benchmark():
+    baseline = load_baseline(os.path.join(os.path.dirname(__file__), "..", DEFAULT_BASELINE_PATH))
+
+    assert set(baseline) == set(get_cases(build_corpus()))
+
+
+def test_missing_baseline_fails_only_in_ci(tmp_path):
+    args = ["--filter", "is_user_exists[api-live]", "--repeat", "1", "--baseline", str(tmp_path / "missing.json")]
+
+    assert main(args) == 0
+    assert main(args + ["--ci"]) == 2
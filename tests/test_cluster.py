@@ -0,0 +1,181 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+import pytest
+from tk3u8.constants import LiveStatus
+from tk3u8.core.cluster import HashRing, SQLiteCoordinator
+from tk3u8.core.daemon import Daemon, load_watchlist
+from tk3u8.core.scheduler import Clock
+from tk3u8.testing.fake_server import FakeTikTokServer
+
+
+USERNAMES = [f"user{index}" for index in range(8)]
+
+
+class ManualClock(Clock):
+    def __init__(self):
+        self.now = 1700000000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def server():
+    server = FakeTikTokServer()
+    server.start()
+
+    for username in USERNAMES:
+        server.add_user(username, [(0, LiveStatus.OFFLINE)])
+
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def config_file(server, tmp_path):
+    config_file = tmp_path / "config.toml"
+    watchlist = "".join(f"[watchlist.{username}]\n" for username in USERNAMES)
+    config_file.write_text(f'[config]\nbase_url = "{server.base_url}"\ntimeout = 1\n\n{watchlist}')
+    return config_file
+
+
+def wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.1)
+
+
+def test_ring_only_moves_the_keys_of_the_changed_node():
+    keys = [f"user{index}" for index in range(1000)]
+    ring = HashRing(["a", "b", "c"])
+    before = {key: ring.get_node(key) for key in keys}
+
+    assert set(before.values()) == {"a", "b", "c"}
+    assert all(HashRing(["c", "b", "a"]).get_node(key) == node for key, node in before.items())
+
+    after = {key: HashRing(["a", "b", "c", "d"]).get_node(key) for key in keys}
+    moved = [key for key in keys if before[key] != after[key]]
+
+    assert all(after[key] == "d" for key in moved)
+    assert 100 < len(moved) < 400
+    assert HashRing().get_node("user") is None
+
+
+def test_leases_expire_unless_renewed(tmp_path):
+    clock = ManualClock()
+    coordinator = SQLiteCoordinator(str(tmp_path / "cluster.db"), lease_ttl=10, clock=clock)
+    other = SQLiteCoordinator(str(tmp_path / "cluster.db"), lease_ttl=10, clock=clock)
+
+    coordinator.heartbeat("a")
+    other.heartbeat("b")
+    assert coordinator.get_nodes() == ["a", "b"]
+
+    assert coordinator.acquire("alice", "a")
+    assert not other.acquire("alice", "b")
+
+    clock.now += 8
+    assert coordinator.acquire("alice", "a")
+    other.heartbeat("b")
+
+    clock.now += 8
+    assert not other.acquire("alice", "b")
+    assert other.get_nodes() == ["b"]
+
+    clock.now += 8
+    assert other.acquire("alice", "b")
+    assert coordinator.get_owners() == {"alice": "b"}
+
+    coordinator.release("alice", "a")
+    assert other.get_owners() == {"alice": "b"}
+
+    other.leave("b")
+    assert coordinator.get_owners() == {}
+    assert coordinator.get_nodes() == []
+
+
+def test_daemons_split_the_watchlist_and_rebalance(config_file, tmp_path):
+    def make_daemon(node_id):
+        coordinator = SQLiteCoordinator(str(tmp_path / "cluster.db"))
+        return Daemon(str(tmp_path), str(config_file), str(tmp_path), coordinator=coordinator, node_id=node_id)
+
+    first = make_daemon("a")
+    second = make_daemon("b")
+    ring = HashRing(["a", "b"])
+    first_users = {username for username in USERNAMES if ring.get_node(username) == "a"}
+    second_users = set(USERNAMES) - first_users
+
+    try:
+        first._apply_watchlist(load_watchlist(str(config_file)))
+        assert set(first.get_watchlist()) == set(USERNAMES)
+
+        # The new node only takes over its users once the old one stopped
+        # watching them and released their leases
+        second._apply_watchlist(load_watchlist(str(config_file)))
+        assert second.get_watchlist() == {}
+
+        first.sync()
+        wait_for(lambda: first._supervise() or all(first.get_handle(username) is None for username in second_users))
+        first.sync()
+        second.sync()
+
+        assert set(first.get_watchlist()) == first_users
+        assert set(second.get_watchlist()) == second_users
+        assert SQLiteCoordinator(str(tmp_path / "cluster.db")).get_owners() == {
+            **{username: "a" for username in first_users},
+            **{username: "b" for username in second_users}
+        }
+
+        second._stop_watchers()
+        second._leave_cluster()
+        first.sync()
+
+        assert set(first.get_watchlist()) == set(USERNAMES)
+    finally:
+        first._stop_watchers()
+        second._stop_watchers()
+
+
+def start_node(node_id, config_file, tmp_path):
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "tk3u8.cli", "daemon",
+            "--config-file", str(config_file),
+            "--download-dir", str(tmp_path),
+            "--cluster", str(tmp_path / "cluster.db"),
+            "--node-id", node_id,
+            "--lease-ttl", "3",
+            "--reload-interval", "0.5",
+            "--headless"
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        env={**os.environ, "XDG_DATA_HOME": str(tmp_path)}
+    )
+
+
+def test_nodes_take_over_the_users_of_a_node_that_died(config_file, tmp_path):
+    nodes = [start_node(node_id, config_file, tmp_path) for node_id in ("a", "b")]
+    coordinator = SQLiteCoordinator(str(tmp_path / "cluster.db"))
+
+    def owners_are(expected_nodes):
+        owners = coordinator.get_owners()
+        return set(owners) == set(USERNAMES) and set(owners.values()) == expected_nodes
+
+    try:
+        wait_for(lambda: owners_are({"a", "b"}))
+
+        nodes[0].kill()
+        nodes[0].wait()
+        wait_for(lambda: owners_are({"b"}))
+
+        nodes[1].send_signal(signal.SIGINT)
+        assert nodes[1].wait(30) == 0
+        assert coordinator.get_owners() == {}
+    finally:
+        for node in nodes:
+            node.kill()
+            node.wait()
@@ -0,0 +1,208 @@
+import time
+from unittest.mock import MagicMock
+import pytest
+from tk3u8.constants import DownloadStatus, LiveStatus
+from tk3u8.core import daemon as daemon_module
+from tk3u8.core.daemon import Daemon, WatchEntry, load_watchlist
+from tk3u8.core.handle import DownloadStats
+from tk3u8.exceptions import ConfigFileError, UserNotFoundError, WorkerError
+from tk3u8.testing.clock import AcceleratedClock
+from tk3u8.testing.fake_server import FakeTikTokServer
+
+
+@pytest.fixture
+def clock():
+    return AcceleratedClock(20)
+
+
+@pytest.fixture
+def server(clock):
+    server = FakeTikTokServer(clock=clock, bitrate_scale=0.01)
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def config_file(server, tmp_path):
+    config_file = tmp_path / "config.toml"
+    write_config(config_file, server, "")
+    return config_file
+
+
+@pytest.fixture
+def daemon(config_file, clock, tmp_path):
+    daemon = Daemon(program_data_dir=str(tmp_path), config_file_path=str(config_file), downloads_dir=str(tmp_path), clock=clock, engine="native")
+    yield daemon
+    daemon._stop_watchers()
+
+
+def write_config(config_file, server, watchlist):
+    config_file.write_text(f'[config]\nbase_url = "{server.base_url}"\ntimeout = 1\n\n{watchlist}')
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+def test_load_watchlist(server, config_file):
+    write_config(config_file, server, '[watchlist.foo]\n\n[watchlist.bar]\nquality = "hd"\ncodec_policy = "h265_only"\npriority = 2\n')
+
+    assert load_watchlist(str(config_file)) == {
+        "foo": WatchEntry("foo"),
+        "bar": WatchEntry("bar", quality="hd", codec_policy="h265_only", priority=2)
+    }
+
+
+@pytest.mark.parametrize("watchlist", [
+    '[watchlist.foo]\nquality = "best"\n',
+    '[watchlist.foo]\nspeed = 2\n',
+    '[watchlist.foo]\npriority = 0\n',
+    '[watchlist."Not Valid"]\n'
+])
+def test_load_watchlist_rejects_invalid_entries(server, config_file, watchlist):
+    write_config(config_file, server, watchlist)
+
+    with pytest.raises(ConfigFileError):
+        load_watchlist(str(config_file))
+
+
+def test_reload_applies_only_the_diff(server, config_file, daemon):
+    server.add_user("alice", [(0, LiveStatus.OFFLINE)])
+    server.add_user("bob", [(0, LiveStatus.OFFLINE)])
+    server.add_user("carol", [(0, LiveStatus.OFFLINE)])
+
+    write_config(config_file, server, '[watchlist.alice]\n\n[watchlist.bob]\n')
+    assert daemon.reload()
+    alice = daemon.get_handle("alice")
+    bob = daemon.get_handle("bob")
+
+    # Unchanged files are not applied again
+    assert not daemon.reload()
+
+    write_config(config_file, server, '[watchlist.alice]\n\n[watchlist.carol]\nquality = "sd"\n')
+    assert daemon.reload()
+
+    assert bob.wait(5)
+    assert bob.get_status() == DownloadStatus.CANCELLED
+    assert daemon.get_handle("alice") is alice
+    assert not alice.done()
+
+    daemon._supervise()
+    assert daemon.get_watchlist() == {"alice": WatchEntry("alice"), "carol": WatchEntry("carol", quality="sd")}
+
+    # An invalid watchlist is skipped
+    write_config(config_file, server, '[watchlist.alice]\nquality = "best"\n')
+    assert not daemon.reload()
+    assert daemon.get_handle("alice") is alice
+
+
+def test_changes_wait_for_the_recording_to_finish(server, clock, config_file, daemon):
+    server.add_user("alice", [(0, LiveStatus.LIVE), (20, LiveStatus.OFFLINE)], added_at=clock.time())
+
+    daemon.apply({"alice": WatchEntry("alice", quality="sd")})
+    recording = daemon.get_handle("alice")
+    wait_for(lambda: recording.get_stats().segments_written > 0)
+
+    daemon.apply({"alice": WatchEntry("alice", quality="ld")})
+    assert daemon.get_watchlist() == {"alice": WatchEntry("alice", quality="sd")}
+
+    assert recording.wait(10)
+    assert recording.get_status() == DownloadStatus.FINISHED
+
+    daemon._supervise()
+
+    assert daemon.get_handle("alice") is not recording
+    assert daemon.get_watchlist() == {"alice": WatchEntry("alice", quality="ld")}
+
+
+def make_failing_tk3u8(monkeypatch, error):
+    """Replaces the instances the daemon makes with ones whose downloads
+    fail right away with the given error, and returns them."""
+    instances = []
+
+    def make_tk3u8(**kwargs):
+        handle = MagicMock()
+        handle.done.return_value = True
+        handle.get_status.return_value = DownloadStatus.FAILED
+        handle.get_error.return_value = error
+        handle.get_stats.return_value = DownloadStats()
+
+        tk3u8 = MagicMock()
+        tk3u8.start_download.return_value = handle
+        instances.append(tk3u8)
+        return tk3u8
+
+    monkeypatch.setattr(daemon_module, "Tk3u8", make_tk3u8)
+    return instances
+
+
+class SteppedClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def wait(self, event, seconds):
+        return event.is_set()
+
+
+@pytest.fixture
+def stepped_daemon(config_file, tmp_path):
+    clock = SteppedClock()
+    daemon = Daemon(program_data_dir=str(tmp_path), config_file_path=str(config_file), downloads_dir=str(tmp_path), clock=clock, engine="native")
+    yield daemon, clock
+    daemon._stop_watchers()
+
+
+def test_restarts_back_off_and_close_the_old_instance(monkeypatch, stepped_daemon):
+    daemon, clock = stepped_daemon
+    instances = make_failing_tk3u8(monkeypatch, ConnectionError("no route"))
+    daemon.apply({"alice": WatchEntry("alice")})
+    restarted_at = [clock.now]
+
+    while len(restarted_at) < 9:
+        clock.now += 1
+        daemon._supervise()
+
+        if len(instances) > len(restarted_at):
+            restarted_at.append(clock.now)
+
+    delays = [after - before for before, after in zip(restarted_at, restarted_at[1:])]
+    assert delays == [31, 61, 121, 241, 481, 961, 1801, 1801]
+
+    # Only the instance of the current download is left open
+    assert all(tk3u8.close.called for tk3u8 in instances[:-1])
+    assert not instances[-1].close.called
+
+    daemon._stop_watchers()
+    assert instances[-1].close.called
+
+
+@pytest.mark.parametrize("error", [
+    UserNotFoundError("alice"),
+    WorkerError("alice", "UserNotFoundError", "not found")
+])
+def test_permanent_errors_stop_the_watching(monkeypatch, stepped_daemon, error):
+    daemon, clock = stepped_daemon
+    instances = make_failing_tk3u8(monkeypatch, error)
+    daemon.apply({"alice": WatchEntry("alice")})
+
+    clock.now += 24 * 60 * 60
+    daemon._supervise()
+    daemon._supervise()
+    assert len(instances) == 1
+
+    # Changing the settings of the user watches it again
+    daemon.apply({"alice": WatchEntry("alice", quality="sd")})
+    assert len(instances) == 2
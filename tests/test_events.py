@@ -0,0 +1,183 @@
+import io
+import json
+import threading
+import pytest
+from rich.console import Console
+from tk3u8.cli.console import console
+from tk3u8.cli.dashboard import Dashboard
+from tk3u8.constants import EventType, LiveStatus
+from tk3u8.core.model import Tk3u8
+from tk3u8.core.scheduler import system_clock
+from tk3u8.exceptions import UserNotLiveError
+from tk3u8.telemetry.events import Event, EventBus, EventDispatcher, NDJSONEventWriter, events, stdout_writer
+from tk3u8.testing.clock import AcceleratedClock
+from tk3u8.testing.fake_server import FakeTikTokServer
+
+
+class FailingWriter:
+    def write(self, event):
+        raise OSError("Broken pipe")
+
+
+@pytest.fixture
+def clock():
+    return AcceleratedClock(20)
+
+
+@pytest.fixture
+def server(clock):
+    server = FakeTikTokServer(clock=clock, bitrate_scale=0.01)
+    server.start()
+    yield server
+    server.stop()
+
+
+def test_ndjson_writer_writes_compact_lines():
+    stream = io.StringIO()
+    writer = NDJSONEventWriter(stream)
+
+    writer.write(Event(EventType.POLLED, "testuser", {"live_status": "offline"}, timestamp=1700000000.12345))
+    writer.write(Event(EventType.ERROR, "testuser", {"error": "DownloadError"}, timestamp=1700000001))
+
+    lines = stream.getvalue().splitlines()
+
+    assert lines[0] == '{"ts":1700000000.123,"event":"polled","username":"testuser","live_status":"offline"}'
+    assert json.loads(lines[1])["event"] == "error"
+
+
+def test_bus_keeps_going_when_a_writer_fails():
+    bus = EventBus()
+    stream = io.StringIO()
+
+    assert not bus.is_enabled()
+    bus.emit(EventType.POLLED, "testuser")
+
+    bus.add_writer(FailingWriter())
+    bus.add_writer(NDJSONEventWriter(stream))
+    bus.emit(EventType.WENT_LIVE, "testuser", start_time=1700000000)
+
+    assert json.loads(stream.getvalue())["start_time"] == 1700000000
+
+
+def make_tk3u8(server, tmp_path, clock=system_clock):
+    config_file = tmp_path / "config.toml"
+    config_file.write_text(f'[config]\nbase_url = "{server.base_url}"\n')
+
+    return Tk3u8(program_data_dir=str(tmp_path), config_file_path=str(config_file), downloads_dir=str(tmp_path), clock=clock)
+
+
+def test_headless_mode_writes_only_events(server, tmp_path, capsys):
+    server.add_user("testuser", [(0, LiveStatus.OFFLINE)])
+    tk3u8 = make_tk3u8(server, tmp_path)
+
+    with pytest.raises(UserNotLiveError):
+        tk3u8.download("testuser", headless=True)
+
+    lines = capsys.readouterr().out.splitlines()
+
+    assert [json.loads(line)["event"] for line in lines] == ["polled", "status_changed", "error"]
+    event = json.loads(lines[0])
+    assert event["username"] == "testuser"
+    assert event["live_status"] == "offline"
+
+    # The output is turned off again once the download is done
+    assert not console.quiet
+    assert not events.is_enabled()
+
+
+def test_headless_output_lasts_until_the_last_download_is_done(server, clock, tmp_path, capsys):
+    server.add_user("alice", [(0, LiveStatus.OFFLINE)])
+    server.add_user("bob", [(0, LiveStatus.OFFLINE)])
+    waiting = make_tk3u8(server, tmp_path, clock=clock)
+    failing = make_tk3u8(server, tmp_path, clock=clock)
+
+    handle = waiting.start_download("alice", headless=True, wait_until_live=True)
+
+    with pytest.raises(UserNotLiveError):
+        failing.download("bob", headless=True)
+
+    # The other download still runs in the headless mode
+    assert console.quiet
+    assert stdout_writer in events._writers
+
+    handle.cancel()
+    assert handle.wait(10)
+
+    assert not console.quiet
+    assert not events.is_enabled()
+
+    lines = capsys.readouterr().out.splitlines()
+    assert {json.loads(line)["username"] for line in lines} == {"alice", "bob"}
+
+
+def test_dashboard_shows_each_user_once():
+    dashboard = Dashboard()
+    dashboard.write(Event(EventType.POLLED, "alice", {"live_status": "offline"}))
+    dashboard.write(Event(EventType.RECORDING_STARTED, "bob", {"quality": "hd"}))
+    dashboard.write(Event(EventType.SEGMENT_STATS, "bob", {"segments_written": 12, "bytes_written": 3 * 2 ** 20, "bytes_per_second": 250000}))
+    dashboard.write(Event(EventType.POLLED, "bob", {"live_status": "live"}))
+
+    output = io.StringIO()
+    Console(file=output, width=200).print(dashboard.render())
+    text = output.getvalue()
+
+    assert text.count("@alice") == 1
+    assert text.count("@bob") == 1
+    assert "recording" in text
+    assert "3 MiB" in text
+    assert "2000 kbps" in text
+
+
+def test_dashboard_restores_the_console_once_stopped():
+    dashboard = Dashboard()
+
+    dashboard.start(console=Console(file=io.StringIO()))
+    assert console.quiet
+
+    dashboard.stop()
+    assert not console.quiet
+    assert not events.is_enabled()
+
+
+def test_dispatcher_calls_callbacks_of_the_user_on_a_worker_thread():
+    dispatcher = EventDispatcher()
+    dispatcher.username = "alice"
+    called = []
+
+    def on_error(event):
+        called.append((event.type, event.username, threading.current_thread() is threading.main_thread()))
+        raise ValueError("Broken callback")
+
+    dispatcher.add_callback(EventType.ERROR, on_error)
+    dispatcher.add_callback(EventType.ERROR, lambda event: called.append(event.data["error"]))
+
+    dispatcher.write(Event(EventType.ERROR, "alice", {"error": "DownloadError"}))
+    dispatcher.write(Event(EventType.ERROR, "bob", {"error": "DownloadError"}))
+    dispatcher.write(Event(EventType.POLLED, "alice"))
+    dispatcher.close()
+
+    assert called == [(EventType.ERROR, "alice", False), "DownloadError"]
+
+
+def test_callbacks_follow_the_recording(server, clock, tmp_path):
+    server.add_user("testuser", [(0, LiveStatus.LIVE), (20, LiveStatus.OFFLINE)], added_at=clock.time())
+    tk3u8 = make_tk3u8(server, tmp_path, clock)
+    called = []
+
+    tk3u8.on_status_change(called.append)
+    tk3u8.on_recording_started(called.append)
+    tk3u8.on_segment_written(called.append)
+    tk3u8.on_recording_finished(called.append)
+
+    tk3u8.download("testuser", quality="sd", engine="native")
+
+    types = [event.type for event in called]
+
+    assert types[:2] == [EventType.STATUS_CHANGED, EventType.RECORDING_STARTED]
+    assert types[-1] == EventType.RECORDING_FINISHED
+    assert EventType.SEGMENT_WRITTEN in types
+
+    segments = [event for event in called if event.type == EventType.SEGMENT_WRITTEN]
+    assert all(event.data["bytes"] > 0 for event in segments)
+    assert called[-1].data["bytes"] == sum(event.data["bytes"] for event in segments)
+    assert called[-1].data["ok"]
@@ -0,0 +1,137 @@
+import json
+import pytest
+import requests
+from unittest.mock import mock_open, patch
+from tk3u8.constants import LiveStatus, OptionKey
+from tk3u8.core.helper import get_link_expiry
+from tk3u8.core.playlist import parse_playlist
+from tk3u8.core.stream_metadata_handler import StreamMetadataHandler
+from tk3u8.options_handler import OptionsHandler
+from tk3u8.paths_handler import PathsHandler
+from tk3u8.session.request_handler import RequestHandler
+from tk3u8.testing.fake_server import FakeTikTokServer, FakeUser, parse_schedule
+from tk3u8.testing.payloads import get_room_id
+
+
+class FakeClock:
+    def __init__(self, now=1700000000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def server(clock):
+    server = FakeTikTokServer(clock=clock, segment_duration=2, playlist_size=3, bitrate_scale=0.01, seed=1)
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def stream_metadata_handler(server):
+    config = {"config": {OptionKey.BASE_URL.value: server.base_url}}
+
+    with patch("tk3u8.options_handler.open", mock_open(read_data="dummy")), \
+         patch("tk3u8.options_handler.toml.load", return_value=config):
+        options_handler = OptionsHandler(PathsHandler())
+
+    return StreamMetadataHandler(RequestHandler(options_handler), options_handler)
+
+
+def test_user_follows_repeating_schedule():
+    user = FakeUser("testuser", [(10, LiveStatus.LIVE), (40, LiveStatus.OFFLINE)], period=60, added_at=1000)
+
+    assert user.get_state(1005) == (LiveStatus.OFFLINE, 1000)
+    assert user.get_state(1015) == (LiveStatus.LIVE, 1010)
+    assert user.get_state(1045) == (LiveStatus.OFFLINE, 1040)
+    assert user.get_state(1075) == (LiveStatus.LIVE, 1070)
+
+
+def test_parse_schedule():
+    assert parse_schedule("0:offline, 30:live,600:preparing") == [
+        (0, LiveStatus.OFFLINE),
+        (30, LiveStatus.LIVE),
+        (600, LiveStatus.PREPARING_TO_GO_LIVE)
+    ]
+
+    with pytest.raises(ValueError):
+        parse_schedule("0:away")
+
+
+def test_stream_data_is_fetched_from_server(server, clock, stream_metadata_handler):
+    server.add_user("testuser", [(30, LiveStatus.LIVE)])
+
+    stream_metadata_handler.initialize_data("testuser")
+    assert stream_metadata_handler.get_live_status() == LiveStatus.OFFLINE
+
+    clock.now += 40
+    stream_metadata_handler.update_data()
+    assert stream_metadata_handler.get_live_status() == LiveStatus.LIVE
+    assert stream_metadata_handler.get_start_time() == 1700000030
+
+    stream_link = stream_metadata_handler.get_stream_link("hd", use_h265=False)
+    assert stream_link.link.startswith(server.base_url)
+    assert server.get_stats() == {"api": 2}
+
+
+def test_live_playlist_slides_and_ends(server, clock):
+    server.add_user("testuser", [(0, LiveStatus.LIVE), (20, LiveStatus.OFFLINE)])
+    playlist_url = f"{server.base_url}/stage/stream-{get_room_id('testuser')}_h264_hd/index.m3u8"
+
+    clock.now += 9
+    response = requests.get(playlist_url)
+    playlist = parse_playlist(response.text, response.url)
+    assert [segment.sequence for segment in playlist.segments] == [2, 3, 4]
+
+    segment = requests.get(playlist.segments[-1].uri)
+    assert segment.status_code == 200
+    assert segment.content[:1] == b"\x47"
+    assert requests.get(playlist_url.replace("index.m3u8", "0.ts")).status_code == 404
+
+    clock.now += 20
+    assert requests.get(playlist_url).status_code == 404
+
+
+def test_injected_faults(server, clock):
+    server.add_user("testuser", [(0, LiveStatus.LIVE)])
+    server.link_ttl = 60
+    server.waf_rate = 1.0
+
+    page = requests.get(f"{server.base_url}/@testuser/live")
+    assert "Please wait..." in page.text
+
+    api_response = requests.get(f"{server.base_url}/api-live/user/room?uniqueId=testuser")
+    hls_link = _get_hls_link(api_response.json())
+    assert get_link_expiry(hls_link) == clock.now + 60
+    assert requests.get(hls_link).status_code == 200
+
+    clock.now += 61
+    assert requests.get(hls_link).status_code == 403
+
+    server.error_rate = 1.0
+    assert requests.get(f"{server.base_url}/api-live/user/room?uniqueId=testuser").status_code == 503
+    assert server.get_stats()["waf"] == 1
+    assert server.get_stats()["expired"] == 1
+    assert server.get_stats()["error"] == 1
+
+
+def _get_hls_link(payload):
+    stream_data = json.loads(payload["data"]["liveRoom"]["streamData"]["pull_data"]["stream_data"])
+    return stream_data["data"]["hd"]["main"]["hls"]
+
+
+def test_dropped_connections_are_counted(server):
+    server.drop_rate = 1
+    server.add_user("testuser")
+
+    with pytest.raises(requests.ConnectionError):
+        requests.get(f"{server.base_url}/@testuser/live", timeout=5)
+
+    assert server.get_stats()["dropped"] == 1
@@ -0,0 +1,84 @@
+import os
+import time
+import pytest
+from tk3u8.constants import DownloadStatus, LiveStatus
+from tk3u8.core.model import Tk3u8
+from tk3u8.core.scheduler import system_clock
+from tk3u8.exceptions import DownloadCancelledError, UserNotLiveError
+from tk3u8.testing.clock import AcceleratedClock
+from tk3u8.testing.fake_server import FakeTikTokServer
+
+
+@pytest.fixture
+def clock():
+    return AcceleratedClock(20)
+
+
+@pytest.fixture
+def server(clock):
+    server = FakeTikTokServer(clock=clock, bitrate_scale=0.01)
+    server.start()
+    yield server
+    server.stop()
+
+
+def make_tk3u8(server, tmp_path, clock=system_clock):
+    config_file = tmp_path / "config.toml"
+    config_file.write_text(f'[config]\nbase_url = "{server.base_url}"\n')
+
+    return Tk3u8(program_data_dir=str(tmp_path), config_file_path=str(config_file), downloads_dir=str(tmp_path), clock=clock)
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+def test_failing_download_does_not_stop_the_others(server, clock, tmp_path):
+    server.add_user("offlineuser", [(0, LiveStatus.OFFLINE)])
+    server.add_user("liveuser", [(0, LiveStatus.LIVE)], added_at=clock.time())
+
+    recording = make_tk3u8(server, tmp_path, clock).start_download("liveuser", quality="sd", engine="native")
+    failing = make_tk3u8(server, tmp_path, clock).start_download("offlineuser")
+
+    assert failing.wait(10)
+    assert failing.get_status() == DownloadStatus.FAILED
+    with pytest.raises(UserNotLiveError):
+        failing.result()
+
+    wait_for(lambda: recording.get_stats().segments_written >= 2)
+    assert recording.get_status() == DownloadStatus.RUNNING
+
+    recording.cancel()
+    assert recording.wait(10)
+
+    assert recording.get_status() == DownloadStatus.CANCELLED
+    with pytest.raises(DownloadCancelledError):
+        recording.result()
+
+    stats = recording.get_stats()
+    assert stats.live_status == "live"
+    assert stats.recordings == 1
+
+    # What was recorded before cancelling is kept
+    user_download_dir = tmp_path / "liveuser"
+    recorded = [name for name in os.listdir(user_download_dir) if name.endswith(".ts")]
+    assert os.path.getsize(user_download_dir / recorded[0]) == stats.bytes_written
+
+
+def test_cancel_stops_waiting_until_live(server, tmp_path):
+    server.add_user("testuser", [(0, LiveStatus.OFFLINE)])
+    handle = make_tk3u8(server, tmp_path).start_download("testuser", wait_until_live=True, timeout=30)
+
+    wait_for(lambda: handle.get_stats().live_status == "offline")
+    handle.cancel()
+
+    assert handle.wait(5)
+    assert handle.get_status() == DownloadStatus.CANCELLED
+
+
+def test_start_download_rejects_unknown_arguments(server, tmp_path):
+    with pytest.raises(TypeError):
+        make_tk3u8(server, tmp_path).start_download("testuser", wait_until_lvie=True)
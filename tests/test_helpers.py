@@ -1,6 +1,7 @@
+import json
 import pytest
 
-from tk3u8.core.helper import is_username_valid
+from tk3u8.core.helper import get_link_expiry, get_stream_bitrates, is_username_valid
 
 
 @pytest.mark.parametrize(
@@ -29,3 +30,38 @@ from tk3u8.core.helper import is_username_valid
 )
 def test_is_username_valid(username, expected):
     assert is_username_valid(username) is expected
+
+
+def test_get_stream_bitrates():
+    stream_data = {
+        "h264": {"data": {
+            "origin": {"main": {"sdk_params": json.dumps({"vbitrate": 4000000})}},
+            "hd": {"main": {"sdk_params": json.dumps({"vbitrate": "2000000"})}},
+            "sd": {"main": {}}
+        }},
+        "h265": {"data": {
+            "origin": {"main": {"sdk_params": "not json"}}
+        }}
+    }
+
+    assert get_stream_bitrates(stream_data) == {
+        "original": {"h264": 4000000},
+        "hd": {"h264": 2000000}
+    }
+
+
+def test_get_stream_bitrates_unexpected_structure():
+    assert get_stream_bitrates({"data": {"original": {"main": {"hls": "http://mock"}}}}) == {}
+
+
+@pytest.mark.parametrize(
+    "link,expected",
+    [
+        ("https://pull-hls.tiktokcdn.com/stage/stream-1_uhd/index.m3u8?expire=1720000000&sign=abc", 1720000000),
+        ("https://pull-hls.tiktokcdn.com/stage/stream-1_uhd/index.m3u8?txSecret=abc&txTime=66a0f180", 0x66a0f180),
+        ("https://pull-hls.tiktokcdn.com/stage/stream-1_uhd/index.m3u8?expire=soon", None),
+        ("https://pull-hls.tiktokcdn.com/stage/stream-1_uhd/index.m3u8", None),
+    ]
+)
+def test_get_link_expiry(link, expected):
+    assert get_link_expiry(link) == expected
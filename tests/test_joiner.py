@@ -0,0 +1,139 @@
+import json
+import pytest
+from tk3u8.core.joiner import find_recordings, group_sessions, join_sessions
+from tk3u8.exceptions import JoinError
+
+
+VIDEO_PID = 256
+
+
+def encode_pes_timestamp(prefix, value):
+    return bytes([
+        (prefix << 4) | ((value >> 29) & 0x0E) | 0x01,
+        (value >> 22) & 0xFF,
+        ((value >> 14) & 0xFE) | 0x01,
+        (value >> 7) & 0xFF,
+        ((value << 1) & 0xFE) | 0x01
+    ])
+
+
+def encode_pcr(value):
+    return bytes([(value >> 25) & 0xFF, (value >> 17) & 0xFF, (value >> 9) & 0xFF, (value >> 1) & 0xFF, ((value & 0x1) << 7) | 0x7E, 0x00])
+
+
+def decode_pes_timestamp(data):
+    return ((data[0] >> 1) & 0x07) << 30 | data[1] << 22 | (data[2] >> 1) << 15 | data[3] << 7 | data[4] >> 1
+
+
+def make_frame_packets(counter, pts, dts):
+    """Builds a PES packet starting a frame, with a PCR, followed by a packet
+    of the rest of the frame."""
+    adaptation_field = bytes([7, 0x10]) + encode_pcr(dts)
+    pes_header = b"\x00\x00\x01\xe0\x00\x00\x80\xc0\x0a" + encode_pes_timestamp(0x3, pts) + encode_pes_timestamp(0x1, dts)
+    first = bytes([0x47, 0x40 | (VIDEO_PID >> 8), VIDEO_PID & 0xFF, 0x30 | (counter & 0x0F)]) + adaptation_field + pes_header
+    first += b"\xaa" * (188 - len(first))
+    second = bytes([0x47, VIDEO_PID >> 8, VIDEO_PID & 0xFF, 0x10 | ((counter + 1) & 0x0F)]) + b"\xbb" * 184
+    return first + second
+
+
+def make_ts(first_pts, frames=10, first_counter=0):
+    return b"".join(make_frame_packets(first_counter + 2 * index, first_pts + 3000 * index, first_pts + 3000 * index - 3000) for index in range(frames))
+
+
+def read_frames(data):
+    """Gets the continuity counter of every packet, and the PTS and DTS of
+    every frame."""
+    counters = []
+    frames = []
+
+    for index in range(0, len(data), 188):
+        packet = data[index:index + 188]
+        counters.append(packet[3] & 0x0F)
+
+        if packet[1] & 0x40:
+            pes = packet[5 + packet[4]:]
+            frames.append((decode_pes_timestamp(pes[9:14]), decode_pes_timestamp(pes[14:19])))
+
+    return counters, frames
+
+
+def write_recording(directory, filename, data, live_started_at=None, started_at="2026-10-19T10:00:00+00:00", finished_at="2026-10-19T10:30:00+00:00", manifest=None):
+    (directory / f"{filename}.ts").write_bytes(data)
+    (directory / f"{filename}.meta.json").write_text(json.dumps({
+        "username": "testuser",
+        "quality": "original",
+        "started_at": started_at,
+        "finished_at": finished_at,
+        "live_started_at": live_started_at
+    }))
+
+    if manifest:
+        (directory / f"{filename}.manifest.json").write_text(json.dumps(manifest))
+
+
+def test_group_sessions_by_live_start_or_gap(tmp_path):
+    write_recording(tmp_path, "testuser-20261019_100000-original", b"", live_started_at=1700000000, started_at="2026-10-19T10:00:00+00:00")
+    write_recording(tmp_path, "testuser-20261019_103100-original", b"", live_started_at=1700000000, started_at="2026-10-19T10:31:00+00:00")
+    write_recording(tmp_path, "testuser-20261019_110000-original", b"", live_started_at=1700009000, started_at="2026-10-19T11:00:00+00:00")
+    write_recording(
+        tmp_path, "testuser-20261019_120000-original", b"",
+        started_at="2026-10-19T12:00:00+00:00", finished_at="2026-10-19T12:10:00+00:00"
+    )
+    write_recording(tmp_path, "testuser-20261019_121200-original", b"", started_at="2026-10-19T12:12:00+00:00")
+
+    sessions = group_sessions(find_recordings(str(tmp_path)), max_gap=300)
+
+    assert [len(parts) for parts in sessions] == [2, 1, 2]
+
+
+def test_join_rebases_timestamps_of_each_part(tmp_path):
+    write_recording(tmp_path, "testuser-20261019_100000-original", make_ts(900000, first_counter=0), live_started_at=1700000000)
+    write_recording(
+        tmp_path, "testuser-20261019_103100-original", make_ts(5000000, first_counter=7),
+        live_started_at=1700000000, started_at="2026-10-19T10:31:00+00:00"
+    )
+
+    joined_paths = join_sessions(str(tmp_path))
+
+    assert joined_paths == [str(tmp_path / "testuser-20261019_100000-original-joined.ts")]
+    counters, frames = read_frames((tmp_path / "testuser-20261019_100000-original-joined.ts").read_bytes())
+
+    # The first part starts at DTS 897000 and its last frame ends at PTS
+    # 927000 + 3000, so the second part continues from there
+    assert frames[:10] == [(900000 + 3000 * index, 897000 + 3000 * index) for index in range(10)]
+    assert frames[10:] == [(933000 + 3000 * index, 930000 + 3000 * index) for index in range(10)]
+    assert counters == [index % 16 for index in range(40)]
+
+    # Sessions that were already joined are skipped
+    assert join_sessions(str(tmp_path)) == []
+
+
+def test_join_uses_duration_from_segment_index(tmp_path):
+    first_part = make_ts(900000)
+    write_recording(
+        tmp_path, "testuser-20261019_100000-original", first_part, live_started_at=1700000000,
+        manifest={"duration": 1.0, "bytes": len(first_part), "segments": [{"size": len(first_part)}]}
+    )
+    write_recording(
+        tmp_path, "testuser-20261019_103100-original", make_ts(5000000),
+        live_started_at=1700000000, started_at="2026-10-19T10:31:00+00:00"
+    )
+
+    join_sessions(str(tmp_path), delete_parts=True)
+
+    _, frames = read_frames((tmp_path / "testuser-20261019_100000-original-joined.ts").read_bytes())
+    assert frames[10] == (897000 + 90000 + 3000, 897000 + 90000)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["testuser-20261019_100000-original-joined.ts"]
+
+
+def test_join_other_formats_needs_ffmpeg(tmp_path, monkeypatch):
+    for filename, started_at in (("testuser-20261019_100000-original", "2026-10-19T10:00:00+00:00"), ("testuser-20261019_103100-original", "2026-10-19T10:31:00+00:00")):
+        (tmp_path / f"{filename}.mp4").write_bytes(b"")
+        (tmp_path / f"{filename}.meta.json").write_text(json.dumps({"quality": "original", "started_at": started_at, "live_started_at": 1700000000}))
+
+    monkeypatch.setattr("tk3u8.core.joiner.shutil.which", lambda name: None)
+
+    with pytest.raises(JoinError):
+        join_sessions(str(tmp_path))
+
+    assert not (tmp_path / "testuser-20261019_100000-original-joined.mp4").exists()
@@ -0,0 +1,29 @@
+from tk3u8.testing.load import LoadHarness, _get_percentile
+from tk3u8.testing.process_stats import get_process_stats
+
+
+def test_get_percentile():
+    values = [float(value) for value in range(1, 101)]
+
+    assert _get_percentile(values, 50) == 50
+    assert _get_percentile(values, 99) == 99
+    assert _get_percentile([3.0], 90) == 3
+    assert _get_percentile([], 50) == 0
+
+
+def test_process_stats_are_read():
+    stats = get_process_stats()
+
+    assert stats.cpu_seconds > 0
+    assert stats.threads >= 1
+
+
+def test_harness_polls_users_and_detects_them_going_live():
+    harness = LoadHarness(20, interval=1, duration=3, workers=4, live_share=0.5, live_duration=10, seed=1)
+    report = harness.run()
+
+    assert report.users == 20
+    assert report.poll_errors == 0
+    assert report.polls >= 20
+    assert report.detections > 0
+    assert 0 <= report.detection_lag["p50"] <= report.detection_lag["max"] < 2.5
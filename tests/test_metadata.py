@@ -0,0 +1,22 @@
+import json
+from tk3u8.constants import StreamLink
+from tk3u8.core.metadata import RecordingMetadata
+
+
+def test_metadata_records_codec_used(tmp_path):
+    stream_link = StreamLink("uhd", "http://uhd265", codec="h265")
+    metadata = RecordingMetadata.from_stream_link("testuser", "uhd", stream_link, "native")
+
+    path = tmp_path / "recording.meta.json"
+    metadata.save(str(path))
+    saved = json.loads(path.read_text())
+
+    assert saved["codec"] == "H.265"
+    assert saved["quality"] == "uhd"
+    assert saved["engine"] == "native"
+    assert saved["stream_link"] == "http://uhd265"
+    assert saved["finished_at"] is None
+
+    metadata.mark_finished()
+    metadata.save(str(path))
+    assert json.loads(path.read_text())["finished_at"] is not None
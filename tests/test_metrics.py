@@ -0,0 +1,62 @@
+import requests
+from tk3u8.telemetry.metrics import MetricsRegistry, MetricsServer
+
+
+def test_counter_and_gauge_render_with_labels():
+    registry = MetricsRegistry()
+    counter = registry.counter("test_requests_total", "Requests.", ("extractor", "status"))
+    gauge = registry.gauge("test_active", "Active.")
+
+    counter.inc(extractor="APIExtractor", status=200)
+    counter.inc(2, extractor="APIExtractor", status=200)
+    gauge.inc()
+    gauge.inc()
+    gauge.dec()
+
+    rendered = registry.render()
+
+    assert "# TYPE test_requests_total counter" in rendered
+    assert 'test_requests_total{extractor="APIExtractor",status="200"} 3' in rendered
+    assert "test_active 1" in rendered
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry()
+    histogram = registry.histogram("test_latency_seconds", "Latency.", ("username",), buckets=(0.1, 1))
+
+    histogram.observe(0.05, username="foo")
+    histogram.observe(0.5, username="foo")
+    histogram.observe(5, username="foo")
+
+    lines = registry.render().splitlines()
+
+    assert 'test_latency_seconds_bucket{username="foo",le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{username="foo",le="1"} 2' in lines
+    assert 'test_latency_seconds_bucket{username="foo",le="+Inf"} 3' in lines
+    assert 'test_latency_seconds_sum{username="foo"} 5.55' in lines
+    assert 'test_latency_seconds_count{username="foo"} 3' in lines
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    registry.gauge("test_gauge", "Gauge.", ("username",)).set(1, username='a"b')
+
+    assert 'test_gauge{username="a\\"b"} 1' in registry.render()
+
+
+def test_metrics_server_serves_metrics_path():
+    registry = MetricsRegistry()
+    registry.counter("test_total", "Total.").inc()
+    server = MetricsServer(0, registry)
+    server.start()
+
+    try:
+        response = requests.get(server.url, timeout=5)
+        not_found = requests.get(server.url.replace("/metrics", "/other"), timeout=5)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert response.status_code == 200
+    assert "test_total 1" in response.text
+    assert not_found.status_code == 404
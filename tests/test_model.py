@@ -1,7 +1,8 @@
 import pytest
-from unittest.mock import patch
+from unittest.mock import ANY, patch
 from tk3u8.constants import OptionKey
 from tk3u8.core.model import Tk3u8
+from tk3u8.exceptions import InvalidProfileModeError
 
 
 @pytest.fixture
@@ -42,7 +43,15 @@ def test_download_triggers_all_components(tk3u8):
          patch.object(tk3u8._downloader, 'download') as mock_download:
         tk3u8.download('testuser', quality='original', wait_until_live=True, timeout=10, force_redownload=False, use_h265=True)
         mock_save_args.assert_called_once_with(
-            wait_until_live=True, timeout=10, force_redownload=False, use_h265=True
+            wait_until_live=True, timeout=10, force_redownload=False, use_h265=True,
+            quality_fallback=None, codec_fallback=None, codec_policy=None, engine=None, max_bandwidth=None,
+            min_bandwidth=None, priority=None, bandwidth_coordinator_port=None, metrics_port=None,
+            trace_file=None, headless=None, dashboard=None
         )
         mock_init_data.assert_called_once_with('testuser')
-        mock_download.assert_called_once_with('original')
+        mock_download.assert_called_once_with('original', ANY)
+
+
+def test_invalid_profile_mode_raises():
+    with pytest.raises(InvalidProfileModeError):
+        Tk3u8(program_data_dir=None, profile='gpu')
@@ -1,6 +1,7 @@
 import pytest
 from unittest.mock import patch, mock_open
 from tk3u8.constants import OptionKey
+from tk3u8.exceptions import ConfigFileError
 from tk3u8.options_handler import OptionsHandler
 from tk3u8.paths_handler import PathsHandler
 
@@ -60,7 +61,7 @@ def test_save_args_values_and_type_error(mock_paths_handler):
 
 def test_file_not_found_raises(mock_paths_handler):
     with patch("tk3u8.options_handler.open", side_effect=FileNotFoundError):
-        with pytest.raises(SystemExit):
+        with pytest.raises(ConfigFileError):
             OptionsHandler(mock_paths_handler)
 
 
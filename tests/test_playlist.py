@@ -0,0 +1,52 @@
+from tk3u8.core.playlist import parse_playlist
+
+
+MEDIA_PLAYLIST = """#EXTM3U
+#EXT-X-VERSION:3
+#EXT-X-TARGETDURATION:2
+#EXT-X-MEDIA-SEQUENCE:100
+#EXTINF:2.000,
+seg-100.ts
+#EXTINF:2.000,
+seg-101.ts
+#EXT-X-DISCONTINUITY
+#EXTINF:1.500,
+https://cdn.example.com/other/seg-102.ts
+"""
+
+MASTER_PLAYLIST = """#EXTM3U
+#EXT-X-STREAM-INF:BANDWIDTH=4000000,RESOLUTION=1920x1080
+hd/index.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=1000000,RESOLUTION=640x360
+sd/index.m3u8
+"""
+
+
+def test_parse_media_playlist():
+    playlist = parse_playlist(MEDIA_PLAYLIST, "https://cdn.example.com/stream/index.m3u8")
+
+    assert playlist.target_duration == 2
+    assert playlist.media_sequence == 100
+    assert not playlist.is_master
+    assert not playlist.is_ended
+    assert [segment.sequence for segment in playlist.segments] == [100, 101, 102]
+    assert playlist.segments[0].uri == "https://cdn.example.com/stream/seg-100.ts"
+    assert playlist.segments[2].uri == "https://cdn.example.com/other/seg-102.ts"
+    assert playlist.segments[2].duration == 1.5
+    assert [segment.discontinuity for segment in playlist.segments] == [False, False, True]
+
+
+def test_parse_ended_playlist():
+    playlist = parse_playlist(MEDIA_PLAYLIST + "#EXT-X-ENDLIST\n", "https://cdn.example.com/stream/index.m3u8")
+    assert playlist.is_ended
+
+
+def test_parse_master_playlist():
+    playlist = parse_playlist(MASTER_PLAYLIST, "https://cdn.example.com/stream/master.m3u8")
+
+    assert playlist.is_master
+    assert playlist.segments == []
+    assert playlist.variant_uris == [
+        "https://cdn.example.com/stream/hd/index.m3u8",
+        "https://cdn.example.com/stream/sd/index.m3u8"
+    ]
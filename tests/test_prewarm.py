@@ -0,0 +1,125 @@
+import socket
+from unittest.mock import MagicMock, patch
+import pytest
+from tk3u8.constants import Engine, LiveStatus, OptionKey
+from tk3u8.core.downloader import Downloader
+from tk3u8.exceptions import QualityNotAvailableError
+from tk3u8.session import prewarm
+from tk3u8.session.prewarm import ConnectionPrewarmer, DNSCache
+
+
+@pytest.fixture()
+def fake_getaddrinfo():
+    fake = MagicMock(return_value=[(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", 443))])
+
+    with patch("socket.getaddrinfo", fake):
+        yield fake
+
+
+@pytest.fixture()
+def dns_cache(fake_getaddrinfo):
+    cache = DNSCache(ttl=300)
+    cache.install()
+    yield cache
+    cache.uninstall()
+
+
+def test_dns_cache_serves_registered_hosts_from_cache(fake_getaddrinfo, dns_cache):
+    dns_cache.resolve("cdn.example.com", 443)
+    socket.getaddrinfo("cdn.example.com", 443, 0, socket.SOCK_STREAM)
+    socket.getaddrinfo("cdn.example.com", 443, 0, socket.SOCK_STREAM)
+
+    assert fake_getaddrinfo.call_count == 1
+
+
+def test_dns_cache_passes_through_other_hosts(fake_getaddrinfo, dns_cache):
+    socket.getaddrinfo("other.example.com", 443)
+    socket.getaddrinfo("other.example.com", 443)
+
+    assert fake_getaddrinfo.call_count == 2
+
+
+def test_dns_cache_expires_entries(fake_getaddrinfo, dns_cache):
+    dns_cache.resolve("cdn.example.com", 443)
+
+    with patch("tk3u8.session.prewarm.time.monotonic", return_value=10**9):
+        socket.getaddrinfo("cdn.example.com", 443, 0, socket.SOCK_STREAM)
+
+    assert fake_getaddrinfo.call_count == 2
+
+
+def test_dns_cache_uninstall_restores_getaddrinfo(fake_getaddrinfo):
+    cache = DNSCache()
+    cache.install()
+    cache.uninstall()
+
+    assert socket.getaddrinfo is fake_getaddrinfo
+
+
+def test_prewarmer_connects_once_per_host(fake_getaddrinfo, dns_cache):
+    session = MagicMock()
+    links = [
+        "https://cdn-a.example.com/stream/sd.m3u8",
+        "https://cdn-a.example.com/stream/hd.m3u8",
+        "https://cdn-b.example.com/stream/sd.m3u8",
+    ]
+
+    ConnectionPrewarmer(dns_cache).prewarm(session, links).join()
+
+    assert [call.args[0] for call in session.get.call_args_list] == [
+        "https://cdn-a.example.com/stream/sd.m3u8",
+        "https://cdn-b.example.com/stream/sd.m3u8",
+    ]
+    assert fake_getaddrinfo.call_count == 2
+
+
+def test_prewarmer_only_resolves_without_session(fake_getaddrinfo, dns_cache):
+    ConnectionPrewarmer(dns_cache).prewarm(None, ["https://cdn-a.example.com/stream/sd.m3u8"]).join()
+
+    fake_getaddrinfo.assert_called_once_with("cdn-a.example.com", 443, 0, socket.SOCK_STREAM)
+
+
+def test_dns_cache_is_uninstalled_once_every_download_is_done(fake_getaddrinfo):
+    cache = DNSCache()
+    cache.install()
+    cache.install()
+
+    cache.uninstall()
+    assert socket.getaddrinfo is not fake_getaddrinfo
+
+    cache.uninstall()
+    assert socket.getaddrinfo is fake_getaddrinfo
+
+
+def test_downloader_closes_prewarmed_session_when_picking_the_link_fails(fake_getaddrinfo):
+    options = {
+        OptionKey.WAIT_UNTIL_LIVE: False,
+        OptionKey.FORCE_REDOWNLOAD: False,
+        OptionKey.USE_H265: False,
+        OptionKey.MAX_BANDWIDTH: None,
+        OptionKey.MIN_BANDWIDTH: 0,
+        OptionKey.PRIORITY: 1,
+        OptionKey.BANDWIDTH_COORDINATOR_PORT: None,
+        OptionKey.PREWARM_CONNECTIONS: True,
+        OptionKey.DNS_CACHE_TTL: 60,
+        OptionKey.ENGINE: Engine.NATIVE.value
+    }
+    options_handler = MagicMock()
+    options_handler.get_option_val.side_effect = options.get
+    stream_metadata_handler = MagicMock()
+    stream_metadata_handler.get_username.return_value = "testuser"
+    stream_metadata_handler.get_live_status.return_value = LiveStatus.LIVE
+    stream_metadata_handler.get_start_time.return_value = None
+    stream_metadata_handler.get_last_process_duration.return_value = None
+    stream_metadata_handler.get_all_stream_links.return_value = ["https://cdn-a.example.com/stream/sd.m3u8"]
+    request_handler = MagicMock()
+
+    downloader = Downloader(MagicMock(), stream_metadata_handler, options_handler, request_handler)
+
+    with patch.object(downloader, "_get_stream_link", side_effect=QualityNotAvailableError()), \
+            patch("tk3u8.core.downloader.console"), pytest.raises(QualityNotAvailableError):
+        downloader.download("sd")
+
+    request_handler.create_stream_session.return_value.close.assert_called_once()
+    assert prewarm.dns_cache._ttl == 60
+    assert socket.getaddrinfo is fake_getaddrinfo
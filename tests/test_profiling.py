@@ -0,0 +1,54 @@
+import os
+import time
+from tk3u8.constants import ProfileMode
+from tk3u8.telemetry.profiling import Profiler
+
+
+def busy_poll():
+    return sum(i * i for i in range(20000))
+
+
+def test_cpu_profiling_writes_report_per_phase(tmp_path):
+    profiler = Profiler()
+    profiler.start(ProfileMode.CPU, str(tmp_path))
+
+    with profiler.phase("poll"):
+        busy_poll()
+
+    paths = profiler.stop()
+    names = [os.path.basename(path) for path in paths]
+    summary = (tmp_path / names[0]).read_text()
+
+    assert names[0].endswith("-cpu.txt")
+    assert any(name.endswith("-cpu-poll.prof") for name in names)
+    assert any(name.endswith("-cpu-other.prof") for name in names)
+    assert "=== Phase: poll ===" in summary
+    assert "busy_poll" in summary.split("=== Phase: poll ===")[1]
+    assert not profiler.is_running()
+
+
+def test_mem_profiling_tracks_phases_and_snapshot_diffs(tmp_path):
+    profiler = Profiler()
+    profiler.start(ProfileMode.MEM, str(tmp_path), snapshot_interval=0.05)
+
+    with profiler.phase("recording"):
+        leaked = [bytearray(1024) for _ in range(100)]
+
+    time.sleep(0.3)
+    paths = profiler.stop()
+    summary = open(paths[0]).read()
+
+    assert paths[0].endswith("-mem.txt")
+    assert "recording: 1 run(s)" in summary
+    assert any(path.endswith("-mem-diffs.txt") for path in paths)
+    assert len(leaked) == 100
+
+
+def test_phase_is_noop_when_not_running(tmp_path):
+    profiler = Profiler()
+
+    with profiler.phase("poll"):
+        pass
+
+    assert profiler.stop() == []
+    assert os.listdir(tmp_path) == []
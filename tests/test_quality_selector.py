@@ -0,0 +1,68 @@
+from tk3u8.constants import StreamLink
+from tk3u8.core.quality_selector import AutoQualitySelector, ThroughputEstimator
+from tk3u8.session.bandwidth import BandwidthLimiter
+
+
+VARIANTS = [
+    StreamLink("sd", "http://sd", 500_000),
+    StreamLink("original", "http://original", 4_000_000),
+    StreamLink("hd", "http://hd", 2_000_000)
+]
+
+
+def test_throughput_estimator_averages_samples():
+    estimator = ThroughputEstimator(alpha=0.5)
+    assert estimator.get_estimate() is None
+
+    estimator.add_sample(1_000_000, 1.0)
+    assert estimator.get_estimate() == 8_000_000
+
+    estimator.add_sample(500_000, 1.0)
+    assert estimator.get_estimate() == 6_000_000
+
+
+def make_selector(warmup_segments=3):
+    limiter = BandwidthLimiter()
+    limiter.register("rec")
+    return AutoQualitySelector(VARIANTS, limiter, "rec", warmup_segments=warmup_segments)
+
+
+def test_initial_variant_is_highest_without_limit():
+    selector = make_selector()
+    assert selector.get_initial_variant().quality == "original"
+
+
+def test_initial_variant_fits_allocated_bandwidth():
+    limiter = BandwidthLimiter()
+    limiter.set_total(6_000_000)
+    limiter.register("other")
+    limiter.register("rec")
+
+    selector = AutoQualitySelector(VARIANTS, limiter, "rec")
+    assert selector.get_initial_variant().quality == "hd"
+
+
+def test_select_switches_down_when_throughput_is_low():
+    selector = make_selector(warmup_segments=2)
+    current = selector.get_initial_variant()
+
+    # 250 KB per second is 2 Mbps, which can't sustain 4 Mbps
+    selector.add_segment_sample(250_000, 1.0)
+    assert selector.select(current) is current
+
+    selector.add_segment_sample(250_000, 1.0)
+    assert selector.select(current).quality == "sd"
+
+
+def test_select_switches_up_only_with_headroom():
+    selector = make_selector(warmup_segments=1)
+    current = VARIANTS[0]
+
+    # 2.8 Mbps can sustain 2 Mbps with the safety margin, but not with the
+    # upswitch margin
+    selector.add_segment_sample(350_000, 1.0)
+    assert selector.select(current) is current
+
+    selector = make_selector(warmup_segments=1)
+    selector.add_segment_sample(1_000_000, 1.0)
+    assert selector.select(current).quality == "original"
@@ -0,0 +1,366 @@
+import hashlib
+import json
+import threading
+from unittest.mock import MagicMock, patch
+import pytest
+from tk3u8.constants import EventType, StreamLink
+from tk3u8.core.recorder import HLSRecorder
+from tk3u8.core.scheduler import Clock
+from tk3u8.exceptions import HLSLinkTemporarilyUnavailableError
+from tk3u8.telemetry.events import events
+from tk3u8.telemetry.tracing import JSONLSpanExporter, tracer
+from tk3u8.testing.clock import AcceleratedClock
+
+
+def make_response(status_code=200, text="", content=b"", url=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.text = text
+    response.content = content
+    response.url = url
+    response.iter_content.return_value = [content]
+    response.__enter__.return_value = response
+    return response
+
+
+def make_playlist(first_sequence, count, ended=False):
+    lines = ["#EXTM3U", "#EXT-X-TARGETDURATION:2", f"#EXT-X-MEDIA-SEQUENCE:{first_sequence}"]
+    for sequence in range(first_sequence, first_sequence + count):
+        lines += ["#EXTINF:2.0,", f"seg-{sequence}.ts"]
+    if ended:
+        lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines)
+
+
+class FakeClock(Clock):
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+    def wait(self, event, seconds):
+        if not event.is_set():
+            self.now += seconds
+        return event.is_set()
+
+
+class FakeSession:
+    def __init__(self, playlists):
+        self._playlists = list(playlists)
+        self.requested = []
+
+    def get(self, url, timeout=None, stream=False):
+        self.requested.append(url)
+        if ".m3u8" in url:
+            return make_response(text=self._playlists.pop(0), url=url)
+        return make_response(content=url.rsplit("/", 1)[1].encode())
+
+
+def test_record_writes_new_segments_once(tmp_path):
+    session = FakeSession([
+        make_playlist(10, 3),
+        make_playlist(11, 3, ended=True)
+    ])
+    output_path = tmp_path / "out.ts"
+    recorder = HLSRecorder(session, str(output_path), StreamLink("original", "http://cdn/index.m3u8"), clock=FakeClock())
+
+    recorder.record()
+
+    assert output_path.read_bytes() == b"seg-10.tsseg-11.tsseg-12.tsseg-13.ts"
+    assert recorder.segments_written == 4
+    assert recorder.segments_dropped == 0
+
+
+def test_record_counts_segments_that_fell_off_the_playlist(tmp_path):
+    session = FakeSession([
+        make_playlist(10, 2),
+        make_playlist(15, 2, ended=True)
+    ])
+    recorder = HLSRecorder(session, str(tmp_path / "out.ts"), StreamLink("original", "http://cdn/index.m3u8"), clock=FakeClock())
+
+    recorder.record()
+
+    assert recorder.segments_written == 4
+    assert recorder.segments_dropped == 3
+
+
+def test_record_stops_after_repeated_playlist_failures(tmp_path):
+    session = MagicMock()
+    session.get.return_value = make_response(status_code=404)
+    recorder = HLSRecorder(session, str(tmp_path / "out.ts"), StreamLink("original", "http://cdn/index.m3u8"), clock=FakeClock())
+
+    recorder.record()
+
+    assert session.get.call_count == HLSRecorder.MAX_PLAYLIST_FAILURES
+    assert recorder.segments_written == 0
+
+
+def test_record_consumes_tokens_for_each_segment(tmp_path):
+    session = FakeSession([make_playlist(10, 2, ended=True)])
+    bucket = MagicMock()
+    recorder = HLSRecorder(session, str(tmp_path / "out.ts"), StreamLink("original", "http://cdn/index.m3u8"), bucket=bucket, clock=FakeClock())
+
+    recorder.record()
+
+    assert [call.args[0] for call in bucket.consume.call_args_list] == [len(b"seg-10.ts"), len(b"seg-11.ts")]
+
+
+def test_record_switches_variant_at_segment_boundary(tmp_path):
+    session = FakeSession([
+        make_playlist(10, 2),
+        make_playlist(11, 2, ended=True)
+    ])
+    selector = MagicMock()
+    low = StreamLink("sd", "http://cdn/sd/index.m3u8", 500_000)
+    high = StreamLink("original", "http://cdn/original/index.m3u8", 4_000_000)
+    selector.select.side_effect = lambda current: low
+    selector.get_throughput_estimate.return_value = 1_000_000
+
+    recorder = HLSRecorder(session, str(tmp_path / "out.ts"), high, selector, clock=FakeClock())
+
+    with patch("tk3u8.core.recorder.console"):
+        recorder.record()
+
+    assert recorder.get_stream_link() is low
+    assert session.requested == [
+        "http://cdn/original/index.m3u8",
+        "http://cdn/original/seg-10.ts",
+        "http://cdn/sd/index.m3u8",
+        "http://cdn/sd/seg-11.ts",
+        "http://cdn/sd/seg-12.ts"
+    ]
+
+
+def test_record_resyncs_when_switched_playlist_is_not_continuous(tmp_path):
+    session = FakeSession([
+        make_playlist(10, 1),
+        make_playlist(500, 3, ended=True)
+    ])
+    selector = MagicMock()
+    low = StreamLink("sd", "http://cdn/sd/index.m3u8", 500_000)
+    high = StreamLink("original", "http://cdn/original/index.m3u8", 4_000_000)
+    selector.select.side_effect = lambda current: low
+    selector.get_throughput_estimate.return_value = 1_000_000
+
+    recorder = HLSRecorder(session, str(tmp_path / "out.ts"), high, selector, clock=FakeClock())
+
+    with patch("tk3u8.core.recorder.console"):
+        recorder.record()
+
+    assert session.requested[-1] == "http://cdn/sd/seg-502.ts"
+    assert recorder.segments_written == 2
+
+
+class ImmediateThread:
+    # Runs the refreshes right away on the fake clock. Refreshes started by
+    # them run right away as well, up to a depth, so refreshes that keep
+    # rescheduling themselves end
+    MAX_DEPTH = 3
+    depth = 0
+
+    def __init__(self, target, args=(), name=None, daemon=None):
+        self._target = target
+        self._args = args
+
+    def start(self):
+        if ImmediateThread.depth >= self.MAX_DEPTH:
+            return
+
+        ImmediateThread.depth += 1
+        try:
+            self._target(*self._args)
+        finally:
+            ImmediateThread.depth -= 1
+
+
+def test_record_switches_to_refreshed_link_before_expiry(tmp_path):
+    session = FakeSession([make_playlist(10, 2, ended=True)])
+    old_link = StreamLink("original", "http://cdn/old/index.m3u8?expire=1", codec="h264")
+    new_link = StreamLink("original", "http://cdn/new/index.m3u8?expire=2", codec="h264")
+    refresher = MagicMock(side_effect=[new_link, new_link])
+
+    recorder = HLSRecorder(session, str(tmp_path / "out.ts"), old_link, link_refresher=refresher, clock=FakeClock())
+
+    with patch("tk3u8.core.recorder.threading.Thread", ImmediateThread):
+        recorder.record()
+
+    refresher.assert_any_call(old_link)
+    assert recorder.get_stream_link() is new_link
+    assert session.requested[0] == "http://cdn/new/index.m3u8?expire=2"
+
+
+def test_record_retries_failed_refresh_before_expiry(tmp_path):
+    session = FakeSession([make_playlist(10, 2, ended=True)])
+    old_link = StreamLink("original", "http://cdn/old/index.m3u8?expire=1", codec="h264")
+    new_link = StreamLink("original", "http://cdn/new/index.m3u8?expire=2", codec="h264")
+    results = [ConnectionError("timed out"), old_link, new_link]
+
+    def refresh(stream_link):
+        result = results.pop(0) if len(results) > 1 else results[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    refresher = MagicMock(side_effect=refresh)
+    delays = []
+
+    class RecordingThread(ImmediateThread):
+        def __init__(self, target, args=(), name=None, daemon=None):
+            delays.append(args[0])
+            super().__init__(target, args, name, daemon)
+
+    recorder = HLSRecorder(session, str(tmp_path / "out.ts"), old_link, link_refresher=refresher, clock=FakeClock())
+
+    with patch("tk3u8.core.recorder.threading.Thread", RecordingThread):
+        recorder.record()
+
+    # The link already expired, so the retries are as short as they can be
+    assert refresher.call_count >= 3
+    assert delays[1:3] == [HLSRecorder.MIN_REFRESH_RETRY_DELAY, HLSRecorder.MIN_REFRESH_RETRY_DELAY]
+    assert recorder.get_stream_link() is new_link
+    assert session.requested[0] == "http://cdn/new/index.m3u8?expire=2"
+
+
+def test_record_stops_once_the_expired_link_cant_be_refreshed(tmp_path):
+    session = FakeSession([make_playlist(10, 2)])
+    expired_link = StreamLink("original", "http://cdn/old/index.m3u8?expire=0", codec="h264")
+    refresher = MagicMock(side_effect=ConnectionError("timed out"))
+
+    class DeepThread(ImmediateThread):
+        MAX_DEPTH = 20
+
+    recorder = HLSRecorder(session, str(tmp_path / "out.ts"), expired_link, link_refresher=refresher, clock=FakeClock())
+
+    with patch("tk3u8.core.recorder.threading.Thread", DeepThread), pytest.raises(HLSLinkTemporarilyUnavailableError):
+        recorder.record()
+
+    assert refresher.call_count == HLSRecorder.MAX_EXPIRED_REFRESH_RETRIES + 1
+
+
+def test_refresh_waits_on_the_clock(tmp_path):
+    clock = AcceleratedClock(1000)
+    old_link = StreamLink("original", f"http://cdn/old/index.m3u8?expire={clock.time() + 100:.0f}", codec="h264")
+    new_link = StreamLink("original", "http://cdn/new/index.m3u8", codec="h264")
+    refreshed = threading.Event()
+
+    def refresh(stream_link):
+        refreshed.set()
+        return new_link
+
+    refresher = MagicMock(side_effect=refresh)
+
+    recorder = HLSRecorder(FakeSession([]), str(tmp_path / "out.ts"), old_link, link_refresher=refresher, clock=clock)
+    recorder._schedule_refresh()
+
+    # Refreshed 40 seconds of the clock later, 60 seconds before the link
+    # expires, which is a fraction of a second in real time
+    assert refreshed.wait(5)
+
+
+def test_record_does_not_refresh_links_without_expiry(tmp_path):
+    session = FakeSession([make_playlist(10, 1, ended=True)])
+    refresher = MagicMock()
+
+    recorder = HLSRecorder(session, str(tmp_path / "out.ts"), StreamLink("original", "http://cdn/index.m3u8"), link_refresher=refresher, clock=FakeClock())
+
+    with patch("tk3u8.core.recorder.threading.Thread", ImmediateThread):
+        recorder.record()
+
+    refresher.assert_not_called()
+
+
+def test_record_marks_first_byte_once(tmp_path):
+    session = FakeSession([make_playlist(10, 2, ended=True)])
+    timer = MagicMock()
+    recorder = HLSRecorder(session, str(tmp_path / "out.ts"), StreamLink("original", "http://cdn/index.m3u8"), timer=timer, clock=FakeClock())
+
+    recorder.record()
+
+    timer.mark_engine_started.assert_called_once_with()
+    assert timer.mark_first_byte.call_count == 2
+    assert timer.mark_first_byte.call_args_list[0].args[0] >= 0
+
+
+def test_record_traces_segment_fetch_and_write(tmp_path):
+    trace_path = tmp_path / "spans.jsonl"
+    session = FakeSession([make_playlist(10, 1, ended=True)])
+    recorder = HLSRecorder(session, str(tmp_path / "out.ts"), StreamLink("original", "http://cdn/index.m3u8"), clock=FakeClock())
+
+    tracer.set_exporter(JSONLSpanExporter(str(trace_path)))
+    try:
+        recorder.record()
+    finally:
+        tracer.set_exporter(None)
+
+    spans = {span["name"]: span for span in map(json.loads, trace_path.read_text().splitlines())}
+
+    assert spans["segment_fetch"]["parentSpanId"] == spans["segment"]["spanId"]
+    assert spans["segment_write"]["parentSpanId"] == spans["segment"]["spanId"]
+    assert "parentSpanId" not in spans["playlist_fetch"]
+
+
+def test_record_emits_throttled_segment_stats(tmp_path):
+    writer = MagicMock()
+    session = FakeSession([
+        make_playlist(10, 3),
+        make_playlist(11, 3, ended=True)
+    ])
+    recorder = HLSRecorder(session, str(tmp_path / "out.ts"), StreamLink("original", "http://cdn/index.m3u8"), username="testuser", clock=FakeClock())
+
+    events.add_writer(writer)
+    try:
+        recorder.record()
+    finally:
+        events.remove_writer(writer)
+
+    stats = [call.args[0] for call in writer.write.call_args_list if call.args[0].type == EventType.SEGMENT_STATS]
+
+    # Once for the first segment, and once more when the recording stops
+    assert len(stats) == 2
+    assert stats[0].data["segments_written"] == 1
+    assert stats[-1].data["segments_written"] == 4
+    assert stats[-1].data["bytes_written"] == len(b"seg-10.tsseg-11.tsseg-12.tsseg-13.ts")
+
+
+def test_record_saves_integrity_manifest(tmp_path):
+    class FailingSegmentSession(FakeSession):
+        def get(self, url, timeout=None, stream=False):
+            if url.endswith("seg-16.ts"):
+                self.requested.append(url)
+                return make_response(status_code=404)
+            return super().get(url, timeout, stream)
+
+    session = FailingSegmentSession([
+        make_playlist(10, 2),
+        make_playlist(15, 3, ended=True)
+    ])
+    output_path = tmp_path / "out.ts"
+    output_path.write_bytes(b"existing")
+    manifest_path = tmp_path / "out.manifest.json"
+    recorder = HLSRecorder(session, str(output_path), StreamLink("original", "http://cdn/index.m3u8"), manifest_path=str(manifest_path), clock=FakeClock())
+
+    recorder.record()
+
+    manifest = json.loads(manifest_path.read_text())
+    content = output_path.read_bytes()
+
+    assert manifest["sha256"] == hashlib.sha256(content).hexdigest()
+    assert manifest["bytes"] == len(content)
+    assert manifest["segment_count"] == 4
+    assert manifest["duration"] == 8.0
+    assert [segment["sequence"] for segment in manifest["segments"]] == [10, 11, 15, 17]
+    assert manifest["segments"][0]["offset"] == len(b"existing")
+    assert manifest["segments"][2]["sha256"] == hashlib.sha256(b"seg-15.ts").hexdigest()
+    assert manifest["gaps"] == [
+        {"first_sequence": 12, "last_sequence": 14, "reason": "fell_off_playlist"},
+        {"first_sequence": 16, "last_sequence": 16, "reason": "fetch_failed"}
+    ]
+    assert manifest["missing_segments"] == 4
+    assert manifest["discontinuities"] == [15, 17]
@@ -5,6 +5,7 @@ from tk3u8.exceptions import RequestFailedError
 from tk3u8.options_handler import OptionsHandler
 from tk3u8.paths_handler import PathsHandler
 from tk3u8.session.request_handler import RequestHandler
+from tk3u8.telemetry.metrics import http_request_retries_total, http_requests_total
 
 
 MOCK_CONFIG = {
@@ -84,6 +85,22 @@ def test_get_data_failure_raises(mock_options_handler, mock_session):
     assert '404' in str(exc.value)
 
 
+def test_get_data_records_metrics_per_extractor(mock_options_handler, mock_session):
+    mock_sess = MagicMock()
+    mock_resp = MagicMock()
+
+    mock_resp.status_code = 404
+    mock_sess.get.return_value = mock_resp
+    mock_session.return_value = mock_sess
+
+    handler = RequestHandler(mock_options_handler)
+    with pytest.raises(RequestFailedError):
+        handler.get_data('http://fail', source='MetricsTestExtractor')
+
+    assert http_requests_total.get(extractor='MetricsTestExtractor', status=404) == 3
+    assert http_request_retries_total.get(extractor='MetricsTestExtractor') == 2
+
+
 def test_update_proxy_sets_proxies(mock_options_handler, mock_session):
     mock_sess = MagicMock()
     mock_session.return_value = mock_sess
@@ -0,0 +1,110 @@
+import threading
+from unittest.mock import MagicMock
+from tk3u8.constants import OptionKey
+from tk3u8.core.downloader import Downloader
+from tk3u8.core.scheduler import Clock, Scheduler, countdown, run_task
+
+
+class FakeClock(Clock):
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def wait(self, event, seconds):
+        if not event.is_set():
+            self.sleep(seconds)
+        return event.is_set()
+
+
+def test_countdown_ticks_every_second():
+    clock = FakeClock()
+    ticks = []
+
+    run_task(countdown(3, lambda remaining: ticks.append((remaining, clock.now))), clock)
+
+    assert ticks == [(3, 0), (2, 1), (1, 2), (0, 3)]
+    assert clock.now == 4
+
+
+def test_scheduler_interleaves_tasks_on_one_thread():
+    clock = FakeClock()
+    ticks = []
+    scheduler = Scheduler(clock)
+
+    scheduler.add(countdown(2, lambda remaining: ticks.append(("a", remaining, clock.now))))
+    clock.now += 0.5
+    scheduler.add(countdown(1, lambda remaining: ticks.append(("b", remaining, clock.now))))
+    scheduler.run()
+
+    assert ticks == [
+        ("a", 2, 0.5),
+        ("b", 1, 0.5),
+        ("a", 1, 1),
+        ("b", 0, 1.5),
+        ("a", 0, 2)
+    ]
+    assert scheduler.get_pending_count() == 0
+    # Waiting for both at once takes as long as the longest one
+    assert clock.now == 3
+
+
+def test_scheduler_keeps_running_other_tasks_when_one_fails():
+    def failing_task():
+        yield 1
+        raise ValueError
+
+    clock = FakeClock()
+    ticks = []
+    scheduler = Scheduler(clock)
+
+    scheduler.add(failing_task())
+    scheduler.add(countdown(2, ticks.append))
+    scheduler.run()
+
+    assert ticks == [2, 1, 0]
+
+
+def test_stopping_ends_the_waits():
+    clock = FakeClock()
+    stopped = threading.Event()
+    ticks = []
+
+    def tick(remaining):
+        ticks.append(remaining)
+        if remaining == 2:
+            stopped.set()
+
+    run_task(countdown(3, tick), clock, stopped)
+    assert ticks == [3, 2]
+
+    stopped.clear()
+    scheduler = Scheduler(clock, stopped)
+    scheduler.add(countdown(3, tick))
+    scheduler.run()
+
+    assert ticks == [3, 2, 3, 2]
+    assert scheduler.get_pending_count() == 1
+
+
+def test_downloader_waits_on_injected_clock():
+    clock = FakeClock()
+    options_handler = MagicMock()
+    options_handler.get_option_val.side_effect = lambda key: {OptionKey.TIMEOUT: 30}[key]
+    live = MagicMock()
+
+    downloader = Downloader(MagicMock(), MagicMock(), options_handler, MagicMock(), clock)
+    downloader._pause_rechecking(live, "offline")
+
+    assert clock.sleeps == [1] * 31
+    # Once per remaining second, and once for the check itself
+    assert live.update.call_count == 32
@@ -0,0 +1,59 @@
+import threading
+import time
+from tk3u8.testing.clock import AcceleratedClock
+from tk3u8.testing.soak import SoakSample, SoakTest
+
+
+def _make_sample(elapsed, rss_bytes):
+    return SoakSample(elapsed, rss_bytes, 10, 2, 3, 1, 1, 0, 1, True)
+
+
+def test_accelerated_clock_runs_faster():
+    clock = AcceleratedClock(100, started_at=1000, started_at_monotonic=50)
+
+    started_at = time.monotonic()
+    clock.sleep(10)
+
+    assert time.monotonic() - started_at < 1
+    assert clock.get_elapsed() >= 10
+    assert clock.monotonic() - 50 >= 10
+
+
+def test_accelerated_clock_waits_faster():
+    clock = AcceleratedClock(1000)
+    event = threading.Event()
+
+    started_at = time.monotonic()
+    assert not clock.wait(event, 100)
+    assert time.monotonic() - started_at < 1
+
+    event.set()
+    assert clock.wait(event, 100)
+
+
+def test_growth_is_compared_over_steady_state():
+    soak_test = SoakTest(warmup=0.25, allowed_growth={"rss_bytes": 100})
+    # The warmup grows a lot, then the usage stays flat except for a spike
+    samples = [_make_sample(i, 1000 * i) for i in range(4)]
+    samples += [_make_sample(i, 5000) for i in range(4, 16)]
+    samples[10].rss_bytes = 90000
+
+    growths = {growth.name: growth for growth in soak_test._get_growths(samples)}
+
+    assert growths["rss_bytes"].growth == 0
+    assert growths["rss_bytes"].passed
+
+    samples[-4:] = [_make_sample(i, 6000) for i in range(12, 16)]
+    growths = {growth.name: growth for growth in soak_test._get_growths(samples)}
+
+    assert not growths["rss_bytes"].passed
+
+
+def test_short_soak_stays_flat():
+    soak_test = SoakTest(days=2 / 24, factor=2000, live_hours=1, offline_hours=0.5, sample_interval=300)
+    report = soak_test.run()
+
+    assert report.error is None
+    assert len(report.samples) >= 12
+    assert report.recordings >= 2
+    assert report.passed
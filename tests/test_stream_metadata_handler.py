@@ -1,8 +1,9 @@
+import sys
 import pytest
 from unittest.mock import MagicMock, mock_open, patch
 from tk3u8.core.stream_metadata_handler import StreamMetadataHandler
-from tk3u8.constants import LiveStatus, OptionKey, StreamLink
-from tk3u8.exceptions import InvalidQualityError
+from tk3u8.constants import TIKTOK_BASE_URL, LiveStatus, OptionKey, StreamLink
+from tk3u8.exceptions import InvalidQualityError, InvalidUsernameError, NoUsernameEnteredError, UserNotFoundError
 from tk3u8.options_handler import OptionsHandler
 from tk3u8.paths_handler import PathsHandler
 from tk3u8.session.request_handler import RequestHandler
@@ -52,8 +53,8 @@ def test_initialization_sets_dependencies(request_handler, options_handler):
 
 def test_initialize_data_success(monkeypatch, request_handler, options_handler):
     class MockExtractor:
-        def __init__(self, username, request_handler):
-            pass
+        def __init__(self, username, request_handler, base_url):
+            assert base_url == TIKTOK_BASE_URL
 
         def get_source_data(self):
             return {'mock': 'data'}
@@ -67,44 +68,105 @@ def test_initialize_data_success(monkeypatch, request_handler, options_handler):
         def get_stream_links(self, stream_data):
             return {'original': 'http://mock'}
 
+        def get_start_time(self, source_data):
+            return 1700000000
+
     handler = StreamMetadataHandler(request_handler, options_handler)
     handler._extractor_classes = [MockExtractor]
     handler._get_and_validate_source_data = lambda extractor, extractor_class: {'mock': 'data'}
     handler.initialize_data('testuser')
-    assert handler._username == 'testuser'
-    assert handler._live_status == LiveStatus.LIVE
-    assert handler._stream_links == {'original': 'http://mock'}
-    assert handler._stream_data == {'data': {'original': {'main': {'hls': 'http://mock'}}}}
+    assert handler._state.username == 'testuser'
+    assert handler._state.live_status == LiveStatus.LIVE
+    assert handler._state.stream_links == {'original': 'http://mock'}
+    assert handler._state.stream_bitrates == {}
+    assert handler.get_start_time() == 1700000000
+    assert handler.get_last_process_duration() is not None
+
+
+def get_deep_size(obj, seen=None):
+    seen = seen if seen is not None else set()
+
+    if id(obj) in seen or isinstance(obj, LiveStatus):
+        return 0
+
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+
+    if isinstance(obj, dict):
+        size += sum(get_deep_size(key, seen) + get_deep_size(value, seen) for key, value in obj.items())
+    elif hasattr(obj, "__slots__"):
+        size += sum(get_deep_size(getattr(obj, name), seen) for name in obj.__slots__)
+
+    return size
+
+
+def test_offline_user_only_keeps_a_compact_state(request_handler, options_handler):
+    live_status = LiveStatus.LIVE
+
+    class MockExtractor:
+        def __init__(self, username, request_handler, base_url):
+            pass
+
+        def get_source_data(self):
+            return {'LiveRoom': {'padding': 'x' * 100000}}
+
+        def get_live_status(self, source_data):
+            return live_status
+
+        def get_stream_data(self, source_data):
+            return {'h264': {'data': {'origin': {'main': {'hls': 'http://mock', 'sdk_params': '{"vbitrate": 4000000}'}}}}}
+
+        def get_stream_links(self, stream_data):
+            return {'original': {'h264': 'http://mock'}}
+
+        def get_start_time(self, source_data):
+            return 1700000000
+
+    handler = StreamMetadataHandler(request_handler, options_handler)
+    handler._extractor_classes = [MockExtractor]
+    handler._get_and_validate_source_data = lambda extractor, extractor_class: extractor.get_source_data()
+
+    handler.refresh_data('testuser')
+    assert handler.find_stream_link('original', 'h264') == StreamLink('original', 'http://mock', 4000000, 'h264')
+
+    live_status = LiveStatus.OFFLINE
+    handler.refresh_data()
+
+    assert handler.get_live_status() == LiveStatus.OFFLINE
+    assert handler.get_start_time() is None
+    assert handler.find_stream_link('original', 'h264') is None
+    assert not hasattr(handler._state, '__dict__')
+    assert get_deep_size(handler._state) < 300
 
 
 def test_get_username_returns_correct_value(request_handler, options_handler):
     handler = StreamMetadataHandler(request_handler, options_handler)
-    handler._username = 'abc'
+    handler._state.username = 'abc'
     assert handler.get_username() == 'abc'
 
 
 def test_get_live_status_returns_correct_value(request_handler, options_handler):
     handler = StreamMetadataHandler(request_handler, options_handler)
 
-    handler._live_status = LiveStatus.LIVE
+    handler._state.live_status = LiveStatus.LIVE
     assert handler.get_live_status() == LiveStatus.LIVE
 
-    handler._live_status = LiveStatus.OFFLINE
+    handler._state.live_status = LiveStatus.OFFLINE
     assert handler.get_live_status() == LiveStatus.OFFLINE
 
-    handler._live_status = LiveStatus.PREPARING_TO_GO_LIVE
+    handler._state.live_status = LiveStatus.PREPARING_TO_GO_LIVE
     assert handler.get_live_status() == LiveStatus.PREPARING_TO_GO_LIVE
 
 
 def test_get_stream_link_returns_link_by_codec(request_handler, options_handler):
     handler = StreamMetadataHandler(request_handler, options_handler)
-    handler._stream_links = {
+    handler._state.stream_links = {
         "original": {
             "h264": "http://testh264",
             "h265": "http://testh265"
         }
     }
-    handler._username = "testuser"
+    handler._state.username = "testuser"
 
     # Test for H.265
     link = handler.get_stream_link('original', use_h265=True)
@@ -116,36 +178,125 @@ def test_get_stream_link_returns_link_by_codec(request_handler, options_handler)
     assert link.link == 'http://testh264'
 
 
+def test_get_stream_link_walks_quality_fallback_ladder(request_handler, options_handler):
+    handler = StreamMetadataHandler(request_handler, options_handler)
+    handler._state.stream_links = {
+        "original": {"h264": "http://original264", "h265": "http://original265"},
+        "uhd_60": {"h264": None, "h265": None},
+        "uhd": {"h264": "", "h265": ""},
+        "hd_60": {"h264": "http://hd60264", "h265": "http://hd60265"}
+    }
+    handler._state.username = "testuser"
+    options_handler.save_args_values(quality_fallback=["uhd", "hd_60", "original"])
+
+    link = handler.get_stream_link('uhd_60', use_h265=False)
+    assert link.quality == 'hd_60'
+    assert link.link == 'http://hd60264'
+
+
+def test_get_stream_link_codec_fallback_before_quality_fallback(request_handler, options_handler):
+    handler = StreamMetadataHandler(request_handler, options_handler)
+    handler._state.stream_links = {
+        "original": {"h264": "http://original264", "h265": "http://original265"},
+        "uhd": {"h264": "http://uhd264", "h265": ""}
+    }
+    handler._state.username = "testuser"
+    options_handler.save_args_values(quality_fallback=["original"], codec_fallback=True)
+
+    link = handler.get_stream_link('uhd', use_h265=True)
+    assert link.quality == 'uhd'
+    assert link.link == 'http://uhd264'
+
+
+def test_get_stream_link_without_fallback_keeps_unavailable_link(request_handler, options_handler):
+    handler = StreamMetadataHandler(request_handler, options_handler)
+    handler._state.stream_links = {
+        "original": {"h264": "http://original264", "h265": "http://original265"},
+        "uhd_60": {"h264": None, "h265": None}
+    }
+    handler._state.username = "testuser"
+
+    link = handler.get_stream_link('uhd_60', use_h265=False)
+    assert link.quality == 'uhd_60'
+    assert link.link is None
+
+
+@pytest.mark.parametrize("codec_policy,h265_link,expected_link,expected_codec", [
+    ("prefer_h265", "http://uhd265", "http://uhd265", "h265"),
+    ("prefer_h265", "", "http://uhd264", "h264"),
+    ("h264_only", "http://uhd265", "http://uhd264", "h264"),
+    ("h265_only", "http://uhd265", "http://uhd265", "h265"),
+])
+def test_get_stream_link_follows_codec_policy(request_handler, options_handler, codec_policy, h265_link, expected_link, expected_codec):
+    handler = StreamMetadataHandler(request_handler, options_handler)
+    handler._state.stream_links = {
+        "uhd": {"h264": "http://uhd264", "h265": h265_link}
+    }
+    handler._state.username = "testuser"
+    options_handler.save_args_values(codec_policy=codec_policy)
+
+    link = handler.get_stream_link('uhd', use_h265=False)
+    assert link.link == expected_link
+    assert link.codec == expected_codec
+
+
+@pytest.mark.parametrize("stream_links,expected_link", [
+    ({"uhd": {"h264": "http://uhd264", "h265": "http://uhd265"}}, "http://uhd265"),
+    ({"uhd": {"h264": "http://uhd264", "h265": ""}}, "http://uhd264"),
+    ({"uhd": {"h264": "http://uhd264"}}, "http://uhd264"),
+])
+def test_get_stream_link_prefers_h265_by_default(request_handler, options_handler, stream_links, expected_link):
+    handler = StreamMetadataHandler(request_handler, options_handler)
+    handler._state.stream_links = stream_links
+    handler._state.username = "testuser"
+
+    link = handler.get_stream_link('uhd', use_h265=None)
+    assert link.link == expected_link
+
+
+def test_get_stream_variants_prefers_h265(request_handler, options_handler):
+    handler = StreamMetadataHandler(request_handler, options_handler)
+    handler._state.stream_links = {
+        "original": {"h264": "http://original264", "h265": "http://original265"},
+        "sd": {"h264": "http://sd264", "h265": ""}
+    }
+    handler._state.stream_bitrates = {
+        "original": {"h264": 4000000, "h265": 2500000},
+        "sd": {"h264": 800000, "h265": 500000}
+    }
+    options_handler.save_args_values(codec_policy="prefer_h265")
+
+    variants = handler.get_stream_variants(use_h265=False)
+    assert variants == [StreamLink("original", "http://original265", 2500000, "h265")]
+
+
 def test_get_stream_link_invalid_quality_raises(request_handler, options_handler):
     handler = StreamMetadataHandler(request_handler, options_handler)
-    handler._stream_links = {'original': 'http://test'}
+    handler._state.stream_links = {'original': 'http://test'}
     with pytest.raises(InvalidQualityError):
         handler.get_stream_link('origgg', use_h265=True)
 
 
-def test_validate_username_empty_exits(monkeypatch, request_handler, options_handler):
+def test_validate_username_empty_raises(monkeypatch, request_handler, options_handler):
     handler = StreamMetadataHandler(request_handler, options_handler)
-    with patch('tk3u8.core.stream_metadata_handler.exit', side_effect=SystemExit):
-        with pytest.raises(SystemExit):
-            handler._validate_username('')
+    with pytest.raises(NoUsernameEnteredError):
+        handler._validate_username('')
 
 
-def test_validate_username_invalid_exits(monkeypatch, request_handler, options_handler):
+def test_validate_username_invalid_raises(monkeypatch, request_handler, options_handler):
     handler = StreamMetadataHandler(request_handler, options_handler)
-    with patch('tk3u8.core.stream_metadata_handler.exit', side_effect=SystemExit):
-        with pytest.raises(SystemExit):
-            handler._validate_username('bad!user')
+    with pytest.raises(InvalidUsernameError):
+        handler._validate_username('bad!user')
 
 
 def test_get_and_validate_source_data_user_not_exists(monkeypatch, request_handler, options_handler):
-    """Tests whether the program exits whenever that the user doesn't exist
+    """Tests whether an error is raised whenever that the user doesn't exist
     from the API/webpage extraction."""
     handler = StreamMetadataHandler(request_handler, options_handler)
-    handler._username = "abc"
+    handler._state.username = "abc"
     extractor = MagicMock()
     extractor_class = MagicMock()
     monkeypatch.setattr('tk3u8.core.stream_metadata_handler.is_user_exists', lambda c, d: False)
     monkeypatch.setattr('tk3u8.core.stream_metadata_handler.console.print', lambda *a, **k: None)
-    with patch('tk3u8.core.stream_metadata_handler.exit', side_effect=SystemExit):
-        with pytest.raises(SystemExit):
-            handler._get_and_validate_source_data(extractor, extractor_class)
+    with pytest.raises(UserNotFoundError):
+        handler._get_and_validate_source_data(extractor, extractor_class)
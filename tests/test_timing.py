@@ -0,0 +1,42 @@
+from unittest.mock import MagicMock
+from tk3u8.core.timing import RecordingTimer
+
+
+def test_timer_breaks_down_time_to_first_byte():
+    clock = MagicMock()
+    clock.monotonic.side_effect = [100.0, 100.5, 102.0, 103.25]
+    clock.time.return_value = 1000.0
+
+    timer = RecordingTimer("testuser", start_time=990, metadata_duration=0.8, clock=clock)
+    timer.set_engine("native")
+    timer.mark_link_resolved()
+    timer.mark_engine_started()
+    timer.mark_first_byte(ttfb=0.3)
+
+    assert timer.first_byte_written.is_set()
+    assert timer.get_timings().to_dict() == {
+        "username": "testuser",
+        "engine": "native",
+        "detection_lag": 10.0,
+        "metadata": 0.8,
+        "link_resolution": 0.5,
+        "engine_startup": 1.5,
+        "first_segment": 1.25,
+        "first_segment_ttfb": 0.3,
+        "total": 3.25
+    }
+
+
+def test_timer_only_marks_each_stage_once():
+    clock = MagicMock()
+    clock.monotonic.side_effect = [0.0, 1.0, 5.0]
+
+    timer = RecordingTimer("testuser", start_time=None, metadata_duration=None, clock=clock)
+    timer.mark_first_byte()
+    timer.mark_first_byte()
+    timer.mark_link_resolved()
+
+    timings = timer.get_timings()
+    assert timings.detection_lag is None
+    assert timings.total == 1.0
+    assert timings.link_resolution == 5.0
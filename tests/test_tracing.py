@@ -0,0 +1,51 @@
+import json
+import pytest
+from tk3u8.telemetry.tracing import JSONLSpanExporter, Tracer
+
+
+@pytest.fixture()
+def trace_path(tmp_path):
+    return tmp_path / "traces" / "spans.jsonl"
+
+
+def read_spans(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_disabled_tracer_yields_no_span():
+    with Tracer().start_span("process_data") as span:
+        assert span is None
+
+
+def test_child_spans_share_trace_and_point_to_parent(trace_path):
+    tracer = Tracer()
+    tracer.set_exporter(JSONLSpanExporter(str(trace_path)))
+
+    with tracer.start_span("process_data", username="foo"):
+        with tracer.start_span("http_request", kind="CLIENT", retry=1) as span:
+            span.set_attribute("status", 200)
+
+    tracer.set_exporter(None)
+    child, parent = read_spans(trace_path)
+
+    assert child["traceId"] == parent["traceId"]
+    assert child["parentSpanId"] == parent["spanId"]
+    assert "parentSpanId" not in parent
+    assert child["kind"] == "SPAN_KIND_CLIENT"
+    assert {"key": "retry", "value": {"intValue": "1"}} in child["attributes"]
+    assert {"key": "status", "value": {"intValue": "200"}} in child["attributes"]
+    assert {"key": "username", "value": {"stringValue": "foo"}} in parent["attributes"]
+    assert int(parent["endTimeUnixNano"]) >= int(child["endTimeUnixNano"])
+
+
+def test_span_records_error(trace_path):
+    tracer = Tracer()
+    tracer.set_exporter(JSONLSpanExporter(str(trace_path)))
+
+    with pytest.raises(ValueError):
+        with tracer.start_span("segment"):
+            raise ValueError("boom")
+
+    tracer.set_exporter(None)
+
+    assert read_spans(trace_path)[0]["status"] == {"code": "STATUS_CODE_ERROR", "message": "ValueError: boom"}
@@ -0,0 +1,162 @@
+import os
+import signal
+import threading
+import time
+import pytest
+from tk3u8.constants import DownloadStatus, LiveStatus
+from tk3u8.core import workers
+from tk3u8.core.workers import RecordingJob, WorkerPool, _Worker
+from tk3u8.exceptions import DownloadCancelledError, WorkerLostError, WorkerPoolClosedError
+from tk3u8.session.request_handler import RequestHandler
+from tk3u8.session.bandwidth import HostCoordinatorClient
+from tk3u8.testing.clock import AcceleratedClock
+from tk3u8.testing.fake_server import FakeTikTokServer
+
+
+@pytest.fixture
+def clock():
+    return AcceleratedClock(20)
+
+
+@pytest.fixture
+def server(clock):
+    server = FakeTikTokServer(clock=clock, bitrate_scale=0.01)
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def pool(server, tmp_path):
+    config_file = tmp_path / "config.toml"
+    config_file.write_text(f'[config]\nbase_url = "{server.base_url}"\ntimeout = 1\n')
+
+    pool = WorkerPool(2, program_data_dir=str(tmp_path), config_file_path=str(config_file), downloads_dir=str(tmp_path))
+    pool.start()
+    yield pool
+    pool.stop()
+
+
+def wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+class FakeProcess:
+    def __init__(self, alive=True):
+        self.alive = alive
+        self.pid = None
+
+    def is_alive(self):
+        return self.alive
+
+
+class FakeConnection:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, message):
+        self.sent.append(message)
+
+
+def test_submit_picks_the_least_loaded_worker():
+    pool = WorkerPool(3)
+    pool._workers = [_Worker(index, FakeProcess(), FakeConnection()) for index in range(3)]
+    pool._workers[0].jobs[100] = RecordingJob(100, "alice")
+    pool._workers[1].cpu_load = 0.5
+    pool._accepting = True
+
+    job = pool.submit("bob", "hd", "/downloads", {"headless": True, "codec_policy": "h265_only"})
+
+    assert job.job_id in pool._workers[2].jobs
+    assert pool._workers[2].connection.sent == [("record", job.job_id, "bob", "hd", "/downloads", {"codec_policy": "h265_only", "wait_until_live": False})]
+
+    pool._workers[2].process.alive = False
+    pool.submit("carol", "hd")
+    assert len(pool._workers[1].jobs) == 1
+
+    pool._accepting = False
+    with pytest.raises(WorkerPoolClosedError):
+        pool.submit("dave", "hd")
+
+
+def test_workers_share_the_bandwidth_budget():
+    pool = WorkerPool(2)
+    pool._workers = [_Worker(index, FakeProcess(), FakeConnection()) for index in range(2)]
+    pool._accepting = True
+    pool._start_bandwidth_coordinator()
+
+    try:
+        pool.submit("alice", "hd", options={"max_bandwidth": 1000})
+        pool.submit("bob", "hd", options={"max_bandwidth": 1000})
+
+        ports = {worker.connection.sent[0][5]["bandwidth_coordinator_port"] for worker in pool._workers}
+        assert len(ports) == 1
+        port = ports.pop()
+
+        # Each worker syncs its recordings with the coordinator of the pool,
+        # the same as its bandwidth limiter does
+        clients = [HostCoordinatorClient(port) for _ in pool._workers]
+        for _ in range(2):
+            allocations = [client.sync(1_000_000, {username: 0}) for client, username in zip(clients, ["alice", "bob"])]
+
+        assert allocations == [{"alice": 500_000}, {"bob": 500_000}]
+
+        # A host-wide coordinator is used instead of the one of the pool
+        pool.submit("carol", "hd", options={"max_bandwidth": 1000, "bandwidth_coordinator_port": 48613})
+        assert pool._workers[0].connection.sent[-1][5]["bandwidth_coordinator_port"] == 48613
+    finally:
+        pool._stop_bandwidth_coordinator()
+
+
+def test_drain_lets_recordings_finish(server, clock, pool, tmp_path):
+    server.add_user("testuser", [(0, LiveStatus.LIVE), (40, LiveStatus.OFFLINE)], added_at=clock.time())
+
+    handle = pool.start_download("testuser", "sd", engine="native")
+    wait_for(lambda: handle.get_stats().recording)
+    pool.drain(timeout=60)
+
+    assert handle.wait(10)
+    assert handle.get_status() == DownloadStatus.FINISHED
+    assert handle.get_stats().segments_written > 0
+    assert any(name.startswith("testuser") for name in os.listdir(tmp_path))
+
+
+def test_lost_worker_fails_its_recording_and_is_restarted(server, clock, pool):
+    server.add_user("testuser", [(0, LiveStatus.LIVE)], added_at=clock.time())
+
+    handle = pool.start_download("testuser", "sd", engine="native")
+    wait_for(lambda: handle.get_stats().recording)
+
+    pids = pool.get_pids()
+    busy_index = next(index for index, load in enumerate(pool.get_loads()) if load[0])
+    os.kill(pids[busy_index], signal.SIGKILL)
+
+    assert handle.wait(10)
+    with pytest.raises(WorkerLostError):
+        handle.result()
+
+    wait_for(lambda: pool.get_pids()[busy_index] != pids[busy_index])
+    assert len(pool.get_pids()) == 2
+    assert pool.get_pids()[1 - busy_index] == pids[1 - busy_index]
+
+
+def test_watching_closes_its_session(server, pool, monkeypatch):
+    server.add_user("testuser", [(0, LiveStatus.OFFLINE)])
+    closed = []
+
+    class ClosingRequestHandler(RequestHandler):
+        def close(self):
+            closed.append(True)
+            super().close()
+
+    monkeypatch.setattr(workers, "RequestHandler", ClosingRequestHandler)
+    cancelled = threading.Event()
+    cancelled.set()
+
+    with pytest.raises(DownloadCancelledError):
+        pool._watch("testuser", "sd", None, {}, cancelled)
+
+    assert closed == [True]
@@ -1,7 +1,8 @@
 import argparse
+from typing import List, Optional
 from rich_argparse import RichHelpFormatter
 from tk3u8.cli.utils import display_version
-from tk3u8.constants import Quality
+from tk3u8.constants import AUTO_QUALITY, CodecPolicy, Engine, ProfileMode, Quality
 
 
 class ArgsHandler():
@@ -30,10 +31,10 @@ class ArgsHandler():
         )
         self._parser.add_argument(
             "-q",
-            choices=[quality.value for quality in Quality],
+            choices=[quality.value for quality in Quality] + [AUTO_QUALITY],
             default=Quality.ORIGINAL.value,
             dest="quality",
-            help="Specify the quality of the video to download. Default: original"
+            help="Specify the quality of the video to download, or 'auto' to pick it based on the available bandwidth. Default: original"
         )
         self._parser.add_argument(
             "--proxy",
@@ -59,7 +60,94 @@ class ArgsHandler():
         self._parser.add_argument(
             "--use-h265",
             action="store_true",
-            help="Use the H.265 (HEVC) encoded live stream instead of H.264 (AVC)",
+            help="Use the H.265 (HEVC) encoded live stream only. By default, it's preferred over H.264 (AVC) when available",
+            default=None
+        )
+        self._parser.add_argument(
+            "--quality-fallback",
+            nargs="+",
+            choices=[quality.value for quality in Quality],
+            dest="quality_fallback",
+            help="The qualities to fall back to, in order, when the chosen quality is not available",
+            default=None
+        )
+        self._parser.add_argument(
+            "--codec-fallback",
+            action="store_true",
+            help="Fall back to the other video codec when the chosen codec is not available",
+            default=None
+        )
+        self._parser.add_argument(
+            "--codec-policy",
+            choices=[policy.value for policy in CodecPolicy],
+            dest="codec_policy",
+            help="Choose the video codec by policy. Overrides --use-h265 and --codec-fallback",
+            default=None
+        )
+        self._parser.add_argument(
+            "--engine",
+            choices=[engine.value for engine in Engine],
+            help="The engine to use for downloading the stream. Default: yt-dlp",
+            default=None
+        )
+        self._parser.add_argument(
+            "--max-bandwidth",
+            help="The total download bandwidth (in kbps) shared by all recordings",
+            type=int,
+            dest="max_bandwidth",
+            default=None
+        )
+        self._parser.add_argument(
+            "--min-bandwidth",
+            help="The minimum download bandwidth (in kbps) guaranteed for this recording",
+            type=int,
+            dest="min_bandwidth",
+            default=None
+        )
+        self._parser.add_argument(
+            "--priority",
+            help="The share of the bandwidth left after the minimums that this recording gets, relative to the others. Default: 1",
+            type=int,
+            dest="priority",
+            default=None
+        )
+        self._parser.add_argument(
+            "--bandwidth-coordinator-port",
+            help="Share the bandwidth limit with other tk3u8 processes on this host through a local socket on this port",
+            type=int,
+            dest="bandwidth_coordinator_port",
+            default=None
+        )
+        self._parser.add_argument(
+            "--metrics-port",
+            help="Serve Prometheus metrics on http://127.0.0.1:<port>/metrics",
+            type=int,
+            dest="metrics_port",
+            default=None
+        )
+        self._parser.add_argument(
+            "--profile",
+            choices=[mode.value for mode in ProfileMode],
+            help="Profile CPU usage or memory allocations, and write the reports to the 'profiles' folder in the program data directory",
+            dest="profile",
+            default=None
+        )
+        self._parser.add_argument(
+            "--trace-file",
+            help="Write tracing spans of each poll and recording phase to this JSONL file",
+            dest="trace_file",
+            default=None
+        )
+        self._parser.add_argument(
+            "--headless",
+            action="store_true",
+            help="Turn off the rich output, and write the lifecycle events as lines of JSON to stdout instead",
+            default=None
+        )
+        self._parser.add_argument(
+            "--dashboard",
+            action="store_true",
+            help="Show a single dashboard of the users being watched, redrawn at a capped rate",
             default=None
         )
         self._parser.add_argument(
@@ -84,3 +172,174 @@ class ArgsHandler():
             action="version",
             version=display_version()
         )
+
+
+class DaemonArgsHandler():
+    """Parses the arguments of 'tk3u8 daemon'. Only the options that apply
+    to the whole daemon are arguments, while the others are set in the
+    'config' table of the config file."""
+
+    def __init__(self) -> None:
+        self._parser: argparse.ArgumentParser = argparse.ArgumentParser(
+            prog="tk3u8 daemon",
+            description="tk3u8 - Watches every user on the watchlist of the config file, and applies the changes to it without restarting",
+            formatter_class=RichHelpFormatter
+        )
+        self._init_args()
+
+    def parse_args(self, argv: Optional[List[str]] = None) -> argparse.Namespace:
+        return self._parser.parse_args(argv)
+
+    def _init_args(self) -> None:
+        self._parser.add_argument(
+            "--reload-interval",
+            help="How often to check the config file for changes, in seconds. Default: 2",
+            type=float,
+            dest="reload_interval",
+            default=2
+        )
+        self._parser.add_argument(
+            "--workers",
+            help="Record in a pool of worker processes, one for each CPU core unless a number is given. Stopping the daemon then lets the recordings in progress finish first",
+            type=int,
+            nargs="?",
+            const=0,
+            default=None
+        )
+        self._parser.add_argument(
+            "--cluster",
+            help="Share the watchlist with the other daemons using the same cluster database, splitting the users between them",
+            metavar="DATABASE_PATH",
+            default=None
+        )
+        self._parser.add_argument(
+            "--node-id",
+            help="The name of this daemon in the cluster, which must be unique. Default: <hostname>-<pid>",
+            dest="node_id",
+            default=None
+        )
+        self._parser.add_argument(
+            "--lease-ttl",
+            help="How long a daemon that stopped responding keeps its users before the others take them over, in seconds. Default: 30",
+            type=float,
+            dest="lease_ttl",
+            default=30
+        )
+        self._parser.add_argument(
+            "--headless",
+            action="store_true",
+            help="Turn off the rich output, and write the lifecycle events as lines of JSON to stdout instead",
+            default=None
+        )
+        self._parser.add_argument(
+            "--dashboard",
+            action="store_true",
+            help="Show a single dashboard of the users being watched, redrawn at a capped rate",
+            default=None
+        )
+        self._parser.add_argument(
+            "--metrics-port",
+            help="Serve Prometheus metrics on http://127.0.0.1:<port>/metrics",
+            type=int,
+            dest="metrics_port",
+            default=None
+        )
+        self._parser.add_argument(
+            "--config-file",
+            help="The path of the config file with the watchlist",
+            default=None
+        )
+        self._parser.add_argument(
+            "--download-dir",
+            help="The directory where stream downloads will be stored, unless the user has its own output",
+            default=None
+        )
+        self._parser.add_argument(
+            "--log-level",
+            help="Set the logging level (default: no logging if not used)",
+            choices=["DEBUG", "ERROR"],
+            dest="log_level"
+        )
+
+
+class JoinArgsHandler():
+    """Parses the arguments of 'tk3u8 join'."""
+
+    def __init__(self) -> None:
+        self._parser: argparse.ArgumentParser = argparse.ArgumentParser(
+            prog="tk3u8 join",
+            description="tk3u8 - Joins the recordings of each live session of a user into one file, without re-encoding",
+            formatter_class=RichHelpFormatter
+        )
+        self._init_args()
+
+    def parse_args(self, argv: Optional[List[str]] = None) -> argparse.Namespace:
+        return self._parser.parse_args(argv)
+
+    def _init_args(self) -> None:
+        self._parser.add_argument(
+            "username",
+            help="The user whose recordings are joined"
+        )
+        self._parser.add_argument(
+            "--max-gap",
+            help="How long a recording may start after the one before it finished to be joined with it, if the start of the live stream is unknown, in seconds. Default: 300",
+            type=float,
+            dest="max_gap",
+            default=300
+        )
+        self._parser.add_argument(
+            "--delete-parts",
+            action="store_true",
+            help="Delete the recordings once they're joined",
+            dest="delete_parts"
+        )
+        self._parser.add_argument(
+            "--config-file",
+            help="The path of the config file",
+            default=None
+        )
+        self._parser.add_argument(
+            "--download-dir",
+            help="The directory where stream downloads are stored",
+            default=None
+        )
+        self._parser.add_argument(
+            "--log-level",
+            help="Set the logging level (default: no logging if not used)",
+            choices=["DEBUG", "ERROR"],
+            dest="log_level"
+        )
+
+
+class UploadArgsHandler():
+    """Parses the arguments of 'tk3u8 upload'."""
+
+    def __init__(self) -> None:
+        self._parser: argparse.ArgumentParser = argparse.ArgumentParser(
+            prog="tk3u8 upload",
+            description="tk3u8 - Finishes uploading the recordings whose uploads were interrupted",
+            formatter_class=RichHelpFormatter
+        )
+        self._init_args()
+
+    def parse_args(self, argv: Optional[List[str]] = None) -> argparse.Namespace:
+        return self._parser.parse_args(argv)
+
+    def _init_args(self) -> None:
+        self._parser.add_argument(
+            "--config-file",
+            help="The path of the config file",
+            default=None
+        )
+        self._parser.add_argument(
+            "--download-dir",
+            help="The directory where stream downloads are stored",
+            default=None
+        )
+        self._parser.add_argument(
+            "--log-level",
+            help="Set the logging level (default: no logging if not used)",
+            choices=["DEBUG", "ERROR"],
+            dest="log_level"
+        )
@@ -1,11 +1,106 @@
+from contextlib import nullcontext
+import threading
+from typing import Any, ContextManager
 from rich.console import Console
-from rich.live import Live  # noqa: F401
+from rich.errors import LiveError
+from rich.live import Live as RichLive
+from rich.status import Status
 from rich.table import Table
+from tk3u8.telemetry.events import events, stdout_writer
 
 
 console = Console()
 
 
+class Live(RichLive):
+    """Live display that isn't started at all while the console of the
+    program is quiet, e.g., in the headless mode, so no thread is left
+    redrawing nothing.
+
+    Only one live display can be shown at a time, so it's also not started
+    while another download in the same process shows one."""
+
+    def start(self, refresh: bool = False) -> None:
+        if console.quiet:
+            return
+
+        try:
+            super().start(refresh)
+        except LiveError:
+            pass
+
+    def __enter__(self) -> 'Live':
+        super().__enter__()
+        return self
+
+
+class HeadlessOutput:
+    """
+    Output of the headless mode, which turns off the rich output of the
+    program and writes the lifecycle events to stdout instead. It's shared by
+    every download of the process that runs in the headless mode, and is
+    only turned off once the last of them stopped it.
+
+    Attributes:
+        _lock (threading.Lock): Guards the count of the downloads.
+        _starts (int): Number of downloads that started the output.
+        _was_quiet (bool): Whether the console was quiet before the output
+            was started, which is restored once it's stopped.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._starts = 0
+        self._was_quiet = False
+
+    def start(self) -> None:
+        with self._lock:
+            self._starts += 1
+
+            if self._starts > 1:
+                return
+
+            self._was_quiet = console.quiet
+            console.quiet = True
+            events.add_writer(stdout_writer)
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._starts == 0:
+                return
+
+            self._starts -= 1
+
+            if self._starts > 0:
+                return
+
+            events.remove_writer(stdout_writer)
+            console.quiet = self._was_quiet
+
+
+headless_output = HeadlessOutput()
+
+
+def status(message: str) -> ContextManager[Any]:
+    """Shows a spinner with the message until the block exits, unless the
+    console is quiet."""
+    if console.quiet:
+        return nullcontext()
+
+    return _Status(message, console=console)
+
+
+class _Status(Status):
+    """Spinner that isn't shown while another download in the same process
+    shows one, the same as 'Live'."""
+
+    def start(self) -> None:
+        try:
+            super().start()
+        except LiveError:
+            pass
+
+
 def render_lines(*args: str) -> Table:
     table = Table.grid()
     for message in args:
@@ -0,0 +1,151 @@
+from dataclasses import dataclass
+import threading
+import time
+from typing import Dict, Optional
+from rich.console import Console
+from rich.live import Live as RichLive
+from rich.table import Table
+from tk3u8.cli.console import console as program_console
+from tk3u8.constants import EventType
+from tk3u8.telemetry.events import Event, events
+
+
+@dataclass
+class _UserRow:
+    username: str
+    status: str = "-"
+    polled_at: Optional[float] = None
+    quality: str = "-"
+    segments_written: Optional[int] = None
+    segments_dropped: Optional[int] = None
+    bytes_written: Optional[int] = None
+    bytes_per_second: Optional[int] = None
+    last_event: str = "-"
+
+
+class Dashboard:
+    """
+    One consolidated view of every user being watched in this process,
+    built from their lifecycle events instead of each of them drawing on the
+    terminal by itself.
+
+    Events only update the rows, while the view is redrawn in the
+    background at most 'refresh_rate' times per second, so the cost of
+    drawing it stays the same however many users are watched.
+
+    The console of the program is kept quiet while the dashboard is shown,
+    and is restored once it's stopped.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._rows: Dict[str, _UserRow] = {}
+        self._live: Optional[RichLive] = None
+        self._was_quiet = False
+
+    def is_running(self) -> bool:
+        return self._live is not None
+
+    def start(self, refresh_rate: float = 2, console: Optional[Console] = None) -> None:
+        if self._live:
+            return
+
+        # The console of the program is kept quiet while the dashboard is
+        # shown, so the dashboard draws on a console of its own
+        self._was_quiet = program_console.quiet
+        program_console.quiet = True
+        self._live = RichLive(
+            get_renderable=self.render,
+            console=console or Console(),
+            refresh_per_second=refresh_rate,
+            auto_refresh=True
+        )
+        self._live.start()
+        events.add_writer(self)
+
+    def stop(self) -> None:
+        if not self._live:
+            return
+
+        events.remove_writer(self)
+        self._live.stop()
+        self._live = None
+        program_console.quiet = self._was_quiet
+
+    def write(self, event: Event) -> None:
+        with self._lock:
+            row = self._rows.get(event.username)
+            if row is None:
+                row = self._rows[event.username] = _UserRow(event.username)
+
+            _apply_event(row, event)
+
+    def render(self) -> Table:
+        now = time.time()
+        table = Table("User", "Status", "Checked", "Quality", "Segments", "Dropped", "Size", "Rate", "Last event", title="tk3u8")
+
+        with self._lock:
+            rows = sorted(self._rows.values(), key=lambda row: row.username)
+
+            for row in rows:
+                table.add_row(
+                    f"@{row.username}",
+                    row.status,
+                    f"{now - row.polled_at:.0f}s ago" if row.polled_at else "-",
+                    row.quality,
+                    _format_count(row.segments_written),
+                    _format_count(row.segments_dropped),
+                    _format_bytes(row.bytes_written),
+                    f"{row.bytes_per_second * 8 / 1000:.0f} kbps" if row.bytes_per_second is not None else "-",
+                    row.last_event
+                )
+
+        return table
+
+
+def _apply_event(row: _UserRow, event: Event) -> None:
+    data = event.data
+    row.last_event = event.type.value
+
+    if event.type == EventType.POLLED:
+        row.polled_at = event.timestamp
+        if row.status != "recording":
+            row.status = data.get("live_status", row.status)
+    elif event.type == EventType.WENT_LIVE:
+        row.status = "live"
+    elif event.type == EventType.RECORDING_STARTED:
+        row.status = "recording"
+        row.quality = data.get("quality") or "-"
+        row.segments_written = row.segments_dropped = row.bytes_written = row.bytes_per_second = None
+    elif event.type == EventType.SEGMENT_STATS:
+        row.segments_written = data.get("segments_written")
+        row.segments_dropped = data.get("segments_dropped")
+        row.bytes_written = data.get("bytes_written")
+        row.bytes_per_second = data.get("bytes_per_second")
+    elif event.type == EventType.RECORDING_FINISHED:
+        row.status = "finished" if data.get("ok") else "failed"
+        row.bytes_written = data.get("bytes", row.bytes_written)
+        row.bytes_per_second = None
+    elif event.type == EventType.ERROR:
+        row.status = "error"
+        row.last_event = f"error: {data.get('error')}"
+
+
+def _format_count(count: Optional[int]) -> str:
+    return f"{count:,}" if count is not None else "-"
+
+
+def _format_bytes(size: Optional[int]) -> str:
+    if size is None:
+        return "-"
+
+    value = float(size)
+    for unit in ("B", "KiB", "MiB"):
+        if value < 1024:
+            return f"{value:.0f} {unit}"
+        value /= 1024
+
+    return f"{value:.1f} GiB"
+
+
+dashboard = Dashboard()
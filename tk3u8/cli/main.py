@@ -1,10 +1,26 @@
-from tk3u8.cli.args_handler import ArgsHandler
+import os
+import sys
+from typing import List
+from tk3u8.cli.args_handler import ArgsHandler, DaemonArgsHandler, JoinArgsHandler, UploadArgsHandler
 from tk3u8.cli.logging import setup_logging
+from tk3u8.exceptions import JoinError, Tk3u8Error, UploadError
 
 
 def start_cli() -> None:
     from tk3u8.core.model import Tk3u8
 
+    if sys.argv[1:2] == ["daemon"]:
+        start_daemon(sys.argv[2:])
+        return
+
+    if sys.argv[1:2] == ["join"]:
+        start_join(sys.argv[2:])
+        return
+
+    if sys.argv[1:2] == ["upload"]:
+        start_upload(sys.argv[2:])
+        return
+
     ah = ArgsHandler()
     args = ah.parse_args()
 
@@ -16,18 +32,118 @@ def start_cli() -> None:
     log_level = args.log_level
     force_redownload = args.force_redownload
     use_h265 = args.use_h265
+    quality_fallback = args.quality_fallback
+    codec_fallback = args.codec_fallback
+    codec_policy = args.codec_policy
+    engine = args.engine
+    max_bandwidth = args.max_bandwidth
+    min_bandwidth = args.min_bandwidth
+    priority = args.priority
+    bandwidth_coordinator_port = args.bandwidth_coordinator_port
+    metrics_port = args.metrics_port
+    trace_file = args.trace_file
+    profile = args.profile
+    headless = args.headless
+    dashboard = args.dashboard
     config_file_path = args.config_file
     download_dir = args.download_dir
 
     setup_logging(log_level)
 
-    tk3u8 = Tk3u8(config_file_path=config_file_path, downloads_dir=download_dir)
-    tk3u8.set_proxy(proxy)
-    tk3u8.download(
-        username=username,
-        quality=quality,
-        wait_until_live=wait_until_live,
-        timeout=timeout,
-        force_redownload=force_redownload,
-        use_h265=use_h265
-    )
+    # The errors are already shown by the time they're raised, so only the
+    # exit code is left
+    try:
+        tk3u8 = Tk3u8(config_file_path=config_file_path, downloads_dir=download_dir, profile=profile)
+        tk3u8.set_proxy(proxy)
+        tk3u8.download(
+            username=username,
+            quality=quality,
+            wait_until_live=wait_until_live,
+            timeout=timeout,
+            force_redownload=force_redownload,
+            use_h265=use_h265,
+            quality_fallback=quality_fallback,
+            codec_fallback=codec_fallback,
+            codec_policy=codec_policy,
+            engine=engine,
+            max_bandwidth=max_bandwidth,
+            min_bandwidth=min_bandwidth,
+            priority=priority,
+            bandwidth_coordinator_port=bandwidth_coordinator_port,
+            metrics_port=metrics_port,
+            trace_file=trace_file,
+            headless=headless,
+            dashboard=dashboard
+        )
+    except Tk3u8Error as e:
+        exit(e.exit_code)
+
+
+def start_daemon(argv: List[str]) -> None:
+    from tk3u8.core.cluster import SQLiteCoordinator
+    from tk3u8.core.daemon import Daemon
+
+    args = DaemonArgsHandler().parse_args(argv)
+    setup_logging(args.log_level)
+
+    try:
+        daemon = Daemon(
+            config_file_path=args.config_file,
+            downloads_dir=args.download_dir,
+            reload_interval=args.reload_interval,
+            workers=args.workers,
+            coordinator=SQLiteCoordinator(args.cluster, lease_ttl=args.lease_ttl) if args.cluster else None,
+            node_id=args.node_id,
+            headless=args.headless,
+            dashboard=args.dashboard,
+            metrics_port=args.metrics_port
+        )
+        daemon.run()
+    except KeyboardInterrupt:
+        pass
+    except Tk3u8Error as e:
+        exit(e.exit_code)
+
+
+def start_join(argv: List[str]) -> None:
+    from tk3u8.cli.console import console
+    from tk3u8.core.joiner import join_sessions
+    from tk3u8.messages import messages
+    from tk3u8.paths_handler import PathsHandler
+
+    args = JoinArgsHandler().parse_args(argv)
+    setup_logging(args.log_level)
+
+    try:
+        paths_handler = PathsHandler(config_file_path=args.config_file, downloads_dir=args.download_dir)
+        join_sessions(os.path.join(paths_handler.DOWNLOAD_DIR, args.username), args.max_gap, args.delete_parts)
+    except JoinError as e:
+        console.print(messages.join_failed.format(error=e))
+        exit(e.exit_code)
+    except Tk3u8Error as e:
+        exit(e.exit_code)
+
+
+def start_upload(argv: List[str]) -> None:
+    from tk3u8.cli.console import console
+    from tk3u8.core.uploader import UploadTarget, resume_uploads
+    from tk3u8.messages import messages
+    from tk3u8.options_handler import OptionsHandler
+    from tk3u8.paths_handler import PathsHandler
+
+    args = UploadArgsHandler().parse_args(argv)
+    setup_logging(args.log_level)
+
+    try:
+        paths_handler = PathsHandler(config_file_path=args.config_file, downloads_dir=args.download_dir)
+        upload_target = UploadTarget.from_options(OptionsHandler(paths_handler))
+
+        if upload_target is None:
+            raise UploadError("No 'upload_url' is set in the config file")
+
+        resume_uploads(paths_handler.DOWNLOAD_DIR, upload_target.client)
+    except UploadError as e:
+        console.print(messages.resuming_uploads_failed.format(error=e))
+        exit(e.exit_code)
+    except Tk3u8Error as e:
+        exit(e.exit_code)
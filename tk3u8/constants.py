@@ -1,11 +1,14 @@
 from dataclasses import dataclass
 from enum import Enum
+from typing import Optional
 
 
 @dataclass
 class StreamLink:
     quality: str
     link: str
+    bitrate: Optional[int] = None
+    codec: Optional[str] = None
 
 
 class StatusCode(Enum):
@@ -29,12 +32,61 @@ class Quality(Enum):
     SD = "sd"
 
 
+# Special quality value that lets the program pick the quality based on
+# the available bandwidth
+AUTO_QUALITY = "auto"
+
+# Base URL of the pages and API where the stream data is fetched from
+TIKTOK_BASE_URL = "https://www.tiktok.com"
+
+
+class CodecPolicy(Enum):
+    PREFER_H265 = "prefer_h265"
+    H264_ONLY = "h264_only"
+    H265_ONLY = "h265_only"
+
+
+class Engine(Enum):
+    YT_DLP = "yt-dlp"
+    NATIVE = "native"
+
+
+class ProfileMode(Enum):
+    CPU = "cpu"
+    MEM = "mem"
+
+
+class EventType(Enum):
+    POLLED = "polled"
+    STATUS_CHANGED = "status_changed"
+    WENT_LIVE = "went_live"
+    RECORDING_STARTED = "recording_started"
+    SEGMENT_WRITTEN = "segment_written"
+    SEGMENT_STATS = "segment_stats"
+    RECORDING_FINISHED = "recording_finished"
+    ERROR = "error"
+
+
+class DownloadStatus(Enum):
+    RUNNING = "running"
+    FINISHED = "finished"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
 class LiveStatus(Enum):
     LIVE = "live"
     PREPARING_TO_GO_LIVE = "preparting_to_go_live"
     OFFLINE = "offline"
 
 
+# Display names of the video codecs offered by the source
+CODEC_NAMES = {
+    "h264": "H.264",
+    "h265": "H.265"
+}
+
+
 class OptionKey(Enum):
     SESSIONID_SS = "sessionid_ss"
     TT_TARGET_IDC = "tt_target_idc"
@@ -45,6 +97,29 @@ class OptionKey(Enum):
     TIMEOUT = "timeout"
     FORCE_REDOWNLOAD = "force_redownload"
     USE_H265 = "use_h265"
+    QUALITY_FALLBACK = "quality_fallback"
+    CODEC_FALLBACK = "codec_fallback"
+    CODEC_POLICY = "codec_policy"
+    ENGINE = "engine"
+    MAX_BANDWIDTH = "max_bandwidth"
+    MIN_BANDWIDTH = "min_bandwidth"
+    PRIORITY = "priority"
+    BANDWIDTH_COORDINATOR_PORT = "bandwidth_coordinator_port"
+    LINK_REFRESH_MARGIN = "link_refresh_margin"
+    PREWARM_CONNECTIONS = "prewarm_connections"
+    DNS_CACHE_TTL = "dns_cache_ttl"
+    METRICS_PORT = "metrics_port"
+    TRACE_FILE = "trace_file"
+    BASE_URL = "base_url"
+    HEADLESS = "headless"
+    DASHBOARD = "dashboard"
+    DASHBOARD_REFRESH_RATE = "dashboard_refresh_rate"
+    UPLOAD_URL = "upload_url"
+    UPLOAD_ACCESS_KEY = "upload_access_key"
+    UPLOAD_SECRET_KEY = "upload_secret_key"
+    UPLOAD_REGION = "upload_region"
+    UPLOAD_PART_SIZE = "upload_part_size"
+    UPLOAD_MAX_SPOOLED_PARTS = "upload_max_spooled_parts"
 
 
 @dataclass
@@ -56,9 +131,36 @@ class Messages:
     reattempting_download: str = "[grey50]Reattempting download for user [b]@{username}[/b]...[/grey50]"
     awaiting_to_go_live: str = "User [b]@{username}[/b] is [red]currently offline[/red]. Awaiting [b]@{username}[/b] to start streaming..."
     quality_not_available: str = "[grey50]Cannot proceed with downloading. The chosen quality [b]({quality})[/b] is not available for download.[/grey50]"
+    falling_back_to_quality: str = "[grey50]The chosen quality [b]({quality}, {codec})[/b] is not available. Falling back to [b]{fallback_quality}, {fallback_codec}[/b] instead.[/grey50]"
     empty_stream_link_error: str = "Cannot proceed with downloading as the stream link was somehow unavailable during stream data extraction. Try downloading again."
     starting_download: str = "Starting download for user [b]@{username}[/b] [grey50](quality: {stream_link.quality}, stream Link: {stream_link.link})[/grey50]"
-    finished_downloading: str = "[green]Finished downloading[/green] [b]{filename}.mp4[/b] [grey50](saved at: {filename_with_download_dir})[/grey50]"
+    switching_quality: str = "[grey50]Switching quality from [b]{old_quality}[/b] to [b]{new_quality}[/b] (measured throughput: {throughput_kbps} kbps)[/grey50]"
+    no_auto_quality_variants: str = "[grey50]Cannot proceed with downloading. No stream links with known bitrates are available for the [b]auto[/b] quality.[/grey50]"
+    bandwidth_allocated: str = "[grey50]Bandwidth allocated for this recording: [b]{allocation_kbps} kbps[/b] (shared between {recordings_count} recording(s) in this process)[/grey50]"
+    stream_ended: str = "[grey50]The live stream of user [b]@{username}[/b] has ended.[/grey50]"
+    serving_metrics: str = "[grey50]Serving metrics on [b]{url}[/b][/grey50]"
+    tracing_failed: str = "[grey50]Cannot write traces to [b]{path}[/b] ({error}). Continuing without tracing.[/grey50]"
+    metrics_server_failed: str = "[grey50]Cannot serve metrics on port [b]{port}[/b] ({error}). Continuing without the metrics endpoint.[/grey50]"
+    watchlist_user_added: str = "[grey50]Watching user [b]@{username}[/b][/grey50]"
+    watchlist_user_removed: str = "[grey50]No longer watching user [b]@{username}[/b] once its recording is done, if any[/grey50]"
+    watchlist_user_changed: str = "[grey50]Watching user [b]@{username}[/b] with the new settings once its recording is done, if any[/grey50]"
+    watchlist_loading_error: str = "Cannot load the watchlist from the config file ({error})."
+    watchlist_user_failed: str = "Stopped watching user [b]@{username}[/b] due to {error}. It will be watched again once its settings in the watchlist change."
+    cluster_joined: str = "[grey50]Joined the cluster as node [b]{node_id}[/b][/grey50]"
+    cluster_lease_lost: str = "[grey50]User [b]@{username}[/b] was taken over by another node, no longer watching it[/grey50]"
+    cluster_unavailable: str = "[grey50]Cannot reach the cluster ({error}). Still watching the users as before.[/grey50]"
+    joining_session: str = "[grey50]Joining [b]{count}[/b] recordings into [b]{path}[/b][/grey50]"
+    session_already_joined: str = "[grey50]Skipping the session already joined into [b]{path}[/b][/grey50]"
+    no_sessions_to_join: str = "[grey50]No recordings to join were found.[/grey50]"
+    join_failed: str = "Cannot join the recordings ({error})."
+    resuming_upload: str = "[grey50]Resuming the upload spooled at [b]{path}[/b][/grey50]"
+    upload_finished: str = "[green]Finished uploading[/green] [b]{key}[/b]"
+    no_uploads_to_resume: str = "[grey50]No interrupted uploads were found.[/grey50]"
+    upload_failed: str = "Cannot upload the recording ({error}). What wasn't uploaded yet is kept at [b]{path}[/b], run [b]tk3u8 upload[/b] to finish uploading it."
+    resuming_uploads_failed: str = "Cannot finish the interrupted uploads ({error})."
+    watchlist_reload_failed: str = "[grey50]Cannot apply the changed watchlist ({error}). Still watching the users as before.[/grey50]"
+    finished_downloading: str = "[green]Finished downloading[/green] [b]{filename}[/b] [grey50](saved at: {filename_with_download_dir})[/grey50]"
+    finished_uploading: str = "[green]Finished downloading[/green] [b]{filename}[/b] [grey50](uploaded to: {key})[/grey50]"
     cancelled_checking_live: str = "[grey50]Checking cancelled by user. Exiting...[/grey50]"
     retrying_to_check_live: str = "[bold yellow]Retrying in {remaining} seconds{seconds_extra_space}"
     ongoing_checking_live: str = "[grey50]Checking...[/grey50]"
@@ -0,0 +1,173 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+import bisect
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from tk3u8.core.scheduler import Clock, system_clock
+from tk3u8.exceptions import CoordinatorError
+
+
+logger = logging.getLogger(__name__)
+
+
+class HashRing:
+    """
+    Assigns keys to nodes by consistent hashing. Each node is placed on the
+    ring 'replicas' times, and a key belongs to the first node after it on
+    the ring, so adding or removing a node only moves the keys of its
+    share, while the rest stay where they were.
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), replicas: int = 64) -> None:
+        self._ring: List[Tuple[int, str]] = sorted(
+            (_hash(f"{node}#{replica}"), node) for node in set(nodes) for replica in range(replicas)
+        )
+        self._hashes = [point for point, _ in self._ring]
+
+    def get_node(self, key: str) -> Optional[str]:
+        """Gets the node the key belongs to, or None if there are no
+        nodes."""
+        if not self._ring:
+            return None
+
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._ring)
+
+        return self._ring[index][1]
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class Coordinator(ABC):
+    """
+    Abstract base class for sharing the watchlist between daemons on many
+    nodes. Nodes keep themselves in the cluster with heartbeats, and each
+    user is recorded by the node holding its lease.
+
+    Both heartbeats and leases expire after 'lease_ttl' seconds unless
+    they're renewed, so the users of a node that died are taken over by the
+    others once it's gone for that long. Subclasses must raise
+    'CoordinatorError' when the shared state can't be reached.
+    """
+
+    def __init__(self, lease_ttl: float = 30) -> None:
+        self.lease_ttl = lease_ttl
+
+    @abstractmethod
+    def heartbeat(self, node_id: str) -> None:
+        """Adds the node to the cluster, or keeps it there."""
+
+    @abstractmethod
+    def leave(self, node_id: str) -> None:
+        """Removes the node from the cluster, and releases its leases, so
+        its users are taken over right away."""
+
+    @abstractmethod
+    def get_nodes(self) -> List[str]:
+        """Gets the nodes whose heartbeats haven't expired."""
+
+    @abstractmethod
+    def acquire(self, username: str, node_id: str) -> bool:
+        """Takes the lease of the user for the node, or renews it if the
+        node already holds it. Returns False if another node holds it."""
+
+    @abstractmethod
+    def release(self, username: str, node_id: str) -> None:
+        """Gives up the lease of the user, if the node holds it."""
+
+    @abstractmethod
+    def get_owners(self) -> Dict[str, str]:
+        """Gets the node holding the lease of each user."""
+
+
+class SQLiteCoordinator(Coordinator):
+    """
+    Coordinates the nodes through a SQLite database on a path they all
+    share, e.g., the daemons on one machine, or on machines that mount the
+    same disk with working file locks. Every change is made in a
+    transaction that holds the write lock of the database, so nodes never
+    take the same lease at once.
+    """
+
+    def __init__(self, path: str, lease_ttl: float = 30, clock: Clock = system_clock) -> None:
+        super().__init__(lease_ttl)
+        self.path = os.path.abspath(path)
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._connection.execute("CREATE TABLE IF NOT EXISTS nodes (node_id TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS leases (username TEXT PRIMARY KEY, node_id TEXT NOT NULL, expires_at REAL NOT NULL)")
+        except (OSError, sqlite3.Error) as e:
+            raise CoordinatorError(f"The cluster database at {self.path} can't be opened: {e}")
+
+    def heartbeat(self, node_id: str) -> None:
+        self._execute(
+            "INSERT INTO nodes (node_id, expires_at) VALUES (?, ?) ON CONFLICT (node_id) DO UPDATE SET expires_at = excluded.expires_at",
+            (node_id, self._clock.time() + self.lease_ttl)
+        )
+
+    def leave(self, node_id: str) -> None:
+        with self._transaction() as cursor:
+            cursor.execute("DELETE FROM nodes WHERE node_id = ?", (node_id,))
+            cursor.execute("DELETE FROM leases WHERE node_id = ?", (node_id,))
+
+    def get_nodes(self) -> List[str]:
+        rows = self._execute("SELECT node_id FROM nodes WHERE expires_at > ? ORDER BY node_id", (self._clock.time(),))
+        return [node_id for node_id, in rows]
+
+    def acquire(self, username: str, node_id: str) -> bool:
+        now = self._clock.time()
+
+        with self._transaction() as cursor:
+            cursor.execute(
+                "INSERT INTO leases (username, node_id, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (username) DO UPDATE SET node_id = excluded.node_id, expires_at = excluded.expires_at "
+                "WHERE leases.node_id = excluded.node_id OR leases.expires_at <= ?",
+                (username, node_id, now + self.lease_ttl, now)
+            )
+            return cursor.rowcount > 0
+
+    def release(self, username: str, node_id: str) -> None:
+        self._execute("DELETE FROM leases WHERE username = ? AND node_id = ?", (username, node_id))
+
+    def get_owners(self) -> Dict[str, str]:
+        rows = self._execute("SELECT username, node_id FROM leases WHERE expires_at > ?", (self._clock.time(),))
+        return dict(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def _execute(self, sql: str, parameters: tuple) -> list:
+        with self._transaction() as cursor:
+            cursor.execute(sql, parameters)
+            return cursor.fetchall()
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Cursor]:
+        """Runs the statements in it as one transaction, which holds the
+        write lock of the database from the start."""
+        with self._lock:
+            try:
+                cursor = self._connection.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+            except sqlite3.Error as e:
+                raise CoordinatorError(f"The cluster database at {self.path} can't be locked: {e}")
+
+            try:
+                yield cursor
+                cursor.execute("COMMIT")
+            except sqlite3.Error as e:
+                self._connection.rollback()
+                raise CoordinatorError(f"The cluster database at {self.path} can't be written: {e}")
+            except BaseException:
+                self._connection.rollback()
+                raise
@@ -0,0 +1,603 @@
+from dataclasses import dataclass
+import logging
+import os
+import socket
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+import toml
+from toml import TomlDecodeError
+from tk3u8.cli.console import console
+from tk3u8.cli.dashboard import dashboard
+from tk3u8.constants import AUTO_QUALITY, CodecPolicy, DownloadStatus, OptionKey, Quality
+from tk3u8.core.cluster import Coordinator, HashRing
+from tk3u8.core.handle import DownloadHandle
+from tk3u8.core.helper import is_username_valid
+from tk3u8.core.model import Tk3u8
+from tk3u8.core.scheduler import Clock, Scheduler, Task, system_clock
+from tk3u8.core.workers import WorkerPool
+from tk3u8.exceptions import (
+    ConfigFileError,
+    CoordinatorError,
+    InvalidArgKeyError,
+    InvalidCookieError,
+    InvalidProfileModeError,
+    InvalidQualityError,
+    InvalidUsernameError,
+    Tk3u8Error,
+    UserNotFoundError,
+    WorkerError
+)
+from tk3u8.messages import messages
+from tk3u8.options_handler import OptionsHandler
+from tk3u8.paths_handler import PathsHandler
+
+
+logger = logging.getLogger(__name__)
+
+
+# Errors that watching the user again won't get past, so the user is only
+# watched again once its settings in the watchlist change
+PERMANENT_ERRORS = (
+    UserNotFoundError,
+    InvalidUsernameError,
+    InvalidQualityError,
+    InvalidCookieError,
+    InvalidArgKeyError,
+    InvalidProfileModeError
+)
+
+
+@dataclass(frozen=True)
+class WatchEntry:
+    """
+    A user on the watchlist, and the settings its streams are downloaded
+    with.
+
+    Attributes:
+        username (str): The user to watch.
+        quality (str): The quality to download, or "auto".
+        codec_policy (str | None): The policy for choosing the video codec.
+            If None, the 'codec_policy' option is used.
+        output (str | None): The download directory. If None, the download
+            directory of the daemon is used.
+        priority (int): The share of the bandwidth left after the minimums
+            that the recordings of the user get, relative to the others.
+    """
+    username: str
+    quality: str = Quality.ORIGINAL.value
+    codec_policy: Optional[str] = None
+    output: Optional[str] = None
+    priority: int = 1
+
+
+def load_watchlist(config_file_path: str) -> Dict[str, WatchEntry]:
+    """
+    Loads the watchlist from the 'watchlist' table of the config file, which
+    has a table for each user:
+
+        [watchlist.foo]
+        quality = "hd"
+        codec_policy = "prefer_h265"
+        output = "D:/recordings"
+        priority = 2
+
+    Every key is optional, so an empty table watches the user with the
+    defaults. Raises 'ConfigFileError' if the file or the watchlist is
+    invalid.
+    """
+    try:
+        with open(config_file_path, "r") as file:
+            config = toml.load(file)
+    except (OSError, UnicodeDecodeError):
+        raise ConfigFileError(f"The watchlist can't be read from {config_file_path}.")
+    except TomlDecodeError as e:
+        raise ConfigFileError(f"Error decoding config file due to: '{e.msg} (line {e.lineno} column {e.colno} char {e.pos})'")
+
+    raw_watchlist = config.get("watchlist", {})
+    if not isinstance(raw_watchlist, dict):
+        raise ConfigFileError("The watchlist must be a table with a table for each user.")
+
+    return {username: _parse_watch_entry(username, values) for username, values in raw_watchlist.items()}
+
+
+def _parse_watch_entry(username: str, values: Any) -> WatchEntry:
+    if not is_username_valid(username):
+        raise ConfigFileError(f"The username '{username}' in the watchlist is invalid.")
+
+    if not isinstance(values, dict):
+        raise ConfigFileError(f"The watchlist entry of user @{username} must be a table.")
+
+    invalid_keys = values.keys() - {"quality", "codec_policy", "output", "priority"}
+    if invalid_keys:
+        raise ConfigFileError(f"The watchlist entry of user @{username} has invalid keys: {', '.join(sorted(invalid_keys))}")
+
+    entry = WatchEntry(username, **values)
+
+    if entry.quality not in [quality.value for quality in Quality] + [AUTO_QUALITY]:
+        raise ConfigFileError(f"The quality '{entry.quality}' of user @{username} is invalid.")
+
+    if entry.codec_policy is not None and entry.codec_policy not in [policy.value for policy in CodecPolicy]:
+        raise ConfigFileError(f"The codec policy '{entry.codec_policy}' of user @{username} is invalid.")
+
+    if entry.output is not None and not isinstance(entry.output, str):
+        raise ConfigFileError(f"The output of user @{username} must be a path.")
+
+    if not isinstance(entry.priority, int) or entry.priority < 1:
+        raise ConfigFileError(f"The priority of user @{username} must be a positive integer.")
+
+    return entry
+
+
+class _Watcher:
+    """
+    Keeps downloading the streams of a user in the background, which
+    happens on the handle of its current download.
+
+    Attributes:
+        entry (WatchEntry): The settings of the current download.
+        handle (DownloadHandle | None): The current download, if started.
+        pending_entry (WatchEntry | None): New settings that are used once
+            the current download is done.
+        removed (bool): Whether the user was removed from the watchlist, so
+            it's no longer watched once the current download is done.
+        restart_at (float | None): When the download is started again after
+            it failed.
+        failures (int): Number of times in a row the download failed without
+            recording anything, which the wait before restarting it grows
+            with.
+        failed_for_good (bool): Whether the download failed with an error
+            that restarting it won't get past.
+        tk3u8 (Tk3u8 | None): The instance of the current download, if it's
+            run in this process.
+    """
+
+    def __init__(self, entry: WatchEntry) -> None:
+        self.entry = entry
+        self.handle: Optional[DownloadHandle] = None
+        self.pending_entry: Optional[WatchEntry] = None
+        self.removed = False
+        self.restart_at: Optional[float] = None
+        self.failures = 0
+        self.failed_for_good = False
+        self.tk3u8: Optional[Tk3u8] = None
+
+    def is_recording(self) -> bool:
+        return self.handle is not None and not self.handle.done() and self.handle.get_stats().recording
+
+    def stop_waiting(self) -> None:
+        """Cancels the current download, unless it's recording, in which
+        case it's left to finish by itself."""
+        if self.handle and not self.is_recording():
+            self.handle.cancel()
+
+    def close(self) -> None:
+        """Closes the instance of the last download, which must be done."""
+        if self.tk3u8:
+            self.tk3u8.close()
+            self.tk3u8 = None
+
+
+class Daemon:
+    """
+    Watches every user on the watchlist of the config file in one process,
+    each of them with a download that waits until they're live, and starts
+    again once the recording is done.
+
+    The config file is checked for changes every 'reload_interval' seconds.
+    Each reload only applies what changed in the watchlist: new users are
+    watched, removed users are no longer watched, and users whose settings
+    changed are watched again with the new settings. Recordings in progress
+    are never interrupted, so the changes to their users are only applied
+    once they're done. Changes to the 'config' table are applied to each
+    user as it's watched again.
+
+    If 'workers' is given, the users are recorded in a pool of that many
+    worker processes, or one for each CPU core if it's 0, while they're
+    still polled in this process. Stopping the daemon then drains the pool,
+    letting the recordings in progress finish first.
+
+    If a coordinator is given, the daemon is a node of a cluster that
+    shares the watchlist, and only watches the users assigned to it by
+    consistent hashing over the nodes in the cluster, once it holds their
+    leases. When nodes join or leave, the users are moved between them, and
+    the ones of a node that died are taken over once its leases expire. A
+    user that moved away is still recorded here until the recording is
+    done, and its lease is only released then.
+
+    A download that failed is started again after 'RESTART_DELAY' seconds,
+    which doubles with each failure in a row up to 'MAX_RESTART_DELAY'.
+    Users whose download failed with one of 'PERMANENT_ERRORS', e.g.,
+    because they don't exist, are no longer watched until their settings
+    in the watchlist change.
+
+    The reloads and the restarts run on the given clock, which is passed on
+    to the downloads and the workers as well.
+    """
+
+    RESTART_DELAY = 30
+    MAX_RESTART_DELAY = 30 * 60
+
+    def __init__(
+            self,
+            program_data_dir: Optional[str] = None,
+            config_file_path: Optional[str] = None,
+            downloads_dir: Optional[str] = None,
+            reload_interval: float = 2,
+            workers: Optional[int] = None,
+            coordinator: Optional[Coordinator] = None,
+            node_id: Optional[str] = None,
+            clock: Clock = system_clock,
+            **download_options: Any
+    ) -> None:
+        self._program_data_dir = program_data_dir
+        self._paths_handler = PathsHandler(program_data_dir, config_file_path, downloads_dir)
+        self._options_handler = OptionsHandler(self._paths_handler)
+        self._options_handler.save_args_values(**download_options)
+        self._reload_interval = reload_interval
+        self._download_options = download_options
+        self._lock = threading.Lock()
+        self._watchers: Dict[str, _Watcher] = {}
+        self._file_stamp: Optional[Tuple[int, int]] = None
+        self._stopped = threading.Event()
+        self._coordinator = coordinator
+        self._node_id = node_id or f"{socket.gethostname()}-{os.getpid()}"
+        self._watchlist: Dict[str, WatchEntry] = {}
+        self._leased: Set[str] = set()
+        self._clock = clock
+        self._pool = WorkerPool(workers or None, program_data_dir, config_file_path, downloads_dir, clock) if workers is not None else None
+
+    def run(self) -> None:
+        """Watches the users on the watchlist until 'stop()' is called.
+        Raises 'ConfigFileError' if the watchlist is invalid at the
+        start."""
+        self._file_stamp = self._get_file_stamp()
+
+        try:
+            watchlist = load_watchlist(self._paths_handler.CONFIG_FILE_PATH)
+        except ConfigFileError as e:
+            error_msg = messages.watchlist_loading_error.format(error=e)
+            console.print(error_msg)
+            logger.error(error_msg)
+            raise
+
+        started_dashboard = self._start_dashboard()
+
+        if self._pool:
+            self._pool.start()
+
+        if self._coordinator:
+            console.print(messages.cluster_joined.format(node_id=self._node_id))
+
+        self._apply_watchlist(watchlist)
+
+        scheduler = Scheduler(self._clock, self._stopped)
+        scheduler.add(self._build_supervision())
+
+        try:
+            scheduler.run()
+        finally:
+            self._stop_watchers()
+            self._leave_cluster()
+
+            if started_dashboard:
+                dashboard.stop()
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def reload(self) -> bool:
+        """Applies the watchlist again if the config file changed. Returns
+        whether it was applied. An invalid watchlist is skipped, and the
+        users keep being watched as they were."""
+        file_stamp = self._get_file_stamp()
+
+        if file_stamp == self._file_stamp:
+            return False
+
+        self._file_stamp = file_stamp
+
+        try:
+            watchlist = load_watchlist(self._paths_handler.CONFIG_FILE_PATH)
+        except ConfigFileError as e:
+            error_msg = messages.watchlist_reload_failed.format(error=e)
+            console.print(error_msg)
+            logger.error(error_msg)
+            return False
+
+        logger.debug("Config file changed, applying the watchlist again")
+        self._apply_watchlist(watchlist)
+
+        return True
+
+    def apply(self, watchlist: Dict[str, WatchEntry]) -> None:
+        """Applies what changed in the watchlist since it was last applied."""
+        with self._lock:
+            for username in self._watchers.keys() - watchlist.keys():
+                removed_watcher = self._watchers[username]
+
+                if not removed_watcher.removed:
+                    console.print(messages.watchlist_user_removed.format(username=username))
+                    removed_watcher.removed = True
+                    removed_watcher.stop_waiting()
+
+            for username, entry in watchlist.items():
+                watcher = self._watchers.get(username)
+
+                if watcher is None:
+                    console.print(messages.watchlist_user_added.format(username=username))
+                    self._watchers[username] = _Watcher(entry)
+                    continue
+
+                watcher.removed = False
+
+                if entry == (watcher.pending_entry or watcher.entry):
+                    continue
+
+                console.print(messages.watchlist_user_changed.format(username=username))
+
+                if watcher.is_recording():
+                    logger.debug(f"User @{username} is being recorded, applying the changes once it's done")
+
+                watcher.pending_entry = entry
+                watcher.stop_waiting()
+
+        self._supervise()
+
+    def sync(self) -> None:
+        """Keeps this node in the cluster, and watches the users assigned
+        to it that it could take the leases of. Renews the leases of the
+        users being watched, and releases the ones no longer watched. If the
+        cluster can't be reached, the users keep being watched as they
+        were."""
+        assert self._coordinator is not None
+
+        try:
+            self._coordinator.heartbeat(self._node_id)
+            ring = HashRing(self._coordinator.get_nodes())
+
+            with self._lock:
+                watched = set(self._watchers)
+
+            assigned = {username: entry for username, entry in self._watchlist.items() if ring.get_node(username) == self._node_id}
+            owned: Dict[str, WatchEntry] = {}
+            lost = set()
+
+            for username in sorted(assigned.keys() | watched):
+                if not self._coordinator.acquire(username, self._node_id):
+                    if username in watched:
+                        lost.add(username)
+                elif username in assigned:
+                    owned[username] = assigned[username]
+
+            for username in self._leased - watched - owned.keys():
+                self._coordinator.release(username, self._node_id)
+
+            self._leased = (watched - lost) | owned.keys()
+        except CoordinatorError as e:
+            error_msg = messages.cluster_unavailable.format(error=e)
+            console.print(error_msg)
+            logger.error(error_msg)
+            return
+
+        self._stop_lost_watchers(lost)
+        self.apply(owned)
+
+    def get_node_id(self) -> str:
+        return self._node_id
+
+    def get_watchlist(self) -> Dict[str, WatchEntry]:
+        """Gets the users being watched, with the settings of their current
+        downloads."""
+        with self._lock:
+            return {username: watcher.entry for username, watcher in self._watchers.items() if not watcher.removed}
+
+    def get_handle(self, username: str) -> Optional[DownloadHandle]:
+        with self._lock:
+            watcher = self._watchers.get(username)
+            return watcher.handle if watcher else None
+
+    def _apply_watchlist(self, watchlist: Dict[str, WatchEntry]) -> None:
+        if self._coordinator:
+            self._watchlist = watchlist
+            self.sync()
+        else:
+            self.apply(watchlist)
+
+    def _stop_lost_watchers(self, usernames: Set[str]) -> None:
+        """Stops watching the users whose leases were taken by other nodes,
+        e.g., after this node couldn't renew them in time, since they're
+        now recorded there."""
+        with self._lock:
+            for username in usernames:
+                watcher = self._watchers.get(username)
+
+                if watcher is None:
+                    continue
+
+                console.print(messages.cluster_lease_lost.format(username=username))
+                del self._watchers[username]
+
+                if watcher.handle:
+                    watcher.handle.cancel()
+
+    def _leave_cluster(self) -> None:
+        if not self._coordinator:
+            return
+
+        try:
+            self._coordinator.leave(self._node_id)
+        except CoordinatorError as e:
+            logger.error(f"Leaving the cluster failed due to: {e}")
+
+        self._leased = set()
+
+    def _build_supervision(self) -> Task:
+        """Builds the loop of the daemon, which applies the changes to the
+        watchlist and restarts the downloads every reload interval."""
+        while True:
+            yield self._reload_interval
+
+            if not self.reload() and self._coordinator:
+                self.sync()
+
+            self._supervise()
+
+    def _supervise(self) -> None:
+        """Starts the downloads of new users, and starts again the ones that
+        are done, with their pending settings if any."""
+        with self._lock:
+            for username, watcher in list(self._watchers.items()):
+                handle = watcher.handle
+
+                if handle and not handle.done():
+                    continue
+
+                if watcher.removed:
+                    watcher.close()
+                    del self._watchers[username]
+                    continue
+
+                if watcher.pending_entry:
+                    watcher.entry, watcher.pending_entry = watcher.pending_entry, None
+                    watcher.restart_at = None
+                    watcher.failures = 0
+                    watcher.failed_for_good = False
+                elif watcher.failed_for_good:
+                    continue
+                elif handle and watcher.restart_at is None:
+                    if handle.get_stats().recordings:
+                        watcher.failures = 0
+
+                    if handle.get_status() == DownloadStatus.FAILED:
+                        self._handle_failure(watcher, handle.get_error())
+
+                        if watcher.failed_for_good:
+                            continue
+
+                if watcher.restart_at is not None and self._clock.monotonic() < watcher.restart_at:
+                    continue
+
+                watcher.restart_at = None
+                self._start_watcher(watcher)
+
+    def _start_watcher(self, watcher: _Watcher) -> None:
+        entry = watcher.entry
+        download_options = {
+            **self._download_options,
+            "wait_until_live": True,
+            "codec_policy": entry.codec_policy or self._download_options.get("codec_policy"),
+            "priority": entry.priority
+        }
+
+        if self._pool:
+            downloads_dir = entry.output or self._paths_handler.DOWNLOAD_DIR
+            watcher.handle = self._pool.start_download(entry.username, entry.quality, downloads_dir, **download_options)
+            return
+
+        # The config file may have changed since the last download, so a new
+        # instance is made for each of them
+        watcher.close()
+
+        try:
+            watcher.tk3u8 = Tk3u8(
+                program_data_dir=self._program_data_dir,
+                config_file_path=self._paths_handler.CONFIG_FILE_PATH,
+                downloads_dir=entry.output or self._paths_handler.DOWNLOAD_DIR,
+                clock=self._clock
+            )
+            watcher.handle = watcher.tk3u8.start_download(entry.username, quality=entry.quality, **download_options)
+        except Tk3u8Error as e:
+            logger.error(f"Watching user @{entry.username} failed to start due to {type(e).__name__}: {e}")
+            watcher.handle = None
+            watcher.close()
+            self._handle_failure(watcher, e)
+
+    def _handle_failure(self, watcher: _Watcher, error: Optional[BaseException]) -> None:
+        """Stops watching the user for good if the error is permanent, or
+        schedules the next restart with an exponential backoff otherwise."""
+        if _is_permanent_error(error):
+            error_name = error.error if isinstance(error, WorkerError) else type(error).__name__
+            error_msg = messages.watchlist_user_failed.format(username=watcher.entry.username, error=error_name)
+            console.print(error_msg)
+            logger.error(error_msg)
+            watcher.failed_for_good = True
+            return
+
+        delay = min(self.RESTART_DELAY * 2 ** watcher.failures, self.MAX_RESTART_DELAY)
+        watcher.failures += 1
+        watcher.restart_at = self._clock.monotonic() + delay
+        logger.debug(f"Watching user @{watcher.entry.username} again in {delay} seconds (failures in a row: {watcher.failures})")
+
+    def _stop_watchers(self) -> None:
+        with self._lock:
+            watchers = list(self._watchers.values())
+            self._watchers.clear()
+
+        if self._pool:
+            self._drain_pool(watchers)
+            return
+
+        handles = [watcher.handle for watcher in watchers if watcher.handle]
+
+        for handle in handles:
+            handle.cancel()
+
+        for handle in handles:
+            handle.wait()
+
+        for watcher in watchers:
+            watcher.close()
+
+    def _drain_pool(self, watchers: List[_Watcher]) -> None:
+        """Stops waiting for the users who aren't being recorded, and lets
+        the recordings in progress finish. Interrupting it again stops them
+        right away instead, keeping what was recorded."""
+        assert self._pool is not None
+
+        for watcher in watchers:
+            watcher.stop_waiting()
+
+        try:
+            self._pool.drain()
+        except KeyboardInterrupt:
+            self._pool.stop()
+            raise
+        finally:
+            for watcher in watchers:
+                if watcher.handle:
+                    watcher.handle.cancel()
+                    watcher.handle.wait()
+
+    def _start_dashboard(self) -> bool:
+        """Starts the dashboard for the whole daemon, so it isn't stopped
+        and started again along with the downloads of each user."""
+        show_dashboard = self._options_handler.get_option_val(OptionKey.DASHBOARD)
+        headless = self._options_handler.get_option_val(OptionKey.HEADLESS)
+        refresh_rate = self._options_handler.get_option_val(OptionKey.DASHBOARD_REFRESH_RATE)
+
+        assert isinstance(show_dashboard, bool)
+        assert isinstance(headless, bool)
+        assert isinstance(refresh_rate, (int, float))
+
+        if not show_dashboard or headless or dashboard.is_running():
+            return False
+
+        dashboard.start(refresh_rate)
+
+        return True
+
+    def _get_file_stamp(self) -> Optional[Tuple[int, int]]:
+        try:
+            stat = os.stat(self._paths_handler.CONFIG_FILE_PATH)
+        except OSError:
+            return None
+
+        return stat.st_mtime_ns, stat.st_size
+
+
+def _is_permanent_error(error: Optional[BaseException]) -> bool:
+    # The errors of the recordings in the workers only keep their names
+    if isinstance(error, WorkerError):
+        return error.error in {error_class.__name__ for error_class in PERMANENT_ERRORS}
+
+    return isinstance(error, PERMANENT_ERRORS)
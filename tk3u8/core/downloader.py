@@ -1,77 +1,164 @@
 from datetime import datetime
 import logging
 import os
-import time
+import threading
+from typing import TYPE_CHECKING, Callable, List, Optional, Tuple
+import requests
 from yt_dlp import YoutubeDL
-from tk3u8.constants import LiveStatus, OptionKey, StreamLink
+from yt_dlp.postprocessor.common import PostProcessor
+from tk3u8.constants import AUTO_QUALITY, Engine, EventType, LiveStatus, OptionKey, StreamLink
 from tk3u8.cli.console import console, Live, render_lines
-from tk3u8.exceptions import DownloadError, QualityNotAvailableError
+from tk3u8.exceptions import (
+    DownloadCancelledError,
+    DownloadError,
+    HLSLinkTemporarilyUnavailableError,
+    QualityNotAvailableError,
+    UploadError,
+    UserNotLiveError,
+    UserPreparingForLiveError
+)
 from tk3u8.messages import messages
 from tk3u8.options_handler import OptionsHandler
+from tk3u8.core.metadata import RecordingMetadata, get_manifest_path
+from tk3u8.core.quality_selector import AutoQualitySelector
+from tk3u8.core.recorder import HLSRecorder
+from tk3u8.core.scheduler import Clock, Task, countdown, run_task, system_clock
 from tk3u8.core.stream_metadata_handler import StreamMetadataHandler
+from tk3u8.core.timing import RecordingTimer, RecordingTimings
+from tk3u8.core.uploader import SpooledUpload, UploadTarget
 from tk3u8.paths_handler import PathsHandler
+from tk3u8.session.bandwidth import TokenBucket, bandwidth_limiter
+from tk3u8.session.prewarm import ConnectionPrewarmer, dns_cache
+from tk3u8.session.request_handler import RequestHandler
+from tk3u8.telemetry.events import events
+from tk3u8.telemetry.metrics import active_recordings, poll_lag_seconds
+from tk3u8.telemetry.profiling import profiler
+from tk3u8.telemetry.tracing import tracer
+
+if TYPE_CHECKING:
+    from yt_dlp.extractor.common import _InfoDict
 
 
 logger = logging.getLogger(__name__)
 
 
+class _EngineStartedPostProcessor(PostProcessor):
+    """Marks the engine as started once yt-dlp has extracted the stream and
+    is about to download it."""
+
+    def __init__(self, timer: RecordingTimer) -> None:
+        super().__init__()
+        self._timer = timer
+
+    def run(self, information: '_InfoDict') -> Tuple[List[str], '_InfoDict']:
+        self._timer.mark_engine_started()
+        return [], information
+
+
 class Downloader:
     def __init__(
             self,
             paths_handler: PathsHandler,
             stream_metadata_handler: StreamMetadataHandler,
-            options_handler: OptionsHandler
+            options_handler: OptionsHandler,
+            request_handler: RequestHandler,
+            clock: Clock = system_clock
     ) -> None:
         self._paths_handler = paths_handler
         self._options_handler = options_handler
         self._stream_metadata_handler = stream_metadata_handler
+        self._request_handler = request_handler
+        self._stream_session: Optional[requests.Session] = None
+        self._prewarm_thread: Optional[threading.Thread] = None
+        self._dns_cache_installed = False
+        self._timings: List[RecordingTimings] = []
+        self._clock = clock
+        self._cancelled = threading.Event()
 
-    def download(self, quality: str) -> None:
+    def download(self, quality: str, cancelled: Optional[threading.Event] = None) -> None:
+        """
+        Downloads the stream of the user in the given quality. If the
+        'cancelled' event is given, setting it stops waiting for the user to
+        go live, or stops the recording, after which
+        'DownloadCancelledError' is raised.
+        """
+        self._cancelled = cancelled or threading.Event()
         username = self._stream_metadata_handler.get_username()
         wait_until_live = self._options_handler.get_option_val(OptionKey.WAIT_UNTIL_LIVE)
         live_status = self._stream_metadata_handler.get_live_status()
         force_redownload = self._options_handler.get_option_val(OptionKey.FORCE_REDOWNLOAD)
         redownload_attempted = False
         use_h265 = self._options_handler.get_option_val(OptionKey.USE_H265)
+        max_bandwidth = self._options_handler.get_option_val(OptionKey.MAX_BANDWIDTH)
+        min_bandwidth = self._options_handler.get_option_val(OptionKey.MIN_BANDWIDTH)
+        priority = self._options_handler.get_option_val(OptionKey.PRIORITY)
+        coordinator_port = self._options_handler.get_option_val(OptionKey.BANDWIDTH_COORDINATOR_PORT)
 
         assert isinstance(username, str)
         assert isinstance(wait_until_live, int)
         assert isinstance(live_status, LiveStatus)
         assert isinstance(force_redownload, bool)
-        assert isinstance(use_h265, bool)
+        assert isinstance(use_h265, (bool, type(None)))
+        assert isinstance(max_bandwidth, (int, type(None)))
+        assert isinstance(min_bandwidth, int)
+        assert isinstance(priority, int)
+        assert isinstance(coordinator_port, (int, type(None)))
+
+        if coordinator_port:
+            bandwidth_limiter.use_host_coordinator(coordinator_port)
+
+        # A download without a cap doesn't keep the cap of an earlier one
+        bandwidth_limiter.set_total(max_bandwidth * 1000 if max_bandwidth else None)
 
         while True:
             if live_status in (LiveStatus.OFFLINE, LiveStatus.PREPARING_TO_GO_LIVE):
                 # If the user did not use the 'wait until live' option from
-                # either the config file or command-line argument, the program
-                # will exit momentarily
+                # either the config file or command-line argument, the download
+                # will stop right away
                 if not wait_until_live:
                     if live_status == LiveStatus.OFFLINE:
                         console.print(messages.user_offline.format(username=username))
-                        exit(0)
+                        raise UserNotLiveError(username)
                     elif live_status == LiveStatus.PREPARING_TO_GO_LIVE:
                         console.print(messages.preparing_to_go_live.format(username=username))
-                        exit(0)
+                        raise UserPreparingForLiveError(username)
 
                 # Otherwise, the program will attempt to check the live
                 # status every n seconds until the user goes live.
                 offline_msg = messages.awaiting_to_go_live.format(username=username)
                 self._wait_until_live(offline_msg, live_status)
 
+            # The stream start time is only meaningful for the first attempt,
+            # as the reattempts happen long after the stream started
+            timer = RecordingTimer(
+                username,
+                None if redownload_attempted else self._stream_metadata_handler.get_start_time(),
+                self._stream_metadata_handler.get_last_process_duration(),
+                self._clock
+            )
+            self._timings.append(timer.get_timings())
+            self._prewarm_connections(quality)
+
             if not redownload_attempted:
                 console.print(messages.user_is_now_live.format(username=username))
+                events.emit(EventType.WENT_LIVE, username, start_time=self._stream_metadata_handler.get_start_time())
             else:
                 console.print(messages.reattempting_download.format(username=username))
 
-            stream_link = self._stream_metadata_handler.get_stream_link(quality, use_h265)
-            if not self._is_stream_link_available(stream_link):
-                console.print(messages.quality_not_available.format(quality=quality))
-                logger.error(f"{QualityNotAvailableError.__name__}: {QualityNotAvailableError()}")
-                exit(0)
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            recording_id = f"{username}-{timestamp}"
+            bucket = bandwidth_limiter.register(recording_id, min_bandwidth * 1000, priority, self._clock)
 
-            self._start_download(username, stream_link)
+            try:
+                stream_link, quality_selector = self._get_stream_link(quality, use_h265, recording_id)
+                timer.mark_link_resolved()
+                self._report_bandwidth_allocation(recording_id)
+                self._start_download(username, timestamp, stream_link, quality_selector, bucket, timer)
+            finally:
+                bandwidth_limiter.unregister(recording_id)
+                self._finish_prewarm()
 
-            if not force_redownload:
+            if not force_redownload or self._cancelled.is_set():
                 break
 
             self._show_redownloading_notice()
@@ -80,7 +167,66 @@ class Downloader:
             live_status = live_status = self._stream_metadata_handler.get_live_status()
             redownload_attempted = True
 
-    def _start_download(self, username: str, stream_link: StreamLink) -> None:
+        # The recording is kept as it is when it's cancelled
+        self._raise_if_cancelled()
+
+    def get_timings(self) -> List[RecordingTimings]:
+        """Gets the time to first byte breakdown of each recording so far."""
+        return self._timings
+
+    def _get_stream_link(self, quality: str, use_h265: Optional[bool], recording_id: str) -> Tuple[StreamLink, Optional[AutoQualitySelector]]:
+        """
+        Gets the stream link to download. If the quality is picked
+        automatically, the quality selector is also returned, which picks
+        the initial tier based on the bandwidth allocated to the recording.
+        """
+        if quality == AUTO_QUALITY:
+            variants = self._stream_metadata_handler.get_stream_variants(use_h265)
+            if not variants:
+                console.print(messages.no_auto_quality_variants)
+                logger.error(f"{QualityNotAvailableError.__name__}: {QualityNotAvailableError()}")
+                raise QualityNotAvailableError()
+
+            quality_selector = AutoQualitySelector(variants, bandwidth_limiter, recording_id)
+            return quality_selector.get_initial_variant(), quality_selector
+
+        stream_link = self._stream_metadata_handler.get_stream_link(quality, use_h265)
+        if not self._is_stream_link_available(stream_link):
+            console.print(messages.quality_not_available.format(quality=quality))
+            logger.error(f"{QualityNotAvailableError.__name__}: {QualityNotAvailableError()}")
+            raise QualityNotAvailableError()
+
+        return stream_link, None
+
+    def _report_bandwidth_allocation(self, recording_id: str) -> None:
+        allocation = bandwidth_limiter.get_allocation(recording_id)
+
+        if allocation is None:
+            return
+
+        allocation_msg = messages.bandwidth_allocated.format(
+            allocation_kbps=allocation // 1000,
+            recordings_count=len(bandwidth_limiter.get_allocations())
+        )
+        console.print(allocation_msg)
+        logger.info(allocation_msg)
+
+    def _start_download(
+            self,
+            username: str,
+            timestamp: str,
+            stream_link: StreamLink,
+            quality_selector: Optional[AutoQualitySelector],
+            bucket: TokenBucket,
+            timer: RecordingTimer
+    ) -> None:
+        """
+        Starts downloading the stream. The built-in HLS recorder is used if
+        the 'native' engine is chosen, if the quality is picked
+        automatically, as switching quality tiers is only possible there, or
+        if the recording is uploaded while it's recorded. Otherwise, yt-dlp
+        is used.
+        """
         starting_download_msg = messages.starting_download.format(
             username=username,
             stream_link=stream_link
@@ -88,31 +234,349 @@ class Downloader:
         console.print(starting_download_msg, end="\n\n")
         logger.debug(starting_download_msg)
 
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{username}-{timestamp}-{stream_link.quality}"
-        filename_with_download_dir = os.path.join(self._paths_handler.DOWNLOAD_DIR, f"{username}", f"{filename}.%(ext)s")
+        engine = self._options_handler.get_option_val(OptionKey.ENGINE)
+        upload_url = self._options_handler.get_option_val(OptionKey.UPLOAD_URL)
+        assert isinstance(engine, str)
 
+        quality = AUTO_QUALITY if quality_selector else stream_link.quality
+        filename = f"{username}-{timestamp}-{quality}"
+        use_native = quality_selector is not None or engine == Engine.NATIVE.value or bool(upload_url)
+
+        user_download_dir = os.path.join(self._paths_handler.DOWNLOAD_DIR, username)
+        os.makedirs(user_download_dir, exist_ok=True)
+
+        used_engine = Engine.NATIVE.value if use_native else Engine.YT_DLP.value
+        timer.set_engine(used_engine)
+
+        metadata_path = os.path.join(user_download_dir, f"{filename}.meta.json")
+        metadata = RecordingMetadata.from_stream_link(username, quality, stream_link, used_engine, self._stream_metadata_handler.get_start_time())
+        metadata.save(metadata_path)
+
+        active_recordings.inc()
+        events.emit(
+            EventType.RECORDING_STARTED,
+            username,
+            filename=filename,
+            download_dir=user_download_dir,
+            quality=stream_link.quality,
+            codec=stream_link.codec,
+            engine=used_engine
+        )
+        started_at = self._clock.monotonic()
+        finished = False
+
+        try:
+            with profiler.phase("recording"), \
+                    tracer.start_span("recording", username=username, quality=quality, codec=stream_link.codec or "", engine=used_engine):
+                if use_native:
+                    self._download_with_native(username, filename, stream_link, quality_selector, bucket, timer)
+                else:
+                    self._download_with_ytdlp(username, filename, stream_link, bucket, timer)
+
+            finished = True
+        finally:
+            active_recordings.dec()
+            metadata.timings = timer.get_timings().to_dict()
+            metadata.mark_finished()
+            metadata.save(metadata_path)
+            events.emit(
+                EventType.RECORDING_FINISHED,
+                username,
+                filename=filename,
+                bytes=_get_recording_size(user_download_dir, filename) if events.is_enabled() else None,
+                duration=round(self._clock.monotonic() - started_at, 3),
+                ok=finished
+            )
+
+    def _download_with_ytdlp(
+            self,
+            username: str,
+            filename: str,
+            stream_link: StreamLink,
+            bucket: TokenBucket,
+            timer: RecordingTimer
+    ) -> None:
+        user_download_dir = os.path.join(self._paths_handler.DOWNLOAD_DIR, f"{username}")
+        filename_with_download_dir = os.path.join(user_download_dir, f"{filename}.%(ext)s")
+
+        # yt-dlp prints to the terminal by itself, so it's kept quiet along
+        # with the console, e.g., in the headless mode
         ydl_opts = {
             'outtmpl': filename_with_download_dir,
-            'quiet': False,  # Set to True to suppress output if needed
+            'quiet': console.quiet,
+            'noprogress': console.quiet,
+            'progress_hooks': [self._build_ytdlp_stats_reporter(username)]
         }
 
+        # yt-dlp only honors the rate limit (in bytes per second) if it uses
+        # its own downloader instead of FFmpeg
+        rate_bps = bucket.get_rate()
+        if rate_bps:
+            ydl_opts['ratelimit'] = rate_bps // 8
+
+        stop_watching = threading.Event()
+        threading.Thread(
+            target=self._watch_first_byte,
+            args=(user_download_dir, filename, timer, stop_watching),
+            daemon=True
+        ).start()
+
         try:
             with YoutubeDL(ydl_opts) as ydl:  # type: ignore[arg-type]
+                ydl.add_post_processor(_EngineStartedPostProcessor(timer), when="before_dl")
                 ydl.download([stream_link.link])
+                self._print_finished_downloading(filename_with_download_dir.replace('%(ext)s', 'mp4'))
+        except Exception as e:
+            # yt-dlp may wrap the cancellation raised by the progress hook
+            if self._cancelled.is_set():
+                logger.debug(f"Recording of user @{username} was cancelled")
+                return
 
-                finished_downloading_msg = messages.finished_downloading.format(
-                    filename=filename,
-                    filename_with_download_dir=filename_with_download_dir.replace('%(ext)s', 'mp4'),
-                )
-                console.print("\n" + finished_downloading_msg)
-                logger.debug(finished_downloading_msg)
+            logger.exception(f"{DownloadError.__name__}: {DownloadError(e)}")
+            raise DownloadError(e)
+        finally:
+            stop_watching.set()
+
+    def _build_ytdlp_stats_reporter(self, username: str) -> Callable[[dict], None]:
+        """Builds a progress hook for yt-dlp that emits an event for each
+        fragment it finished, and the download progress as segment stats at
+        most once every 'SEGMENT_STATS_INTERVAL' seconds."""
+        last_reported_at: Optional[float] = None
+        last_fragment: Optional[Tuple[int, int, float]] = None
+
+        def report(progress: dict) -> None:
+            nonlocal last_reported_at, last_fragment
+
+            # Raising here is the only way to stop yt-dlp while it downloads
+            # the stream by itself. It can't be stopped while FFmpeg
+            # downloads it, which doesn't call the progress hooks.
+            self._raise_if_cancelled()
+
+            if progress.get("status") != "downloading" or not events.is_enabled():
+                return
+
+            now = self._clock.monotonic()
+            fragment_index = progress.get("fragment_index")
+            downloaded_bytes = progress.get("downloaded_bytes") or 0
+
+            # yt-dlp reports the progress of each chunk, so a fragment is
+            # only done once the next one is being downloaded
+            if fragment_index is not None and (last_fragment is None or fragment_index > last_fragment[0]):
+                if last_fragment is not None:
+                    events.emit(
+                        EventType.SEGMENT_WRITTEN,
+                        username,
+                        sequence=last_fragment[0],
+                        bytes=downloaded_bytes - last_fragment[1],
+                        duration=round(now - last_fragment[2], 3)
+                    )
+
+                last_fragment = (fragment_index, downloaded_bytes, now)
+
+            if last_reported_at is not None and now - last_reported_at < HLSRecorder.SEGMENT_STATS_INTERVAL:
+                return
+
+            last_reported_at = now
+            speed = progress.get("speed")
+            events.emit(
+                EventType.SEGMENT_STATS,
+                username,
+                segments_written=fragment_index,
+                bytes_written=downloaded_bytes,
+                bytes_per_second=round(speed) if speed else None
+            )
+
+        return report
+
+    def _watch_first_byte(self, user_download_dir: str, filename: str, timer: RecordingTimer, stop: threading.Event) -> None:
+        """
+        Marks the first byte as written once the output file of yt-dlp is no
+        longer empty. yt-dlp doesn't report this by itself when it hands the
+        download over to FFmpeg, so the file is checked every 100 ms instead.
+        """
+        while not stop.is_set() and not timer.first_byte_written.is_set():
+            try:
+                with os.scandir(user_download_dir) as entries:
+                    for entry in entries:
+                        if (
+                            entry.name.startswith(f"{filename}.")
+                            and not entry.name.endswith((".meta.json", ".manifest.json"))
+                            and entry.stat().st_size > 0
+                        ):
+                            timer.mark_first_byte()
+                            return
+            except OSError:
+                pass
+
+            stop.wait(0.1)
+
+    def _download_with_native(
+            self,
+            username: str,
+            filename: str,
+            stream_link: StreamLink,
+            quality_selector: Optional[AutoQualitySelector],
+            bucket: TokenBucket,
+            timer: RecordingTimer
+    ) -> None:
+        filename_with_download_dir = os.path.join(self._paths_handler.DOWNLOAD_DIR, username, f"{filename}.ts")
+
+        refresh_margin = self._options_handler.get_option_val(OptionKey.LINK_REFRESH_MARGIN)
+        assert isinstance(refresh_margin, int)
+
+        def refresh_stream_link(current_stream_link: StreamLink) -> Optional[StreamLink]:
+            return self._refresh_stream_link(current_stream_link, quality_selector)
+
+        upload = self._start_upload(filename_with_download_dir, username)
+        session = self._take_stream_session()
+        recorder = HLSRecorder(
+            session,
+            filename_with_download_dir,
+            stream_link,
+            quality_selector,
+            bucket,
+            link_refresher=refresh_stream_link,
+            refresh_margin=refresh_margin,
+            timer=timer,
+            username=username,
+            stop_requested=self._cancelled,
+            manifest_path=get_manifest_path(filename_with_download_dir),
+            output=upload,
+            clock=self._clock
+        )
+
+        try:
+            recorder.record()
+        except (KeyboardInterrupt, HLSLinkTemporarilyUnavailableError):
+            # What was recorded before the link expired is kept
+            self._print_finished_downloading(filename_with_download_dir, upload)
+            raise
+        except UploadError as e:
+            assert upload is not None
+            console.print(messages.upload_failed.format(error=e, path=upload.get_spool_dir()))
+            logger.exception(f"{DownloadError.__name__}: {DownloadError(e)}")
+            raise DownloadError(e)
         except Exception as e:
             logger.exception(f"{DownloadError.__name__}: {DownloadError(e)}")
             raise DownloadError(e)
+        finally:
+            session.close()
+
+        console.print(messages.stream_ended.format(username=username))
+        self._print_finished_downloading(filename_with_download_dir, upload)
+
+    def _start_upload(self, filename_with_download_dir: str, username: str) -> Optional[SpooledUpload]:
+        """Starts uploading the recording while it's recorded, if an upload
+        URL is set. Only a few parts of it are kept on the disk at a time."""
+        try:
+            upload_target = UploadTarget.from_options(self._options_handler)
+        except UploadError as e:
+            console.print(messages.upload_failed.format(error=e, path=filename_with_download_dir))
+            logger.error(f"{DownloadError.__name__}: {DownloadError(e)}")
+            raise DownloadError(e)
+
+        if upload_target is None:
+            return None
+
+        return upload_target.start_upload(filename_with_download_dir, username)
+
+    def _prewarm_connections(self, quality: str) -> None:
+        """
+        Resolves and connects to the CDN hosts of the stream links in the
+        background as soon as the user is live, while the stream link is
+        still being picked. This takes the DNS lookups and TCP and TLS
+        handshakes off the time it takes to get the first segment.
+        """
+        prewarm_connections = self._options_handler.get_option_val(OptionKey.PREWARM_CONNECTIONS)
+        dns_cache_ttl = self._options_handler.get_option_val(OptionKey.DNS_CACHE_TTL)
+        engine = self._options_handler.get_option_val(OptionKey.ENGINE)
+
+        assert isinstance(prewarm_connections, bool)
+        assert isinstance(dns_cache_ttl, int)
+        assert isinstance(engine, str)
+
+        if not prewarm_connections:
+            return
+
+        dns_cache.set_ttl(dns_cache_ttl)
+        dns_cache.install()
+        self._dns_cache_installed = True
+
+        # Only the native engine, which is always used for the 'auto'
+        # quality, can reuse the connections of the session. yt-dlp opens its
+        # own, so the hosts are only resolved for it.
+        if engine == Engine.NATIVE.value or quality == AUTO_QUALITY:
+            self._stream_session = self._request_handler.create_stream_session()
+
+        self._prewarm_thread = ConnectionPrewarmer(dns_cache).prewarm(
+            self._stream_session,
+            self._stream_metadata_handler.get_all_stream_links()
+        )
+
+    def _take_stream_session(self) -> requests.Session:
+        """Gets the pre-warmed stream session, or a new one if there is
+        none."""
+        if self._prewarm_thread:
+            self._prewarm_thread.join(ConnectionPrewarmer.REQUEST_TIMEOUT)
+            self._prewarm_thread = None
+
+        session = self._stream_session or self._request_handler.create_stream_session()
+        self._stream_session = None
+
+        return session
+
+    def _finish_prewarm(self) -> None:
+        """Closes the pre-warmed stream session if the recording didn't take
+        it, e.g., when picking the stream link failed, and uninstalls the
+        DNS cache once the recording is done."""
+        if self._prewarm_thread:
+            self._prewarm_thread.join(ConnectionPrewarmer.REQUEST_TIMEOUT)
+            self._prewarm_thread = None
+
+        if self._stream_session:
+            self._stream_session.close()
+            self._stream_session = None
+
+        if self._dns_cache_installed:
+            dns_cache.uninstall()
+            self._dns_cache_installed = False
+
+    def _refresh_stream_link(self, stream_link: StreamLink, quality_selector: Optional[AutoQualitySelector]) -> Optional[StreamLink]:
+        """
+        Refreshes the stream metadata in the background and gets the new
+        stream link of the same quality and codec. The variants of the
+        quality selector are refreshed as well, as their links expire at the
+        same time.
+        """
+        logger.debug(f"Refreshing stream link before it expires: {stream_link}")
+        self._stream_metadata_handler.refresh_data()
+
+        if self._stream_metadata_handler.get_live_status() != LiveStatus.LIVE:
+            return None
+
+        assert isinstance(stream_link.codec, str)
+
+        if quality_selector:
+            quality_selector.update_variants(self._stream_metadata_handler.get_stream_variants(stream_link.codec == "h265"))
+
+        return self._stream_metadata_handler.find_stream_link(stream_link.quality, stream_link.codec)
+
+    def _print_finished_downloading(self, filename_with_download_dir: str, upload: Optional[SpooledUpload] = None) -> None:
+        if upload:
+            finished_downloading_msg = messages.finished_uploading.format(
+                filename=os.path.basename(filename_with_download_dir),
+                key=upload.get_key()
+            )
+        else:
+            finished_downloading_msg = messages.finished_downloading.format(
+                filename=os.path.basename(filename_with_download_dir),
+                filename_with_download_dir=filename_with_download_dir,
+            )
+        console.print("\n" + finished_downloading_msg)
+        logger.debug(finished_downloading_msg)
 
     def _is_stream_link_available(self, stream_link: StreamLink) -> bool:
-        if stream_link.link is None:
+        if not stream_link.link:
             return False
         return True
 
@@ -127,13 +591,26 @@ class Downloader:
         with Live(render_lines(offline_msg)) as live:
             try:
                 while not live_status == LiveStatus.LIVE:
+                    checking_started_at = self._clock.monotonic()
                     self._pause_rechecking(live, offline_msg)
                     self._update_data()
                     live_status = self._stream_metadata_handler.get_live_status()
+                    self._report_poll_lag(checking_started_at)
                 live.update(render_lines())
             except KeyboardInterrupt:
                 live.update(render_lines(offline_msg, messages.cancelled_checking_live))
-                exit(0)
+                raise DownloadCancelledError(self._stream_metadata_handler.get_username()) from None
+
+    def _report_poll_lag(self, checking_started_at: float) -> None:
+        """Reports how much later than the timeout the live status check
+        finished, which includes the time spent fetching the data."""
+        timeout = self._options_handler.get_option_val(OptionKey.TIMEOUT)
+        assert isinstance(timeout, int)
+
+        poll_lag_seconds.set(
+            max(self._clock.monotonic() - checking_started_at - timeout, 0),
+            username=self._stream_metadata_handler.get_username()
+        )
 
     def _update_data(self) -> None:
         self._stream_metadata_handler.update_data()
@@ -144,20 +621,27 @@ class Downloader:
         and prints the seconds remaining before the next check.
         """
 
+        run_task(self._build_rechecking_pause(live, offline_msg), self._clock)
+        live.update(render_lines(offline_msg, messages.ongoing_checking_live))
+
+    def _build_rechecking_pause(self, live: Live, offline_msg: str) -> Task:
+        """Builds the countdown before rechecking live status, which only
+        renders the seconds remaining and leaves the waiting to whoever runs
+        it."""
         seconds_left = self._options_handler.get_option_val(OptionKey.TIMEOUT)
         assert isinstance(seconds_left, int)
 
         seconds_left_len = len(str(seconds_left))
         seconds_extra_space = " " * seconds_left_len
 
-        for remaining in range(seconds_left, -1, -1):
+        def render(remaining: int) -> None:
+            self._raise_if_cancelled()
             live.update(render_lines(offline_msg, messages.retrying_to_check_live.format(
                 remaining=remaining,
                 seconds_extra_space=seconds_extra_space
             )))
-            time.sleep(1)
 
-        live.update(render_lines(offline_msg, messages.ongoing_checking_live))
+        return countdown(seconds_left, render)
 
     def _show_redownloading_notice(self) -> None:
         """
@@ -170,9 +654,34 @@ class Downloader:
 
         with Live() as live:
             try:
-                for remaining_seconds in range(5, -1, -1):
-                    live.update(render_lines("\n" + messages.redownloading_notice.format(remaining=remaining_seconds)))
-                    time.sleep(1)
+                run_task(self._build_redownloading_notice(live), self._clock)
             except KeyboardInterrupt:
                 live.update(render_lines(messages.exiting_download_reattempt))
-                exit(0)
+                raise DownloadCancelledError(self._stream_metadata_handler.get_username()) from None
+
+    def _build_redownloading_notice(self, live: Live) -> Task:
+        def render(remaining: int) -> None:
+            self._raise_if_cancelled()
+            live.update(render_lines("\n" + messages.redownloading_notice.format(remaining=remaining)))
+
+        return countdown(5, render)
+
+    def _raise_if_cancelled(self) -> None:
+        if self._cancelled.is_set():
+            raise DownloadCancelledError(self._stream_metadata_handler.get_username())
+
+
+def _get_recording_size(user_download_dir: str, filename: str) -> int:
+    """Gets the size of the files of the recording, whose extension depends
+    on the engine that wrote them."""
+    size = 0
+
+    try:
+        with os.scandir(user_download_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith(f"{filename}.") and not entry.name.endswith((".meta.json", ".manifest.json")) and entry.is_file():
+                    size += entry.stat().st_size
+    except OSError:
+        pass
+
+    return size
@@ -1,9 +1,10 @@
 from abc import ABC, abstractmethod
 import json
+from typing import Optional
 
 from bs4 import BeautifulSoup
 
-from tk3u8.constants import LiveStatus, Quality
+from tk3u8.constants import TIKTOK_BASE_URL, LiveStatus, Quality
 from tk3u8.exceptions import (
     HLSLinkNotFoundError,
     LiveStatusCodeNotFoundError,
@@ -14,6 +15,7 @@ from tk3u8.exceptions import (
 )
 from tk3u8.messages import messages
 from tk3u8.session.request_handler import RequestHandler
+from tk3u8.telemetry.metrics import waf_challenges_total
 import logging
 
 
@@ -24,11 +26,15 @@ class Extractor(ABC):
     """
     Abstract base class for extracting streaming data for a given username.
     Subclasses must implement methods to fetch source data and extract stream data.
+
+    The base URL is where the pages and API are fetched from, which can be
+    pointed to a stand-in server for testing.
     """
 
-    def __init__(self, username: str, request_handler: RequestHandler):
+    def __init__(self, username: str, request_handler: RequestHandler, base_url: str = TIKTOK_BASE_URL):
         self._request_handler = request_handler
         self._username = username
+        self._base_url = base_url.rstrip("/")
 
     @abstractmethod
     def get_source_data(self) -> dict:
@@ -45,6 +51,13 @@ class Extractor(ABC):
         a LiveStatus constant.
         """
 
+    @abstractmethod
+    def get_start_time(self, source_data: dict) -> Optional[int]:
+        """
+        Gets the time (as a Unix timestamp) when the stream started from the
+        extracted source data, or None if it's not included.
+        """
+
     def get_stream_links(self, stream_data: dict[str, dict]) -> dict:
         """
         This builds the stream links in dict. The qualities are first constructed
@@ -90,6 +103,22 @@ class Extractor(ABC):
 
         return stream_links
 
+    def _get_stream_data_by_codec(self, live_room: dict) -> dict:
+        """
+        Decodes the stream data of each codec from the live room. The H.264
+        stream data is always there, while rooms that aren't streamed in
+        H.265 have no HEVC stream data, in which case only the H.264 stream
+        data is returned.
+        """
+        stream_data = {"h264": json.loads(live_room["streamData"]["pull_data"]["stream_data"])}
+
+        try:
+            stream_data["h265"] = json.loads(live_room["hevcStreamData"]["pull_data"]["stream_data"])
+        except (KeyError, TypeError, ValueError):
+            logger.debug(f"No H.265 stream data found for user @{self._username}")
+
+        return stream_data
+
     def _get_live_status(self, status_code: int) -> LiveStatus:
         if status_code == 1:
             return LiveStatus.PREPARING_TO_GO_LIVE
@@ -111,27 +140,24 @@ class Extractor(ABC):
         trying to download is in different server locations.
         """
 
-        h264_bool: bool = False
-        h265_bool: bool = False
-
-        for quality in stream_links:
-            links_by_codec = stream_links[quality]
-
-            for codec, link in links_by_codec.items():
-                if link != "":
-                    continue
-                else:
-                    if codec == "h264":
-                        h264_bool = True
-                    elif codec == "h265":
-                        h265_bool = True
+        # Rooms without H.265 only have the H.264 links
+        codecs = {codec for links_by_codec in stream_links.values() for codec in links_by_codec}
+        codecs_with_empty_links = {
+            codec
+            for links_by_codec in stream_links.values()
+            for codec, link in links_by_codec.items()
+            if link == ""
+        }
 
-        return all([h264_bool, h265_bool])
+        return bool(codecs) and codecs_with_empty_links == codecs
 
 
 class APIExtractor(Extractor):
     def get_source_data(self) -> dict:
-        response = self._request_handler.get_data(f"https://www.tiktok.com/api-live/user/room?aid=1988&sourceType=54&uniqueId={self._username}")
+        response = self._request_handler.get_data(
+            f"{self._base_url}/api-live/user/room?aid=1988&sourceType=54&uniqueId={self._username}",
+            source=self.__class__.__name__
+        )
 
         soup = BeautifulSoup(response.text, "html.parser")
         content = json.loads(soup.text)
@@ -145,10 +171,8 @@ class APIExtractor(Extractor):
 
     def get_stream_data(self, source_data: dict) -> dict:
         try:
-            stream_data = {
-                "h264": json.loads(source_data["data"]["liveRoom"]["streamData"]["pull_data"]["stream_data"]),
-                "h265": json.loads(source_data["data"]["liveRoom"]["hevcStreamData"]["pull_data"]["stream_data"])
-            }
+            live_room = source_data["data"]["liveRoom"]
+            stream_data = self._get_stream_data_by_codec(live_room)
 
             logger.debug(messages.extracted_stream_data.format(
                 username=self._username,
@@ -173,12 +197,19 @@ class APIExtractor(Extractor):
             logger.exception(f"{LiveStatusCodeNotFoundError.__name__}: {LiveStatusCodeNotFoundError(self._username)}")
             raise LiveStatusCodeNotFoundError(self._username)
 
+    def get_start_time(self, source_data: dict) -> Optional[int]:
+        try:
+            return source_data["data"]["liveRoom"]["startTime"] or None
+        except (KeyError, TypeError):
+            return None
+
 
 class WebpageExtractor(Extractor):
     def get_source_data(self) -> dict:
-        response = self._request_handler.get_data(f"https://www.tiktok.com/@{self._username}/live")
+        response = self._request_handler.get_data(f"{self._base_url}/@{self._username}/live", source=self.__class__.__name__)
 
         if "Please wait..." in response.text:
+            waf_challenges_total.inc()
             logger.exception(f"{WAFChallengeError.__name__}: {WAFChallengeError}")
             raise WAFChallengeError()
 
@@ -200,11 +231,8 @@ class WebpageExtractor(Extractor):
 
     def get_stream_data(self, source_data: dict) -> dict:
         try:
-            stream_data = json.loads(source_data["LiveRoom"]["liveRoomUserInfo"]["liveRoom"]["streamData"]["pull_data"]["stream_data"])
-            stream_data = {
-                "h264": json.loads(source_data["LiveRoom"]["liveRoomUserInfo"]["liveRoom"]["streamData"]["pull_data"]["stream_data"]),
-                "h265": json.loads(source_data["LiveRoom"]["liveRoomUserInfo"]["liveRoom"]["hevcStreamData"]["pull_data"]["stream_data"])
-            }
+            live_room = source_data["LiveRoom"]["liveRoomUserInfo"]["liveRoom"]
+            stream_data = self._get_stream_data_by_codec(live_room)
 
             logger.debug(messages.extracted_stream_data.format(
                 username=self._username,
@@ -228,3 +256,9 @@ class WebpageExtractor(Extractor):
         except KeyError:
             logger.exception(f"{LiveStatusCodeNotFoundError.__name__}: {LiveStatusCodeNotFoundError(self._username)}")
             raise LiveStatusCodeNotFoundError(self._username)
+
+    def get_start_time(self, source_data: dict) -> Optional[int]:
+        try:
+            return source_data["LiveRoom"]["liveRoomUserInfo"]["liveRoom"]["startTime"] or None
+        except (KeyError, TypeError):
+            return None
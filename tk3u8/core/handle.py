@@ -0,0 +1,133 @@
+from concurrent import futures
+from dataclasses import dataclass, replace
+import threading
+from typing import Callable, Optional
+from tk3u8.constants import DownloadStatus, EventType
+from tk3u8.exceptions import DownloadCancelledError
+from tk3u8.telemetry.events import Event, events
+
+
+@dataclass
+class DownloadStats:
+    """
+    Stats of a download so far, taken from the lifecycle events of its user.
+
+    Attributes:
+        live_status (str | None): The live status from the last check.
+        recording (bool): Whether a recording is in progress.
+        recordings (int): Number of recordings started.
+        segments_written (int): Number of segments written to disk.
+        bytes_written (int): Number of bytes of the segments written to disk.
+        last_event_at (float | None): When the last event happened, in Unix
+            time.
+    """
+    live_status: Optional[str] = None
+    recording: bool = False
+    recordings: int = 0
+    segments_written: int = 0
+    bytes_written: int = 0
+    last_event_at: Optional[float] = None
+
+
+class DownloadHandle:
+    """
+    Handle of a download running in the background, which works like a
+    future of its result. The download runs on a thread of its own, so many
+    of them can share one long-lived process, and any error is raised again
+    by 'result()' instead of stopping the process.
+
+    While the download runs, the handle listens to the lifecycle events of
+    its user to keep its stats.
+    """
+
+    def __init__(self, username: str, cancelled: threading.Event) -> None:
+        self.username = username
+        self._cancelled = cancelled
+        self._future: futures.Future = futures.Future()
+        self._lock = threading.Lock()
+        self._stats = DownloadStats()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, target: Callable[[], None]) -> None:
+        self._future.set_running_or_notify_cancel()
+        events.add_writer(self)
+        self._thread = threading.Thread(target=self._run, args=(target,), name=f"tk3u8-download-{self.username}", daemon=True)
+        self._thread.start()
+
+    def cancel(self) -> None:
+        """Stops waiting for the user to go live, or stops the recording,
+        keeping what was written so far. Returns right away, so use
+        'wait()' to wait until it's stopped."""
+        self._cancelled.set()
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Waits until the download is done, and returns whether it's
+        done."""
+        try:
+            self._future.exception(timeout)
+        except futures.TimeoutError:
+            return False
+
+        return True
+
+    def result(self, timeout: Optional[float] = None) -> None:
+        """Waits until the download is done, and raises its error if it
+        failed or was cancelled."""
+        self._future.result(timeout)
+
+    def get_status(self) -> DownloadStatus:
+        if not self._future.done():
+            return DownloadStatus.RUNNING
+
+        error = self._future.exception()
+
+        if isinstance(error, DownloadCancelledError):
+            return DownloadStatus.CANCELLED
+        elif error:
+            return DownloadStatus.FAILED
+
+        return DownloadStatus.FINISHED
+
+    def get_error(self) -> Optional[BaseException]:
+        """Gets the error of the download if it's done and failed or was
+        cancelled, or None otherwise."""
+        if not self._future.done():
+            return None
+
+        return self._future.exception()
+
+    def get_stats(self) -> DownloadStats:
+        with self._lock:
+            return replace(self._stats)
+
+    def write(self, event: Event) -> None:
+        if event.username != self.username:
+            return
+
+        with self._lock:
+            stats = self._stats
+            stats.last_event_at = event.timestamp
+
+            if event.type == EventType.POLLED:
+                stats.live_status = event.data.get("live_status")
+            elif event.type == EventType.RECORDING_STARTED:
+                stats.recording = True
+                stats.recordings += 1
+            elif event.type == EventType.RECORDING_FINISHED:
+                stats.recording = False
+            elif event.type == EventType.SEGMENT_WRITTEN:
+                stats.segments_written += 1
+                stats.bytes_written += event.data.get("bytes") or 0
+
+    def _run(self, target: Callable[[], None]) -> None:
+        try:
+            target()
+        except BaseException as e:
+            self._future.set_exception(e)
+        else:
+            self._future.set_result(None)
+        finally:
+            events.remove_writer(self)
@@ -1,4 +1,7 @@
+import json
 import re
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
 from tk3u8.core.extractor import APIExtractor, Extractor, WebpageExtractor
 from tk3u8.exceptions import InvalidExtractorError
 
@@ -26,3 +29,57 @@ def is_user_exists(extractor: type[Extractor], source_data: dict) -> bool:
 
     else:
         raise InvalidExtractorError()
+
+
+def get_stream_bitrates(stream_data: dict) -> dict[str, dict[str, Optional[int]]]:
+    """
+    Gets the video bitrate (in bits per second) of each quality and codec
+    from the 'sdk_params' of the stream data. The key "origin" is replaced
+    with "original" to match the keys of the stream links.
+
+    Qualities or codecs without a parsable bitrate are skipped, so this
+    returns an empty dict if the stream data has an unexpected structure.
+    """
+    bitrates: dict[str, dict[str, Optional[int]]] = {}
+
+    for codec, codec_data in stream_data.items():
+        try:
+            qualities = codec_data["data"]
+        except (KeyError, TypeError):
+            continue
+
+        if not isinstance(qualities, dict):
+            continue
+
+        for quality_key, quality_data in qualities.items():
+            try:
+                sdk_params = json.loads(quality_data["main"]["sdk_params"])
+                bitrate = int(sdk_params["vbitrate"])
+            except (KeyError, TypeError, ValueError):
+                continue
+
+            quality = "original" if quality_key == "origin" else quality_key
+            bitrates.setdefault(quality, {})[codec] = bitrate
+
+    return bitrates
+
+
+def get_link_expiry(link: str) -> Optional[float]:
+    """
+    Gets the expiry time (as a Unix timestamp) of a signed stream link from
+    its query string. The 'expire' parameter holds it in decimal, while the
+    'txTime' parameter used by some CDNs holds it in hexadecimal.
+
+    Returns None if the link doesn't have a parsable expiry time.
+    """
+    query = parse_qs(urlparse(link).query)
+
+    try:
+        if "expire" in query:
+            return float(int(query["expire"][0]))
+        if "txTime" in query:
+            return float(int(query["txTime"][0], 16))
+    except ValueError:
+        return None
+
+    return None
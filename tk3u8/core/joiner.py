@@ -0,0 +1,470 @@
+from dataclasses import dataclass
+from datetime import datetime
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from typing import BinaryIO, Dict, List, Optional, Tuple
+from tk3u8.cli.console import console
+from tk3u8.core.metadata import get_manifest_path
+from tk3u8.exceptions import JoinError
+from tk3u8.messages import messages
+
+
+logger = logging.getLogger(__name__)
+
+
+JOINED_SUFFIX = "-joined"
+
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+
+# PTS, DTS and the PCR base are 33-bit counters of a 90 kHz clock
+TIMESTAMP_MODULO = 2 ** 33
+TIMESTAMP_CLOCK = 90000
+
+# Stream IDs of PES packets without the optional header, and so without
+# timestamps
+_PES_IDS_WITHOUT_HEADER = {0xBC, 0xBE, 0xBF, 0xF0, 0xF1, 0xF2, 0xF8, 0xFF}
+
+
+@dataclass
+class RecordingPart:
+    """
+    A recording of a user, as found through its '.meta.json' file.
+
+    Attributes:
+        path (str): Path of the recorded file.
+        quality (str): Quality of the recording.
+        started_at (datetime): When the recording started.
+        finished_at (datetime | None): When the recording finished, if it
+            did.
+        live_started_at (int | None): When the live stream started, which
+            is the same for every recording of a live session.
+        duration (float | None): Duration of the recording from its
+            integrity manifest, if it has one.
+        first_segment_size (int | None): Size of the first segment from the
+            integrity manifest, if it has one.
+        size (int | None): Size of the written segments from the integrity
+            manifest, if it has one.
+    """
+    path: str
+    quality: str
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    live_started_at: Optional[int] = None
+    duration: Optional[float] = None
+    first_segment_size: Optional[int] = None
+    size: Optional[int] = None
+
+    def get_extension(self) -> str:
+        return os.path.splitext(self.path)[1]
+
+
+def join_sessions(user_download_dir: str, max_gap: float = 300, delete_parts: bool = False) -> List[str]:
+    """
+    Joins the parts of each live session in the download directory of a
+    user, and returns the paths of the joined recordings. Sessions that
+    were already joined are skipped. If 'delete_parts' is set, the parts
+    are deleted along with their metadata once they're joined.
+    """
+    joined_paths = []
+
+    for parts in group_sessions(find_recordings(user_download_dir), max_gap):
+        if len(parts) < 2:
+            continue
+
+        output_path = get_joined_path(parts)
+
+        if os.path.exists(output_path):
+            console.print(messages.session_already_joined.format(path=output_path))
+            continue
+
+        console.print(messages.joining_session.format(count=len(parts), path=output_path))
+        join_parts(parts, output_path)
+        joined_paths.append(output_path)
+        logger.info(f"Joined {len(parts)} recordings into {output_path}")
+
+        if delete_parts:
+            for part in parts:
+                _delete_part(part)
+
+    if not joined_paths:
+        console.print(messages.no_sessions_to_join)
+
+    return joined_paths
+
+
+def _delete_part(part: RecordingPart) -> None:
+    stem = os.path.splitext(part.path)[0]
+
+    for path in (part.path, f"{stem}.meta.json", get_manifest_path(part.path)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Error deleting {path}: {e}")
+
+
+def find_recordings(user_download_dir: str) -> List[RecordingPart]:
+    """Finds the recordings in the download directory of a user, ordered by
+    when they started. Joined recordings are left out."""
+    parts = []
+
+    try:
+        names = os.listdir(user_download_dir)
+    except OSError as e:
+        raise JoinError(f"The recordings in {user_download_dir} can't be listed: {e}")
+
+    for name in names:
+        if not name.endswith(".meta.json") or name.endswith(f"{JOINED_SUFFIX}.meta.json"):
+            continue
+
+        part = _load_part(user_download_dir, name[:-len(".meta.json")], names)
+        if part:
+            parts.append(part)
+
+    return sorted(parts, key=lambda part: part.started_at)
+
+
+def _load_part(user_download_dir: str, filename: str, names: List[str]) -> Optional[RecordingPart]:
+    # Recordings that are being uploaded only have a spool directory
+    recorded_names = [
+        name for name in names
+        if name.startswith(f"{filename}.") and not name.endswith(".json") and os.path.isfile(os.path.join(user_download_dir, name))
+    ]
+
+    if len(recorded_names) != 1:
+        logger.debug(f"Skipping recording {filename}, as {len(recorded_names)} recorded files were found for it")
+        return None
+
+    try:
+        with open(os.path.join(user_download_dir, f"{filename}.meta.json"), encoding="utf-8") as file:
+            metadata = json.load(file)
+
+        part = RecordingPart(
+            path=os.path.join(user_download_dir, recorded_names[0]),
+            quality=metadata["quality"],
+            started_at=datetime.fromisoformat(metadata["started_at"]),
+            finished_at=datetime.fromisoformat(metadata["finished_at"]) if metadata.get("finished_at") else None,
+            live_started_at=metadata.get("live_started_at")
+        )
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning(f"Skipping recording {filename}, as its metadata can't be read: {e}")
+        return None
+
+    try:
+        with open(get_manifest_path(part.path), encoding="utf-8") as file:
+            manifest = json.load(file)
+
+        part.duration = manifest["duration"]
+        part.size = manifest["bytes"]
+        part.first_segment_size = manifest["segments"][0]["size"] if manifest["segments"] else None
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError, TypeError, IndexError) as e:
+        logger.warning(f"Ignoring the integrity manifest of recording {filename}, as it can't be read: {e}")
+
+    return part
+
+
+def group_sessions(parts: List[RecordingPart], max_gap: float = 300) -> List[List[RecordingPart]]:
+    """
+    Groups the recordings that are parts of the same live session, e.g.,
+    the ones restarted through 'force_redownload'. Recordings are parts of
+    the same session if the live stream started at the same time, or, when
+    that's unknown, if each part started at most 'max_gap' seconds after
+    the one before it finished. Only recordings with the same quality and
+    file type are grouped.
+    """
+    sessions: List[List[RecordingPart]] = []
+
+    for part in parts:
+        previous = sessions[-1][-1] if sessions else None
+
+        if previous and _is_same_session(previous, part, max_gap):
+            sessions[-1].append(part)
+        else:
+            sessions.append([part])
+
+    return sessions
+
+
+def _is_same_session(previous: RecordingPart, part: RecordingPart, max_gap: float) -> bool:
+    if previous.quality != part.quality or previous.get_extension() != part.get_extension():
+        return False
+
+    if previous.live_started_at is not None and part.live_started_at is not None:
+        return previous.live_started_at == part.live_started_at
+
+    if previous.finished_at is None:
+        return False
+
+    return 0 <= (part.started_at - previous.finished_at).total_seconds() <= max_gap
+
+
+def get_joined_path(parts: List[RecordingPart]) -> str:
+    stem, extension = os.path.splitext(parts[0].path)
+    return f"{stem}{JOINED_SUFFIX}{extension}"
+
+
+def join_parts(parts: List[RecordingPart], output_path: str) -> None:
+    """
+    Joins the parts of a session into one file by copying their streams,
+    without re-encoding. The timestamps of each part are rebased to continue
+    right where the part before it ended.
+
+    MPEG-TS recordings of the native engine are joined by the program
+    itself. Other recordings are joined through the concat demuxer of
+    FFmpeg, which rebases the timestamps the same way.
+    """
+    if len(parts) < 2:
+        raise JoinError("At least two recordings are needed to join them.")
+
+    if os.path.exists(output_path):
+        raise JoinError(f"The joined recording {output_path} already exists.")
+
+    try:
+        if parts[0].get_extension() == ".ts":
+            _join_ts_parts(parts, output_path)
+        else:
+            _join_with_ffmpeg(parts, output_path)
+    except BaseException:
+        # A partly joined file would be skipped on the next attempt
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+
+
+def _join_ts_parts(parts: List[RecordingPart], output_path: str) -> None:
+    rebaser = _TSRebaser()
+    end: Optional[int] = None
+
+    try:
+        with open(output_path, "wb") as output:
+            for part in parts:
+                first_timestamp = _find_first_timestamp(part)
+
+                if first_timestamp is None:
+                    logger.warning(f"Skipping {part.path}, as no timestamps were found in it")
+                    continue
+
+                # The first part keeps its timestamps, and the others start
+                # where the part before them ended
+                offset = 0 if end is None else (end - first_timestamp) % TIMESTAMP_MODULO
+                length = rebaser.copy(part.path, output, offset, first_timestamp, part.size)
+
+                if part.duration is not None:
+                    length = round(part.duration * TIMESTAMP_CLOCK)
+
+                end = (first_timestamp + offset + length) % TIMESTAMP_MODULO
+                logger.debug(f"Joined {part.path} with a timestamp offset of {offset / TIMESTAMP_CLOCK:.3f} seconds")
+    except OSError as e:
+        raise JoinError(f"Joining the recordings into {output_path} failed: {e}")
+
+
+def _find_first_timestamp(part: RecordingPart) -> Optional[int]:
+    """Finds the earliest timestamp at the start of the part. Only its first
+    segment is read if its size is known from the integrity manifest.
+    Otherwise, the first few megabytes are read."""
+    scan_size = part.first_segment_size or 4 * 1024 * 1024
+    timestamps: List[int] = []
+
+    with open(part.path, "rb") as file:
+        data = file.read(scan_size)
+
+    for packet in _iter_packets(data):
+        timestamps.extend(timestamp for _, timestamp in _read_timestamps(packet))
+
+    if not timestamps:
+        return None
+
+    # Timestamps just after a wrap around are later than the ones before it
+    reference = timestamps[0]
+    return min(timestamps, key=lambda timestamp: (timestamp - reference + TIMESTAMP_MODULO // 2) % TIMESTAMP_MODULO)
+
+
+def _iter_packets(data: bytes) -> List[bytes]:
+    start = data.find(bytes([TS_SYNC_BYTE]))
+    return [
+        data[index:index + TS_PACKET_SIZE]
+        for index in range(max(start, 0), len(data) - TS_PACKET_SIZE + 1, TS_PACKET_SIZE)
+        if data[index] == TS_SYNC_BYTE
+    ]
+
+
+def _read_timestamps(packet: bytes) -> List[Tuple[int, int]]:
+    """Gets the positions and values of the PCR, PTS, and DTS in the
+    packet."""
+    timestamps = []
+    adaptation_field_control = (packet[3] >> 4) & 0x3
+    payload_start = 4
+
+    if adaptation_field_control & 0x2:
+        adaptation_field_length = packet[4]
+        payload_start = 5 + adaptation_field_length
+
+        if adaptation_field_length >= 7 and packet[5] & 0x10:
+            timestamps.append((6, _read_pcr_base(packet, 6)))
+
+    is_pes_start = packet[1] & 0x40 and adaptation_field_control & 0x1
+    payload = packet[payload_start:]
+
+    if is_pes_start and len(payload) >= 19 and payload[:3] == b"\x00\x00\x01" and payload[3] not in _PES_IDS_WITHOUT_HEADER:
+        pts_dts_flags = (payload[7] >> 6) & 0x3
+
+        if pts_dts_flags & 0x2:
+            timestamps.append((payload_start + 9, _read_pes_timestamp(payload, 9)))
+
+        if pts_dts_flags == 0x3:
+            timestamps.append((payload_start + 14, _read_pes_timestamp(payload, 14)))
+
+    return timestamps
+
+
+def _read_pcr_base(data: bytes, index: int) -> int:
+    return (data[index] << 25) | (data[index + 1] << 17) | (data[index + 2] << 9) | (data[index + 3] << 1) | (data[index + 4] >> 7)
+
+
+def _write_pcr_base(data: bytearray, index: int, value: int) -> None:
+    data[index] = (value >> 25) & 0xFF
+    data[index + 1] = (value >> 17) & 0xFF
+    data[index + 2] = (value >> 9) & 0xFF
+    data[index + 3] = (value >> 1) & 0xFF
+    data[index + 4] = ((value & 0x1) << 7) | (data[index + 4] & 0x7F)
+
+
+def _read_pes_timestamp(data: bytes, index: int) -> int:
+    return (
+        ((data[index] >> 1) & 0x07) << 30
+        | data[index + 1] << 22
+        | (data[index + 2] >> 1) << 15
+        | data[index + 3] << 7
+        | data[index + 4] >> 1
+    )
+
+
+def _write_pes_timestamp(data: bytearray, index: int, value: int) -> None:
+    data[index] = (data[index] & 0xF1) | ((value >> 29) & 0x0E)
+    data[index + 1] = (value >> 22) & 0xFF
+    data[index + 2] = ((value >> 14) & 0xFE) | 0x01
+    data[index + 3] = (value >> 7) & 0xFF
+    data[index + 4] = ((value << 1) & 0xFE) | 0x01
+
+
+class _TSRebaser:
+    """
+    Copies MPEG-TS files one after another, shifting the PCR, PTS, and DTS
+    of each by an offset, and keeping the continuity counter of each stream
+    going across them. Only the packets with timestamps are changed, while
+    everything else is copied as it is.
+    """
+
+    CHUNK_PACKETS = 8192
+
+    def __init__(self) -> None:
+        self._continuity_counters: Dict[int, int] = {}
+
+    def copy(self, path: str, output: BinaryIO, offset: int, first_timestamp: int, size: Optional[int] = None) -> int:
+        """Copies the file to the output, and returns how long it lasts in
+        ticks of the 90 kHz clock, from its first timestamp to the end of
+        its last frame. Only the first 'size' bytes are copied if given,
+        which leaves out a segment that was only partly written."""
+        last_by_pid: Dict[int, int] = {}
+        step_by_pid: Dict[int, int] = {}
+        remaining = size
+
+        with open(path, "rb") as file:
+            pending = b""
+
+            while remaining is None or remaining > 0:
+                read_size = TS_PACKET_SIZE * self.CHUNK_PACKETS
+                chunk = file.read(read_size if remaining is None else min(read_size, remaining))
+
+                if not chunk:
+                    break
+
+                if remaining is not None:
+                    remaining -= len(chunk)
+
+                data = bytearray(pending + chunk)
+                usable = len(data) - len(data) % TS_PACKET_SIZE
+                pending = bytes(data[usable:])
+
+                for index in range(0, usable, TS_PACKET_SIZE):
+                    if data[index] != TS_SYNC_BYTE:
+                        continue
+
+                    self._rebase_packet(data, index, offset, first_timestamp, last_by_pid, step_by_pid)
+
+                output.write(data[:usable])
+
+            if pending:
+                logger.debug(f"Leaving out {len(pending)} bytes at the end of {path}, which don't make up a whole packet")
+
+        return max((last_by_pid[pid] + step_by_pid.get(pid, 0) for pid in last_by_pid), default=0)
+
+    def _rebase_packet(
+            self,
+            data: bytearray,
+            index: int,
+            offset: int,
+            first_timestamp: int,
+            last_by_pid: Dict[int, int],
+            step_by_pid: Dict[int, int]
+    ) -> None:
+        pid = ((data[index + 1] & 0x1F) << 8) | data[index + 2]
+
+        if data[index + 3] & 0x10:
+            counter = (self._continuity_counters.get(pid, -1) + 1) & 0x0F
+            self._continuity_counters[pid] = counter
+            data[index + 3] = (data[index + 3] & 0xF0) | counter
+
+        # Only the packets that start a PES packet or carry a PCR have
+        # timestamps
+        if not (data[index + 1] & 0x40 or (data[index + 3] & 0x20 and data[index + 4] and data[index + 5] & 0x10)):
+            return
+
+        packet = bytes(data[index:index + TS_PACKET_SIZE])
+
+        for position, timestamp in _read_timestamps(packet):
+            if position == 6:
+                _write_pcr_base(data, index + position, (timestamp + offset) % TIMESTAMP_MODULO)
+                continue
+
+            _write_pes_timestamp(data, index + position, (timestamp + offset) % TIMESTAMP_MODULO)
+            elapsed = (timestamp - first_timestamp) % TIMESTAMP_MODULO
+            previous = last_by_pid.get(pid)
+
+            if previous is None or elapsed > previous:
+                if previous is not None:
+                    step_by_pid[pid] = elapsed - previous
+
+                last_by_pid[pid] = elapsed
+
+
+def _join_with_ffmpeg(parts: List[RecordingPart], output_path: str) -> None:
+    ffmpeg_path = shutil.which("ffmpeg")
+
+    if not ffmpeg_path:
+        raise JoinError(f"FFmpeg is needed to join {parts[0].get_extension()} recordings, but it wasn't found.")
+
+    with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False, encoding="utf-8") as list_file:
+        for part in parts:
+            escaped_path = os.path.abspath(part.path).replace("'", "'\\''")
+            list_file.write(f"file '{escaped_path}'\n")
+
+    try:
+        result = subprocess.run(
+            [ffmpeg_path, "-hide_banner", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_file.name, "-c", "copy", output_path],
+            capture_output=True,
+            text=True
+        )
+    finally:
+        os.remove(list_file.name)
+
+    if result.returncode != 0:
+        raise JoinError(f"FFmpeg failed to join the recordings: {result.stderr.strip()}")
@@ -0,0 +1,206 @@
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+import hashlib
+import json
+import logging
+import os
+from typing import List, Optional
+from tk3u8.constants import CODEC_NAMES, StreamLink
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RecordingMetadata:
+    """
+    Metadata of a recording, which is saved as a JSON file next to the
+    output file so that details like the codec that was actually used are
+    kept together with the recording. The time when the live stream
+    started is the same for every recording of a live session, so they can
+    be joined afterwards.
+    """
+    username: str
+    quality: str
+    codec: Optional[str]
+    engine: str
+    stream_link: str
+    started_at: str
+    finished_at: Optional[str] = None
+    timings: Optional[dict] = None
+    live_started_at: Optional[int] = None
+
+    @classmethod
+    def from_stream_link(
+            cls,
+            username: str,
+            quality: str,
+            stream_link: StreamLink,
+            engine: str,
+            live_started_at: Optional[int] = None
+    ) -> 'RecordingMetadata':
+        return cls(
+            username=username,
+            quality=quality,
+            codec=CODEC_NAMES.get(stream_link.codec) if stream_link.codec else None,
+            engine=engine,
+            stream_link=stream_link.link,
+            started_at=datetime.now().astimezone().isoformat(),
+            live_started_at=live_started_at
+        )
+
+    def mark_finished(self) -> None:
+        self.finished_at = datetime.now().astimezone().isoformat()
+
+    def save(self, path: str) -> None:
+        try:
+            with open(path, "w", encoding="utf-8") as file:
+                json.dump(asdict(self), file, indent=4, ensure_ascii=False)
+        except OSError as e:
+            logger.warning(f"Error saving recording metadata to {path}: {e}")
+
+
+@dataclass
+class SegmentEntry:
+    """
+    A segment written to the recording.
+
+    Attributes:
+        sequence (int): Media sequence number of the segment.
+        offset (int): Where the segment starts in the file, in bytes.
+        size (int): Size of the segment, in bytes.
+        duration (float): Duration of the segment from the playlist, in
+            seconds.
+        quality (str): Quality tier the segment was fetched from.
+        sha256 (str): SHA-256 hash of the segment.
+    """
+    sequence: int
+    offset: int
+    size: int
+    duration: float
+    quality: str
+    sha256: str
+
+
+@dataclass
+class SegmentGap:
+    """
+    Segments missing from the recording.
+
+    Attributes:
+        first_sequence (int): Media sequence number of the first missing
+            segment.
+        last_sequence (int): Media sequence number of the last missing
+            segment.
+        reason (str): Either "fell_off_playlist" if the segments were gone
+            from the playlist before they were fetched, or "fetch_failed".
+    """
+    first_sequence: int
+    last_sequence: int
+    reason: str
+
+
+@dataclass
+class IntegrityManifest:
+    """
+    Hashes and layout of a recording, which are saved as a JSON file next to
+    the output file. The hashes are computed as the segments are written,
+    so the recording can be verified and deduplicated without reading it
+    again.
+
+    Attributes:
+        sha256 (str): SHA-256 hash of the whole file.
+        bytes (int): Size of the whole file.
+        segment_count (int): Number of segments written.
+        missing_segments (int): Number of segments missing in the gaps.
+        duration (float): Duration of the written segments, in seconds.
+        segments (list[SegmentEntry]): Every written segment, in order.
+        gaps (list[SegmentGap]): Every run of missing segments, in order.
+        discontinuities (list[int]): Media sequence numbers of the segments
+            where the stream isn't continuous with the segment before it,
+            e.g., after a gap, a switch of the quality tier, or a
+            discontinuity tag in the playlist.
+    """
+    sha256: str
+    bytes: int
+    segment_count: int
+    missing_segments: int
+    duration: float
+    segments: List[SegmentEntry] = field(default_factory=list)
+    gaps: List[SegmentGap] = field(default_factory=list)
+    discontinuities: List[int] = field(default_factory=list)
+
+    def save(self, path: str) -> None:
+        try:
+            with open(path, "w", encoding="utf-8") as file:
+                json.dump(asdict(self), file, indent=4)
+        except OSError as e:
+            logger.warning(f"Error saving integrity manifest to {path}: {e}")
+
+
+class ManifestBuilder:
+    """
+    Builds the integrity manifest of a recording as its segments are
+    written, keeping a rolling hash of the whole file along with the hash
+    of each segment.
+    """
+
+    def __init__(self) -> None:
+        self._file_hash = hashlib.sha256()
+        self._bytes = 0
+        self._duration = 0.0
+        self._segments: List[SegmentEntry] = []
+        self._gaps: List[SegmentGap] = []
+        self._discontinuities: List[int] = []
+        self._pending_discontinuity = False
+
+    def add_existing_content(self, path: str) -> None:
+        """Hashes what's already in the file the recording is appended to,
+        so the hash covers the whole file. This is the only time the file is
+        read."""
+        try:
+            with open(path, "rb") as file:
+                for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                    self._file_hash.update(chunk)
+                    self._bytes += len(chunk)
+        except FileNotFoundError:
+            pass
+
+    def add_segment(self, sequence: int, content: bytes, duration: float, quality: str, discontinuity: bool = False) -> None:
+        previous = self._segments[-1] if self._segments else None
+
+        if previous and (discontinuity or self._pending_discontinuity or quality != previous.quality):
+            self._discontinuities.append(sequence)
+
+        self._pending_discontinuity = False
+        self._file_hash.update(content)
+        self._segments.append(SegmentEntry(sequence, self._bytes, len(content), duration, quality, hashlib.sha256(content).hexdigest()))
+        self._bytes += len(content)
+        self._duration += duration
+
+    def add_gap(self, first_sequence: int, last_sequence: int, reason: str) -> None:
+        last_gap = self._gaps[-1] if self._gaps else None
+
+        if last_gap and last_gap.reason == reason and last_gap.last_sequence + 1 == first_sequence:
+            last_gap.last_sequence = last_sequence
+        else:
+            self._gaps.append(SegmentGap(first_sequence, last_sequence, reason))
+
+        self._pending_discontinuity = True
+
+    def build(self) -> IntegrityManifest:
+        return IntegrityManifest(
+            sha256=self._file_hash.hexdigest(),
+            bytes=self._bytes,
+            segment_count=len(self._segments),
+            missing_segments=sum(gap.last_sequence - gap.first_sequence + 1 for gap in self._gaps),
+            duration=round(self._duration, 3),
+            segments=list(self._segments),
+            gaps=list(self._gaps),
+            discontinuities=list(self._discontinuities)
+        )
+
+
+def get_manifest_path(output_path: str) -> str:
+    """Gets the path of the integrity manifest of the given output file."""
+    return f"{os.path.splitext(output_path)[0]}.manifest.json"
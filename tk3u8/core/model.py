@@ -1,13 +1,25 @@
+import inspect
 import logging
-from typing import Optional
-from tk3u8.cli.console import console
-from tk3u8.constants import OptionKey, Quality
+import os
+import threading
+from typing import Any, Callable, List, Optional
+from tk3u8.cli.console import console, headless_output
+from tk3u8.cli.dashboard import dashboard as shared_dashboard
+from tk3u8.constants import EventType, OptionKey, ProfileMode, Quality
 from tk3u8.core.downloader import Downloader
+from tk3u8.core.handle import DownloadHandle
+from tk3u8.core.scheduler import Clock, system_clock
 from tk3u8.core.stream_metadata_handler import StreamMetadataHandler
+from tk3u8.core.timing import RecordingTimings
+from tk3u8.exceptions import DownloadCancelledError, InvalidCookieError, InvalidProfileModeError
 from tk3u8.messages import messages
 from tk3u8.options_handler import OptionsHandler
 from tk3u8.paths_handler import PathsHandler
 from tk3u8.session.request_handler import RequestHandler
+from tk3u8.telemetry.events import EventCallback, EventDispatcher, events
+from tk3u8.telemetry.metrics import start_metrics_server
+from tk3u8.telemetry.profiling import profiler
+from tk3u8.telemetry.tracing import JSONLSpanExporter, tracer
 
 
 logger = logging.getLogger(__name__)
@@ -25,26 +37,37 @@ class Tk3u8:
     metadata processing, and downloading logic. Users are encouraged to
     interact with this class directly when integrating tk3u8 into their
     scripts.
+
+    The waits of the downloads, e.g., between the live status checks, run
+    on the given clock, which is real time unless replaced, e.g., in
+    simulations.
     """
     def __init__(
             self,
             program_data_dir: Optional[str] = None,
             config_file_path: Optional[str] = None,
-            downloads_dir: Optional[str] = None
+            downloads_dir: Optional[str] = None,
+            profile: Optional[str] = None,
+            clock: Clock = system_clock
     ) -> None:
         logger.debug("Initializing Tk3u8 class")
+        self._profile_mode = self._get_profile_mode(profile)
         self._paths_handler = PathsHandler(program_data_dir, config_file_path, downloads_dir)
         self._options_handler = OptionsHandler(self._paths_handler)
         self._request_handler = RequestHandler(self._options_handler)
         self._stream_metadata_handler = StreamMetadataHandler(
             self._request_handler,
-            self._options_handler
+            self._options_handler,
+            clock
         )
         self._downloader = Downloader(
             self._paths_handler,
             self._stream_metadata_handler,
-            self._options_handler
+            self._options_handler,
+            self._request_handler,
+            clock
         )
+        self._dispatcher = EventDispatcher()
 
     def download(
             self,
@@ -53,14 +76,27 @@ class Tk3u8:
             wait_until_live: Optional[bool] = None,
             timeout: Optional[int] = None,
             force_redownload: Optional[bool] = None,
-            use_h265: Optional[bool] = None
+            use_h265: Optional[bool] = None,
+            quality_fallback: Optional[list[str]] = None,
+            codec_fallback: Optional[bool] = None,
+            codec_policy: Optional[str] = None,
+            engine: Optional[str] = None,
+            max_bandwidth: Optional[int] = None,
+            min_bandwidth: Optional[int] = None,
+            priority: Optional[int] = None,
+            bandwidth_coordinator_port: Optional[int] = None,
+            metrics_port: Optional[int] = None,
+            trace_file: Optional[str] = None,
+            headless: Optional[bool] = None,
+            dashboard: Optional[bool] = None
     ) -> None:
         """
         Downloads a stream for the specified user with the given quality and options.
         Args:
             username (str): The username of the stream to download.
-            quality (str, optional): The desired stream quality. Defaults to
-                original".
+            quality (str, optional): The desired stream quality, or "auto" to
+                pick it based on the available bandwidth. Defaults to
+                "original".
             wait_until_live (bool, optional): Whether to wait until the stream
                 is live before downloading. Defaults to False.
             timeout (int, optional): The timeout (in seconds) before rechecking
@@ -68,15 +104,187 @@ class Tk3u8:
             force_redownload (bool, optional): Force re-download while the user
                 is live. Use this if you encounter auto-stopping of download.
                 Defaults to False.
+            use_h265 (bool, optional): Download the H.265 (HEVC) encoded
+                stream if True, or the H.264 (AVC) one if False. Defaults to
+                None, which prefers H.265 and falls back to H.264.
+            quality_fallback (list[str], optional): The qualities to fall
+                back to, in order, when the chosen quality is not available.
+                Defaults to an empty list.
+            codec_fallback (bool, optional): Fall back to the other video
+                codec when the chosen codec is not available. Defaults to
+                False.
+            codec_policy (str, optional): Choose the video codec by policy,
+                either "prefer_h265", "h264_only", or "h265_only". Overrides
+                use_h265 and codec_fallback. Defaults to None.
+            engine (str, optional): The engine to use for downloading, either
+                "yt-dlp" or "native". Defaults to "yt-dlp".
+            max_bandwidth (int, optional): The total download bandwidth (in
+                kbps) shared by all recordings. Defaults to unlimited.
+            min_bandwidth (int, optional): The minimum download bandwidth (in
+                kbps) guaranteed for this recording. Defaults to 0.
+            priority (int, optional): The share of the bandwidth left after
+                the minimums that this recording gets, relative to the other
+                recordings. Defaults to 1.
+            bandwidth_coordinator_port (int, optional): Share the bandwidth
+                limit with other tk3u8 processes on this host through a local
+                socket on this port. Defaults to None.
+            metrics_port (int, optional): Serve Prometheus metrics on
+                http://127.0.0.1:<port>/metrics. Defaults to None.
+            trace_file (str, optional): Write tracing spans of each poll and
+                recording phase to this JSONL file. Defaults to None.
+            headless (bool, optional): Turn off the rich output, and write
+                the lifecycle events as lines of JSON to stdout instead.
+                Defaults to False.
+            dashboard (bool, optional): Show a single dashboard of every
+                user being watched in this process instead of the rich
+                output of each of them. Ignored in the headless mode.
+                Defaults to False.
+
+        Raises:
+            Tk3u8Error: If the download can't be done, e.g., the user is
+                offline without waiting until live, or the quality is not
+                available. The subclasses are in 'tk3u8.exceptions'.
         """
         self._options_handler.save_args_values(
             wait_until_live=wait_until_live,
             timeout=timeout,
             force_redownload=force_redownload,
-            use_h265=use_h265
+            use_h265=use_h265,
+            quality_fallback=quality_fallback,
+            codec_fallback=codec_fallback,
+            codec_policy=codec_policy,
+            engine=engine,
+            max_bandwidth=max_bandwidth,
+            min_bandwidth=min_bandwidth,
+            priority=priority,
+            bandwidth_coordinator_port=bandwidth_coordinator_port,
+            metrics_port=metrics_port,
+            trace_file=trace_file,
+            headless=headless,
+            dashboard=dashboard
         )
-        self._stream_metadata_handler.initialize_data(username)
-        self._downloader.download(quality)
+        self._download(username, quality, threading.Event())
+
+    def start_download(self, username: str, quality: str = Quality.ORIGINAL.value, **kwargs: Any) -> DownloadHandle:
+        """
+        Starts downloading a stream in the background, and returns right
+        away with a handle of the download, which has its status and stats,
+        and can cancel it. Takes the same arguments as 'download()'.
+
+        Only one download of a Tk3u8 instance may run at a time, so use an
+        instance for each user to download many of them at once.
+
+        Returns:
+            DownloadHandle: The handle of the download. Its 'result()'
+                raises the error of the download, if any.
+        """
+        arguments = inspect.signature(self.download).bind(username, quality, **kwargs)
+        arguments.apply_defaults()
+        del arguments.arguments["username"], arguments.arguments["quality"]
+        self._options_handler.save_args_values(**arguments.arguments)
+
+        cancelled = threading.Event()
+        handle = DownloadHandle(username, cancelled)
+        handle.start(lambda: self._download(username, quality, cancelled))
+
+        return handle
+
+    def _download(self, username: str, quality: str, cancelled: threading.Event) -> None:
+        stop_output = self._start_output()
+        self._start_metrics_server()
+        self._start_tracing()
+
+        if self._profile_mode:
+            profiler.start(self._profile_mode, os.path.join(self._paths_handler.PROGRAM_DATA_DIR, "profiles"))
+
+        if self._dispatcher.has_callbacks():
+            self._dispatcher.username = username
+            events.add_writer(self._dispatcher)
+
+        try:
+            self._stream_metadata_handler.initialize_data(username)
+            self._downloader.download(quality, cancelled)
+        except DownloadCancelledError:
+            raise
+        except Exception as e:
+            events.emit(EventType.ERROR, username, error=type(e).__name__, message=str(e))
+            raise
+        finally:
+            if self._profile_mode:
+                profiler.stop()
+
+            if stop_output:
+                stop_output()
+
+            # The callbacks of the last events are done by the time this
+            # returns
+            events.remove_writer(self._dispatcher)
+            self._dispatcher.close()
+
+    def close(self) -> None:
+        """
+        Closes the session used for fetching the stream data. The instance
+        can't be used for downloading anymore afterwards, so only close it
+        once its downloads are done.
+        """
+        self._request_handler.close()
+
+    def get_timings(self) -> List[RecordingTimings]:
+        """
+        Gets the breakdown of how long it took for the first byte of each
+        recording to be written to disk, from the moment the user was seen
+        live, in the order the recordings were started.
+
+        Returns:
+            List[RecordingTimings]: The timings of each recording.
+        """
+        return self._downloader.get_timings()
+
+    def on_status_change(self, callback: EventCallback) -> EventCallback:
+        """
+        Registers a callback for when the live status of the user changes,
+        including when it's first checked. The data of the event has the
+        'previous' and the new 'live_status'.
+
+        Callbacks are called on a worker thread, in the order the events
+        happened, so they don't hold up checking and recording. Each
+        callback is called with the event, and is returned so this can be
+        used as a decorator. The same applies to the other callbacks.
+        """
+        return self._add_callback(EventType.STATUS_CHANGED, callback)
+
+    def on_recording_started(self, callback: EventCallback) -> EventCallback:
+        """
+        Registers a callback for when a recording starts. The data of the
+        event has the 'filename' (without its extension), 'download_dir',
+        'quality', 'codec' and 'engine'.
+        """
+        return self._add_callback(EventType.RECORDING_STARTED, callback)
+
+    def on_segment_written(self, callback: EventCallback) -> EventCallback:
+        """
+        Registers a callback for each segment written to the recording. The
+        data of the event has the 'sequence' number of the segment, its
+        'bytes', and the seconds it took to download it ('duration'). The
+        'native' engine also gives the time to first byte ('ttfb').
+        """
+        return self._add_callback(EventType.SEGMENT_WRITTEN, callback)
+
+    def on_recording_finished(self, callback: EventCallback) -> EventCallback:
+        """
+        Registers a callback for when a recording finishes. The data of the
+        event has the 'filename', its size in 'bytes', how long the
+        recording took in seconds ('duration'), and whether it ended
+        without an error ('ok').
+        """
+        return self._add_callback(EventType.RECORDING_FINISHED, callback)
+
+    def on_error(self, callback: EventCallback) -> EventCallback:
+        """
+        Registers a callback for when downloading fails with an error. The
+        data of the event has the name of the 'error' and its 'message'.
+        """
+        return self._add_callback(EventType.ERROR, callback)
 
     def set_proxy(self, proxy: str | None) -> None:
         """
@@ -102,7 +310,7 @@ class Tk3u8:
                 error_msg = messages.invalid_cookie_key_error.format(key=key)
                 console.print(error_msg)
                 logger.error(error_msg)
-                exit(1)
+                raise InvalidCookieError(f"Cookie key '{key}' is invalid.")
 
         new_sessionid_ss = self._options_handler.get_option_val(OptionKey.SESSIONID_SS)
         new_tt_target_idc = self._options_handler.get_option_val(OptionKey.TT_TARGET_IDC)
@@ -111,3 +319,74 @@ class Tk3u8:
         assert isinstance(new_tt_target_idc, str)
 
         self._request_handler.update_cookies(new_sessionid_ss, new_tt_target_idc)
+
+    def _add_callback(self, event_type: EventType, callback: EventCallback) -> EventCallback:
+        self._dispatcher.add_callback(event_type, callback)
+        return callback
+
+    def _start_output(self) -> Optional[Callable[[], None]]:
+        """Turns off the rich output in the headless and dashboard modes, and
+        starts writing the lifecycle events or showing the dashboard instead.
+        Returns what stops the output started by this call, if any, which is
+        called once the download is done."""
+        headless = self._options_handler.get_option_val(OptionKey.HEADLESS)
+        show_dashboard = self._options_handler.get_option_val(OptionKey.DASHBOARD)
+        refresh_rate = self._options_handler.get_option_val(OptionKey.DASHBOARD_REFRESH_RATE)
+
+        assert isinstance(headless, bool)
+        assert isinstance(show_dashboard, bool)
+        assert isinstance(refresh_rate, (int, float))
+
+        if headless:
+            headless_output.start()
+            return headless_output.stop
+
+        if show_dashboard and not shared_dashboard.is_running():
+            shared_dashboard.start(refresh_rate)
+            return shared_dashboard.stop
+
+        return None
+
+    def _start_metrics_server(self) -> None:
+        metrics_port = self._options_handler.get_option_val(OptionKey.METRICS_PORT)
+        assert isinstance(metrics_port, (int, type(None)))
+
+        if not metrics_port:
+            return
+
+        try:
+            server = start_metrics_server(metrics_port)
+        except OSError as e:
+            error_msg = messages.metrics_server_failed.format(port=metrics_port, error=e)
+            console.print(error_msg)
+            logger.warning(error_msg)
+            return
+
+        console.print(messages.serving_metrics.format(url=server.url))
+
+    def _start_tracing(self) -> None:
+        trace_file = self._options_handler.get_option_val(OptionKey.TRACE_FILE)
+        assert isinstance(trace_file, (str, type(None)))
+
+        if not trace_file or tracer.is_enabled():
+            return
+
+        try:
+            tracer.set_exporter(JSONLSpanExporter(trace_file))
+        except OSError as e:
+            error_msg = messages.tracing_failed.format(path=trace_file, error=e)
+            console.print(error_msg)
+            logger.warning(error_msg)
+            return
+
+        logger.debug(f"Writing tracing spans to: {trace_file}")
+
+    def _get_profile_mode(self, profile: Optional[str]) -> Optional[ProfileMode]:
+        if profile is None:
+            return None
+
+        try:
+            return ProfileMode(profile)
+        except ValueError:
+            logger.exception(f"{InvalidProfileModeError.__name__}: {InvalidProfileModeError(profile)}")
+            raise InvalidProfileModeError(profile)
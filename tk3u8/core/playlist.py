@@ -0,0 +1,85 @@
+from dataclasses import dataclass, field
+from typing import List, Optional
+from urllib.parse import urljoin
+
+
+@dataclass
+class Segment:
+    sequence: int
+    uri: str
+    duration: float
+    discontinuity: bool = False
+
+
+@dataclass
+class MediaPlaylist:
+    target_duration: float
+    media_sequence: int
+    segments: List[Segment] = field(default_factory=list)
+    is_ended: bool = False
+    variant_uris: List[str] = field(default_factory=list)
+
+    @property
+    def is_master(self) -> bool:
+        return bool(self.variant_uris)
+
+
+def parse_playlist(text: str, base_url: str) -> MediaPlaylist:
+    """
+    Parses an HLS playlist into a MediaPlaylist object.
+
+    Only the tags needed for recording a live stream are handled. Segment
+    and variant URIs are resolved against the given base URL. If the
+    playlist is a master playlist, the variant URIs are collected instead
+    of segments, in the same order they appear in the playlist.
+    """
+    target_duration: float = 0
+    media_sequence = 0
+    segments: List[Segment] = []
+    variant_uris: List[str] = []
+    is_ended = False
+
+    pending_duration: Optional[float] = None
+    pending_discontinuity = False
+    expecting_variant_uri = False
+
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+
+        if not line:
+            continue
+
+        if line.startswith("#EXT-X-TARGETDURATION:"):
+            target_duration = float(line.split(":", 1)[1])
+        elif line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+            media_sequence = int(line.split(":", 1)[1])
+        elif line.startswith("#EXTINF:"):
+            pending_duration = float(line.split(":", 1)[1].split(",", 1)[0])
+        elif line.startswith("#EXT-X-DISCONTINUITY") and not line.startswith("#EXT-X-DISCONTINUITY-SEQUENCE"):
+            pending_discontinuity = True
+        elif line.startswith("#EXT-X-ENDLIST"):
+            is_ended = True
+        elif line.startswith("#EXT-X-STREAM-INF"):
+            expecting_variant_uri = True
+        elif line.startswith("#"):
+            continue
+        elif expecting_variant_uri:
+            variant_uris.append(urljoin(base_url, line))
+            expecting_variant_uri = False
+        elif pending_duration is not None:
+            segments.append(Segment(
+                sequence=media_sequence + len(segments),
+                uri=urljoin(base_url, line),
+                duration=pending_duration,
+                discontinuity=pending_discontinuity
+            ))
+            pending_duration = None
+            pending_discontinuity = False
+
+    return MediaPlaylist(
+        target_duration=target_duration,
+        media_sequence=media_sequence,
+        segments=segments,
+        is_ended=is_ended,
+        variant_uris=variant_uris
+    )
@@ -0,0 +1,141 @@
+import logging
+from typing import List, Optional
+from tk3u8.constants import StreamLink
+from tk3u8.session.bandwidth import BandwidthLimiter
+
+
+logger = logging.getLogger(__name__)
+
+
+class ThroughputEstimator:
+    """
+    Estimates the achievable download throughput using an exponentially
+    weighted moving average of the throughput of each fetched segment.
+    """
+
+    def __init__(self, alpha: float = 0.3) -> None:
+        self._alpha = alpha
+        self._estimate_bps: Optional[float] = None
+        self.samples = 0
+
+    def add_sample(self, num_bytes: int, elapsed: float) -> None:
+        if elapsed <= 0:
+            return
+
+        sample_bps = num_bytes * 8 / elapsed
+
+        if self._estimate_bps is None:
+            self._estimate_bps = sample_bps
+        else:
+            self._estimate_bps = self._alpha * sample_bps + (1 - self._alpha) * self._estimate_bps
+
+        self.samples += 1
+
+    def get_estimate(self) -> Optional[float]:
+        return self._estimate_bps
+
+
+class AutoQualitySelector:
+    """
+    Picks the quality tier to record based on the measured throughput and
+    the bandwidth allocated to the recording by the bandwidth limiter.
+
+    The variants are sorted from the highest bitrate to the lowest. A tier
+    is considered sustainable if its bitrate, multiplied by the safety
+    margin, fits within the available bandwidth. Switching down happens as
+    soon as the current tier is no longer sustainable, while switching up
+    requires a bigger headroom and a few segments since the last switch to
+    avoid flapping between tiers.
+
+    Attributes:
+        _variants (List[StreamLink]): Available variants with known bitrates.
+        _limiter (BandwidthLimiter): The limiter shared by all recordings.
+        _recording_id (str): ID of the recording in the limiter.
+        _estimator (ThroughputEstimator): Throughput estimator of this recording.
+        _warmup_segments (int): Number of segments to measure before switching.
+        _segments_since_switch (int): Segments fetched since the last switch.
+    """
+
+    SAFETY_MARGIN = 1.25
+    UPSWITCH_MARGIN = 1.5
+
+    def __init__(
+            self,
+            variants: List[StreamLink],
+            limiter: BandwidthLimiter,
+            recording_id: str,
+            warmup_segments: int = 3
+    ) -> None:
+        self._variants = sorted(variants, key=lambda variant: variant.bitrate or 0, reverse=True)
+        self._limiter = limiter
+        self._recording_id = recording_id
+        self._estimator = ThroughputEstimator()
+        self._warmup_segments = warmup_segments
+        self._segments_since_switch = 0
+
+    def get_initial_variant(self) -> StreamLink:
+        """Gets the highest tier that fits the allocated bandwidth, as there
+        is no measured throughput yet."""
+        share = self._limiter.get_allocation(self._recording_id)
+
+        if share is None:
+            return self._variants[0]
+
+        return self._get_sustainable_variant(share, self.SAFETY_MARGIN)
+
+    def add_segment_sample(self, num_bytes: int, elapsed: float) -> None:
+        self._estimator.add_sample(num_bytes, elapsed)
+        self._segments_since_switch += 1
+
+    def select(self, current: StreamLink) -> StreamLink:
+        """Selects the tier to use for the next segment."""
+        if self._segments_since_switch < self._warmup_segments:
+            return current
+
+        available_bps = self._get_available_bps()
+        if available_bps is None:
+            return current
+
+        current_bitrate = current.bitrate or 0
+
+        if current_bitrate * self.SAFETY_MARGIN > available_bps:
+            selected = self._get_sustainable_variant(available_bps, self.SAFETY_MARGIN)
+        else:
+            selected = self._get_sustainable_variant(available_bps, self.UPSWITCH_MARGIN)
+            if (selected.bitrate or 0) <= current_bitrate:
+                return current
+
+        if selected.quality != current.quality:
+            logger.debug(
+                f"Switching quality from {current.quality} ({current.bitrate} bps) to "
+                f"{selected.quality} ({selected.bitrate} bps), available: {int(available_bps)} bps"
+            )
+            self._segments_since_switch = 0
+
+        return selected
+
+    def update_variants(self, variants: List[StreamLink]) -> None:
+        """Replaces the variants with the ones from refreshed stream links."""
+        if variants:
+            self._variants = sorted(variants, key=lambda variant: variant.bitrate or 0, reverse=True)
+
+    def get_throughput_estimate(self) -> Optional[float]:
+        return self._estimator.get_estimate()
+
+    def _get_available_bps(self) -> Optional[float]:
+        estimate = self._estimator.get_estimate()
+        share = self._limiter.get_allocation(self._recording_id)
+
+        if estimate is None:
+            return share
+        if share is None:
+            return estimate
+
+        return min(estimate, share)
+
+    def _get_sustainable_variant(self, available_bps: float, margin: float) -> StreamLink:
+        for variant in self._variants:
+            if (variant.bitrate or 0) * margin <= available_bps:
+                return variant
+
+        return self._variants[-1]
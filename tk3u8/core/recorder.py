@@ -0,0 +1,577 @@
+import io
+import logging
+import threading
+from typing import BinaryIO, Callable, List, Optional, Tuple, Union
+import requests
+from requests.exceptions import ChunkedEncodingError, ConnectionError, ReadTimeout
+from tk3u8.constants import EventType, StreamLink
+from tk3u8.core.helper import get_link_expiry
+from tk3u8.core.metadata import ManifestBuilder
+from tk3u8.core.playlist import MediaPlaylist, Segment, parse_playlist
+from tk3u8.core.quality_selector import AutoQualitySelector
+from tk3u8.core.scheduler import Clock, Task, run_task, system_clock
+from tk3u8.core.timing import RecordingTimer
+from tk3u8.exceptions import HLSLinkTemporarilyUnavailableError
+from tk3u8.messages import messages
+from tk3u8.cli.console import console
+from tk3u8.session.bandwidth import TokenBucket
+from tk3u8.telemetry.events import events
+from tk3u8.telemetry.metrics import (
+    recording_bytes_per_second,
+    recording_bytes_total,
+    segment_fetch_duration_seconds,
+    segment_queue_depth,
+    segments_dropped_total
+)
+from tk3u8.telemetry.tracing import tracer
+
+
+logger = logging.getLogger(__name__)
+
+# Where the segments are written to, which is the output file unless
+# another output is given, e.g., one that uploads the recording
+Output = Union[BinaryIO, io.RawIOBase]
+
+
+class HLSRecorder:
+    """
+    Records a live HLS stream by repeatedly fetching the media playlist and
+    appending each new segment to the output file as it appears.
+
+    When a quality selector is given, the quality tier can be switched in
+    between segments. After switching, the recording continues from the
+    next media sequence number if the new playlist still contains it.
+    Otherwise, it resyncs to the newest segment of the new playlist.
+
+    Stream links are signed and expire after some time. If a link refresher
+    is given, it is called in the background shortly before the link
+    expires, and the refreshed link is switched to at the next segment
+    boundary, the same way as switching quality tiers. If refreshing fails,
+    it's retried with a backoff, as often as needed to get a new link
+    before the old one expires. Once the link has expired, it's only
+    retried 'MAX_EXPIRED_REFRESH_RETRIES' times, after which the recording
+    stops with 'HLSLinkTemporarilyUnavailableError'.
+
+    The recording stops whenever the playlist is marked as ended, the
+    playlist can't be fetched for several times in a row, or no new segments
+    appeared for a while, which means the live stream has ended. It also
+    stops once it's requested to, e.g., when the download is cancelled.
+
+    If a manifest path is given, the hashes of the whole file and of each
+    segment are computed as the segments are written, and saved along with
+    the gaps and discontinuities as an integrity manifest once the
+    recording stops.
+
+    The waits between the fetches of the playlist and before the refreshes
+    of the link run on the given clock, and end early once the recording is
+    requested to stop.
+
+    If an output is given, the segments are written to it instead of the
+    output file, and it's closed once the recording stops.
+
+    Attributes:
+        _session (requests.Session): Session used for fetching the playlist
+            and segments.
+        _output_path (str): Path of the file where segments are written.
+        _stream_link (StreamLink): The stream link currently being recorded.
+        _quality_selector (AutoQualitySelector | None): Picks the quality
+            tier in between segments, if the quality is picked automatically.
+        _bucket (TokenBucket | None): Limits the download rate of segments.
+        _link_refresher (Callable | None): Gets a refreshed stream link for
+            the given stream link, or None if it can't be refreshed.
+        _refresh_margin (float): Seconds before the expiry of the link when
+            the link is refreshed.
+        _refresh_cancelled (threading.Event | None): Cancels the wait of the
+            next refresh once it's set.
+        _expired_refresh_retries (int): Number of times refreshing the link
+            was retried since it expired.
+        _refresh_failed (bool): Whether refreshing the expired link was given
+            up on, which stops the recording.
+        _timer (RecordingTimer | None): Marks when the recording starts and
+            when its first byte is written.
+        _username (str): The user being recorded, used as a label in the
+            metrics.
+        _stop_requested (threading.Event): Stops the recording once it's
+            set, keeping what was written so far.
+        _manifest_path (str | None): Path of the integrity manifest.
+        _output (io.RawIOBase | None): Where the segments are written to
+            instead of the output file, if given.
+        _manifest_builder (ManifestBuilder | None): Hashes the segments as
+            they're written, if there is a manifest path.
+        _started_at (float | None): When the recording started.
+        _pending_stream_link (StreamLink | None): Refreshed stream link that
+            is yet to be switched to.
+        _playlist_url (str): URL of the media playlist currently being polled.
+        _last_sequence (int | None): Media sequence number of the last
+            written segment.
+        _resync (bool): Whether the playlist was just switched.
+        bytes_written (int): Total number of bytes written.
+        segments_written (int): Total number of segments written.
+        segments_dropped (int): Number of segments that were skipped, either
+            because they fell off the playlist or failed to download.
+        _stats_reported_at (float | None): When the segment stats were last
+            emitted as an event.
+        _clock (Clock): Tells the time and runs the waits of the recording.
+    """
+
+    REQUEST_TIMEOUT = 10
+    CHUNK_SIZE = 64 * 1024
+    MAX_PLAYLIST_FAILURES = 5
+    MIN_STALL_TIMEOUT = 30
+    STALL_TIMEOUT_MULTIPLIER = 6
+    SEGMENT_STATS_INTERVAL = 10
+    REFRESH_RETRY_DELAY = 5
+    MIN_REFRESH_RETRY_DELAY = 1
+    MAX_EXPIRED_REFRESH_RETRIES = 5
+
+    def __init__(
+            self,
+            session: requests.Session,
+            output_path: str,
+            stream_link: StreamLink,
+            quality_selector: Optional[AutoQualitySelector] = None,
+            bucket: Optional[TokenBucket] = None,
+            link_refresher: Optional[Callable[[StreamLink], Optional[StreamLink]]] = None,
+            refresh_margin: float = 60,
+            timer: Optional[RecordingTimer] = None,
+            username: str = "",
+            stop_requested: Optional[threading.Event] = None,
+            manifest_path: Optional[str] = None,
+            output: Optional[io.RawIOBase] = None,
+            clock: Clock = system_clock
+    ) -> None:
+        self._session = session
+        self._output_path = output_path
+        self._stream_link = stream_link
+        self._quality_selector = quality_selector
+        self._bucket = bucket
+        self._link_refresher = link_refresher
+        self._refresh_margin = refresh_margin
+        self._refresh_cancelled: Optional[threading.Event] = None
+        self._refresh_stopped = False
+        self._expired_refresh_retries = 0
+        self._refresh_failed = False
+        self._timer = timer
+        self._username = username
+        self._stop_requested = stop_requested or threading.Event()
+        self._manifest_path = manifest_path
+        self._output = output
+        self._manifest_builder = ManifestBuilder() if manifest_path else None
+        self._started_at: Optional[float] = None
+        self._pending_stream_link: Optional[StreamLink] = None
+        self._lock = threading.Lock()
+        self._playlist_url = stream_link.link
+        self._last_sequence: Optional[int] = None
+        self._resync = False
+        self.bytes_written = 0
+        self.segments_written = 0
+        self.segments_dropped = 0
+        self._stats_reported_at: Optional[float] = None
+        self._clock = clock
+
+    def get_stream_link(self) -> StreamLink:
+        return self._stream_link
+
+    def record(self) -> None:
+        self._schedule_refresh()
+
+        try:
+            self._record()
+        finally:
+            with self._lock:
+                self._refresh_stopped = True
+
+            self._cancel_refresh()
+            self._report_segment_stats(force=True)
+
+            if self._manifest_builder and self._manifest_path:
+                self._manifest_builder.build().save(self._manifest_path)
+
+            recording_bytes_per_second.remove(username=self._username)
+            segment_queue_depth.remove(username=self._username)
+
+    def _record(self) -> None:
+        self._started_at = self._clock.monotonic()
+
+        if self._timer:
+            self._timer.mark_engine_started()
+
+        with self._open_output() as file:
+            if self._manifest_builder and file.tell() > 0:
+                self._manifest_builder.add_existing_content(self._output_path)
+
+            run_task(self._build_polling(file), self._clock, self._stop_requested)
+
+    def _build_polling(self, file: Output) -> Task:
+        """Builds the polling of the playlist, which writes the new segments
+        of each fetch, and waits between the fetches."""
+        playlist_failures = 0
+        last_new_segment_time = self._clock.monotonic()
+
+        while not self._stop_requested.is_set():
+            self._apply_pending_stream_link()
+
+            if self._refresh_failed:
+                logger.exception(f"{HLSLinkTemporarilyUnavailableError.__name__}: {HLSLinkTemporarilyUnavailableError()}")
+                raise HLSLinkTemporarilyUnavailableError()
+
+            playlist = self._fetch_playlist()
+
+            if playlist is None:
+                playlist_failures += 1
+
+                if playlist_failures >= self.MAX_PLAYLIST_FAILURES:
+                    logger.debug(f"Playlist failed {playlist_failures} times in a row, stopping recording")
+                    return
+
+                yield 1
+                continue
+
+            playlist_failures = 0
+
+            if playlist.is_master:
+                self._playlist_url = playlist.variant_uris[0]
+                logger.debug(f"Master playlist found, using first variant: {self._playlist_url}")
+                continue
+
+            new_segments = self._get_new_segments(playlist)
+
+            for index, segment in enumerate(new_segments):
+                segment_queue_depth.set(len(new_segments) - index, username=self._username)
+                self._write_segment(file, segment)
+
+                if self._stop_requested.is_set() or self._apply_pending_stream_link() or self._switch_quality_if_needed():
+                    break
+
+            segment_queue_depth.set(0, username=self._username)
+
+            if new_segments:
+                last_new_segment_time = self._clock.monotonic()
+
+            if playlist.is_ended:
+                logger.debug("Playlist has ended, stopping recording")
+                return
+
+            stall_timeout = max(playlist.target_duration * self.STALL_TIMEOUT_MULTIPLIER, self.MIN_STALL_TIMEOUT)
+            if self._clock.monotonic() - last_new_segment_time > stall_timeout:
+                logger.debug(f"No new segments for {stall_timeout} seconds, stopping recording")
+                return
+
+            if not self._resync:
+                yield max(playlist.target_duration / 2, 1)
+
+    def _open_output(self) -> Output:
+        if self._output is not None:
+            return self._output
+
+        return open(self._output_path, "ab")
+
+    def _fetch_playlist(self) -> Optional[MediaPlaylist]:
+        with tracer.start_span("playlist_fetch", kind="CLIENT", url=self._playlist_url) as span:
+            try:
+                response = self._session.get(self._playlist_url, timeout=self.REQUEST_TIMEOUT)
+            except (ConnectionError, ReadTimeout) as e:
+                logger.warning(f"{type(e).__name__} occurred while fetching playlist: {e}")
+
+                if span:
+                    span.error = f"{type(e).__name__}: {e}"
+
+                return None
+
+            if span:
+                span.set_attribute("status", response.status_code)
+
+        if response.status_code != 200:
+            logger.warning(f"Fetching playlist failed due to status code: {response.status_code}")
+            return None
+
+        return parse_playlist(response.text, response.url or self._playlist_url)
+
+    def _get_new_segments(self, playlist: MediaPlaylist) -> List[Segment]:
+        segments = playlist.segments
+
+        if not segments or self._last_sequence is None:
+            self._resync = False
+            return segments
+
+        if self._resync:
+            self._resync = False
+            first_sequence = segments[0].sequence
+            last_sequence = segments[-1].sequence
+
+            if not first_sequence <= self._last_sequence + 1 <= last_sequence + 1:
+                logger.debug(f"Media sequence is not continuous after switching, resyncing to segment #{last_sequence}")
+                segments[-1].discontinuity = True
+                return segments[-1:]
+
+        new_segments = [segment for segment in segments if segment.sequence > self._last_sequence]
+
+        if new_segments and new_segments[0].sequence > self._last_sequence + 1:
+            dropped = new_segments[0].sequence - self._last_sequence - 1
+            self.segments_dropped += dropped
+
+            if self._manifest_builder:
+                self._manifest_builder.add_gap(self._last_sequence + 1, new_segments[0].sequence - 1, "fell_off_playlist")
+
+            segments_dropped_total.inc(dropped, username=self._username)
+            logger.warning(f"{dropped} segment(s) fell off the playlist before they were downloaded")
+
+        return new_segments
+
+    def _write_segment(self, file: Output, segment: Segment) -> None:
+        with tracer.start_span("segment", sequence=segment.sequence, quality=self._stream_link.quality):
+            self._fetch_and_write_segment(file, segment)
+
+    def _fetch_and_write_segment(self, file: Output, segment: Segment) -> None:
+        started_at = self._clock.monotonic()
+        fetched_segment = self._fetch_segment(segment)
+
+        if fetched_segment is None:
+            self._drop_segment(segment)
+            return
+
+        content, ttfb = fetched_segment
+        elapsed = self._clock.monotonic() - started_at
+        segment_fetch_duration_seconds.observe(elapsed, username=self._username)
+
+        with tracer.start_span("segment_write", sequence=segment.sequence, bytes=len(content)):
+            file.write(content)
+            file.flush()
+
+        if self._manifest_builder:
+            self._manifest_builder.add_segment(segment.sequence, content, segment.duration, self._stream_link.quality, segment.discontinuity)
+
+        if self._timer:
+            self._timer.mark_first_byte(ttfb)
+
+        self._last_sequence = segment.sequence
+        events.emit(
+            EventType.SEGMENT_WRITTEN,
+            self._username,
+            sequence=segment.sequence,
+            quality=self._stream_link.quality,
+            bytes=len(content),
+            duration=round(elapsed, 3),
+            ttfb=round(ttfb, 3)
+        )
+        self.bytes_written += len(content)
+        self.segments_written += 1
+        recording_bytes_total.inc(len(content), username=self._username)
+
+        if self._started_at is not None:
+            recording_bytes_per_second.set(self.bytes_written / max(self._clock.monotonic() - self._started_at, 1e-3), username=self._username)
+
+        if self._quality_selector:
+            self._quality_selector.add_segment_sample(len(content), elapsed)
+
+        self._report_segment_stats()
+
+    def _fetch_segment(self, segment: Segment) -> Optional[Tuple[bytes, float]]:
+        """Fetches the segment, and returns its content along with the time
+        to first byte, or None if it failed."""
+        started_at = self._clock.monotonic()
+
+        with tracer.start_span("segment_fetch", kind="CLIENT", url=segment.uri, sequence=segment.sequence) as span:
+            try:
+                with self._session.get(segment.uri, timeout=self.REQUEST_TIMEOUT, stream=True) as response:
+                    ttfb = self._clock.monotonic() - started_at
+
+                    if span:
+                        span.set_attribute("status", response.status_code)
+                        span.set_attribute("ttfb", ttfb)
+
+                    if response.status_code != 200:
+                        error_msg = f"Fetching segment #{segment.sequence} failed due to status code: {response.status_code}"
+                        logger.warning(error_msg)
+
+                        if span:
+                            span.error = error_msg
+
+                        return None
+
+                    content = self._read_content(response)
+            except (ConnectionError, ReadTimeout, ChunkedEncodingError) as e:
+                logger.warning(f"{type(e).__name__} occurred while fetching segment #{segment.sequence}: {e}")
+
+                if span:
+                    span.error = f"{type(e).__name__}: {e}"
+
+                return None
+
+        return content, ttfb
+
+    def _read_content(self, response: requests.Response) -> bytes:
+        chunks = []
+
+        for chunk in response.iter_content(chunk_size=self.CHUNK_SIZE):
+            if self._bucket:
+                self._bucket.consume(len(chunk))
+            chunks.append(chunk)
+
+        return b"".join(chunks)
+
+    def _drop_segment(self, segment: Segment) -> None:
+        if self._manifest_builder:
+            self._manifest_builder.add_gap(segment.sequence, segment.sequence, "fetch_failed")
+
+        self._last_sequence = segment.sequence
+        self.segments_dropped += 1
+        segments_dropped_total.inc(username=self._username)
+
+    def _report_segment_stats(self, force: bool = False) -> None:
+        """Emits the segment stats so far, at most once every
+        'SEGMENT_STATS_INTERVAL' seconds unless forced."""
+        if not events.is_enabled():
+            return
+
+        now = self._clock.monotonic()
+        if not force and self._stats_reported_at is not None and now - self._stats_reported_at < self.SEGMENT_STATS_INTERVAL:
+            return
+
+        self._stats_reported_at = now
+        elapsed = now - self._started_at if self._started_at is not None else 0
+
+        events.emit(
+            EventType.SEGMENT_STATS,
+            self._username,
+            quality=self._stream_link.quality,
+            segments_written=self.segments_written,
+            segments_dropped=self.segments_dropped,
+            bytes_written=self.bytes_written,
+            bytes_per_second=round(self.bytes_written / max(elapsed, 1e-3)),
+            last_sequence=self._last_sequence
+        )
+
+    def _switch_quality_if_needed(self) -> bool:
+        """Switches to the tier picked by the quality selector. Returns True
+        if the tier has been switched."""
+        if not self._quality_selector:
+            return False
+
+        selected = self._quality_selector.select(self._stream_link)
+        if selected.quality == self._stream_link.quality:
+            return False
+
+        throughput = self._quality_selector.get_throughput_estimate() or 0
+        switching_msg = messages.switching_quality.format(
+            old_quality=self._stream_link.quality,
+            new_quality=selected.quality,
+            throughput_kbps=int(throughput / 1000)
+        )
+        console.print(switching_msg)
+        logger.info(switching_msg)
+
+        self._switch_stream_link(selected)
+
+        return True
+
+    def _switch_stream_link(self, stream_link: StreamLink) -> None:
+        self._stream_link = stream_link
+        self._playlist_url = stream_link.link
+        self._resync = True
+        self._schedule_refresh()
+
+    def _apply_pending_stream_link(self) -> bool:
+        """Switches to the refreshed stream link, if there is one. Returns
+        True if the stream link has been switched."""
+        with self._lock:
+            pending_stream_link = self._pending_stream_link
+            self._pending_stream_link = None
+
+        if not pending_stream_link:
+            return False
+
+        # The quality may have been switched while refreshing
+        if pending_stream_link.quality != self._stream_link.quality:
+            return False
+
+        logger.debug(f"Switching to refreshed stream link: {pending_stream_link}")
+        self._switch_stream_link(pending_stream_link)
+
+        return True
+
+    def _schedule_refresh(self) -> None:
+        self._cancel_refresh()
+
+        if not self._link_refresher:
+            return
+
+        expiry = get_link_expiry(self._stream_link.link)
+        if expiry is None:
+            logger.debug("Stream link has no expiry time, it won't be refreshed")
+            return
+
+        delay = max(expiry - self._refresh_margin - self._clock.time(), 0)
+        logger.debug(f"Stream link expires at {expiry}, refreshing it in {delay:.0f} seconds")
+
+        self._start_refresh_timer(delay, self._stream_link, 0)
+
+    def _start_refresh_timer(self, delay: float, stream_link: StreamLink, attempt: int) -> None:
+        with self._lock:
+            # The recording may have stopped or switched to another link
+            # while the refresh was failing
+            if self._refresh_stopped or stream_link is not self._stream_link:
+                return
+
+            refresh_cancelled = threading.Event()
+            self._refresh_cancelled = refresh_cancelled
+
+        threading.Thread(
+            target=self._wait_and_refresh,
+            args=(delay, stream_link, attempt, refresh_cancelled),
+            name="tk3u8-link-refresh",
+            daemon=True
+        ).start()
+
+    def _wait_and_refresh(self, delay: float, stream_link: StreamLink, attempt: int, refresh_cancelled: threading.Event) -> None:
+        if self._clock.wait(refresh_cancelled, delay):
+            return
+
+        self._refresh_stream_link(stream_link, attempt)
+
+    def _cancel_refresh(self) -> None:
+        with self._lock:
+            if self._refresh_cancelled:
+                self._refresh_cancelled.set()
+                self._refresh_cancelled = None
+
+    def _refresh_stream_link(self, stream_link: StreamLink, attempt: int = 0) -> None:
+        assert self._link_refresher is not None
+
+        try:
+            refreshed_stream_link = self._link_refresher(stream_link)
+        except Exception as e:
+            logger.warning(f"Refreshing stream link failed due to {type(e).__name__}: {e}")
+            self._retry_refresh(stream_link, attempt)
+            return
+
+        if not refreshed_stream_link or refreshed_stream_link.link == stream_link.link:
+            logger.warning("Refreshing stream link did not return a new link")
+            self._retry_refresh(stream_link, attempt)
+            return
+
+        with self._lock:
+            self._pending_stream_link = refreshed_stream_link
+            self._expired_refresh_retries = 0
+
+    def _retry_refresh(self, stream_link: StreamLink, attempt: int) -> None:
+        """Retries refreshing the stream link with an exponential backoff,
+        which is cut short so that at least a few more retries happen
+        before the link expires."""
+        delay = self.REFRESH_RETRY_DELAY * 2 ** attempt
+        expiry = get_link_expiry(stream_link.link)
+
+        if expiry is not None:
+            delay = min(delay, max((expiry - self._clock.time()) / 4, self.MIN_REFRESH_RETRY_DELAY))
+
+            if expiry <= self._clock.time():
+                with self._lock:
+                    self._expired_refresh_retries += 1
+
+                    if self._expired_refresh_retries > self.MAX_EXPIRED_REFRESH_RETRIES:
+                        logger.warning(f"Stream link expired and couldn't be refreshed after {self.MAX_EXPIRED_REFRESH_RETRIES} retries")
+                        self._refresh_failed = True
+                        return
+
+        logger.debug(f"Retrying to refresh the stream link in {delay:.0f} seconds")
+        self._start_refresh_timer(delay, stream_link, attempt + 1)
@@ -0,0 +1,116 @@
+from dataclasses import dataclass, field
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Callable, Generator, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# A step-by-step wait, which yields how many seconds to wait before its next
+# step, so it can be run on its own or along with others on one thread
+Task = Generator[float, None, None]
+
+
+class Clock:
+    """
+    Tells the time and waits, in real time. Waits are run against a clock
+    instead of the 'time' module, so they can be replaced with one that runs
+    faster than real time, e.g., in simulations.
+    """
+
+    def time(self) -> float:
+        return time.time()
+
+    def monotonic(self) -> float:
+        return time.monotonic()
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+    def wait(self, event: threading.Event, seconds: float) -> bool:
+        """Waits until the event is set or the seconds pass, and returns
+        whether the event is set."""
+        return event.wait(seconds)
+
+
+system_clock = Clock()
+
+
+def countdown(seconds: int, on_tick: Callable[[int], None]) -> Task:
+    """Counts down from the given seconds to 0, one second at a time, and
+    calls 'on_tick' with the remaining seconds at each of them."""
+    for remaining in range(seconds, -1, -1):
+        on_tick(remaining)
+        yield 1
+
+
+def run_task(task: Task, clock: Clock = system_clock, stopped: Optional[threading.Event] = None) -> None:
+    """Runs the task until it's done, waiting on the clock between its
+    steps. If the 'stopped' event is given, setting it stops the task in
+    the middle of its wait."""
+    for delay in task:
+        if stopped is None:
+            clock.sleep(delay)
+        elif clock.wait(stopped, delay):
+            return
+
+
+@dataclass(order=True)
+class _ScheduledTask:
+    due: float
+    order: int
+    task: Task = field(compare=False)
+
+
+class Scheduler:
+    """
+    Runs many tasks cooperatively on one thread, e.g., the waits of many
+    users being watched. Each task is stepped once its wait is over, in the
+    order their waits end, and the scheduler only sleeps until the next one
+    is due. If the 'stopped' event is given, setting it stops the scheduler
+    in the middle of its wait, leaving the tasks that weren't done.
+    """
+
+    def __init__(self, clock: Clock = system_clock, stopped: Optional[threading.Event] = None) -> None:
+        self._clock = clock
+        self._stopped = stopped
+        self._queue: List[_ScheduledTask] = []
+        self._counter = itertools.count()
+
+    def add(self, task: Task) -> None:
+        """Adds a task, whose first step runs right away."""
+        heapq.heappush(self._queue, _ScheduledTask(self._clock.monotonic(), next(self._counter), task))
+
+    def get_pending_count(self) -> int:
+        return len(self._queue)
+
+    def run(self) -> None:
+        """Runs the tasks until all of them are done, or the scheduler is
+        stopped."""
+        while self._queue:
+            wait = self._queue[0].due - self._clock.monotonic()
+
+            if self._stopped is not None:
+                if self._clock.wait(self._stopped, max(wait, 0)):
+                    return
+            elif wait > 0:
+                self._clock.sleep(wait)
+
+            scheduled = heapq.heappop(self._queue)
+
+            try:
+                delay = next(scheduled.task)
+            except StopIteration:
+                continue
+            except Exception:
+                logger.exception("A scheduled task failed")
+                continue
+
+            # Scheduling from when the step was due rather than when it ran
+            # keeps the tasks from drifting when the thread falls behind
+            scheduled.due = max(scheduled.due, self._clock.monotonic() - delay) + delay
+            scheduled.order = next(self._counter)
+            heapq.heappush(self._queue, scheduled)
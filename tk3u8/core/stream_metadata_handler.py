@@ -1,10 +1,13 @@
 import logging
-from typing import List, Optional
-from tk3u8.constants import LiveStatus, StreamLink
-from tk3u8.cli.console import console
+import sys
+from typing import Dict, List, Optional, Tuple
+from tk3u8.constants import CODEC_NAMES, CodecPolicy, EventType, LiveStatus, OptionKey, StreamLink
+from tk3u8.cli.console import console, status
 from tk3u8.core.extractor import APIExtractor, Extractor, WebpageExtractor
-from tk3u8.core.helper import is_user_exists, is_username_valid
+from tk3u8.core.helper import get_stream_bitrates, is_user_exists, is_username_valid
+from tk3u8.core.scheduler import Clock, system_clock
 from tk3u8.exceptions import (
+    ExtractionFailedError,
     HLSLinkNotFoundError,
     HLSLinkTemporarilyUnavailableError,
     InvalidQualityError,
@@ -19,11 +22,60 @@ from tk3u8.exceptions import (
 from tk3u8.messages import messages
 from tk3u8.options_handler import OptionsHandler
 from tk3u8.session.request_handler import RequestHandler
+from tk3u8.telemetry.events import events
+from tk3u8.telemetry.metrics import extractor_attempts_total, process_data_duration_seconds
+from tk3u8.telemetry.profiling import profiler
+from tk3u8.telemetry.tracing import tracer
 
 
 logger = logging.getLogger(__name__)
 
 
+class WatchState:
+    """
+    The state of a user being watched, which is kept between checks. Only
+    what's needed to schedule the checks and to start a recording is kept,
+    while the payloads the state was extracted from are dropped right away,
+    so a user that is offline only takes a few hundred bytes.
+
+    Attributes:
+        username (str | None): The user being watched.
+        live_status (LiveStatus | None): The live status from the last check.
+        start_time (int | None): Time when the stream started, if known.
+        last_process_duration (float | None): Seconds it took to check the
+            user the last time.
+        stream_links (dict | None): Available stream links by quality and
+            codec, which are only kept while the user is live.
+        stream_bitrates (dict | None): Video bitrates of the stream links by
+            quality and codec, which are only kept while the user is live.
+    """
+
+    __slots__ = ("username", "live_status", "start_time", "last_process_duration", "stream_links", "stream_bitrates")
+
+    def __init__(self) -> None:
+        self.username: Optional[str] = None
+        self.live_status: Optional[LiveStatus] = None
+        self.start_time: Optional[int] = None
+        self.last_process_duration: Optional[float] = None
+        self.stream_links: Optional[dict] = None
+        self.stream_bitrates: Optional[Dict[str, Dict[str, Optional[int]]]] = None
+
+    def set_offline(self, live_status: LiveStatus) -> None:
+        self.live_status = live_status
+        self.start_time = None
+        self.stream_links = None
+        self.stream_bitrates = None
+
+
+def _intern_keys(data: dict) -> dict:
+    """Interns the quality and codec keys, which are the same few strings
+    for every user, so they're only kept in memory once."""
+    return {
+        sys.intern(key): _intern_keys(value) if isinstance(value, dict) else value
+        for key, value in data.items()
+    }
+
+
 class StreamMetadataHandler:
     """
     Handles the retrieval, validation, and management of stream metadata for a given user.
@@ -36,56 +88,93 @@ class StreamMetadataHandler:
         _request_handler (RequestHandler): Handles HTTP requests for data extraction.
         _options_handler (OptionsHandler): Manages configuration options.
         _extractor_classes (List[type[Extractor]]): List of extractor classes to use for data retrieval.
-        _source_data (dict): Raw data obtained from the extractor.
-        _stream_data (dict): Processed stream data.
-        _stream_links (dict): Available stream links by quality.
-        _live_status (LiveStatus | None): Current live status of the stream.
-        _username (str | None): Username for which metadata is being handled.
+        _state (WatchState): What was extracted for the user the last time.
+        _clock (Clock): Tells the time that processing the data takes.
     """
-    def __init__(self, request_handler: RequestHandler, options_handler: OptionsHandler):
+    def __init__(self, request_handler: RequestHandler, options_handler: OptionsHandler, clock: Clock = system_clock):
         self._request_handler = request_handler
         self._options_handler = options_handler
+        self._clock = clock
         self._extractor_classes: List[type[Extractor]] = [APIExtractor, WebpageExtractor]
-        self._source_data: dict = {}
-        self._stream_data: dict = {}
-        self._stream_links: dict = {}
-        self._live_status: LiveStatus | None = None
-        self._username: str | None = None
+        self._state = WatchState()
 
     def initialize_data(self, username: str) -> None:
-        with console.status(messages.processing_data):
+        with status(messages.processing_data):
             self._process_data(username)
 
     def update_data(self) -> None:
-        with console.status(messages.processing_data):
+        with status(messages.processing_data):
             self._process_data()
 
+    def refresh_data(self, username: Optional[str] = None) -> None:
+        """Updates the data without showing the status spinner, which is used
+        for refreshing the data in the background while recording, and for
+        polling many users at once."""
+        self._process_data(username)
+
     def get_username(self) -> str:
-        assert isinstance(self._username, str)
+        assert isinstance(self._state.username, str)
 
-        return self._username
+        return self._state.username
 
     def get_live_status(self) -> LiveStatus:
-        assert isinstance(self._live_status, LiveStatus)
+        assert isinstance(self._state.live_status, LiveStatus)
+
+        return self._state.live_status
 
-        return self._live_status
+    def get_start_time(self) -> Optional[int]:
+        return self._state.start_time
+
+    def get_last_process_duration(self) -> Optional[float]:
+        return self._state.last_process_duration
+
+    def get_stream_link(self, quality: str, use_h265: Optional[bool]) -> StreamLink:
+        """
+        Gets the stream link for the given quality and codec.
+
+        If the link of the chosen quality and codec is unavailable (either
+        missing or an empty string), the fallback ladder from the
+        'quality_fallback' option and the codec ladder is walked in order,
+        and the first available link from the already fetched stream links
+        is used instead. Each quality is tried with every codec in the ladder
+        before moving on to the next quality.
+        """
+        stream_links = self._state.stream_links or {}
 
-    def get_stream_link(self, quality: str, use_h265: bool) -> StreamLink:
         try:
-            if quality in self._stream_links:
-                assert isinstance(self._username, str)
-                codec, formatted_codec_str = ("h265", "H.265") if use_h265 else ("h264", "H.264")
-                stream_link = self._stream_links[quality][codec]
+            if quality in stream_links:
+                codecs = self._get_codec_ladder(use_h265)
+                codec = codecs[0]
+
+                for fallback_quality, fallback_codec in self._get_fallback_ladder(quality, codecs):
+                    stream_link = stream_links[fallback_quality].get(fallback_codec)
+
+                    if not stream_link:
+                        continue
+
+                    if (fallback_quality, fallback_codec) != (quality, codec):
+                        fallback_msg = messages.falling_back_to_quality.format(
+                            quality=quality,
+                            codec=CODEC_NAMES[codec],
+                            fallback_quality=fallback_quality,
+                            fallback_codec=CODEC_NAMES[fallback_codec]
+                        )
+                        console.print(fallback_msg)
+                        logger.warning(fallback_msg)
+
+                    stream_link_obj = StreamLink(fallback_quality, stream_link, codec=fallback_codec)
+                    logger.debug(f"Chosen stream link: {stream_link_obj} ({CODEC_NAMES[fallback_codec]})")
+
+                    return stream_link_obj
+
+                stream_link = stream_links[quality].get(codec)
 
                 if stream_link == "":
                     logger.exception(f"{HLSLinkTemporarilyUnavailableError.__name__}: {HLSLinkTemporarilyUnavailableError()}")
                     console.print(messages.empty_stream_link_error)
-                    exit(0)
+                    raise HLSLinkTemporarilyUnavailableError()
 
-                stream_link_obj = StreamLink(quality, stream_link)
-                logger.debug(f"Chosen stream link: {stream_link_obj} ({formatted_codec_str})")
-
-                return stream_link_obj
+                return StreamLink(quality, stream_link, codec=codec)
 
             logger.exception(f"{InvalidQualityError.__name__}: {InvalidQualityError}")
             raise InvalidQualityError()
@@ -93,74 +182,221 @@ class StreamMetadataHandler:
             logger.exception(f"{QualityNotAvailableError.__name__}: {QualityNotAvailableError}")
             raise QualityNotAvailableError()
 
+    def find_stream_link(self, quality: str, codec: str) -> Optional[StreamLink]:
+        """Gets the stream link of the exact quality and codec without any
+        fallback, or None if it's not available."""
+        link = (self._state.stream_links or {}).get(quality, {}).get(codec)
+
+        if not link:
+            return None
+
+        return StreamLink(quality, link, (self._state.stream_bitrates or {}).get(quality, {}).get(codec), codec)
+
+    def get_all_stream_links(self) -> List[str]:
+        """Gets the links of every available quality and codec."""
+        return [
+            link
+            for links_by_codec in (self._state.stream_links or {}).values()
+            for link in links_by_codec.values()
+            if link
+        ]
+
+    def get_stream_variants(self, use_h265: Optional[bool]) -> List[StreamLink]:
+        """
+        Gets all of the available stream links of the first codec in the
+        codec ladder that has any, which is used for picking the quality
+        automatically. Only the stream links with a known bitrate are
+        included.
+        """
+        stream_links = self._state.stream_links or {}
+        stream_bitrates = self._state.stream_bitrates or {}
+
+        for codec in self._get_codec_ladder(use_h265):
+            variants = []
+
+            for quality, links_by_codec in stream_links.items():
+                link = links_by_codec.get(codec)
+                bitrate = stream_bitrates.get(quality, {}).get(codec)
+
+                if link and bitrate:
+                    variants.append(StreamLink(quality, link, bitrate, codec))
+
+            if variants:
+                logger.debug(f"Available stream variants ({CODEC_NAMES[codec]}): {variants}")
+                return variants
+
+        return []
+
+    def _get_codec_ladder(self, use_h265: Optional[bool]) -> List[str]:
+        """
+        Builds the ordered list of codecs to try. The 'codec_policy' option
+        takes precedence if set. Otherwise, if 'use_h265' is set, the codec is
+        chosen through it, and the other codec is only used as a fallback if
+        the 'codec_fallback' option is enabled. If neither is set, H.265 is
+        preferred, falling back to H.264, the same as the 'prefer_h265'
+        policy.
+        """
+        codec_policy = self._options_handler.get_option_val(OptionKey.CODEC_POLICY)
+        codec_fallback = self._options_handler.get_option_val(OptionKey.CODEC_FALLBACK)
+
+        assert isinstance(codec_policy, (str, type(None)))
+        assert isinstance(codec_fallback, bool)
+
+        if codec_policy == CodecPolicy.PREFER_H265.value:
+            return ["h265", "h264"]
+        elif codec_policy == CodecPolicy.H264_ONLY.value:
+            return ["h264"]
+        elif codec_policy == CodecPolicy.H265_ONLY.value:
+            return ["h265"]
+        elif codec_policy is not None:
+            logger.warning(f"Ignoring unknown codec policy: {codec_policy}")
+
+        if use_h265 is None:
+            return ["h265", "h264"]
+
+        codecs = ["h265", "h264"] if use_h265 else ["h264", "h265"]
+
+        return codecs if codec_fallback else codecs[:1]
+
+    def _get_fallback_ladder(self, quality: str, codecs: List[str]) -> List[Tuple[str, str]]:
+        """
+        Builds the ordered list of (quality, codec) pairs to try, starting
+        with the chosen quality and the first codec of the codec ladder.
+        """
+        quality_fallback = self._options_handler.get_option_val(OptionKey.QUALITY_FALLBACK)
+        assert isinstance(quality_fallback, list)
+
+        qualities = [quality]
+        for fallback_quality in quality_fallback:
+            if fallback_quality not in (self._state.stream_links or {}):
+                logger.warning(f"Ignoring unknown quality in fallback ladder: {fallback_quality}")
+                continue
+
+            if fallback_quality not in qualities:
+                qualities.append(fallback_quality)
+
+        return [(q, c) for q in qualities for c in codecs]
+
     def _process_data(self, username: Optional[str] = None) -> None:
         """
         Processes stream metadata for the given username.
 
         Whenever the first extractor fails due to the given exceptions, the next
         available extractor will be used. When all of the available extractors
-        failed, the program will exit.
+        failed, 'ExtractionFailedError' is raised.
         """
+        state = self._state
+
+        # The live status of another user doesn't count as a change
+        previous_live_status = state.live_status
+
         if username:
-            self._username = self._validate_username(username)
-
-        assert isinstance(self._username, str)
-        logger.debug(messages.processing_data_for_user.format(username=self._username))
-
-        for idx, extractor_class in enumerate(self._extractor_classes):
-            logger.debug(messages.trying_extractor.format(
-                pos=idx + 1,
-                extractor_class_name=extractor_class.__name__
-            ))
-
-            try:
-                extractor = extractor_class(self._username, self._request_handler)
-
-                self._source_data = self._get_and_validate_source_data(extractor, extractor_class)
-                self._live_status = extractor.get_live_status(self._source_data)
-
-                if self._live_status in (LiveStatus.OFFLINE, LiveStatus.PREPARING_TO_GO_LIVE):
-                    break
-
-                self._stream_data = extractor.get_stream_data(self._source_data)
-                self._stream_links = extractor.get_stream_links(self._stream_data)
-
-                break
-            except (
-                WAFChallengeError,
-                SigiStateMissingError,
-                StreamDataNotFoundError,
-                HLSLinkNotFoundError
-            ) as e:
-                if idx != len(self._extractor_classes) - 1:
-                    error_msg = messages.current_extractor_failed.format(
-                        current_extr_pos=idx + 1,
-                        current_extr_name=extractor.__class__.__name__,
-                        exc_name=type(e).__name__,
-                        next_extr_pos=idx + 2
-                    )
-                    console.print(error_msg)
-                    logger.error(error_msg)
-                else:
-                    error_msg = messages.last_extractor_failed.format(
-                        current_extr_pos=idx + 1,
-                        current_extr_name=extractor.__class__.__name__,
-                        exc_name=type(e).__name__,
-                    )
-                    console.print(error_msg)
-                    logger.error(error_msg)
-                    exit()
+            validated_username = self._validate_username(username)
+
+            if validated_username != state.username:
+                previous_live_status = None
+
+            state.username = sys.intern(validated_username)
+
+        username = state.username
+        assert isinstance(username, str)
+        logger.debug(messages.processing_data_for_user.format(username=username))
+        started_at = self._clock.monotonic()
+        base_url = self._options_handler.get_option_val(OptionKey.BASE_URL)
+        assert isinstance(base_url, str)
+
+        with profiler.phase("poll"), tracer.start_span("process_data", username=username):
+            for idx, extractor_class in enumerate(self._extractor_classes):
+                logger.debug(messages.trying_extractor.format(
+                    pos=idx + 1,
+                    extractor_class_name=extractor_class.__name__
+                ))
+
+                with tracer.start_span("extractor_attempt", extractor=extractor_class.__name__, attempt=idx + 1) as span:
+                    try:
+                        extractor = extractor_class(username, self._request_handler, base_url)
+
+                        # The payloads are only kept while extracting, and
+                        # dropped once the state is taken from them
+                        source_data = self._get_and_validate_source_data(extractor, extractor_class)
+                        live_status = extractor.get_live_status(source_data)
+
+                        if span:
+                            span.set_attribute("live_status", live_status.name)
+
+                        if live_status in (LiveStatus.OFFLINE, LiveStatus.PREPARING_TO_GO_LIVE):
+                            state.set_offline(live_status)
+                            extractor_attempts_total.inc(extractor=extractor_class.__name__, result="success")
+                            break
+
+                        stream_data = extractor.get_stream_data(source_data)
+                        stream_links = extractor.get_stream_links(stream_data)
+                        state.live_status = live_status
+                        state.stream_links = _intern_keys(stream_links)
+                        state.stream_bitrates = _intern_keys(get_stream_bitrates(stream_data))
+                        state.start_time = extractor.get_start_time(source_data)
+                        extractor_attempts_total.inc(extractor=extractor_class.__name__, result="success")
+
+                        break
+                    except (
+                        WAFChallengeError,
+                        SigiStateMissingError,
+                        StreamDataNotFoundError,
+                        HLSLinkNotFoundError
+                    ) as e:
+                        extractor_attempts_total.inc(extractor=extractor_class.__name__, result=type(e).__name__)
+
+                        if span:
+                            span.error = type(e).__name__
+
+                        if idx != len(self._extractor_classes) - 1:
+                            error_msg = messages.current_extractor_failed.format(
+                                current_extr_pos=idx + 1,
+                                current_extr_name=extractor.__class__.__name__,
+                                exc_name=type(e).__name__,
+                                next_extr_pos=idx + 2
+                            )
+                            console.print(error_msg)
+                            logger.error(error_msg)
+                        else:
+                            error_msg = messages.last_extractor_failed.format(
+                                current_extr_pos=idx + 1,
+                                current_extr_name=extractor.__class__.__name__,
+                                exc_name=type(e).__name__,
+                            )
+                            console.print(error_msg)
+                            logger.error(error_msg)
+                            raise ExtractionFailedError(username) from e
+
+        state.last_process_duration = self._clock.monotonic() - started_at
+        process_data_duration_seconds.observe(state.last_process_duration, username=username)
+
+        if state.live_status:
+            events.emit(
+                EventType.POLLED,
+                username,
+                live_status=state.live_status.value,
+                duration=round(state.last_process_duration, 3)
+            )
+
+            if state.live_status != previous_live_status:
+                events.emit(
+                    EventType.STATUS_CHANGED,
+                    username,
+                    previous=previous_live_status.value if previous_live_status else None,
+                    live_status=state.live_status.value
+                )
 
     def _validate_username(self, username: str) -> str:
         if not username:
             logger.exception(f"{NoUsernameEnteredError.__name__}: {NoUsernameEnteredError()}")
             console.print(messages.no_username_entered)
-            exit(0)
+            raise NoUsernameEnteredError()
 
         if not is_username_valid(username):
             logger.exception(f"{InvalidUsernameError.__name__}: {InvalidUsernameError(username)}")
             console.print(messages.invalid_username.format(username=username))
-            exit(0)
+            raise InvalidUsernameError(username)
 
         logger.debug(f"Entered username: {username}")
 
@@ -168,12 +404,13 @@ class StreamMetadataHandler:
 
     def _get_and_validate_source_data(self, extractor: Extractor, extractor_class: type[Extractor]) -> dict:
         source_data: dict = extractor.get_source_data()
+        username = self._state.username
 
-        assert isinstance(self._username, str)
+        assert isinstance(username, str)
 
         if not is_user_exists(extractor_class, source_data):
-            logger.exception(f"{UserNotFoundError.__name__}: {UserNotFoundError(self._username)}")
-            console.print(messages.account_not_found.format(username=self._username))
-            exit(0)
+            logger.exception(f"{UserNotFoundError.__name__}: {UserNotFoundError(username)}")
+            console.print(messages.account_not_found.format(username=username))
+            raise UserNotFoundError(username)
 
         return source_data
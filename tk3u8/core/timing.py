@@ -0,0 +1,112 @@
+from dataclasses import asdict, dataclass
+import logging
+import threading
+from typing import Optional
+from tk3u8.core.scheduler import Clock, system_clock
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class RecordingTimings:
+    """
+    Breakdown of the time it took for the first byte of a recording to be
+    written to disk, in seconds. Stages that haven't happened (yet) or
+    couldn't be measured are None.
+
+    Attributes:
+        username (str): The user being recorded.
+        engine (str | None): The engine used for the recording.
+        detection_lag (float | None): From the stream starting, according to
+            the stream data, until the program saw that the user is live.
+            This includes the wait between live status checks.
+        metadata (float | None): Fetching and processing the stream data
+            that showed the user is live, including extractor fallbacks and
+            retries.
+        link_resolution (float | None): Picking the stream link to record.
+        engine_startup (float | None): From the stream link being picked
+            until the engine is about to fetch the stream.
+        first_segment (float | None): From the engine starting until the
+            first byte is written to disk.
+        first_segment_ttfb (float | None): Time to first byte of the response
+            of the first segment from the CDN. Only measured by the native
+            engine.
+        total (float | None): From the program seeing that the user is live
+            until the first byte is written to disk.
+    """
+    username: str
+    engine: Optional[str] = None
+    detection_lag: Optional[float] = None
+    metadata: Optional[float] = None
+    link_resolution: Optional[float] = None
+    engine_startup: Optional[float] = None
+    first_segment: Optional[float] = None
+    first_segment_ttfb: Optional[float] = None
+    total: Optional[float] = None
+
+    def to_dict(self) -> dict:
+        return {key: round(value, 3) if isinstance(value, float) else value for key, value in asdict(self).items()}
+
+
+class RecordingTimer:
+    """
+    Marks the stages of a recording from the moment the user is seen live
+    until the first byte is written to disk, and logs the breakdown once the
+    first byte is written.
+
+    The stages can be marked from any thread, and each stage is only marked
+    the first time, so the engines can mark them without keeping track of
+    whether they already did.
+    """
+
+    def __init__(
+            self,
+            username: str,
+            start_time: Optional[float],
+            metadata_duration: Optional[float],
+            clock: Clock = system_clock
+    ) -> None:
+        self._lock = threading.Lock()
+        self._clock = clock
+        self._detected_at = clock.monotonic()
+        self._link_resolved_at: Optional[float] = None
+        self._engine_started_at: Optional[float] = None
+        self._first_byte_at: Optional[float] = None
+        self._timings = RecordingTimings(
+            username=username,
+            detection_lag=max(clock.time() - start_time, 0) if start_time else None,
+            metadata=metadata_duration
+        )
+        self.first_byte_written = threading.Event()
+
+    def set_engine(self, engine: str) -> None:
+        self._timings.engine = engine
+
+    def mark_link_resolved(self) -> None:
+        with self._lock:
+            if self._link_resolved_at is None:
+                self._link_resolved_at = self._clock.monotonic()
+                self._timings.link_resolution = self._link_resolved_at - self._detected_at
+
+    def mark_engine_started(self) -> None:
+        with self._lock:
+            if self._engine_started_at is None:
+                self._engine_started_at = self._clock.monotonic()
+                self._timings.engine_startup = self._engine_started_at - (self._link_resolved_at or self._detected_at)
+
+    def mark_first_byte(self, ttfb: Optional[float] = None) -> None:
+        with self._lock:
+            if self._first_byte_at is not None:
+                return
+
+            self._first_byte_at = self._clock.monotonic()
+            self._timings.first_segment = self._first_byte_at - (self._engine_started_at or self._detected_at)
+            self._timings.first_segment_ttfb = ttfb
+            self._timings.total = self._first_byte_at - self._detected_at
+
+        self.first_byte_written.set()
+        logger.info(f"Time to first byte of the recording: {self._timings.to_dict()}")
+
+    def get_timings(self) -> RecordingTimings:
+        return self._timings
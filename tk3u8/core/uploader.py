@@ -0,0 +1,422 @@
+from collections import deque
+from dataclasses import asdict, dataclass, field
+import io
+import json
+import logging
+import os
+import shutil
+import threading
+from typing import Deque, List, Optional
+from tk3u8.cli.console import console
+from tk3u8.constants import OptionKey
+from tk3u8.exceptions import UploadError
+from tk3u8.messages import messages
+from tk3u8.options_handler import OptionsHandler
+from tk3u8.session.s3 import DEFAULT_REGION, S3Client, UploadedPart, parse_upload_url
+
+
+logger = logging.getLogger(__name__)
+
+
+SPOOL_SUFFIX = ".spool"
+STATE_FILENAME = "upload.json"
+PART_SUFFIX = ".part"
+
+# S3 rejects parts smaller than this, except for the last one
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+@dataclass
+class UploadState:
+    """
+    State of a multipart upload, which is saved in its spool directory
+    after each part is uploaded, so the upload can be resumed if it's
+    interrupted.
+
+    Attributes:
+        bucket (str): Bucket the recording is uploaded to.
+        key (str): Key of the uploaded object.
+        upload_id (str | None): ID of the multipart upload, once it's
+            started.
+        parts (List[dict]): Number, ETag and size of each uploaded part.
+    """
+    bucket: str
+    key: str
+    upload_id: Optional[str] = None
+    parts: List[dict] = field(default_factory=list)
+
+    def get_parts(self) -> List[UploadedPart]:
+        return [UploadedPart(**part) for part in self.parts]
+
+    def add_part(self, part: UploadedPart) -> None:
+        self.parts.append(asdict(part))
+
+    def save(self, path: str) -> None:
+        # Written to a temporary file first, so a crash never leaves a
+        # half-written state behind
+        temp_path = f"{path}.tmp"
+
+        try:
+            with open(temp_path, "w", encoding="utf-8") as file:
+                json.dump(asdict(self), file, indent=4)
+            os.replace(temp_path, path)
+        except OSError as e:
+            raise UploadError(f"The upload state can't be saved to {path}: {e}")
+
+    @classmethod
+    def load(cls, path: str) -> 'UploadState':
+        try:
+            with open(path, encoding="utf-8") as file:
+                return cls(**json.load(file))
+        except (OSError, ValueError, TypeError) as e:
+            raise UploadError(f"The upload state can't be read from {path}: {e}")
+
+
+@dataclass
+class UploadTarget:
+    """
+    Where recordings are uploaded to, as set through the 'upload_*' config
+    keys.
+
+    Attributes:
+        client (S3Client): Client of the storage.
+        bucket (str): Bucket the recordings are uploaded to.
+        prefix (str): Prefix of the keys of the uploaded recordings.
+        part_size (int): Size of each part in bytes.
+        max_spooled_parts (int): Number of full parts that can wait on the
+            disk to be uploaded.
+    """
+    client: S3Client
+    bucket: str
+    prefix: str
+    part_size: int
+    max_spooled_parts: int
+
+    @classmethod
+    def from_options(cls, options_handler: OptionsHandler) -> Optional['UploadTarget']:
+        """Gets the upload target from the options, or None if uploading is
+        not set up. The keys fall back to the usual AWS environment
+        variables."""
+        upload_url = options_handler.get_option_val(OptionKey.UPLOAD_URL)
+        access_key = options_handler.get_option_val(OptionKey.UPLOAD_ACCESS_KEY) or os.environ.get("AWS_ACCESS_KEY_ID")
+        secret_key = options_handler.get_option_val(OptionKey.UPLOAD_SECRET_KEY) or os.environ.get("AWS_SECRET_ACCESS_KEY")
+        region = options_handler.get_option_val(OptionKey.UPLOAD_REGION) or os.environ.get("AWS_REGION") or DEFAULT_REGION
+        part_size = options_handler.get_option_val(OptionKey.UPLOAD_PART_SIZE)
+        max_spooled_parts = options_handler.get_option_val(OptionKey.UPLOAD_MAX_SPOOLED_PARTS)
+
+        assert isinstance(upload_url, (str, type(None)))
+        assert isinstance(region, str)
+        assert isinstance(part_size, int)
+        assert isinstance(max_spooled_parts, int)
+
+        if not upload_url:
+            return None
+
+        if not isinstance(access_key, str) or not isinstance(secret_key, str):
+            raise UploadError("Uploading needs both 'upload_access_key' and 'upload_secret_key' to be set")
+
+        endpoint, bucket, prefix = parse_upload_url(upload_url)
+
+        return cls(
+            S3Client(endpoint, access_key, secret_key, region),
+            bucket,
+            prefix,
+            max(part_size * 1024 * 1024, MIN_PART_SIZE),
+            max(max_spooled_parts, 1)
+        )
+
+    def start_upload(self, output_path: str, username: str) -> 'SpooledUpload':
+        """Starts uploading the recording that would have been saved at the
+        output path, spooling it next to where it would have been."""
+        key = "/".join(name for name in (self.prefix, username, os.path.basename(output_path)) if name)
+        return SpooledUpload(self.client, get_spool_dir(output_path), self.bucket, key, self.part_size, self.max_spooled_parts)
+
+
+class SpooledUpload(io.RawIOBase):
+    """
+    A file-like output that uploads a recording to S3 while it's being
+    written, so that the local disk never has to hold the whole recording.
+
+    What's written is spooled in part files inside the spool directory.
+    Once a part is full, it's uploaded as a part of a multipart upload in
+    the background, and deleted once it's uploaded. If the upload falls
+    behind and 'max_spooled_parts' full parts are waiting, writing waits
+    for them to be uploaded. Closing uploads the last part and completes
+    the upload, which removes the spool directory.
+
+    If uploading fails even after retrying, the next write or the closing
+    raises 'UploadError'. The spool directory is then kept along with the
+    state of the upload, so the upload can be resumed through
+    'resume_upload'.
+
+    Attributes:
+        _client (S3Client): Client of the storage.
+        _spool_dir (str): Directory of the part files and the upload state.
+        _state (UploadState): State of the upload.
+        _part_size (int): Size after which a part is full.
+        _max_spooled_parts (int): Number of full parts that can wait to be
+            uploaded before writing waits for them.
+        _part_number (int): Number of the part being written.
+        _part_file (BinaryIO | None): File of the part being written.
+        _part_bytes (int): Bytes written to the part being written.
+        _queue (Deque[int]): Numbers of the full parts waiting to be
+            uploaded, including the one being uploaded.
+        _finishing (bool): Whether no more parts will be queued.
+        _error (UploadError | None): Why uploading failed, if it did.
+        bytes_written (int): Total number of bytes written.
+    """
+
+    def __init__(
+            self,
+            client: S3Client,
+            spool_dir: str,
+            bucket: str,
+            key: str,
+            part_size: int = MIN_PART_SIZE,
+            max_spooled_parts: int = 4
+    ) -> None:
+        super().__init__()
+        self._client = client
+        self._spool_dir = spool_dir
+        self._state = UploadState(bucket, key)
+        self._part_size = part_size
+        self._max_spooled_parts = max_spooled_parts
+        self._part_number = 1
+        self._part_file: Optional[io.BufferedWriter] = None
+        self._part_bytes = 0
+        self._queue: Deque[int] = deque()
+        self._finishing = False
+        self._error: Optional[UploadError] = None
+        self._condition = threading.Condition()
+        self.bytes_written = 0
+
+        os.makedirs(spool_dir, exist_ok=True)
+        self._state.save(get_state_path(spool_dir))
+
+        self._thread = threading.Thread(target=self._upload_parts, name=f"upload-{os.path.basename(key)}", daemon=True)
+        self._thread.start()
+
+    def get_spool_dir(self) -> str:
+        return self._spool_dir
+
+    def get_key(self) -> str:
+        return self._state.key
+
+    def writable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.bytes_written
+
+    def write(self, data: bytes) -> int:  # type: ignore[override]
+        self._raise_if_failed()
+
+        if self._part_file is None:
+            self._part_file = open(get_part_path(self._spool_dir, self._part_number), "ab")
+
+        self._part_file.write(data)
+        self._part_file.flush()
+        self._part_bytes += len(data)
+        self.bytes_written += len(data)
+
+        if self._part_bytes >= self._part_size:
+            self._queue_part()
+            self._wait_for_spool()
+
+        return len(data)
+
+    def close(self) -> None:
+        if self.closed:
+            return
+
+        try:
+            self._finish()
+        finally:
+            super().close()
+
+    def __del__(self) -> None:
+        # The upload is only completed when it's closed on purpose, never
+        # when it's garbage collected
+        pass
+
+    def _finish(self) -> None:
+        if self._part_file is not None and self._error is None:
+            self._queue_part()
+        elif self._part_file is not None:
+            self._part_file.close()
+
+        with self._condition:
+            self._finishing = True
+            self._condition.notify_all()
+
+        self._thread.join()
+        self._raise_if_failed()
+
+        if self._state.upload_id is None:
+            # Nothing was written, so there is nothing to upload
+            shutil.rmtree(self._spool_dir, ignore_errors=True)
+            return
+
+        _complete_upload(self._client, self._state, self._spool_dir)
+
+    def _queue_part(self) -> None:
+        assert self._part_file is not None
+        self._part_file.close()
+        self._part_file = None
+
+        with self._condition:
+            self._queue.append(self._part_number)
+            self._condition.notify_all()
+
+        self._part_number += 1
+        self._part_bytes = 0
+
+    def _wait_for_spool(self) -> None:
+        """Waits until fewer than 'max_spooled_parts' full parts are waiting
+        to be uploaded."""
+        with self._condition:
+            while len(self._queue) >= self._max_spooled_parts and self._error is None:
+                logger.debug(f"{len(self._queue)} parts of {self._state.key} are waiting to be uploaded, waiting for them")
+                self._condition.wait()
+
+        self._raise_if_failed()
+
+    def _raise_if_failed(self) -> None:
+        if self._error is not None:
+            raise self._error
+
+    def _upload_parts(self) -> None:
+        while True:
+            with self._condition:
+                while not self._queue and not self._finishing:
+                    self._condition.wait()
+
+                if not self._queue:
+                    return
+
+                number = self._queue[0]
+
+            try:
+                _upload_part(self._client, self._state, self._spool_dir, number)
+            except UploadError as e:
+                logger.error(f"Uploading part #{number} of {self._state.key} failed: {e}")
+
+                with self._condition:
+                    self._error = e
+                    self._condition.notify_all()
+
+                return
+
+            with self._condition:
+                self._queue.popleft()
+                self._condition.notify_all()
+
+
+def get_spool_dir(output_path: str) -> str:
+    return f"{output_path}{SPOOL_SUFFIX}"
+
+
+def get_state_path(spool_dir: str) -> str:
+    return os.path.join(spool_dir, STATE_FILENAME)
+
+
+def get_part_path(spool_dir: str, number: int) -> str:
+    return os.path.join(spool_dir, f"{number:05d}{PART_SUFFIX}")
+
+
+def _get_spooled_part_numbers(spool_dir: str) -> List[int]:
+    return sorted(
+        int(name[:-len(PART_SUFFIX)])
+        for name in os.listdir(spool_dir)
+        if name.endswith(PART_SUFFIX) and name[:-len(PART_SUFFIX)].isdigit()
+    )
+
+
+def _upload_part(client: S3Client, state: UploadState, spool_dir: str, number: int) -> None:
+    """Uploads the spooled part, saves it in the upload state and deletes
+    it, starting the multipart upload first if it hasn't been started."""
+    state_path = get_state_path(spool_dir)
+
+    if state.upload_id is None:
+        state.upload_id = client.create_multipart_upload(state.bucket, state.key)
+        state.save(state_path)
+
+    part_path = get_part_path(spool_dir, number)
+
+    try:
+        with open(part_path, "rb") as file:
+            data = file.read()
+    except OSError as e:
+        raise UploadError(f"The spooled part {part_path} can't be read: {e}")
+
+    state.add_part(client.upload_part(state.bucket, state.key, state.upload_id, number, data))
+    state.save(state_path)
+    os.remove(part_path)
+
+
+def _complete_upload(client: S3Client, state: UploadState, spool_dir: str) -> None:
+    assert state.upload_id is not None
+    client.complete_multipart_upload(state.bucket, state.key, state.upload_id, state.get_parts())
+    shutil.rmtree(spool_dir, ignore_errors=True)
+
+
+def resume_upload(spool_dir: str, client: S3Client) -> str:
+    """
+    Resumes an interrupted upload from its spool directory, and returns the
+    key of the uploaded object. Parts that were uploaded but not yet saved
+    in the upload state, e.g., if the program was killed in between, are
+    taken from the storage instead of being uploaded again.
+    """
+    state = UploadState.load(get_state_path(spool_dir))
+    part_numbers = _get_spooled_part_numbers(spool_dir)
+
+    if state.upload_id is not None:
+        saved_numbers = {part["number"] for part in state.parts}
+
+        for part in client.list_parts(state.bucket, state.key, state.upload_id):
+            part_path = get_part_path(spool_dir, part.number)
+
+            if part.number in saved_numbers:
+                if part.number in part_numbers:
+                    os.remove(part_path)
+                    part_numbers.remove(part.number)
+            elif part.number in part_numbers and os.path.getsize(part_path) == part.size:
+                state.add_part(part)
+                os.remove(part_path)
+                part_numbers.remove(part.number)
+
+        state.save(get_state_path(spool_dir))
+
+    for number in part_numbers:
+        _upload_part(client, state, spool_dir, number)
+
+    if state.upload_id is None:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+    else:
+        _complete_upload(client, state, spool_dir)
+
+    return state.key
+
+
+def resume_uploads(download_dir: str, client: S3Client) -> List[str]:
+    """Resumes the interrupted uploads of every user in the download
+    directory, and returns the keys of the uploaded objects."""
+    spool_dirs = []
+
+    for root, dirs, _ in os.walk(download_dir):
+        for name in dirs:
+            if name.endswith(SPOOL_SUFFIX) and os.path.isfile(get_state_path(os.path.join(root, name))):
+                spool_dirs.append(os.path.join(root, name))
+
+    if not spool_dirs:
+        console.print(messages.no_uploads_to_resume)
+        return []
+
+    keys = []
+
+    for spool_dir in sorted(spool_dirs):
+        console.print(messages.resuming_upload.format(path=spool_dir))
+        keys.append(resume_upload(spool_dir, client))
+        console.print(messages.upload_finished.format(key=keys[-1]))
+
+    return keys
@@ -0,0 +1,515 @@
+import logging
+import multiprocessing
+from multiprocessing.connection import Connection
+import os
+import signal
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from tk3u8.cli.console import console
+from tk3u8.constants import DownloadStatus, EventType, LiveStatus, OptionKey, Quality
+from tk3u8.core.handle import DownloadHandle
+from tk3u8.core.model import Tk3u8
+from tk3u8.core.scheduler import Clock, system_clock
+from tk3u8.core.stream_metadata_handler import StreamMetadataHandler
+from tk3u8.exceptions import (
+    DownloadCancelledError,
+    Tk3u8Error,
+    UserNotLiveError,
+    UserPreparingForLiveError,
+    WorkerError,
+    WorkerLostError,
+    WorkerPoolClosedError
+)
+from tk3u8.options_handler import OptionsHandler
+from tk3u8.paths_handler import PathsHandler
+from tk3u8.session.bandwidth import HostBandwidthCoordinator
+from tk3u8.session.request_handler import RequestHandler
+from tk3u8.telemetry.events import Event, events
+
+
+logger = logging.getLogger(__name__)
+
+
+# Errors of a recording in a worker after which the user is polled again, as
+# the user went offline between the poll and the start of the recording
+_NOT_LIVE_ERRORS = {UserNotLiveError.__name__, UserPreparingForLiveError.__name__}
+
+# Options that only apply to the process of the pool, which shows the output
+# and serves the metrics of the whole pool
+_POOL_OPTIONS = {"headless", "dashboard", "metrics_port"}
+
+
+class RecordingJob:
+    """
+    A recording handed to a worker process, which works like a future of
+    its result.
+
+    Attributes:
+        job_id (int): Identifies the job within the pool.
+        username (str): The user being recorded.
+        status (DownloadStatus): Whether the recording is running, or how it
+            ended.
+        error (Tk3u8Error | None): Why the recording failed, if it did.
+    """
+
+    def __init__(self, job_id: int, username: str) -> None:
+        self.job_id = job_id
+        self.username = username
+        self.status = DownloadStatus.RUNNING
+        self.error: Optional[Tk3u8Error] = None
+        self._done = threading.Event()
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def finish(self, status: DownloadStatus, error: Optional[Tk3u8Error] = None) -> None:
+        if self._done.is_set():
+            return
+
+        self.status = status
+        self.error = error
+        self._done.set()
+
+
+class _Worker:
+    """
+    A worker process in a slot of the pool, and the recordings it runs.
+
+    Attributes:
+        index (int): The slot of the worker in the pool.
+        process (multiprocessing.Process): The worker process.
+        connection (Connection): The end of the pipe to the worker.
+        jobs (dict[int, RecordingJob]): The recordings that are running.
+        last_heartbeat_at (float): When the worker last reported its load.
+        cpu_time (float): The CPU time of the worker when it last reported.
+        cpu_load (float): The share of a core the worker used between its
+            last two reports.
+    """
+
+    def __init__(self, index: int, process: Any, connection: Connection) -> None:
+        self.index = index
+        self.process = process
+        self.connection = connection
+        self.jobs: Dict[int, RecordingJob] = {}
+        self.last_heartbeat_at = time.monotonic()
+        self.cpu_time = 0.0
+        self.cpu_load = 0.0
+        self._send_lock = threading.Lock()
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def get_load(self) -> Tuple[int, float]:
+        return len(self.jobs), self.cpu_load
+
+    def send(self, message: tuple) -> None:
+        try:
+            with self._send_lock:
+                self.connection.send(message)
+        except OSError as e:
+            # The worker is restarted once it's seen as gone
+            logger.warning(f"Can't send to worker #{self.index}: {e}")
+
+
+class WorkerPool:
+    """
+    Runs the recordings in a pool of worker processes, one for each CPU core
+    by default, so parsing and writing the segments of many recordings isn't
+    capped by a single core. The users are polled in this process, which
+    only hands the recordings over to the workers once the users are live.
+
+    Each recording goes to the least loaded worker, i.e., the one with the
+    fewest recordings, and then the one that used the least CPU lately.
+    Workers that exit, or stop reporting their load for
+    'HEARTBEAT_TIMEOUT' seconds, are restarted, and their recordings fail
+    with 'WorkerLostError'. The lifecycle events of the recordings are
+    forwarded to this process, so the output, the dashboard and the stats
+    of the handles cover the whole pool.
+
+    The pool runs a bandwidth coordinator that the workers share the
+    'max_bandwidth' budget through, unless the host-wide one of
+    'bandwidth_coordinator_port' is used.
+
+    The users are polled on the given clock, which is passed on to the
+    workers for their recordings as well. The heartbeats of the workers are
+    always in real time.
+    """
+
+    HEARTBEAT_INTERVAL = 1
+    HEARTBEAT_TIMEOUT = 15
+    MONITOR_INTERVAL = 0.5
+    RESTART_BACKOFF = 5
+
+    def __init__(
+            self,
+            size: Optional[int] = None,
+            program_data_dir: Optional[str] = None,
+            config_file_path: Optional[str] = None,
+            downloads_dir: Optional[str] = None,
+            clock: Clock = system_clock
+    ) -> None:
+        self._size = size or os.cpu_count() or 1
+        self._program_data_dir = program_data_dir
+        self._paths_handler = PathsHandler(program_data_dir, config_file_path, downloads_dir)
+        self._context = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        self._workers: List[_Worker] = []
+        self._restart_at: List[float] = [0.0] * self._size
+        self._next_job_id = 0
+        self._accepting = False
+        self._stopped = threading.Event()
+        self._monitor_thread: Optional[threading.Thread] = None
+        self._bandwidth_coordinator: Optional[HostBandwidthCoordinator] = None
+        self._clock = clock
+
+    def start(self) -> None:
+        self._start_bandwidth_coordinator()
+
+        with self._lock:
+            self._workers = [self._start_worker(index) for index in range(self._size)]
+            self._accepting = True
+
+        self._monitor_thread = threading.Thread(target=self._monitor, name="tk3u8-worker-monitor", daemon=True)
+        self._monitor_thread.start()
+
+    def get_size(self) -> int:
+        return self._size
+
+    def get_loads(self) -> List[Tuple[int, float]]:
+        """Gets the number of recordings and the CPU load of each worker."""
+        with self._lock:
+            return [worker.get_load() for worker in self._workers]
+
+    def get_pids(self) -> List[Optional[int]]:
+        with self._lock:
+            return [worker.process.pid for worker in self._workers]
+
+    def submit(self, username: str, quality: str, downloads_dir: Optional[str] = None, options: Optional[Dict[str, Any]] = None) -> RecordingJob:
+        """Hands a recording of a user who is live over to the least loaded
+        worker. Takes the same options as 'Tk3u8.download()'."""
+        # The user was found live by the pool, so the worker records right
+        # away, and the pool polls the user again if it's no longer live
+        worker_options = {key: value for key, value in (options or {}).items() if key not in _POOL_OPTIONS}
+        worker_options["wait_until_live"] = False
+
+        if self._bandwidth_coordinator and not worker_options.get("bandwidth_coordinator_port"):
+            worker_options["bandwidth_coordinator_port"] = self._bandwidth_coordinator.server_address[1]
+
+        with self._lock:
+            if not self._accepting:
+                raise WorkerPoolClosedError()
+
+            workers = [worker for worker in self._workers if worker.is_alive()]
+            if not workers:
+                raise WorkerLostError(username)
+
+            worker = min(workers, key=lambda worker: worker.get_load())
+            job = RecordingJob(self._next_job_id, username)
+            self._next_job_id += 1
+            worker.jobs[job.job_id] = job
+
+        logger.debug(f"Recording of user @{username} handed to worker #{worker.index} (recordings: {len(worker.jobs)})")
+        worker.send(("record", job.job_id, username, quality, downloads_dir or self._paths_handler.DOWNLOAD_DIR, worker_options))
+
+        return job
+
+    def cancel(self, job: RecordingJob) -> None:
+        with self._lock:
+            worker = next((worker for worker in self._workers if job.job_id in worker.jobs), None)
+
+        if worker:
+            worker.send(("cancel", job.job_id))
+
+    def start_download(self, username: str, quality: str = Quality.ORIGINAL.value, downloads_dir: Optional[str] = None, **options: Any) -> DownloadHandle:
+        """
+        Starts watching a user in the background, the same as
+        'Tk3u8.start_download()' with 'wait_until_live', except that the
+        user is polled in this process and recorded in a worker. Takes the
+        same options, and returns a handle of the download, which is done
+        once the recording is.
+        """
+        cancelled = threading.Event()
+        handle = DownloadHandle(username, cancelled)
+        handle.start(lambda: self._watch(username, quality, downloads_dir, options, cancelled))
+
+        return handle
+
+    def drain(self, timeout: Optional[float] = None) -> None:
+        """Stops taking recordings, and waits until the ones in progress are
+        done before stopping the workers. The ones left after the timeout
+        are cancelled."""
+        with self._lock:
+            self._accepting = False
+            jobs = [job for worker in self._workers for job in worker.jobs.values()]
+
+        logger.debug(f"Draining the worker pool, waiting for {len(jobs)} recording(s)")
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
+        for job in jobs:
+            job.wait(max(deadline - time.monotonic(), 0) if deadline is not None else None)
+
+        self.stop()
+
+    def stop(self) -> None:
+        """Cancels the recordings in progress, keeping what was recorded, and
+        stops the workers."""
+        with self._lock:
+            self._accepting = False
+            workers = list(self._workers)
+
+        self._stopped.set()
+
+        if self._monitor_thread:
+            self._monitor_thread.join()
+            self._monitor_thread = None
+
+        for worker in workers:
+            worker.send(("stop",))
+
+        for worker in workers:
+            worker.process.join(30)
+
+            if worker.is_alive():
+                logger.warning(f"Worker #{worker.index} didn't stop in time, killing it")
+                worker.process.kill()
+                worker.process.join()
+
+            self._fail_jobs(worker, DownloadStatus.CANCELLED)
+
+        self._stop_bandwidth_coordinator()
+
+    def _watch(self, username: str, quality: str, downloads_dir: Optional[str], options: Dict[str, Any], cancelled: threading.Event) -> None:
+        options_handler = OptionsHandler(self._paths_handler)
+        options_handler.save_args_values(**options)
+        request_handler = RequestHandler(options_handler)
+        stream_metadata_handler = StreamMetadataHandler(request_handler, options_handler, self._clock)
+
+        timeout = options_handler.get_option_val(OptionKey.TIMEOUT)
+        assert isinstance(timeout, int)
+
+        try:
+            stream_metadata_handler.initialize_data(username)
+
+            while True:
+                if stream_metadata_handler.get_live_status() == LiveStatus.LIVE:
+                    job = self.submit(username, quality, downloads_dir, options)
+
+                    while not job.wait(self.MONITOR_INTERVAL):
+                        if cancelled.is_set():
+                            self.cancel(job)
+
+                    if job.status == DownloadStatus.CANCELLED:
+                        raise DownloadCancelledError(username)
+                    elif job.error is None:
+                        return
+                    elif not (isinstance(job.error, WorkerError) and job.error.error in _NOT_LIVE_ERRORS):
+                        raise job.error
+
+                if self._clock.wait(cancelled, timeout):
+                    raise DownloadCancelledError(username)
+
+                stream_metadata_handler.update_data()
+        except (DownloadCancelledError, WorkerError):
+            # The workers emit the errors of the recordings by themselves
+            raise
+        except Exception as e:
+            events.emit(EventType.ERROR, username, error=type(e).__name__, message=str(e))
+            raise
+        finally:
+            request_handler.close()
+
+    def _start_bandwidth_coordinator(self) -> None:
+        # Listens on any free port, as it's only meant for the workers
+        self._bandwidth_coordinator = HostBandwidthCoordinator(0)
+        threading.Thread(target=self._bandwidth_coordinator.serve_forever, name="tk3u8-bandwidth-coordinator", daemon=True).start()
+        logger.debug(f"Started bandwidth coordinator of the workers on port {self._bandwidth_coordinator.server_address[1]}")
+
+    def _stop_bandwidth_coordinator(self) -> None:
+        if self._bandwidth_coordinator:
+            self._bandwidth_coordinator.shutdown()
+            self._bandwidth_coordinator.server_close()
+            self._bandwidth_coordinator = None
+
+    def _start_worker(self, index: int) -> _Worker:
+        connection, worker_connection = self._context.Pipe()
+        process = self._context.Process(
+            target=_run_worker,
+            args=(worker_connection, self._program_data_dir, self._paths_handler.CONFIG_FILE_PATH, self.HEARTBEAT_INTERVAL, self._clock),
+            name=f"tk3u8-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        worker_connection.close()
+
+        worker = _Worker(index, process, connection)
+        threading.Thread(target=self._read, args=(worker,), name=f"tk3u8-worker-reader-{index}", daemon=True).start()
+        logger.debug(f"Started worker #{index} (pid: {process.pid})")
+
+        return worker
+
+    def _read(self, worker: _Worker) -> None:
+        while True:
+            try:
+                message = worker.connection.recv()
+            except (EOFError, OSError):
+                return
+
+            kind = message[0]
+
+            if kind == "heartbeat":
+                now = time.monotonic()
+                cpu_time = message[1]
+                worker.cpu_load = (cpu_time - worker.cpu_time) / max(now - worker.last_heartbeat_at, 1e-3)
+                worker.cpu_time = cpu_time
+                worker.last_heartbeat_at = now
+            elif kind == "event":
+                _, event_type, username, data, timestamp = message
+                events.publish(Event(EventType(event_type), username, data, timestamp))
+            elif kind == "done":
+                _, job_id, status, error, error_message = message
+
+                with self._lock:
+                    job = worker.jobs.pop(job_id, None)
+
+                if job:
+                    job.finish(DownloadStatus(status), WorkerError(job.username, error, error_message) if error else None)
+
+    def _monitor(self) -> None:
+        while not self._stopped.wait(self.MONITOR_INTERVAL):
+            now = time.monotonic()
+
+            for index, worker in enumerate(list(self._workers)):
+                if worker.is_alive() and now - worker.last_heartbeat_at > self.HEARTBEAT_TIMEOUT:
+                    logger.warning(f"Worker #{index} stopped responding, killing it")
+                    worker.process.kill()
+                    worker.process.join()
+
+                if worker.is_alive():
+                    continue
+
+                self._fail_jobs(worker, DownloadStatus.FAILED)
+
+                if now < self._restart_at[index]:
+                    continue
+
+                logger.warning(f"Worker #{index} exited with code {worker.process.exitcode}, restarting it")
+                worker.connection.close()
+
+                with self._lock:
+                    if not self._accepting:
+                        return
+
+                    self._workers[index] = self._start_worker(index)
+                    self._restart_at[index] = now + self.RESTART_BACKOFF
+
+    def _fail_jobs(self, worker: _Worker, status: DownloadStatus) -> None:
+        with self._lock:
+            jobs = list(worker.jobs.values())
+            worker.jobs.clear()
+
+        for job in jobs:
+            job.finish(status, WorkerLostError(job.username) if status == DownloadStatus.FAILED else None)
+
+
+class _ForwardingWriter:
+    """Forwards the lifecycle events of a worker to the pool."""
+
+    def __init__(self, send: Callable[[tuple], None]) -> None:
+        self._send = send
+
+    def write(self, event: Event) -> None:
+        self._send(("event", event.type.value, event.username, event.data, event.timestamp))
+
+
+def _run_worker(
+        connection: Connection,
+        program_data_dir: Optional[str],
+        config_file_path: str,
+        heartbeat_interval: float,
+        clock: Clock
+) -> None:
+    """Runs the recordings handed over by the pool until it's told to stop,
+    or the pool is gone."""
+    # Ctrl+C reaches every process in the terminal, but stopping is up to
+    # the pool, which drains the workers first
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    console.quiet = True
+
+    send_lock = threading.Lock()
+    stopped = threading.Event()
+    handles: Dict[int, DownloadHandle] = {}
+    reporters: List[threading.Thread] = []
+
+    def send(message: tuple) -> None:
+        try:
+            with send_lock:
+                connection.send(message)
+        except OSError:
+            pass
+
+    def send_heartbeats() -> None:
+        while not stopped.wait(heartbeat_interval):
+            send(("heartbeat", time.process_time()))
+
+    def report_when_done(job_id: int, tk3u8: Tk3u8, handle: DownloadHandle) -> None:
+        handle.wait()
+        handles.pop(job_id, None)
+        tk3u8.close()
+
+        try:
+            handle.result()
+            send(("done", job_id, handle.get_status().value, None, None))
+        except BaseException as e:
+            send(("done", job_id, handle.get_status().value, type(e).__name__, str(e)))
+
+    events.add_writer(_ForwardingWriter(send))
+    threading.Thread(target=send_heartbeats, daemon=True).start()
+
+    while True:
+        try:
+            message = connection.recv()
+        except (EOFError, OSError):
+            break
+
+        kind = message[0]
+
+        if kind == "record":
+            _, job_id, username, quality, downloads_dir, options = message
+
+            tk3u8: Optional[Tk3u8] = None
+
+            try:
+                tk3u8 = Tk3u8(program_data_dir=program_data_dir, config_file_path=config_file_path, downloads_dir=downloads_dir, clock=clock)
+                handle = tk3u8.start_download(username, quality, **options)
+            except Tk3u8Error as e:
+                if tk3u8:
+                    tk3u8.close()
+
+                send(("done", job_id, DownloadStatus.FAILED.value, type(e).__name__, str(e)))
+                continue
+
+            handles[job_id] = handle
+            reporter = threading.Thread(target=report_when_done, args=(job_id, tk3u8, handle), daemon=True)
+            reporter.start()
+            reporters[:] = [running for running in reporters if running.is_alive()] + [reporter]
+        elif kind == "cancel":
+            cancelled_handle = handles.get(message[1])
+
+            if cancelled_handle:
+                cancelled_handle.cancel()
+        elif kind == "stop":
+            break
+
+    for handle in list(handles.values()):
+        handle.cancel()
+
+    # The reports of the cancelled recordings are sent before the worker
+    # exits
+    for reporter in reporters:
+        reporter.join()
+
+    stopped.set()
@@ -1,7 +1,18 @@
 from tk3u8.constants import OptionKey
 
 
-class RequestFailedError(Exception):
+class Tk3u8Error(Exception):
+    """Base exception of every error raised by tk3u8, so a script that runs
+    many downloads in one process can catch all of them at once.
+
+    'exit_code' is the exit code of the program when it's used through the
+    terminal and stops due to this error.
+    """
+
+    exit_code = 0
+
+
+class RequestFailedError(Tk3u8Error):
     """Custom exception for failed HTTP requests.
 
     Raised when an HTTP request fails due to network issues,
@@ -13,7 +24,7 @@ class RequestFailedError(Exception):
         super().__init__(self.message)
 
 
-class WAFChallengeError(Exception):
+class WAFChallengeError(Tk3u8Error):
     """Custom exception when 'Please wait...' message appears when extracting data
     from source."""
 
@@ -22,7 +33,7 @@ class WAFChallengeError(Exception):
         super().__init__(self.message)
 
 
-class SigiStateMissingError(Exception):
+class SigiStateMissingError(Tk3u8Error):
     """Custom exception for failed data extraction from the SIGI_STATE script tag.
 
     Raised when the SIGI_STATE script tag isn't found from the webpage.
@@ -33,7 +44,7 @@ class SigiStateMissingError(Exception):
         super().__init__(self.message)
 
 
-class UserNotLiveError(Exception):
+class UserNotLiveError(Tk3u8Error):
     """Custom exception when user is not live."""
 
     def __init__(self, username: str) -> None:
@@ -41,7 +52,7 @@ class UserNotLiveError(Exception):
         super().__init__(self.message)
 
 
-class UserNotFoundError(Exception):
+class UserNotFoundError(Tk3u8Error):
     """Custom exception whenever data extraction from specified user fails.
 
     This exception will be raised whenever the account is private or the
@@ -53,7 +64,7 @@ class UserNotFoundError(Exception):
         super().__init__(self.message)
 
 
-class InvalidUsernameError(Exception):
+class InvalidUsernameError(Tk3u8Error):
     """Custom exception whenever username entered is invalid."""
 
     def __init__(self, username: str) -> None:
@@ -65,7 +76,7 @@ class InvalidUsernameError(Exception):
         super().__init__(self.message)
 
 
-class NoUsernameEnteredError(Exception):
+class NoUsernameEnteredError(Tk3u8Error):
     """Custom exception when no username is entered."""
 
     def __init__(self) -> None:
@@ -73,7 +84,7 @@ class NoUsernameEnteredError(Exception):
         super().__init__(self.message)
 
 
-class UserPreparingForLiveError(Exception):
+class UserPreparingForLiveError(Tk3u8Error):
     """Custom exception when the user is preparing to go live.
     """
 
@@ -82,7 +93,7 @@ class UserPreparingForLiveError(Exception):
         super().__init__(self.message)
 
 
-class UnknownStatusCodeError(Exception):
+class UnknownStatusCodeError(Tk3u8Error):
     """Custom exception whenever the status code returned isn't 2 or 4.
 
     This exception is a weird one, but I still implemented in case that there might be some
@@ -96,7 +107,7 @@ class UnknownStatusCodeError(Exception):
         super().__init__(self.message)
 
 
-class InvalidQualityError(Exception):
+class InvalidQualityError(Tk3u8Error):
     """Custom exception when quality arg is incorrectly entered."""
 
     def __init__(self) -> None:
@@ -104,7 +115,7 @@ class InvalidQualityError(Exception):
         super().__init__(self.message)
 
 
-class QualityNotAvailableError(Exception):
+class QualityNotAvailableError(Tk3u8Error):
     """Custom exception when quality is not available for download."""
 
     def __init__(self) -> None:
@@ -112,7 +123,7 @@ class QualityNotAvailableError(Exception):
         super().__init__(self.message)
 
 
-class LinkNotAvailableError(Exception):
+class LinkNotAvailableError(Tk3u8Error):
     """Custom exception when the stream link isn't available for some reason."""
 
     def __init__(self) -> None:
@@ -120,7 +131,7 @@ class LinkNotAvailableError(Exception):
         super().__init__(self.message)
 
 
-class StreamDataNotFoundError(Exception):
+class StreamDataNotFoundError(Tk3u8Error):
     """Custom exception when the stream data can't be scraped."""
 
     def __init__(self, username: str) -> None:
@@ -128,7 +139,7 @@ class StreamDataNotFoundError(Exception):
         super().__init__(self.message)
 
 
-class LiveStatusCodeNotFoundError(Exception):
+class LiveStatusCodeNotFoundError(Tk3u8Error):
     """Custom exception when the live status code failed to be retrieved."""
 
     def __init__(self, username: str) -> None:
@@ -136,7 +147,7 @@ class LiveStatusCodeNotFoundError(Exception):
         super().__init__(self.message)
 
 
-class HLSLinkNotFoundError(Exception):
+class HLSLinkNotFoundError(Tk3u8Error):
     """Custom exception when the HLS stream link isn't available, even though
     there is a stream going on."""
 
@@ -145,7 +156,7 @@ class HLSLinkNotFoundError(Exception):
         super().__init__(self.message)
 
 
-class HLSLinkTemporarilyUnavailableError(Exception):
+class HLSLinkTemporarilyUnavailableError(Tk3u8Error):
     """Custom exception when the HLS stream link isn't available temporarily
     for some reason.
 
@@ -160,7 +171,7 @@ class HLSLinkTemporarilyUnavailableError(Exception):
         super().__init__(self.message)
 
 
-class InvalidArgKeyError(Exception):
+class InvalidArgKeyError(Tk3u8Error):
     """Custom exception when an invalid key is encountered."""
 
     def __init__(self, key: OptionKey) -> None:
@@ -168,7 +179,7 @@ class InvalidArgKeyError(Exception):
         super().__init__(self.message)
 
 
-class FileParsingError(Exception):
+class FileParsingError(Tk3u8Error):
     """Custom exception for when there is a problem parsing the file."""
 
     def __init__(self) -> None:
@@ -176,22 +187,123 @@ class FileParsingError(Exception):
         super().__init__(self.message)
 
 
-class InvalidCookieError(Exception):
+class ConfigFileError(Tk3u8Error):
+    """Custom exception when the config file can't be found, read, or has an
+    invalid key."""
+
+    exit_code = 1
+
+    def __init__(self, message: str) -> None:
+        self.message = message
+        super().__init__(self.message)
+
+
+class InvalidCookieError(Tk3u8Error):
     """Custom exception when user improperly sets cookie in the config file."""
 
+    exit_code = 1
+
     def __init__(self, message: str) -> None:
         super().__init__(message)
 
 
-class DownloadError(Exception):
+class DownloadError(Tk3u8Error):
     """Custom exception when there is an issue downloading with yt-dlp."""
 
     def __init__(self, e: Exception) -> None:
         super().__init__(f"Download failed with error: {e}")
 
 
-class InvalidExtractorError(Exception):
+class ExtractionFailedError(Tk3u8Error):
+    """Custom exception when every extractor failed to get the data of the
+    user."""
+
+    def __init__(self, username: str) -> None:
+        self.message = f"All extractors failed to get the data of user @{username}."
+        super().__init__(self.message)
+
+
+class DownloadCancelledError(Tk3u8Error):
+    """Custom exception when the download is cancelled, either by
+    cancelling its handle or by pressing Ctrl+C while waiting."""
+
+    def __init__(self, username: str) -> None:
+        self.message = f"Download of user @{username} was cancelled."
+        super().__init__(self.message)
+
+
+class WorkerError(Tk3u8Error):
+    """Custom exception when a recording failed in a worker process. The
+    error raised in the worker can't be raised again as it is, so its name
+    and message are kept instead."""
+
+    def __init__(self, username: str, error: str, message: str) -> None:
+        self.username = username
+        self.error = error
+        self.message = f"Recording of user @{username} failed in a worker process due to {error}: {message}"
+        super().__init__(self.message)
+
+
+class WorkerLostError(Tk3u8Error):
+    """Custom exception when the worker process of a recording exited or
+    stopped responding before the recording was done."""
+
+    def __init__(self, username: str) -> None:
+        self.message = f"The worker process recording user @{username} was lost."
+        super().__init__(self.message)
+
+
+class WorkerPoolClosedError(Tk3u8Error):
+    """Custom exception when a recording is handed to a worker pool that is
+    draining or stopped."""
+
+    def __init__(self) -> None:
+        self.message = "The worker pool is no longer taking recordings."
+        super().__init__(self.message)
+
+
+class CoordinatorError(Tk3u8Error):
+    """Custom exception when the state shared by the nodes of a cluster
+    can't be read or written."""
+
+    exit_code = 1
+
+    def __init__(self, message: str) -> None:
+        self.message = message
+        super().__init__(self.message)
+
+
+class JoinError(Tk3u8Error):
+    """Custom exception when the recordings of a live session can't be
+    joined."""
+
+    exit_code = 1
+
+    def __init__(self, message: str) -> None:
+        self.message = message
+        super().__init__(self.message)
+
+
+class UploadError(Tk3u8Error):
+    """Custom exception when a recording can't be uploaded to the object
+    storage."""
+
+    exit_code = 1
+
+    def __init__(self, message: str) -> None:
+        self.message = message
+        super().__init__(self.message)
+
+
+class InvalidExtractorError(Tk3u8Error):
     """Custom exception raised when an invalid extractor is used."""
 
     def __init__(self) -> None:
         super().__init__("The specified extractor is invalid or has failed.")
+
+
+class InvalidProfileModeError(Tk3u8Error):
+    """Custom exception raised when an invalid profiling mode is used."""
+
+    def __init__(self, profile: str) -> None:
+        super().__init__(f"Invalid profiling mode: {profile}. Supported modes: cpu, mem")
@@ -3,19 +3,43 @@ from typing import Optional
 import toml
 from toml import TomlDecodeError
 from tk3u8.cli.console import console
-from tk3u8.constants import OptionKey
+from tk3u8.constants import TIKTOK_BASE_URL, Engine, OptionKey
+from tk3u8.exceptions import ConfigFileError
 from tk3u8.messages import messages
 from tk3u8.paths_handler import PathsHandler
 
 
-OPTION_KEY_DEFAULT_VALUES = {
+OPTION_KEY_DEFAULT_VALUES: dict[OptionKey, Optional[str | int | bool | list]] = {
     OptionKey.SESSIONID_SS: None,
     OptionKey.TT_TARGET_IDC: None,
     OptionKey.PROXY: None,
     OptionKey.WAIT_UNTIL_LIVE: False,
     OptionKey.TIMEOUT: 30,
     OptionKey.FORCE_REDOWNLOAD: False,
-    OptionKey.USE_H265: False
+    OptionKey.USE_H265: None,
+    OptionKey.QUALITY_FALLBACK: [],
+    OptionKey.CODEC_FALLBACK: False,
+    OptionKey.CODEC_POLICY: None,
+    OptionKey.ENGINE: Engine.YT_DLP.value,
+    OptionKey.MAX_BANDWIDTH: None,
+    OptionKey.MIN_BANDWIDTH: 0,
+    OptionKey.PRIORITY: 1,
+    OptionKey.BANDWIDTH_COORDINATOR_PORT: None,
+    OptionKey.LINK_REFRESH_MARGIN: 60,
+    OptionKey.PREWARM_CONNECTIONS: True,
+    OptionKey.DNS_CACHE_TTL: 300,
+    OptionKey.METRICS_PORT: None,
+    OptionKey.TRACE_FILE: None,
+    OptionKey.BASE_URL: TIKTOK_BASE_URL,
+    OptionKey.HEADLESS: False,
+    OptionKey.DASHBOARD: False,
+    OptionKey.DASHBOARD_REFRESH_RATE: 2,
+    OptionKey.UPLOAD_URL: None,
+    OptionKey.UPLOAD_ACCESS_KEY: None,
+    OptionKey.UPLOAD_SECRET_KEY: None,
+    OptionKey.UPLOAD_REGION: None,
+    OptionKey.UPLOAD_PART_SIZE: 16,
+    OptionKey.UPLOAD_MAX_SPOOLED_PARTS: 4
 }
 
 logger = logging.getLogger(__name__)
@@ -43,7 +67,7 @@ class OptionsHandler:
         self._args_values: dict = {}
         self._config_values: dict = self._load_config_values()
 
-    def get_option_val(self, key: OptionKey) -> Optional[str | int | bool]:
+    def get_option_val(self, key: OptionKey) -> Optional[str | int | bool | list]:
         """
         Retrieves the value for a given option key, checking arguments first, then config file,
         and finally falling back to default values.
@@ -58,7 +82,7 @@ class OptionsHandler:
 
         return OPTION_KEY_DEFAULT_VALUES.get(key)
 
-    def save_args_values(self, *args: dict, **kwargs: Optional[str | int]) -> None:
+    def save_args_values(self, *args: dict, **kwargs: Optional[str | int | list]) -> None:
         """
         Saves provided argument values into the 'self._args_values',
         accepting both dictionaries and keyword arguments.
@@ -83,7 +107,7 @@ class OptionsHandler:
         except (FileNotFoundError, UnicodeDecodeError):
             console.print(messages.config_file_parsing_error)
             logger.error(messages.config_file_parsing_error)
-            exit(1)
+            raise ConfigFileError(messages.config_file_parsing_error)
 
         except TomlDecodeError as e:
             exc_msg = f'{e.msg} (line {e.lineno} column {e.colno} char {e.pos})'
@@ -92,7 +116,7 @@ class OptionsHandler:
             console.print(formatted_msg)
             logger.debug(formatted_msg)
 
-            exit(1)
+            raise ConfigFileError(f"Error decoding config file due to: '{exc_msg}'")
 
     def _validate_and_retouch_config(self, config: dict) -> dict:
         """Validates the configuration dictionary, ensuring all keys are valid
@@ -107,7 +131,7 @@ class OptionsHandler:
                 console.print(msg)
                 logger.debug(msg)
 
-                exit(1)
+                raise ConfigFileError(f"Option key '{key}' is invalid.")
 
             if value == "":
                 raw_config[key] = None
@@ -5,6 +5,7 @@ from platformdirs import user_data_path, user_downloads_path
 import toml
 from tk3u8.cli.console import console
 from tk3u8.constants import APP_NAME, DEFAULT_CONFIG
+from tk3u8.exceptions import ConfigFileError
 from tk3u8.messages import messages
 
 logger = logging.getLogger(__name__)
@@ -79,7 +80,7 @@ class PathsHandler:
                 error_msg = messages.config_file_loading_error
                 console.print(error_msg)
                 logger.error(error_msg)
-                exit(1)
+                raise ConfigFileError(error_msg)
         else:
             default_path = os.path.join(self.PROGRAM_DATA_DIR, "tk3u8.conf")
 
@@ -0,0 +1,397 @@
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+import uuid
+from typing import Dict, Optional
+from tk3u8.core.scheduler import Clock, system_clock
+
+
+logger = logging.getLogger(__name__)
+
+# Smallest allocation of a recording, 1 byte per second. An allocation is
+# never 0, as only None means that the bandwidth is unlimited.
+MIN_ALLOCATION_BPS = 8
+
+
+def allocate_bandwidth(
+        total_bps: Optional[int],
+        min_bps_by_id: Dict[str, int],
+        weight_by_id: Optional[Dict[str, int]] = None
+) -> Dict[str, Optional[int]]:
+    """
+    Splits the total bandwidth between recordings. Each recording first gets
+    its minimum guarantee, then the remaining bandwidth is split between all
+    of them in proportion to their weights, which are 1 if not given, i.e.,
+    evenly.
+
+    If the minimum guarantees add up to more than the total, each recording
+    gets a part of the total that is proportional to its minimum times its
+    weight instead, and recordings without a minimum are squeezed down to
+    'MIN_ALLOCATION_BPS'. No recording ever gets less than that. If the
+    total is None, the bandwidth is unlimited for every recording.
+    """
+    if total_bps is None:
+        return {recording_id: None for recording_id in min_bps_by_id}
+
+    if not min_bps_by_id:
+        return {}
+
+    total_min_bps = sum(min_bps_by_id.values())
+    weights = {recording_id: max((weight_by_id or {}).get(recording_id, 1), 1) for recording_id in min_bps_by_id}
+
+    if total_min_bps >= total_bps:
+        claims = {recording_id: min_bps * weights[recording_id] for recording_id, min_bps in min_bps_by_id.items()}
+        total_claims = sum(claims.values())
+        squeezed_count = sum(1 for claim in claims.values() if not claim)
+        remaining_bps = max(total_bps - squeezed_count * MIN_ALLOCATION_BPS, 0)
+
+        return {
+            recording_id: max(remaining_bps * claim // total_claims if total_claims else 0, MIN_ALLOCATION_BPS)
+            for recording_id, claim in claims.items()
+        }
+
+    total_weight = sum(weights.values())
+
+    return {
+        recording_id: max(min_bps + (total_bps - total_min_bps) * weights[recording_id] // total_weight, MIN_ALLOCATION_BPS)
+        for recording_id, min_bps in min_bps_by_id.items()
+    }
+
+
+class TokenBucket:
+    """
+    Token bucket for limiting the download rate of a single recording. The
+    tokens are in bytes, and the bucket can hold up to one second worth of
+    tokens. Consuming more tokens than available makes the caller sleep
+    until the deficit is refilled. A rate of None means that the rate is
+    unlimited, while any other rate is at least 'MIN_ALLOCATION_BPS'. The
+    refills and the sleeps run on the given clock.
+    """
+
+    def __init__(self, rate_bps: Optional[int] = None, clock: Clock = system_clock) -> None:
+        self._lock = threading.Lock()
+        self._clock = clock
+        self._rate_bps = _clamp_rate(rate_bps)
+        self._tokens = self._get_capacity()
+        self._last_refill = clock.monotonic()
+
+    def get_rate(self) -> Optional[int]:
+        return self._rate_bps
+
+    def set_rate(self, rate_bps: Optional[int]) -> None:
+        with self._lock:
+            self._refill()
+            self._rate_bps = _clamp_rate(rate_bps)
+            self._tokens = min(self._tokens, self._get_capacity())
+
+    def consume(self, num_bytes: int) -> None:
+        with self._lock:
+            if self._rate_bps is None:
+                return
+
+            self._refill()
+            self._tokens -= num_bytes
+            wait_seconds = -self._tokens / (self._rate_bps / 8) if self._tokens < 0 else 0
+
+        if wait_seconds > 0:
+            self._clock.sleep(wait_seconds)
+
+    def _refill(self) -> None:
+        now = self._clock.monotonic()
+
+        if self._rate_bps is not None:
+            self._tokens = min(self._tokens + (now - self._last_refill) * self._rate_bps / 8, self._get_capacity())
+
+        self._last_refill = now
+
+    def _get_capacity(self) -> float:
+        return self._rate_bps / 8 if self._rate_bps is not None else 0
+
+
+def _clamp_rate(rate_bps: Optional[int]) -> Optional[int]:
+    return max(rate_bps, MIN_ALLOCATION_BPS) if rate_bps is not None else None
+
+
+class _CoordinatorRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        server = self.server
+        assert isinstance(server, HostBandwidthCoordinator)
+
+        response: dict
+
+        try:
+            request = json.loads(self.rfile.readline())
+            allocations = server.sync(request["process"], request["total_bps"], request["recordings"], request.get("weights"))
+            response = {"allocations": allocations}
+        except (ValueError, KeyError, TypeError) as e:
+            response = {"error": str(e)}
+
+        self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class HostBandwidthCoordinator(socketserver.ThreadingTCPServer):
+    """
+    Local socket server that splits the bandwidth budget between the
+    recordings of all tk3u8 processes on the host.
+
+    Each process periodically sends all of its recordings, which replace the
+    ones it sent before. Processes that haven't synced for a while are
+    considered gone, and their recordings are dropped from the allocation.
+    The most recent non-empty total sent by any process is used as the
+    host-wide budget.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+    STALE_PROCESS_SECONDS = 10
+
+    def __init__(self, port: int) -> None:
+        super().__init__(("127.0.0.1", port), _CoordinatorRequestHandler)
+        self._lock = threading.Lock()
+        self._total_bps: Optional[int] = None
+        self._recordings_by_process: Dict[str, Dict[str, int]] = {}
+        self._weights_by_process: Dict[str, Dict[str, int]] = {}
+        self._last_seen_by_process: Dict[str, float] = {}
+
+    def sync(
+            self,
+            process: str,
+            total_bps: Optional[int],
+            recordings: Dict[str, int],
+            weights: Optional[Dict[str, int]] = None
+    ) -> Dict[str, Optional[int]]:
+        with self._lock:
+            now = time.monotonic()
+
+            if total_bps is not None:
+                self._total_bps = total_bps
+
+            self._recordings_by_process[process] = recordings
+            self._weights_by_process[process] = weights or {}
+            self._last_seen_by_process[process] = now
+
+            for stale_process in [p for p, last_seen in self._last_seen_by_process.items() if now - last_seen > self.STALE_PROCESS_SECONDS]:
+                del self._recordings_by_process[stale_process]
+                del self._weights_by_process[stale_process]
+                del self._last_seen_by_process[stale_process]
+
+            min_bps_by_key = {
+                f"{p}/{recording_id}": min_bps
+                for p, process_recordings in self._recordings_by_process.items()
+                for recording_id, min_bps in process_recordings.items()
+            }
+            weight_by_key = {
+                f"{p}/{recording_id}": weight
+                for p, process_weights in self._weights_by_process.items()
+                for recording_id, weight in process_weights.items()
+            }
+            allocations = allocate_bandwidth(self._total_bps, min_bps_by_key, weight_by_key)
+
+            return {
+                recording_id: allocations[f"{process}/{recording_id}"]
+                for recording_id in recordings
+            }
+
+
+class HostCoordinatorClient:
+    """
+    Client of the host-wide bandwidth coordinator. If no coordinator is
+    listening on the port yet, this process starts one in a background
+    thread, so the first tk3u8 process on the host becomes the coordinator.
+    """
+
+    SOCKET_TIMEOUT = 2
+
+    def __init__(self, port: int) -> None:
+        self._port = port
+        self._process = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._server: Optional[HostBandwidthCoordinator] = None
+
+    def sync(
+            self,
+            total_bps: Optional[int],
+            recordings: Dict[str, int],
+            weights: Optional[Dict[str, int]] = None
+    ) -> Dict[str, Optional[int]]:
+        request = {"process": self._process, "total_bps": total_bps, "recordings": recordings, "weights": weights or {}}
+
+        try:
+            return self._send(request)
+        except OSError:
+            self._start_server()
+            return self._send(request)
+
+    def close(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _send(self, request: dict) -> Dict[str, Optional[int]]:
+        with socket.create_connection(("127.0.0.1", self._port), timeout=self.SOCKET_TIMEOUT) as sock:
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            response = json.loads(sock.makefile("rb").readline())
+
+        if "error" in response:
+            raise OSError(f"Bandwidth coordinator error: {response['error']}")
+
+        return response["allocations"]
+
+    def _start_server(self) -> None:
+        try:
+            server = HostBandwidthCoordinator(self._port)
+        except OSError:
+            # Another process became the coordinator in the meantime
+            return
+
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self._server = server
+        logger.debug(f"Started host-wide bandwidth coordinator on port {self._port}")
+
+
+class BandwidthLimiter:
+    """
+    Limits the download bandwidth of all recordings in this process, and
+    optionally of all tk3u8 processes on the host through a local socket.
+
+    Each registered recording gets a token bucket whose rate is set by its
+    allocation. The allocations are recomputed whenever a recording is
+    registered or unregistered, and periodically when coordinating with the
+    other processes on the host, as their recordings can change anytime.
+    The coordinator is reached without holding the lock, so a slow one
+    doesn't hold up the recordings consuming their buckets.
+
+    Attributes:
+        _total_bps (int | None): The total budget in bits per second. If
+            None, the bandwidth is unlimited.
+        _min_bps_by_id (dict[str, int]): Minimum guarantee of each recording.
+        _weight_by_id (dict[str, int]): Weight of each recording in the
+            split of the bandwidth left after the minimum guarantees.
+        _buckets (dict[str, TokenBucket]): Token bucket of each recording.
+        _client (HostCoordinatorClient | None): Client of the host-wide
+            coordinator, if enabled.
+        _rebalances (int): Number of rebalances started so far.
+        _applied_rebalance (int): Number of the last rebalance whose
+            allocations were applied, so the allocations of an older one
+            that took longer aren't applied over them.
+    """
+
+    SYNC_INTERVAL = 2
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._total_bps: Optional[int] = None
+        self._min_bps_by_id: Dict[str, int] = {}
+        self._weight_by_id: Dict[str, int] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._client: Optional[HostCoordinatorClient] = None
+        self._sync_thread: Optional[threading.Thread] = None
+        self._rebalances = 0
+        self._applied_rebalance = 0
+
+    def set_total(self, total_bps: Optional[int]) -> None:
+        with self._lock:
+            if total_bps == self._total_bps:
+                return
+
+            self._total_bps = total_bps
+            logger.debug(f"Bandwidth budget set to: {total_bps} bps")
+
+        self._rebalance()
+
+    def use_host_coordinator(self, port: int) -> None:
+        with self._lock:
+            if self._client:
+                return
+
+            self._client = HostCoordinatorClient(port)
+            self._sync_thread = threading.Thread(target=self._sync_periodically, daemon=True)
+            self._sync_thread.start()
+
+        self._rebalance()
+
+    def register(self, recording_id: str, min_bps: int = 0, weight: int = 1, clock: Clock = system_clock) -> TokenBucket:
+        """Registers a recording, and returns the token bucket that limits
+        its download rate, which runs on the given clock."""
+        with self._lock:
+            self._min_bps_by_id[recording_id] = min_bps
+            self._weight_by_id[recording_id] = weight
+            bucket = self._buckets[recording_id] = TokenBucket(clock=clock)
+
+        self._rebalance()
+
+        return bucket
+
+    def unregister(self, recording_id: str) -> None:
+        with self._lock:
+            self._min_bps_by_id.pop(recording_id, None)
+            self._weight_by_id.pop(recording_id, None)
+            self._buckets.pop(recording_id, None)
+
+        self._rebalance()
+
+    def get_allocation(self, recording_id: str) -> Optional[int]:
+        with self._lock:
+            bucket = self._buckets.get(recording_id)
+            return bucket.get_rate() if bucket else None
+
+    def get_allocations(self) -> Dict[str, Optional[int]]:
+        with self._lock:
+            return {recording_id: bucket.get_rate() for recording_id, bucket in self._buckets.items()}
+
+    def _rebalance(self) -> None:
+        """Recomputes the allocations, and sets the rates of the buckets to
+        them. Must be called without holding the lock."""
+        with self._lock:
+            self._rebalances += 1
+            rebalance = self._rebalances
+            client = self._client
+            total_bps = self._total_bps
+            min_bps_by_id = dict(self._min_bps_by_id)
+            weight_by_id = dict(self._weight_by_id)
+
+        allocations: Dict[str, Optional[int]]
+        scope = "process"
+
+        if client:
+            try:
+                allocations = client.sync(total_bps, min_bps_by_id, weight_by_id)
+                scope = "host"
+            except OSError as e:
+                logger.warning(f"Can't reach the host-wide bandwidth coordinator, limiting within this process only: {e}")
+                allocations = allocate_bandwidth(total_bps, min_bps_by_id, weight_by_id)
+        else:
+            allocations = allocate_bandwidth(total_bps, min_bps_by_id, weight_by_id)
+
+        with self._lock:
+            if rebalance < self._applied_rebalance:
+                return
+
+            self._applied_rebalance = rebalance
+
+            for recording_id, bucket in self._buckets.items():
+                # Recordings registered since then are left to the next
+                # rebalance, which their registration started
+                if recording_id not in allocations:
+                    continue
+
+                allocation = allocations[recording_id]
+
+                if allocation != bucket.get_rate():
+                    logger.info(
+                        f"Bandwidth allocation of recording '{recording_id}' changed from {bucket.get_rate()} bps "
+                        f"to {allocation} bps (minimum: {self._min_bps_by_id[recording_id]} bps, scope: {scope})"
+                    )
+                    bucket.set_rate(allocation)
+
+    def _sync_periodically(self) -> None:
+        while True:
+            time.sleep(self.SYNC_INTERVAL)
+            self._rebalance()
+
+
+bandwidth_limiter = BandwidthLimiter()
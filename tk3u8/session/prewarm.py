@@ -0,0 +1,157 @@
+import logging
+import socket
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+import requests
+from requests.exceptions import RequestException
+
+
+logger = logging.getLogger(__name__)
+
+
+class DNSCache:
+    """
+    Caches the DNS lookups of CDN hostnames while downloads are using it.
+
+    Once installed, 'socket.getaddrinfo' is wrapped so that lookups of the
+    registered hostnames are served from the cache until they expire. This
+    applies to every library doing lookups through the socket module,
+    including requests and yt-dlp. Lookups of any other hostname are passed
+    through as is.
+
+    Each download installs the cache when the user goes live, and
+    uninstalls it once the recording is done. 'socket.getaddrinfo' is only
+    restored once every download that installed it did so.
+
+    Attributes:
+        _ttl (float): Seconds before a cached lookup expires.
+        _hosts (set[str]): Hostnames whose lookups are cached.
+        _entries (dict): Cached lookups with the time they were cached.
+        _installs (int): Number of downloads that installed the cache.
+    """
+
+    def __init__(self, ttl: float = 300) -> None:
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._hosts: set[str] = set()
+        self._entries: Dict[Tuple, Tuple[float, List]] = {}
+        self._installs = 0
+        self._original_getaddrinfo: Optional[Any] = None
+
+    def set_ttl(self, ttl: float) -> None:
+        self._ttl = ttl
+
+    def install(self) -> None:
+        with self._lock:
+            self._installs += 1
+
+            if self._original_getaddrinfo is not None:
+                return
+
+            self._original_getaddrinfo = socket.getaddrinfo
+            socket.getaddrinfo = self._getaddrinfo  # type: ignore[assignment]
+
+        logger.debug("DNS cache for CDN hostnames installed")
+
+    def uninstall(self) -> None:
+        with self._lock:
+            self._installs = max(self._installs - 1, 0)
+
+            if self._installs > 0 or self._original_getaddrinfo is None:
+                return
+
+            socket.getaddrinfo = self._original_getaddrinfo
+            self._original_getaddrinfo = None
+            self._hosts.clear()
+            self._entries.clear()
+
+        logger.debug("DNS cache for CDN hostnames uninstalled")
+
+    def resolve(self, host: str, port: int) -> None:
+        """Registers the hostname and looks it up ahead of time, so that the
+        connection doesn't have to wait for it."""
+        with self._lock:
+            self._hosts.add(host)
+
+        try:
+            socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        except OSError as e:
+            logger.warning(f"Resolving {host} failed: {e}")
+
+    def _getaddrinfo(self, host: Any, port: Any, *args: Any, **kwargs: Any) -> List:
+        assert self._original_getaddrinfo is not None
+
+        if host not in self._hosts:
+            return self._original_getaddrinfo(host, port, *args, **kwargs)
+
+        key = (host, port, args, tuple(sorted(kwargs.items())))
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+        if entry and time.monotonic() - entry[0] < self._ttl:
+            return entry[1]
+
+        result = self._original_getaddrinfo(host, port, *args, **kwargs)
+
+        with self._lock:
+            self._entries[key] = (time.monotonic(), result)
+
+        return result
+
+
+class ConnectionPrewarmer:
+    """
+    Resolves and connects to the CDN hosts of the stream links in the
+    background, as soon as the user goes live, so that DNS lookups and TCP
+    and TLS handshakes are already done by the time the recording starts.
+
+    The connection is made by fetching the first stream link of each host
+    through the given session, which keeps the connection open in its pool
+    for the recorder to reuse. If no session is given, the hosts are only
+    resolved, which is the case when the download is handed over to yt-dlp.
+    """
+
+    REQUEST_TIMEOUT = 10
+
+    def __init__(self, dns_cache: DNSCache) -> None:
+        self._dns_cache = dns_cache
+
+    def prewarm(self, session: Optional[requests.Session], links: List[str]) -> threading.Thread:
+        thread = threading.Thread(target=self._prewarm, args=(session, links), daemon=True)
+        thread.start()
+
+        return thread
+
+    def _prewarm(self, session: Optional[requests.Session], links: List[str]) -> None:
+        started_at = time.monotonic()
+        links_by_origin: Dict[Tuple[str, str, int], str] = {}
+
+        for link in links:
+            parsed_link = urlparse(link)
+
+            if not parsed_link.hostname:
+                continue
+
+            port = parsed_link.port or (443 if parsed_link.scheme == "https" else 80)
+            links_by_origin.setdefault((parsed_link.scheme, parsed_link.hostname, port), link)
+
+        for (_, host, port), link in links_by_origin.items():
+            self._dns_cache.resolve(host, port)
+
+            if not session:
+                continue
+
+            try:
+                # The response has to be read fully for the connection to be
+                # returned to the pool of the session
+                session.get(link, timeout=self.REQUEST_TIMEOUT).content
+            except RequestException as e:
+                logger.warning(f"Pre-connecting to {host} failed: {e}")
+
+        logger.debug(f"Pre-warmed connections to {len(links_by_origin)} CDN host(s) in {time.monotonic() - started_at:.3f} seconds")
+
+
+dns_cache = DNSCache()
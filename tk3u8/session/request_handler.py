@@ -1,10 +1,14 @@
 import logging
 import random
+import time
+from typing import Optional
 import requests
 from requests.exceptions import ConnectionError, ReadTimeout
 from tk3u8.constants import USER_AGENT_LIST, OptionKey
 from tk3u8.exceptions import RequestFailedError
 from tk3u8.options_handler import OptionsHandler
+from tk3u8.telemetry.metrics import http_request_duration_seconds, http_request_retries_total, http_requests_total
+from tk3u8.telemetry.tracing import tracer
 
 
 logger = logging.getLogger(__name__)
@@ -32,13 +36,22 @@ class RequestHandler:
         self._session: requests.Session
         self._initialize_session()
 
-    def get_data(self, url: str) -> requests.Response:
+    def get_data(self, url: str, source: Optional[str] = None) -> requests.Response:
+        """
+        Fetches the URL, retrying up to 3 times on connection errors and
+        unsuccessful status codes. The source, which is the name of the
+        extractor making the request, is used as a label in the metrics.
+        """
         retries = 3
         exc_msg: str = ""
+        extractor = source or ""
 
         for retry in range(1, retries + 1):
+            if retry > 1:
+                http_request_retries_total.inc(extractor=extractor)
+
             try:
-                response = self._session.get(url)
+                response = self._send_request(url, extractor, retry)
                 status_code = response.status_code
 
                 if status_code != 200:
@@ -70,6 +83,48 @@ class RequestHandler:
 
         raise RequestFailedError(exc_msg)
 
+    def _send_request(self, url: str, extractor: str, retry: int) -> requests.Response:
+        """Sends a single request, recording its metrics and tracing span."""
+        started_at = time.monotonic()
+        status: int | str = "error"
+
+        with tracer.start_span("http_request", kind="CLIENT", url=url, extractor=extractor, retry=retry) as span:
+            try:
+                response = self._session.get(url)
+                status = response.status_code
+
+                return response
+            except (ConnectionError, ReadTimeout) as e:
+                status = type(e).__name__
+                raise
+            finally:
+                http_request_duration_seconds.observe(time.monotonic() - started_at, extractor=extractor)
+                http_requests_total.inc(extractor=extractor, status=status)
+
+                if span:
+                    span.set_attribute("status", status)
+                    if isinstance(status, int) and status != 200:
+                        span.error = f"Request error due to status code: {status}"
+
+    def create_stream_session(self) -> requests.Session:
+        """
+        Creates a separate session for fetching the HLS playlist and segments
+        from the CDN. It shares the proxy and User-Agent of the main session,
+        but not its cookies, as these are only meant for TikTok itself.
+        """
+        session = requests.Session()
+        session.proxies.update(self._session.proxies)
+        session.headers.update({
+            "User-Agent": self._session.headers["User-Agent"]
+        })
+
+        logger.debug("New requests.Session for stream initialized.")
+        return session
+
+    def close(self) -> None:
+        self._session.close()
+        logger.debug("Requests' session closed.")
+
     def update_proxy(self, proxy: str | None) -> None:
         if proxy:
             self._session.proxies.update({
@@ -0,0 +1,274 @@
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import hashlib
+import hmac
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, quote, urlparse
+from xml.etree import ElementTree
+import requests
+from requests.exceptions import ConnectionError, ReadTimeout
+from tk3u8.exceptions import UploadError
+
+
+logger = logging.getLogger(__name__)
+
+
+SIGNING_ALGORITHM = "AWS4-HMAC-SHA256"
+DEFAULT_REGION = "us-east-1"
+
+# Namespace of the XML documents of the S3 API
+S3_NAMESPACE = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+
+@dataclass
+class UploadedPart:
+    """
+    A part of a multipart upload that was uploaded.
+
+    Attributes:
+        number (int): Number of the part, starting from 1.
+        etag (str): ETag returned for the part, which is needed to complete
+            the upload.
+        size (int): Size of the part in bytes.
+    """
+    number: int
+    etag: str
+    size: int
+
+
+def parse_upload_url(url: str) -> Tuple[str, str, str]:
+    """
+    Splits an upload URL like 'https://s3.example.com/bucket/some/prefix'
+    into the endpoint, the bucket and the prefix of the object keys, which
+    may be empty.
+    """
+    parsed = urlparse(url)
+    bucket, _, prefix = parsed.path.strip("/").partition("/")
+
+    if parsed.scheme not in ("http", "https") or not parsed.netloc or not bucket:
+        raise UploadError(f"The upload URL '{url}' must look like 'https://host/bucket' or 'https://host/bucket/prefix'")
+
+    return f"{parsed.scheme}://{parsed.netloc}", bucket, prefix.strip("/")
+
+
+def sign_request(
+        method: str,
+        url: str,
+        headers: Dict[str, str],
+        payload_hash: str,
+        access_key: str,
+        secret_key: str,
+        region: str = DEFAULT_REGION,
+        now: Optional[datetime] = None
+) -> Dict[str, str]:
+    """
+    Signs a request to S3 with AWS Signature Version 4, and returns the
+    headers to send along with it, including the 'Authorization' header.
+    Every given header is signed. The path and the query of the URL must
+    already be URI-encoded.
+    """
+    now = now or datetime.now(timezone.utc)
+    amz_date = now.strftime("%Y%m%dT%H%M%SZ")
+    date = amz_date[:8]
+    parsed = urlparse(url)
+
+    signed_headers = {name.lower(): " ".join(str(value).split()) for name, value in headers.items()}
+    signed_headers["host"] = parsed.netloc
+    signed_headers["x-amz-date"] = amz_date
+    signed_headers["x-amz-content-sha256"] = payload_hash
+    signed_names = ";".join(sorted(signed_headers))
+
+    canonical_request = "\n".join([
+        method,
+        parsed.path or "/",
+        get_canonical_query(parsed.query),
+        "".join(f"{name}:{signed_headers[name]}\n" for name in sorted(signed_headers)),
+        signed_names,
+        payload_hash
+    ])
+    scope = f"{date}/{region}/s3/aws4_request"
+    string_to_sign = "\n".join([
+        SIGNING_ALGORITHM,
+        amz_date,
+        scope,
+        hashlib.sha256(canonical_request.encode()).hexdigest()
+    ])
+
+    signing_key = f"AWS4{secret_key}".encode()
+    for value in (date, region, "s3", "aws4_request"):
+        signing_key = hmac.new(signing_key, value.encode(), hashlib.sha256).digest()
+
+    signature = hmac.new(signing_key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+    signed_headers["authorization"] = f"{SIGNING_ALGORITHM} Credential={access_key}/{scope}, SignedHeaders={signed_names}, Signature={signature}"
+
+    return signed_headers
+
+
+def get_canonical_query(query: str) -> str:
+    """Sorts the parameters of the query and encodes them the way
+    Signature Version 4 expects them to be."""
+    params = sorted(
+        (quote(name, safe="-_.~"), quote(value, safe="-_.~"))
+        for name, value in parse_qsl(query, keep_blank_values=True)
+    )
+    return "&".join(f"{name}={value}" for name, value in params)
+
+
+class S3Client:
+    """
+    A minimal client of the S3 API, covering the multipart uploads that
+    recordings are uploaded with. Path-style URLs are used, so it works with
+    S3-compatible storages like MinIO as well.
+
+    Requests that fail due to a connection error, a timeout or a 5xx status
+    code are retried with an exponential backoff, up to 'MAX_ATTEMPTS'
+    times. Any other error is raised right away as 'UploadError'.
+
+    Attributes:
+        _endpoint (str): Scheme and host of the storage, e.g.,
+            'https://s3.us-east-1.amazonaws.com'.
+        _access_key (str): Access key ID used to sign the requests.
+        _secret_key (str): Secret access key used to sign the requests.
+        _region (str): Region of the bucket.
+        _session (requests.Session): Session used for the requests.
+        _retry_backoff (float): Seconds to wait before the first retry,
+            which doubles with each retry.
+    """
+
+    REQUEST_TIMEOUT = 60
+    MAX_ATTEMPTS = 5
+    RETRY_BACKOFF = 1.0
+
+    def __init__(
+            self,
+            endpoint: str,
+            access_key: str,
+            secret_key: str,
+            region: str = DEFAULT_REGION,
+            session: Optional[requests.Session] = None,
+            retry_backoff: float = RETRY_BACKOFF
+    ) -> None:
+        self._endpoint = endpoint.rstrip("/")
+        self._access_key = access_key
+        self._secret_key = secret_key
+        self._region = region
+        self._session = session or requests.Session()
+        self._retry_backoff = retry_backoff
+
+    def create_multipart_upload(self, bucket: str, key: str) -> str:
+        """Starts a multipart upload of the object, and returns its upload
+        ID."""
+        response = self._request("POST", bucket, key, {"uploads": ""})
+        upload_id = _parse_xml(response).findtext(f"{{{S3_NAMESPACE}}}UploadId")
+
+        if not upload_id:
+            raise UploadError(f"No upload ID was returned for {bucket}/{key}")
+
+        return upload_id
+
+    def upload_part(self, bucket: str, key: str, upload_id: str, number: int, data: bytes) -> UploadedPart:
+        response = self._request("PUT", bucket, key, {"partNumber": str(number), "uploadId": upload_id}, data)
+        etag = response.headers.get("ETag")
+
+        if not etag:
+            raise UploadError(f"No ETag was returned for part #{number} of {bucket}/{key}")
+
+        return UploadedPart(number, etag, len(data))
+
+    def list_parts(self, bucket: str, key: str, upload_id: str) -> List[UploadedPart]:
+        """Gets the parts of the multipart upload that were uploaded so
+        far."""
+        parts: List[UploadedPart] = []
+        marker = "0"
+
+        while True:
+            response = self._request("GET", bucket, key, {"uploadId": upload_id, "part-number-marker": marker})
+            root = _parse_xml(response)
+
+            for part in root.iter(f"{{{S3_NAMESPACE}}}Part"):
+                parts.append(UploadedPart(
+                    int(part.findtext(f"{{{S3_NAMESPACE}}}PartNumber") or 0),
+                    part.findtext(f"{{{S3_NAMESPACE}}}ETag") or "",
+                    int(part.findtext(f"{{{S3_NAMESPACE}}}Size") or 0)
+                ))
+
+            if root.findtext(f"{{{S3_NAMESPACE}}}IsTruncated") != "true":
+                return parts
+
+            marker = root.findtext(f"{{{S3_NAMESPACE}}}NextPartNumberMarker") or str(parts[-1].number)
+
+    def complete_multipart_upload(self, bucket: str, key: str, upload_id: str, parts: List[UploadedPart]) -> None:
+        """Completes the multipart upload, which joins the parts into the
+        object."""
+        root = ElementTree.Element("CompleteMultipartUpload", xmlns=S3_NAMESPACE)
+
+        for part in sorted(parts, key=lambda part: part.number):
+            element = ElementTree.SubElement(root, "Part")
+            ElementTree.SubElement(element, "PartNumber").text = str(part.number)
+            ElementTree.SubElement(element, "ETag").text = part.etag
+
+        self._request("POST", bucket, key, {"uploadId": upload_id}, ElementTree.tostring(root))
+
+    def abort_multipart_upload(self, bucket: str, key: str, upload_id: str) -> None:
+        self._request("DELETE", bucket, key, {"uploadId": upload_id})
+
+    def _request(self, method: str, bucket: str, key: str, query: Dict[str, str], body: bytes = b"") -> requests.Response:
+        url = f"{self._endpoint}/{quote(bucket, safe='')}/{quote(key)}"
+        if query:
+            url += "?" + "&".join(f"{quote(name, safe='-_.~')}={quote(value, safe='-_.~')}" for name, value in query.items())
+
+        payload_hash = hashlib.sha256(body).hexdigest()
+        error = ""
+
+        for attempt in range(1, self.MAX_ATTEMPTS + 1):
+            headers = sign_request(method, url, {}, payload_hash, self._access_key, self._secret_key, self._region)
+
+            try:
+                response = self._session.request(method, url, data=body, headers=headers, timeout=self.REQUEST_TIMEOUT)
+            except (ConnectionError, ReadTimeout) as e:
+                error = f"{type(e).__name__}: {e}"
+            else:
+                # Completing an upload may fail after the response has
+                # started, in which case the error comes with a 200
+                error_code = _get_error_code(response)
+
+                if response.status_code < 300 and error_code is None:
+                    return response
+
+                error = f"{method} {bucket}/{key} failed with status code {response.status_code} ({error_code or 'no error code'})"
+
+                if 300 <= response.status_code < 500 and response.status_code != 429:
+                    raise UploadError(error)
+
+            if attempt < self.MAX_ATTEMPTS:
+                delay = self._retry_backoff * 2 ** (attempt - 1)
+                logger.warning(f"{error}, retrying in {delay:.0f} seconds (attempt {attempt}/{self.MAX_ATTEMPTS})")
+                time.sleep(delay)
+
+        raise UploadError(error)
+
+
+def _parse_xml(response: requests.Response) -> ElementTree.Element:
+    try:
+        return ElementTree.fromstring(response.content)
+    except ElementTree.ParseError as e:
+        raise UploadError(f"Invalid response from the storage: {e}")
+
+
+def _get_error_code(response: requests.Response) -> Optional[str]:
+    """Gets the code of the error document in the response, if it is
+    one."""
+    if b"<Error>" not in response.content[:512]:
+        return None
+
+    try:
+        root = ElementTree.fromstring(response.content)
+    except ElementTree.ParseError:
+        return None
+
+    if root.tag.rsplit("}", 1)[-1] != "Error":
+        return None
+
+    return root.findtext("Code") or root.findtext(f"{{{S3_NAMESPACE}}}Code") or "Error"
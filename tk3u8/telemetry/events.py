@@ -0,0 +1,175 @@
+from dataclasses import dataclass, field
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from typing import Any, Callable, Collection, Dict, List, Optional, Protocol, TextIO
+from tk3u8.constants import EventType
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Event:
+    """
+    A lifecycle event of a user being watched.
+
+    Attributes:
+        type (EventType): What happened.
+        username (str): The user it happened to.
+        data (dict): Details of what happened, which depend on the type.
+        timestamp (float): When it happened, in Unix time.
+    """
+    type: EventType
+    username: str
+    data: Dict[str, Any] = field(default_factory=dict)
+    timestamp: float = field(default_factory=time.time)
+
+    def to_dict(self) -> dict:
+        return {"ts": round(self.timestamp, 3), "event": self.type.value, "username": self.username, **self.data}
+
+
+EventCallback = Callable[[Event], None]
+
+
+class EventWriter(Protocol):
+    def write(self, event: Event) -> None:
+        ...
+
+
+class NDJSONEventWriter:
+    """Writes each event as a compact line of JSON to the given stream, or
+    to stdout if not given. If event types are given, other events are
+    skipped."""
+
+    def __init__(self, stream: Optional[TextIO] = None, event_types: Optional[Collection[EventType]] = None) -> None:
+        self._stream = stream
+        self._event_types = event_types
+        self._lock = threading.Lock()
+
+    def write(self, event: Event) -> None:
+        if self._event_types is not None and event.type not in self._event_types:
+            return
+
+        line = json.dumps(event.to_dict(), ensure_ascii=False, separators=(",", ":"), default=str) + "\n"
+        stream = self._stream or sys.stdout
+
+        with self._lock:
+            stream.write(line)
+            stream.flush()
+
+
+class EventBus:
+    """
+    Hands over the lifecycle events to the writers that were added, e.g.,
+    the NDJSON output of the headless mode and the dashboard.
+
+    Events are dropped right away while no writers are added, so emitting
+    them costs next to nothing when nobody is listening.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._writers: List[EventWriter] = []
+
+    def is_enabled(self) -> bool:
+        return bool(self._writers)
+
+    def add_writer(self, writer: EventWriter) -> None:
+        with self._lock:
+            if writer not in self._writers:
+                self._writers = self._writers + [writer]
+
+    def remove_writer(self, writer: EventWriter) -> None:
+        with self._lock:
+            self._writers = [added for added in self._writers if added is not writer]
+
+    def emit(self, event_type: EventType, username: str, **data: Any) -> None:
+        if not self._writers:
+            return
+
+        self.publish(Event(event_type, username, data))
+
+    def publish(self, event: Event) -> None:
+        """Hands over an event that was already created, e.g., one that was
+        forwarded from another process."""
+        for writer in self._writers:
+            try:
+                writer.write(event)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Error writing event '{event.type.value}': {e}")
+
+
+class EventDispatcher:
+    """
+    Calls the callbacks registered for each type of event on a worker
+    thread, so slow callbacks don't hold up the polling and recording. The
+    events are only queued where they're emitted, and the callbacks are
+    called in the order the events were emitted.
+
+    If a username is set, only the events of that user are dispatched.
+    """
+
+    _STOP = object()
+
+    def __init__(self) -> None:
+        self.username: Optional[str] = None
+        self._lock = threading.Lock()
+        self._callbacks: Dict[EventType, List[EventCallback]] = {}
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+
+    def add_callback(self, event_type: EventType, callback: EventCallback) -> None:
+        with self._lock:
+            self._callbacks[event_type] = self._callbacks.get(event_type, []) + [callback]
+
+    def has_callbacks(self) -> bool:
+        return bool(self._callbacks)
+
+    def write(self, event: Event) -> None:
+        if event.type not in self._callbacks or (self.username and event.username != self.username):
+            return
+
+        with self._lock:
+            if not self._thread:
+                self._thread = threading.Thread(target=self._dispatch, name="tk3u8-event-dispatcher", daemon=True)
+                self._thread.start()
+
+            self._queue.put(event)
+
+    def close(self) -> None:
+        """Stops the worker thread once the queued events are dispatched,
+        and waits for it. The thread is started again by the next event."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+
+            if not thread:
+                return
+
+            self._queue.put(self._STOP)
+
+        thread.join()
+
+    def _dispatch(self) -> None:
+        while True:
+            event = self._queue.get()
+
+            if event is self._STOP:
+                return
+
+            for callback in self._callbacks.get(event.type, []):
+                try:
+                    callback(event)
+                except Exception:
+                    logger.exception(f"Error in the callback for event '{event.type.value}' of user @{event.username}")
+
+
+events = EventBus()
+
+# Shared by every instance that runs in the headless mode, so each event is
+# only written once. Every written segment would be too chatty, so only their
+# periodic stats are written.
+stdout_writer = NDJSONEventWriter(event_types=[event_type for event_type in EventType if event_type != EventType.SEGMENT_WRITTEN])
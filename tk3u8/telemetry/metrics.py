@@ -0,0 +1,296 @@
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+    if not labels:
+        return ""
+
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """
+    Base class of the metrics, which keeps a value for each combination of
+    label values. The label values are given as keyword arguments, and any
+    label that is left out gets an empty value.
+    """
+
+    TYPE = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self._labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], Any] = {}
+
+    def remove(self, **labels: Any) -> None:
+        with self._lock:
+            self._values.pop(self._get_key(labels), None)
+
+    def get(self, **labels: Any) -> Any:
+        with self._lock:
+            return self._values.get(self._get_key(labels))
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+
+        with self._lock:
+            for key, value in self._values.items():
+                lines += self._render_value(list(zip(self._labelnames, key)), value)
+
+        return lines
+
+    def _render_value(self, labels: List[Tuple[str, str]], value: Any) -> List[str]:
+        return [f"{self.name}{_format_labels(labels)} {_format_value(value)}"]
+
+    def _get_key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        unknown_labels = set(labels) - set(self._labelnames)
+        if unknown_labels:
+            raise ValueError(f"Unknown labels for metric {self.name}: {', '.join(sorted(unknown_labels))}")
+
+        return tuple(str(labels.get(name, "")) for name in self._labelnames)
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        with self._lock:
+            key = self._get_key(labels)
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    TYPE = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._values[self._get_key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        with self._lock:
+            key = self._get_key(labels)
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """
+    Counts the observed values into cumulative buckets, along with their
+    sum and count. The value of each label combination is a list of the
+    counts of each bucket, followed by the sum and the count.
+    """
+
+    TYPE = "histogram"
+
+    def __init__(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Sequence[str] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self._buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value: float, **labels: Any) -> None:
+        with self._lock:
+            key = self._get_key(labels)
+            counts = self._values.setdefault(key, [0] * (len(self._buckets) + 2))
+            counts[bisect_left(self._buckets, value)] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def _render_value(self, labels: List[Tuple[str, str]], value: Any) -> List[str]:
+        lines = []
+        cumulative_count = 0
+
+        for bucket, count in zip(self._buckets, value):
+            cumulative_count += count
+            bucket_labels = labels + [("le", _format_value(bucket))]
+            lines.append(f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative_count}")
+
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(value[-2])}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {value[-1]}")
+
+        return lines
+
+
+class MetricsRegistry:
+    """Collection of metrics that are rendered together in the Prometheus
+    text exposition format."""
+
+    def __init__(self) -> None:
+        self._metrics: List[Metric] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+            self,
+            name: str,
+            documentation: str,
+            labelnames: Sequence[str] = (),
+            buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+
+        for metric in self._metrics:
+            lines += metric.render()
+
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric: Any) -> Any:
+        self._metrics.append(metric)
+        return metric
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        server = self.server
+        assert isinstance(server, MetricsServer)
+
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+
+        body = server.registry.render().encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug(f"Metrics request from {self.address_string()}: {format % args}")
+
+
+class MetricsServer(ThreadingHTTPServer):
+    """Local HTTP server that serves the metrics of the registry on the
+    '/metrics' path."""
+
+    daemon_threads = True
+
+    def __init__(self, port: int, registry: MetricsRegistry, host: str = "127.0.0.1") -> None:
+        super().__init__((host, port), _MetricsRequestHandler)
+        self.registry = registry
+        self.url = f"http://{host}:{self.server_port}/metrics"
+
+    def start(self) -> None:
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        logger.debug(f"Serving metrics on {self.url}")
+
+
+registry = MetricsRegistry()
+
+http_requests_total = registry.counter(
+    "tk3u8_http_requests_total",
+    "Requests made for fetching the stream data, by extractor and status code (or error name).",
+    ("extractor", "status")
+)
+http_request_duration_seconds = registry.histogram(
+    "tk3u8_http_request_duration_seconds",
+    "Latency of the requests made for fetching the stream data.",
+    ("extractor",)
+)
+http_request_retries_total = registry.counter(
+    "tk3u8_http_request_retries_total",
+    "Retried requests for fetching the stream data.",
+    ("extractor",)
+)
+waf_challenges_total = registry.counter(
+    "tk3u8_waf_challenges_total",
+    "WAF challenges received instead of the stream data."
+)
+extractor_attempts_total = registry.counter(
+    "tk3u8_extractor_attempts_total",
+    "Attempts of each extractor, by result ('success' or the error name).",
+    ("extractor", "result")
+)
+process_data_duration_seconds = registry.histogram(
+    "tk3u8_process_data_duration_seconds",
+    "Time spent fetching and processing the stream data of a user, including extractor fallbacks.",
+    ("username",)
+)
+poll_lag_seconds = registry.gauge(
+    "tk3u8_poll_lag_seconds",
+    "How much later than the configured timeout the last live status check finished.",
+    ("username",)
+)
+active_recordings = registry.gauge(
+    "tk3u8_active_recordings",
+    "Recordings currently in progress."
+)
+recording_bytes_total = registry.counter(
+    "tk3u8_recording_bytes_total",
+    "Bytes written to disk by the native engine.",
+    ("username",)
+)
+recording_bytes_per_second = registry.gauge(
+    "tk3u8_recording_bytes_per_second",
+    "Average bytes written per second since the current recording started (native engine).",
+    ("username",)
+)
+segment_fetch_duration_seconds = registry.histogram(
+    "tk3u8_segment_fetch_duration_seconds",
+    "Time spent fetching each segment (native engine).",
+    ("username",)
+)
+segment_queue_depth = registry.gauge(
+    "tk3u8_segment_queue_depth",
+    "Segments listed in the playlist that are yet to be fetched (native engine).",
+    ("username",)
+)
+segments_dropped_total = registry.counter(
+    "tk3u8_segments_dropped_total",
+    "Segments that fell off the playlist or failed to download (native engine).",
+    ("username",)
+)
+
+
+_server: Optional[MetricsServer] = None
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port: int) -> MetricsServer:
+    """Starts serving the metrics on the given port, if not yet started, and
+    returns the server. Raises OSError if the port can't be bound."""
+    global _server
+
+    with _server_lock:
+        if not _server:
+            _server = MetricsServer(port, registry)
+            _server.start()
+
+        return _server
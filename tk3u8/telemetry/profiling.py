@@ -0,0 +1,262 @@
+from contextlib import contextmanager
+import cProfile
+from datetime import datetime
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from typing import Dict, Iterator, List, Optional
+from tk3u8.constants import ProfileMode
+
+
+logger = logging.getLogger(__name__)
+
+
+class _PhaseStats:
+    """Memory statistics of a phase, accumulated over all of its runs."""
+
+    def __init__(self) -> None:
+        self.runs = 0
+        self.seconds = 0.0
+        self.net_bytes = 0
+        self.peak_bytes = 0
+
+
+class Profiler:
+    """
+    Profiles the program either for CPU usage (with cProfile) or memory
+    allocations (with tracemalloc), with a breakdown by phase, e.g., the
+    live status checks and the recordings.
+
+    In 'cpu' mode, each phase has its own cProfile profile, and the profile
+    of the active phase is switched whenever a phase starts or ends. Only the
+    thread that started the profiler is profiled, as cProfile profiles a
+    single thread. Code running outside of any phase is counted under the
+    'other' phase.
+
+    In 'mem' mode, the net allocated memory and the peak memory of each
+    phase are tracked. A snapshot is also taken periodically and compared to
+    the previous one, so the lines whose allocations keep growing in
+    long-running processes can be spotted.
+
+    The reports are written to the output directory once the profiler is
+    stopped.
+
+    Attributes:
+        _mode (ProfileMode | None): The profiling mode, or None if stopped.
+        _output_dir (str | None): Directory where the reports are written.
+        _started_at (str | None): Timestamp used for naming the reports.
+        _thread_id (int | None): ID of the thread being profiled (cpu mode).
+        _phase_stack (List[str]): Phases currently running in that thread.
+        _cpu_profiles (Dict[str, cProfile.Profile]): Profile of each phase.
+        _mem_stats (Dict[str, _PhaseStats]): Memory statistics of each phase.
+        _snapshot_interval (float): Seconds between memory snapshots.
+    """
+
+    OTHER_PHASE = "other"
+    TOP_ENTRIES = 25
+    TRACEBACK_LIMIT = 10
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._mode: Optional[ProfileMode] = None
+        self._output_dir: Optional[str] = None
+        self._started_at: Optional[str] = None
+        self._thread_id: Optional[int] = None
+        self._phase_stack: List[str] = []
+        self._cpu_profiles: Dict[str, cProfile.Profile] = {}
+        self._mem_stats: Dict[str, _PhaseStats] = {}
+        self._snapshot_interval = 300.0
+        self._stop_snapshots = threading.Event()
+        self._previous_snapshot: Optional[tracemalloc.Snapshot] = None
+
+    def is_running(self) -> bool:
+        return self._mode is not None
+
+    def start(self, mode: ProfileMode, output_dir: str, snapshot_interval: float = 300) -> None:
+        with self._lock:
+            if self._mode:
+                return
+
+            os.makedirs(output_dir, exist_ok=True)
+
+            self._mode = mode
+            self._output_dir = output_dir
+            self._started_at = datetime.now().strftime("%Y%m%d_%H%M%S")
+            self._thread_id = threading.get_ident()
+            self._phase_stack = [self.OTHER_PHASE]
+            self._cpu_profiles = {}
+            self._mem_stats = {}
+            self._snapshot_interval = snapshot_interval
+
+            if mode == ProfileMode.CPU:
+                self._get_cpu_profile(self.OTHER_PHASE).enable()
+            else:
+                tracemalloc.start(self.TRACEBACK_LIMIT)
+                self._previous_snapshot = tracemalloc.take_snapshot()
+                self._stop_snapshots.clear()
+                threading.Thread(target=self._take_snapshots_periodically, daemon=True).start()
+
+        logger.debug(f"Started {mode.value} profiling, reports will be written to: {output_dir}")
+
+    def stop(self) -> List[str]:
+        """Stops profiling and writes the reports. Returns the paths of the
+        written reports."""
+        with self._lock:
+            mode = self._mode
+
+            if not mode:
+                return []
+
+            self._mode = None
+
+            if mode == ProfileMode.CPU:
+                self._cpu_profiles[self._phase_stack[-1]].disable()
+                paths = self._write_cpu_reports()
+            else:
+                self._stop_snapshots.set()
+                paths = self._write_mem_reports()
+                tracemalloc.stop()
+
+        for path in paths:
+            logger.info(f"Profiling report written to: {path}")
+
+        return paths
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Counts everything within the block under the given phase."""
+        mode = self._mode
+
+        if mode == ProfileMode.CPU and threading.get_ident() == self._thread_id:
+            self._switch_cpu_phase(name)
+
+            try:
+                yield
+            finally:
+                self._switch_cpu_phase(None)
+        elif mode == ProfileMode.MEM:
+            started_at = time.monotonic()
+            size_before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+            try:
+                yield
+            finally:
+                if tracemalloc.is_tracing():
+                    size_after, peak = tracemalloc.get_traced_memory()
+                    self._add_mem_stats(name, time.monotonic() - started_at, size_after - size_before, peak)
+        else:
+            yield
+
+    def _switch_cpu_phase(self, name: Optional[str]) -> None:
+        """Switches to the profile of the given phase, or back to the
+        previous phase if None."""
+        with self._lock:
+            if self._mode != ProfileMode.CPU:
+                return
+
+            self._cpu_profiles[self._phase_stack[-1]].disable()
+
+            if name:
+                self._phase_stack.append(name)
+            elif len(self._phase_stack) > 1:
+                self._phase_stack.pop()
+
+            self._get_cpu_profile(self._phase_stack[-1]).enable()
+
+    def _get_cpu_profile(self, name: str) -> cProfile.Profile:
+        if name not in self._cpu_profiles:
+            self._cpu_profiles[name] = cProfile.Profile()
+
+        return self._cpu_profiles[name]
+
+    def _add_mem_stats(self, name: str, seconds: float, net_bytes: int, peak_bytes: int) -> None:
+        with self._lock:
+            stats = self._mem_stats.setdefault(name, _PhaseStats())
+            stats.runs += 1
+            stats.seconds += seconds
+            stats.net_bytes += net_bytes
+            stats.peak_bytes = max(stats.peak_bytes, peak_bytes)
+
+    def _take_snapshots_periodically(self) -> None:
+        while not self._stop_snapshots.wait(self._snapshot_interval):
+            with self._lock:
+                if self._mode != ProfileMode.MEM:
+                    return
+
+                self._write_snapshot_diff()
+
+    def _write_snapshot_diff(self) -> None:
+        snapshot = tracemalloc.take_snapshot()
+        previous_snapshot = self._previous_snapshot
+        self._previous_snapshot = snapshot
+
+        if previous_snapshot is None:
+            return
+
+        lines = [f"=== {datetime.now().isoformat(timespec='seconds')} (traced: {tracemalloc.get_traced_memory()[0]} bytes) ==="]
+        lines += [str(stat) for stat in snapshot.compare_to(previous_snapshot, "lineno")[:self.TOP_ENTRIES]]
+
+        with open(self._get_report_path("mem-diffs.txt"), "a", encoding="utf-8") as file:
+            file.write("\n".join(lines) + "\n\n")
+
+    def _write_cpu_reports(self) -> List[str]:
+        summary_path = self._get_report_path("cpu.txt")
+        paths = [summary_path]
+        sections = []
+        totals = []
+
+        for name, profile in self._cpu_profiles.items():
+            stats = pstats.Stats(profile)
+            total_tt = getattr(stats, "total_tt", 0.0)
+            totals.append(f"{name}: {total_tt:.3f} s")
+
+            profile_path = self._get_report_path(f"cpu-{name}.prof")
+            stats.dump_stats(profile_path)
+            paths.append(profile_path)
+
+            stream = io.StringIO()
+            pstats.Stats(profile, stream=stream).sort_stats("cumulative").print_stats(self.TOP_ENTRIES)
+            sections.append(f"=== Phase: {name} ===\n{stream.getvalue()}")
+
+        with open(summary_path, "w", encoding="utf-8") as file:
+            file.write("CPU time by phase:\n" + "\n".join(totals) + "\n\n" + "\n".join(sections))
+
+        return paths
+
+    def _write_mem_reports(self) -> List[str]:
+        summary_path = self._get_report_path("mem.txt")
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+
+        lines = [f"Traced memory: {current} bytes (peak: {peak} bytes)", "", "Memory by phase:"]
+        for name, stats in self._mem_stats.items():
+            lines.append(
+                f"{name}: {stats.runs} run(s), {stats.seconds:.3f} s, "
+                f"net allocated: {stats.net_bytes} bytes, peak: {stats.peak_bytes} bytes"
+            )
+
+        lines += ["", f"Top {self.TOP_ENTRIES} allocations:"]
+        lines += [str(stat) for stat in snapshot.statistics("lineno")[:self.TOP_ENTRIES]]
+
+        with open(summary_path, "w", encoding="utf-8") as file:
+            file.write("\n".join(lines) + "\n")
+
+        paths = [summary_path]
+        diffs_path = self._get_report_path("mem-diffs.txt")
+        if os.path.exists(diffs_path):
+            paths.append(diffs_path)
+
+        return paths
+
+    def _get_report_path(self, suffix: str) -> str:
+        assert self._output_dir is not None
+
+        return os.path.join(self._output_dir, f"{self._started_at}-{suffix}")
+
+
+profiler = Profiler()
@@ -0,0 +1,157 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    """
+    A single timed operation. Spans started while another span is active in
+    the same thread become its children, and share its trace ID.
+
+    Attributes:
+        name (str): Name of the operation.
+        kind (str): 'INTERNAL', or 'CLIENT' for outgoing requests.
+        trace_id (str): ID of the trace, shared by a span and its children.
+        span_id (str): ID of this span.
+        parent_span_id (str | None): ID of the parent span, if any.
+        attributes (dict): Details of the operation.
+        start_time (int): When the span started, in Unix nanoseconds.
+        end_time (int | None): When the span ended, in Unix nanoseconds.
+        error (str | None): The error that ended the span, if any.
+    """
+
+    def __init__(self, name: str, parent: Optional['Span'], kind: str, attributes: Dict[str, Any]) -> None:
+        self.name = name
+        self.kind = kind
+        self.trace_id: str = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id: str = secrets.token_hex(8)
+        self.parent_span_id = parent.span_id if parent else None
+        self.attributes = dict(attributes)
+        self.start_time = time.time_ns()
+        self.end_time: Optional[int] = None
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def end(self) -> None:
+        self.end_time = time.time_ns()
+
+    def to_dict(self) -> dict:
+        """Converts the span into the shape of a span in the OTLP JSON
+        encoding of OpenTelemetry."""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": f"SPAN_KIND_{self.kind}",
+            "startTimeUnixNano": str(self.start_time),
+            "endTimeUnixNano": str(self.end_time or self.start_time),
+            "attributes": [{"key": key, "value": _to_any_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": "STATUS_CODE_ERROR", "message": self.error} if self.error else {"code": "STATUS_CODE_OK"}
+        }
+
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+
+        return span
+
+
+def _to_any_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+
+    return {"stringValue": str(value)}
+
+
+class JSONLSpanExporter:
+    """Writes each ended span as a line of JSON to the given file."""
+
+    def __init__(self, path: str) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def export(self, spans: List[Span]) -> None:
+        lines = "".join(json.dumps(span.to_dict(), ensure_ascii=False) + "\n" for span in spans)
+
+        with self._lock:
+            self._file.write(lines)
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class Tracer:
+    """
+    Creates spans and hands them over to the exporter once they end. The
+    active span is tracked per thread (and per context), so spans started in
+    background threads begin their own trace.
+
+    Tracing is disabled until an exporter is set, in which case no spans are
+    created at all.
+    """
+
+    def __init__(self) -> None:
+        self._exporter: Optional[JSONLSpanExporter] = None
+        self._current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+    def is_enabled(self) -> bool:
+        return self._exporter is not None
+
+    def set_exporter(self, exporter: Optional[JSONLSpanExporter]) -> None:
+        if self._exporter:
+            self._exporter.close()
+
+        self._exporter = exporter
+
+    @contextmanager
+    def start_span(self, name: str, kind: str = "INTERNAL", **attributes: Any) -> Iterator[Optional[Span]]:
+        """
+        Starts a span as a child of the active span, and makes it the active
+        span until the block exits. If the block raises, the error is
+        recorded in the span. Yields None if tracing is disabled.
+        """
+        exporter = self._exporter
+
+        if not exporter:
+            yield None
+            return
+
+        span = Span(name, self._current_span.get(), kind, attributes)
+        token = self._current_span.set(span)
+
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            self._current_span.reset(token)
+            span.end()
+
+            try:
+                exporter.export([span])
+            except (OSError, ValueError) as e:
+                logger.warning(f"Error exporting span '{span.name}': {e}")
+
+
+tracer = Tracer()
@@ -0,0 +1,259 @@
+"""
+Offline benchmarks of the extractors, which run on every live status check.
+Run them with:
+
+    python -m tk3u8.testing.benchmarks [--corpus DIR] [--baseline PATH] [--save-baseline] [--ci]
+"""
+import argparse
+from dataclasses import asdict, dataclass
+from functools import partial
+import glob
+import json
+import os
+import platform
+import sys
+import timeit
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+import requests
+from rich.markup import escape
+from rich.table import Table
+from tk3u8.cli.console import console
+from tk3u8.constants import LiveStatus
+from tk3u8.core.extractor import APIExtractor, Extractor, WebpageExtractor
+from tk3u8.core.helper import is_user_exists
+from tk3u8.session.request_handler import RequestHandler
+from tk3u8.testing.payloads import build_api_payload, build_webpage_payload
+
+
+BENCHMARK_USERNAME = "benchmark_user"
+DEFAULT_BASELINE_PATH = os.path.join("benchmarks", "extractors.json")
+DEFAULT_TOLERANCE = 0.25
+
+# Extractor used for each kind of payload in the corpus, which is picked by
+# the prefix of the payload name, e.g., "api-live" or "webpage-offline"
+EXTRACTORS: Dict[str, type[Extractor]] = {
+    "api": APIExtractor,
+    "webpage": WebpageExtractor
+}
+CORPUS_FILE_EXTENSIONS = {
+    "api": ".json",
+    "webpage": ".html"
+}
+
+
+@dataclass
+class BenchmarkResult:
+    """
+    Attributes:
+        name (str): Name of the benchmark, e.g., 'get_stream_data[api-live]'.
+        ops_per_second (float): Calls per second, based on the fastest run.
+        seconds_per_op (float): Seconds per call, based on the fastest run.
+        peak_bytes_per_op (int): Peak memory allocated during a single call.
+    """
+    name: str
+    ops_per_second: float
+    seconds_per_op: float
+    peak_bytes_per_op: int
+
+
+class PayloadRequestHandler(RequestHandler):
+    """Serves the same payload for every request, so the extractors can be
+    benchmarked without sending any request."""
+
+    def __init__(self, payload: str) -> None:
+        self._response = requests.Response()
+        self._response.status_code = 200
+        self._response.encoding = "utf-8"
+        self._response._content = payload.encode("utf-8")
+
+    def get_data(self, url: str, source: Optional[str] = None) -> requests.Response:
+        return self._response
+
+
+def build_corpus() -> Dict[str, str]:
+    """Builds the payloads of a live, an offline and a nonexistent user for
+    each extractor, in realistic sizes."""
+    corpus = {}
+
+    for kind, build_payload in (("api", build_api_payload), ("webpage", build_webpage_payload)):
+        corpus[f"{kind}-live"] = build_payload(BENCHMARK_USERNAME, LiveStatus.LIVE, start_time=1700000000, expire=1700600000)
+        corpus[f"{kind}-offline"] = build_payload(BENCHMARK_USERNAME, LiveStatus.OFFLINE)
+        corpus[f"{kind}-not_found"] = build_payload(BENCHMARK_USERNAME, exists=False)
+
+    return corpus
+
+
+def load_corpus(directory: str) -> Dict[str, str]:
+    """
+    Loads the payloads saved in the given directory, e.g., responses
+    recorded from the source. Files have to be named after the extractor
+    they are for, like 'api-<name>.json' and 'webpage-<name>.html'.
+    """
+    corpus = {}
+
+    for kind, extension in CORPUS_FILE_EXTENSIONS.items():
+        for path in sorted(glob.glob(os.path.join(directory, f"{kind}-*{extension}"))):
+            with open(path, "r", encoding="utf-8") as file:
+                corpus[os.path.basename(path)[:-len(extension)]] = file.read()
+
+    return corpus
+
+
+def save_corpus(corpus: Dict[str, str], directory: str) -> None:
+    os.makedirs(directory, exist_ok=True)
+
+    for name, payload in corpus.items():
+        extension = CORPUS_FILE_EXTENSIONS[name.split("-", 1)[0]]
+
+        with open(os.path.join(directory, name + extension), "w", encoding="utf-8") as file:
+            file.write(payload)
+
+
+def get_cases(corpus: Dict[str, str]) -> Dict[str, Callable[[], object]]:
+    """
+    Gets the functions to benchmark for each payload. The source data is
+    parsed beforehand, so each function only measures its own step. The
+    stream data and stream links are only benchmarked for payloads of live
+    users, as the other payloads don't have them.
+    """
+    cases: Dict[str, Callable[[], object]] = {}
+
+    for name, payload in corpus.items():
+        extractor_class = EXTRACTORS[name.split("-", 1)[0]]
+        extractor = extractor_class(BENCHMARK_USERNAME, PayloadRequestHandler(payload))
+        source_data = extractor.get_source_data()
+
+        cases[f"get_source_data[{name}]"] = extractor.get_source_data
+        cases[f"is_user_exists[{name}]"] = partial(is_user_exists, extractor_class, source_data)
+
+        if not is_user_exists(extractor_class, source_data) or extractor.get_live_status(source_data) != LiveStatus.LIVE:
+            continue
+
+        stream_data = extractor.get_stream_data(source_data)
+        cases[f"get_stream_data[{name}]"] = partial(extractor.get_stream_data, source_data)
+        cases[f"get_stream_links[{name}]"] = partial(extractor.get_stream_links, stream_data)
+
+    return cases
+
+
+def run_benchmark(name: str, func: Callable[[], object], repeat: int = 5) -> BenchmarkResult:
+    """
+    Calls the function in batches large enough to take at least 0.2 seconds,
+    and keeps the fastest batch, which is the one least disturbed by other
+    processes. The peak memory of a single call is then measured separately,
+    as tracing allocations slows down the calls.
+    """
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    seconds_per_op = min(timer.repeat(repeat, number)) / number
+
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        size_before = tracemalloc.get_traced_memory()[0]
+        func()
+        peak_bytes = tracemalloc.get_traced_memory()[1] - size_before
+    finally:
+        tracemalloc.stop()
+
+    return BenchmarkResult(name, 1 / seconds_per_op, seconds_per_op, peak_bytes)
+
+
+def run_benchmarks(corpus: Dict[str, str], name_filter: Optional[str] = None, repeat: int = 5) -> List[BenchmarkResult]:
+    return [
+        run_benchmark(name, func, repeat)
+        for name, func in get_cases(corpus).items()
+        if not name_filter or name_filter in name
+    ]
+
+
+def load_baseline(path: str) -> Dict[str, BenchmarkResult]:
+    with open(path, "r", encoding="utf-8") as file:
+        data = json.load(file)
+
+    return {name: BenchmarkResult(**result) for name, result in data["results"].items()}
+
+
+def save_baseline(results: List[BenchmarkResult], path: str) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    data = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": {result.name: asdict(result) for result in results}
+    }
+
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(data, file, indent=4)
+
+
+def compare_results(results: List[BenchmarkResult], baseline: Dict[str, BenchmarkResult], tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """Returns the regressions, which are the benchmarks that got slower
+    or allocate more memory than the baseline by more than the tolerance.
+    Benchmarks missing from the baseline are skipped."""
+    regressions = []
+
+    for result in results:
+        expected = baseline.get(result.name)
+        if not expected:
+            continue
+
+        if result.seconds_per_op > expected.seconds_per_op * (1 + tolerance):
+            regressions.append(f"{result.name}: {_format_duration(result.seconds_per_op)} per call, baseline is {_format_duration(expected.seconds_per_op)}")
+        if result.peak_bytes_per_op > expected.peak_bytes_per_op * (1 + tolerance):
+            regressions.append(f"{result.name}: {result.peak_bytes_per_op} bytes peak per call, baseline is {expected.peak_bytes_per_op} bytes")
+
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks the extractors against a corpus of payloads")
+    parser.add_argument("--corpus", help="Directory of recorded payloads to use instead of the generated ones", default=None)
+    parser.add_argument("--write-corpus", help="Write the generated payloads to this directory and exit", default=None)
+    parser.add_argument("--baseline", help=f"Path of the baseline file. Default: {DEFAULT_BASELINE_PATH}", default=DEFAULT_BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Save the results as the new baseline instead of comparing them")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help=f"Allowed slowdown before failing, as a fraction. Default: {DEFAULT_TOLERANCE}")
+    parser.add_argument("--filter", help="Only run the benchmarks whose name contains this", dest="name_filter", default=None)
+    parser.add_argument("--repeat", type=int, default=5, help="Number of timed batches of each benchmark. Default: 5")
+    parser.add_argument("--ci", action="store_true", help="Fail if there is no baseline to compare the results with")
+    args = parser.parse_args(argv)
+
+    if args.write_corpus:
+        save_corpus(build_corpus(), args.write_corpus)
+        return 0
+
+    corpus = load_corpus(args.corpus) if args.corpus else build_corpus()
+    results = run_benchmarks(corpus, args.name_filter, args.repeat)
+
+    table = Table("Benchmark", "Calls/s", "Per call", "Peak memory")
+    for result in results:
+        table.add_row(escape(result.name), f"{result.ops_per_second:,.0f}", _format_duration(result.seconds_per_op), f"{result.peak_bytes_per_op / 1024:,.1f} KiB")
+    console.print(table)
+
+    if args.save_baseline:
+        save_baseline(results, args.baseline)
+        console.print(f"Saved baseline to: [b]{args.baseline}[/b]")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        console.print(f"No baseline found at [b]{args.baseline}[/b]. Use --save-baseline to save one.")
+        return 2 if args.ci else 0
+
+    regressions = compare_results(results, load_baseline(args.baseline), args.tolerance)
+    for regression in regressions:
+        console.print(f"[red]Regression[/red] {escape(regression)}")
+
+    return 1 if regressions else 0
+
+
+def _format_duration(seconds: float) -> str:
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds * 1e6:.1f} µs"
+
+
+if __name__ == "__main__":
+    sys.exit(main())
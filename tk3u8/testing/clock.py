@@ -0,0 +1,42 @@
+import threading
+import time
+from typing import Optional
+from tk3u8.core.scheduler import Clock
+
+
+class AcceleratedClock(Clock):
+    """
+    A clock that runs faster than real time by the given factor, starting
+    from the moment it was created. Sleeping and waiting on it are shortened
+    by the same factor, so code that waits and checks the time on it
+    behaves as if the time passes faster.
+
+    It can be passed wherever a clock is taken, e.g., to 'Tk3u8' or the
+    daemon. The clock only depends on its start and factor, so copies of it
+    in other processes (e.g., the stand-in server or the workers) tell the
+    same time.
+    """
+
+    def __init__(self, factor: float, started_at: Optional[float] = None, started_at_monotonic: Optional[float] = None) -> None:
+        self.factor = factor
+        self.started_at = started_at if started_at is not None else time.time()
+        self.started_at_monotonic = started_at_monotonic if started_at_monotonic is not None else time.monotonic()
+
+    def __call__(self) -> float:
+        return self.time()
+
+    def time(self) -> float:
+        return self.started_at + (time.time() - self.started_at) * self.factor
+
+    def monotonic(self) -> float:
+        return self.started_at_monotonic + (time.monotonic() - self.started_at_monotonic) * self.factor
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds / self.factor)
+
+    def wait(self, event: threading.Event, seconds: float) -> bool:
+        return event.wait(seconds / self.factor)
+
+    def get_elapsed(self) -> float:
+        """Gets the seconds that passed on this clock since it started."""
+        return self.time() - self.started_at
@@ -0,0 +1,411 @@
+"""
+Local stand-in for S3-compatible object storage, which keeps the uploaded
+objects in memory, so uploading recordings can be tested offline. Run it
+with:
+
+    python -m tk3u8.testing.fake_s3 --port 9000
+
+Then point the program to it through the 'upload_*' config keys:
+
+    [config]
+    upload_url = "http://127.0.0.1:9000/recordings"
+    upload_access_key = "tk3u8"
+    upload_secret_key = "tk3u8-secret"
+"""
+import argparse
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+import re
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+import uuid
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+from tk3u8.cli.console import console
+from tk3u8.session.s3 import DEFAULT_REGION, S3_NAMESPACE, sign_request
+
+
+logger = logging.getLogger(__name__)
+
+AUTHORIZATION_PATTERN = re.compile(
+    r"^AWS4-HMAC-SHA256 Credential=(?P<access_key>[^/]+)/(?P<scope>[^,]+), SignedHeaders=(?P<signed_headers>[^,]+), Signature=(?P<signature>[0-9a-f]+)$"
+)
+
+# The headers that 'sign_request' adds by itself
+_GENERATED_HEADERS = {"host", "x-amz-date", "x-amz-content-sha256"}
+
+
+@dataclass
+class FakeMultipartUpload:
+    """
+    A multipart upload in progress.
+
+    Attributes:
+        bucket (str): Bucket of the object.
+        key (str): Key of the object.
+        parts (Dict[int, Tuple[str, bytes]]): ETag and content of each
+            uploaded part, by part number.
+    """
+    bucket: str
+    key: str
+    parts: Dict[int, Tuple[str, bytes]] = field(default_factory=dict)
+
+
+class FakeS3Server(ThreadingHTTPServer):
+    """
+    Serves the parts of the S3 API used for uploading recordings: multipart
+    uploads, along with putting and getting whole objects. Buckets don't
+    have to be created first. Like S3, the signature of every request is
+    checked, and parts smaller than the minimum part size are rejected when
+    completing an upload, unless they're the last part.
+
+    Faults can be injected to check how the program copes with them: a
+    delay before each response, and a number of upcoming requests failing
+    with the given status code.
+
+    Args:
+        port (int): Port to listen on, or 0 to pick a free one.
+        host (str): Host to listen on.
+        access_key (str): Access key ID that requests must be signed with.
+        secret_key (str): Secret access key that requests must be signed
+            with.
+        region (str): Region that requests must be signed for.
+        min_part_size (int): Minimum size of each part but the last.
+        latency (float): Seconds to wait before each response.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+            self,
+            port: int = 0,
+            host: str = "127.0.0.1",
+            access_key: str = "tk3u8",
+            secret_key: str = "tk3u8-secret",
+            region: str = DEFAULT_REGION,
+            min_part_size: int = 5 * 1024 * 1024,
+            latency: float = 0.0
+    ) -> None:
+        super().__init__((host, port), _FakeS3RequestHandler)
+        self.base_url = f"http://{host}:{self.server_port}"
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.region = region
+        self.min_part_size = min_part_size
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._objects: Dict[Tuple[str, str], bytes] = {}
+        self._uploads: Dict[str, FakeMultipartUpload] = {}
+        self._failures: List[int] = []
+        self._stats: Dict[str, int] = {}
+
+    def start(self) -> None:
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        logger.debug(f"Fake S3 server listening on {self.base_url}")
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            logger.debug(f"Fake S3 server connection from {client_address} was closed by the client")
+            return
+
+        super().handle_error(request, client_address)
+
+    def fail_next(self, count: int, status: int = 503) -> None:
+        """Makes the next requests fail with the given status code, or stops
+        failing them if the count is 0."""
+        with self._lock:
+            self._failures = [status] * count
+
+    def get_object(self, bucket: str, key: str) -> Optional[bytes]:
+        with self._lock:
+            return self._objects.get((bucket, key))
+
+    def get_upload_parts(self, bucket: str, key: str) -> Dict[int, int]:
+        """Gets the size of each part uploaded so far to the uploads of the
+        object in progress, by part number."""
+        with self._lock:
+            return {
+                number: len(content)
+                for upload in self._uploads.values() if (upload.bucket, upload.key) == (bucket, key)
+                for number, (_, content) in upload.parts.items()
+            }
+
+    def get_stats(self) -> Dict[str, int]:
+        """Gets the number of requests served, by operation ('create',
+        'upload_part', 'list_parts', 'complete', 'abort', 'put' and 'get')
+        and by injected fault ('error')."""
+        with self._lock:
+            return dict(self._stats)
+
+    def build_response(self, method: str, path: str, headers: Dict[str, str], body: bytes) -> Tuple[int, Dict[str, str], bytes]:
+        """Builds the response to the given request, as the status code, the
+        headers and the body."""
+        with self._lock:
+            if self._failures:
+                status = self._failures.pop(0)
+                self._count("error")
+                return _build_error(status, "InternalError" if status >= 500 else "AccessDenied")
+
+        error = self._check_signature(method, path, headers, body)
+        if error:
+            return error
+
+        url = urlparse(path)
+        query = {name: values[0] for name, values in parse_qs(url.query, keep_blank_values=True).items()}
+        bucket, _, key = unquote(url.path).lstrip("/").partition("/")
+
+        if not bucket or not key:
+            return _build_error(400, "InvalidRequest")
+
+        if method == "POST" and "uploads" in query:
+            return self._create_upload(bucket, key)
+        if method == "PUT" and "uploadId" in query:
+            return self._upload_part(query["uploadId"], query.get("partNumber", ""), body)
+        if method == "POST" and "uploadId" in query:
+            return self._complete_upload(query["uploadId"], body)
+        if method == "GET" and "uploadId" in query:
+            return self._list_parts(query["uploadId"])
+        if method == "DELETE" and "uploadId" in query:
+            return self._abort_upload(query["uploadId"])
+        if method == "PUT":
+            return self._put_object(bucket, key, body)
+        if method == "GET":
+            return self._get_object(bucket, key)
+
+        return _build_error(405, "MethodNotAllowed")
+
+    def _check_signature(self, method: str, path: str, headers: Dict[str, str], body: bytes) -> Optional[Tuple[int, Dict[str, str], bytes]]:
+        match = AUTHORIZATION_PATTERN.match(headers.get("authorization", ""))
+
+        if not match or match["access_key"] != self.access_key:
+            return _build_error(403, "InvalidAccessKeyId")
+
+        payload_hash = headers.get("x-amz-content-sha256", "")
+        if payload_hash != hashlib.sha256(body).hexdigest():
+            return _build_error(400, "XAmzContentSHA256Mismatch")
+
+        try:
+            now = datetime.strptime(headers.get("x-amz-date", ""), "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+        except ValueError:
+            return _build_error(403, "AccessDenied")
+
+        signed_headers = {
+            name: headers.get(name, "")
+            for name in match["signed_headers"].split(";")
+            if name not in _GENERATED_HEADERS
+        }
+        expected = sign_request(
+            method,
+            f"http://{headers.get('host', '')}{path}",
+            signed_headers,
+            payload_hash,
+            self.access_key,
+            self.secret_key,
+            self.region,
+            now
+        )
+
+        if expected["authorization"] != headers["authorization"]:
+            return _build_error(403, "SignatureDoesNotMatch")
+
+        return None
+
+    def _create_upload(self, bucket: str, key: str) -> Tuple[int, Dict[str, str], bytes]:
+        upload_id = uuid.uuid4().hex
+
+        with self._lock:
+            self._count("create")
+            self._uploads[upload_id] = FakeMultipartUpload(bucket, key)
+
+        return _build_xml(
+            "InitiateMultipartUploadResult",
+            f"<Bucket>{escape(bucket)}</Bucket><Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId>"
+        )
+
+    def _upload_part(self, upload_id: str, part_number: str, body: bytes) -> Tuple[int, Dict[str, str], bytes]:
+        if not part_number.isdigit() or not 1 <= int(part_number) <= 10000:
+            return _build_error(400, "InvalidArgument")
+
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+
+        with self._lock:
+            self._count("upload_part")
+            upload = self._uploads.get(upload_id)
+
+            if upload is None:
+                return _build_error(404, "NoSuchUpload")
+
+            upload.parts[int(part_number)] = (etag, body)
+
+        return 200, {"ETag": etag}, b""
+
+    def _complete_upload(self, upload_id: str, body: bytes) -> Tuple[int, Dict[str, str], bytes]:
+        try:
+            root = ElementTree.fromstring(body)
+        except ElementTree.ParseError:
+            return _build_error(400, "MalformedXML")
+
+        requested_parts = [
+            (int(part.findtext(f"{{{S3_NAMESPACE}}}PartNumber") or 0), part.findtext(f"{{{S3_NAMESPACE}}}ETag") or "")
+            for part in root.iter(f"{{{S3_NAMESPACE}}}Part")
+        ]
+
+        with self._lock:
+            self._count("complete")
+            upload = self._uploads.get(upload_id)
+
+            if upload is None:
+                return _build_error(404, "NoSuchUpload")
+
+            if not requested_parts or [number for number, _ in requested_parts] != sorted({number for number, _ in requested_parts}):
+                return _build_error(400, "InvalidPartOrder")
+
+            contents = []
+
+            for index, (number, etag) in enumerate(requested_parts):
+                part = upload.parts.get(number)
+
+                if part is None or part[0] != etag:
+                    return _build_error(400, "InvalidPart")
+
+                if index < len(requested_parts) - 1 and len(part[1]) < self.min_part_size:
+                    return _build_error(400, "EntityTooSmall")
+
+                contents.append(part[1])
+
+            self._objects[(upload.bucket, upload.key)] = b"".join(contents)
+            del self._uploads[upload_id]
+
+        return _build_xml(
+            "CompleteMultipartUploadResult",
+            f"<Bucket>{escape(upload.bucket)}</Bucket><Key>{escape(upload.key)}</Key>"
+        )
+
+    def _list_parts(self, upload_id: str) -> Tuple[int, Dict[str, str], bytes]:
+        with self._lock:
+            self._count("list_parts")
+            upload = self._uploads.get(upload_id)
+
+            if upload is None:
+                return _build_error(404, "NoSuchUpload")
+
+            parts = "".join(
+                f"<Part><PartNumber>{number}</PartNumber><ETag>{escape(etag)}</ETag><Size>{len(content)}</Size></Part>"
+                for number, (etag, content) in sorted(upload.parts.items())
+            )
+
+        return _build_xml("ListPartsResult", f"<UploadId>{upload_id}</UploadId><IsTruncated>false</IsTruncated>{parts}")
+
+    def _abort_upload(self, upload_id: str) -> Tuple[int, Dict[str, str], bytes]:
+        with self._lock:
+            self._count("abort")
+
+            if self._uploads.pop(upload_id, None) is None:
+                return _build_error(404, "NoSuchUpload")
+
+        return 204, {}, b""
+
+    def _put_object(self, bucket: str, key: str, body: bytes) -> Tuple[int, Dict[str, str], bytes]:
+        with self._lock:
+            self._count("put")
+            self._objects[(bucket, key)] = body
+
+        return 200, {"ETag": f'"{hashlib.md5(body).hexdigest()}"'}, b""
+
+    def _get_object(self, bucket: str, key: str) -> Tuple[int, Dict[str, str], bytes]:
+        with self._lock:
+            self._count("get")
+            content = self._objects.get((bucket, key))
+
+        if content is None:
+            return _build_error(404, "NoSuchKey")
+
+        return 200, {"Content-Type": "application/octet-stream"}, content
+
+    def _count(self, key: str) -> None:
+        # Only called while holding the lock
+        self._stats[key] = self._stats.get(key, 0) + 1
+
+
+def _build_xml(root: str, content: str) -> Tuple[int, Dict[str, str], bytes]:
+    body = f'<?xml version="1.0" encoding="UTF-8"?>\n<{root} xmlns="{S3_NAMESPACE}">{content}</{root}>'
+    return 200, {"Content-Type": "application/xml"}, body.encode()
+
+
+def _build_error(status: int, code: str) -> Tuple[int, Dict[str, str], bytes]:
+    body = f'<?xml version="1.0" encoding="UTF-8"?>\n<Error><Code>{code}</Code><Message>{code}</Message></Error>'
+    return status, {"Content-Type": "application/xml"}, body.encode()
+
+
+class _FakeS3RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    timeout = 120
+
+    def do_GET(self) -> None:
+        self._handle()
+
+    def do_PUT(self) -> None:
+        self._handle()
+
+    def do_POST(self) -> None:
+        self._handle()
+
+    def do_DELETE(self) -> None:
+        self._handle()
+
+    def _handle(self) -> None:
+        server = self.server
+        assert isinstance(server, FakeS3Server)
+
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        headers = {name.lower(): value for name, value in self.headers.items()}
+        status, response_headers, response_body = server.build_response(self.command, self.path, headers, body)
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        self.send_response(status)
+
+        for name, value in response_headers.items():
+            self.send_header(name, value)
+
+        self.send_header("Content-Length", str(len(response_body)))
+        self.end_headers()
+        self.wfile.write(response_body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug(f"Fake S3 server request from {self.address_string()}: {format % args}")
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Serves a local stand-in for S3-compatible object storage")
+    parser.add_argument("--host", default="127.0.0.1", help="Host to listen on. Default: 127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000, help="Port to listen on. Default: 9000")
+    parser.add_argument("--access-key", default="tk3u8", help="Access key ID that requests must be signed with. Default: tk3u8")
+    parser.add_argument("--secret-key", default="tk3u8-secret", help="Secret access key that requests must be signed with. Default: tk3u8-secret")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before each response")
+    args = parser.parse_args(argv)
+
+    server = FakeS3Server(args.port, args.host, access_key=args.access_key, secret_key=args.secret_key, latency=args.latency)
+    console.print(f"Serving on [b]{server.base_url}[/b], set [b]upload_url[/b] to it followed by a bucket name in the config file. Press Ctrl+C to stop.")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,427 @@
+"""
+Local stand-in for TikTok, which serves the stream data of fake users and
+their live streams, so the program can be tested and benchmarked offline.
+Run it with:
+
+    python -m tk3u8.testing.fake_server --port 8080 --user alice=0:live --user bob=0:offline,30:live,600:offline
+
+Then point the program to it through the 'base_url' config key:
+
+    [config]
+    base_url = "http://127.0.0.1:8080"
+"""
+import argparse
+from dataclasses import dataclass, field
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import logging
+import random
+import re
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlencode, urlparse
+from tk3u8.cli.console import console
+from tk3u8.constants import LiveStatus
+from tk3u8.testing.payloads import (
+    SOURCE_QUALITIES,
+    WAF_PAGE,
+    build_api_payload,
+    build_webpage_payload,
+    get_room_id
+)
+
+
+logger = logging.getLogger(__name__)
+
+API_PATH = "/api-live/user/room"
+WEBPAGE_PATH_PATTERN = re.compile(r"^/@(?P<username>[^/]+)/live$")
+STREAM_PATH_PATTERN = re.compile(r"^/stage/stream-(?P<room_id>\d+)_(?P<codec>h26[45])_(?P<quality>[a-z_0-9]+)/(?P<file>index\.m3u8|\d+\.ts)$")
+
+# An MPEG-TS packet with the null PID, which players skip, so the segments
+# are valid MPEG-TS without having to encode any video
+TS_NULL_PACKET = b"\x47\x1f\xff\x10" + b"\xff" * 184
+
+
+@dataclass
+class FakeUser:
+    """
+    A user of the fake server. The schedule lists the times (in seconds
+    since the user was added) when the live status of the user changes, and
+    the user is offline before the first change. If a period is set, the
+    schedule repeats itself every period.
+
+    Attributes:
+        username (str): The username of the user.
+        schedule (List[Tuple[float, LiveStatus]]): The changes of the live
+            status, sorted by time.
+        period (float | None): Seconds after which the schedule repeats.
+        exists (bool): Whether the user exists at all.
+        added_at (float): When the user was added, by the clock of the server.
+    """
+    username: str
+    schedule: List[Tuple[float, LiveStatus]] = field(default_factory=list)
+    period: Optional[float] = None
+    exists: bool = True
+    added_at: float = 0.0
+
+    def get_state(self, now: float) -> Tuple[LiveStatus, float]:
+        """Gets the live status at the given time, and since when the user
+        has had that status."""
+        elapsed = now - self.added_at
+        offset = 0.0
+
+        if self.period:
+            offset = elapsed // self.period * self.period
+            elapsed -= offset
+
+        status, since = LiveStatus.OFFLINE, 0.0
+        for changed_at, changed_status in self.schedule:
+            if changed_at > elapsed:
+                break
+            status, since = changed_status, changed_at
+
+        return status, self.added_at + offset + since
+
+
+class FakeTikTokServer(ThreadingHTTPServer):
+    """
+    Serves the 'api-live/user/room' API, the '/@user/live' page and the HLS
+    playlists and segments of the live streams of its users.
+
+    The stream links point back to this server. While a user is live, the
+    playlist has a sliding window of the latest segments, starting from the
+    moment the user went live. Once the user goes offline, the playlist and
+    segments return 404, like the source does.
+
+    Faults can be injected to check how the program copes with them: a
+    delay before each response, a random share of responses failing with
+    503, a random share of connections being dropped without a response, a
+    random share of pages being WAF challenges, and stream links that expire
+    after some time and then return 403.
+
+    Args:
+        port (int): Port to listen on, or 0 to pick a free one.
+        host (str): Host to listen on.
+        latency (float): Seconds to wait before each response.
+        error_rate (float): Share of responses that fail with 503.
+        drop_rate (float): Share of requests whose connection is dropped.
+        waf_rate (float): Share of pages that are WAF challenges.
+        link_ttl (float | None): Seconds before a stream link expires.
+        segment_duration (float): Duration of each segment, in seconds.
+        playlist_size (int): Number of segments in the playlist window.
+        bitrate_scale (float): Scales the size of the segments, which are
+            as large as the bitrate of the quality would make them.
+        clock (Callable[[], float]): Gives the current Unix time, which can
+            be replaced to speed up time.
+        seed (int | None): Seed for picking the responses to fail.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+            self,
+            port: int = 0,
+            host: str = "127.0.0.1",
+            latency: float = 0.0,
+            error_rate: float = 0.0,
+            drop_rate: float = 0.0,
+            waf_rate: float = 0.0,
+            link_ttl: Optional[float] = None,
+            segment_duration: float = 2.0,
+            playlist_size: int = 5,
+            bitrate_scale: float = 1.0,
+            clock: Callable[[], float] = time.time,
+            seed: Optional[int] = None
+    ) -> None:
+        super().__init__((host, port), _FakeTikTokRequestHandler)
+        self.base_url = f"http://{host}:{self.server_port}"
+        self.latency = latency
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.waf_rate = waf_rate
+        self.link_ttl = link_ttl
+        self.segment_duration = segment_duration
+        self.playlist_size = playlist_size
+        self.bitrate_scale = bitrate_scale
+        self.clock = clock
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._users: Dict[str, FakeUser] = {}
+        self._room_ids: Dict[str, str] = {}
+        self._stats: Dict[str, int] = {}
+
+    def start(self) -> None:
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        logger.debug(f"Fake TikTok server listening on {self.base_url}")
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request: Any, client_address: Any) -> None:
+        # Clients closing their connections, e.g., when they re-initialize
+        # their session, are expected and not worth a traceback
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            logger.debug(f"Fake TikTok server connection from {client_address} was closed by the client")
+            return
+
+        super().handle_error(request, client_address)
+
+    def add_user(
+            self,
+            username: str,
+            schedule: Optional[List[Tuple[float, LiveStatus]]] = None,
+            period: Optional[float] = None,
+            exists: bool = True,
+            added_at: Optional[float] = None
+    ) -> FakeUser:
+        """Adds a user, whose schedule starts at the given time, or right
+        away if not given."""
+        added_at = added_at if added_at is not None else self.clock()
+        user = FakeUser(username, sorted(schedule or [], key=lambda change: change[0]), period, exists, added_at)
+
+        with self._lock:
+            self._users[username] = user
+            self._room_ids[get_room_id(username)] = username
+
+        return user
+
+    def set_live_status(self, username: str, live_status: LiveStatus) -> None:
+        """Changes the live status of the user right away, replacing its
+        schedule."""
+        self.add_user(username, [(0, live_status)])
+
+    def get_stats(self) -> Dict[str, int]:
+        """Gets the number of responses served, by kind ('api', 'webpage',
+        'playlist' and 'segment') and by injected fault ('error', 'dropped',
+        'waf' and 'expired')."""
+        with self._lock:
+            return dict(self._stats)
+
+    def build_response(self, path: str, query: Dict[str, str]) -> Tuple[int, str, bytes]:
+        """Builds the response to the given request, as the status code, the
+        content type and the body."""
+        if path == API_PATH:
+            return self._serve_room("api", query.get("uniqueId", ""))
+
+        match = WEBPAGE_PATH_PATTERN.match(path)
+        if match:
+            return self._serve_room("webpage", match["username"])
+
+        match = STREAM_PATH_PATTERN.match(path)
+        if match:
+            return self._serve_stream(match["room_id"], match["codec"], match["quality"], match["file"], query)
+
+        return 404, "text/plain", b"Not Found"
+
+    def should_drop(self) -> bool:
+        if self._should_inject(self.drop_rate):
+            self._count("dropped")
+            return True
+
+        return False
+
+    def _serve_room(self, kind: str, username: str) -> Tuple[int, str, bytes]:
+        self._count(kind)
+
+        if self._should_inject(self.error_rate):
+            self._count("error")
+            return 503, "text/plain", b"Service Unavailable"
+
+        if kind == "webpage" and self._should_inject(self.waf_rate):
+            self._count("waf")
+            return 200, "text/html", WAF_PAGE.encode()
+
+        user = self._users.get(username)
+        now = self.clock()
+        live_status, since = user.get_state(now) if user else (LiveStatus.OFFLINE, now)
+        build_payload = build_api_payload if kind == "api" else build_webpage_payload
+        payload = build_payload(
+            username,
+            live_status,
+            start_time=int(since) if live_status == LiveStatus.LIVE else None,
+            cdn_url=self.base_url,
+            expire=int(now + self.link_ttl) if self.link_ttl else None,
+            exists=bool(user and user.exists)
+        )
+
+        return 200, "application/json" if kind == "api" else "text/html", payload.encode()
+
+    def _serve_stream(self, room_id: str, codec: str, quality: str, file: str, query: Dict[str, str]) -> Tuple[int, str, bytes]:
+        is_playlist = file == "index.m3u8"
+        self._count("playlist" if is_playlist else "segment")
+
+        username = self._room_ids.get(room_id)
+        user = self._users.get(username) if username else None
+        now = self.clock()
+
+        if not user or quality not in SOURCE_QUALITIES:
+            return 404, "text/plain", b"Not Found"
+
+        if self.link_ttl and float(query.get("expire", 0)) < now:
+            self._count("expired")
+            return 403, "text/plain", b"Forbidden"
+
+        if self._should_inject(self.error_rate):
+            self._count("error")
+            return 503, "text/plain", b"Service Unavailable"
+
+        live_status, since = user.get_state(now)
+        if live_status != LiveStatus.LIVE:
+            return 404, "text/plain", b"Not Found"
+
+        latest_sequence = int((now - since) // self.segment_duration)
+
+        if is_playlist:
+            return 200, "application/vnd.apple.mpegurl", self._build_playlist(latest_sequence, query).encode()
+
+        sequence = int(file.split(".", 1)[0])
+        if not latest_sequence - self.playlist_size < sequence <= latest_sequence:
+            return 404, "text/plain", b"Not Found"
+
+        return 200, "video/mp2t", _build_segment(self._get_segment_size(quality))
+
+    def _build_playlist(self, latest_sequence: int, query: Dict[str, str]) -> str:
+        first_sequence = max(latest_sequence - self.playlist_size + 1, 0)
+        query_string = urlencode(query)
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:3",
+            f"#EXT-X-TARGETDURATION:{int(self.segment_duration + 0.999)}",
+            f"#EXT-X-MEDIA-SEQUENCE:{first_sequence}"
+        ]
+
+        for sequence in range(first_sequence, latest_sequence + 1):
+            lines.append(f"#EXTINF:{self.segment_duration:.3f},")
+            lines.append(f"{sequence}.ts?{query_string}" if query_string else f"{sequence}.ts")
+
+        return "\n".join(lines) + "\n"
+
+    def _get_segment_size(self, quality: str) -> int:
+        bitrate = SOURCE_QUALITIES[quality][1]
+        return int(bitrate * self.segment_duration / 8 * self.bitrate_scale)
+
+    def _should_inject(self, rate: float) -> bool:
+        if not rate:
+            return False
+
+        with self._lock:
+            return self._random.random() < rate
+
+    def _count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] = self._stats.get(key, 0) + 1
+
+
+@lru_cache(maxsize=16)
+def _build_segment(size: int) -> bytes:
+    """Builds a segment of about the given size out of null packets."""
+    return TS_NULL_PACKET * max(size // len(TS_NULL_PACKET), 1)
+
+
+class _FakeTikTokRequestHandler(BaseHTTPRequestHandler):
+    # Keeps the connections open between requests, like the source does,
+    # until they stay idle for this many seconds
+    protocol_version = "HTTP/1.1"
+    timeout = 120
+
+    def do_GET(self) -> None:
+        server = self.server
+        assert isinstance(server, FakeTikTokServer)
+
+        if server.should_drop():
+            self.close_connection = True
+            return
+
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        status, content_type, body = server.build_response(url.path, query)
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.debug(f"Fake TikTok server request from {self.address_string()}: {format % args}")
+
+
+def parse_schedule(text: str) -> List[Tuple[float, LiveStatus]]:
+    """
+    Parses a schedule written as comma-separated '<seconds>:<status>'
+    changes, where the status is 'live', 'offline' or 'preparing', e.g.,
+    '0:offline,30:live,600:offline'.
+    """
+    statuses = {
+        "live": LiveStatus.LIVE,
+        "offline": LiveStatus.OFFLINE,
+        "preparing": LiveStatus.PREPARING_TO_GO_LIVE
+    }
+    schedule = []
+
+    for change in text.split(","):
+        seconds, _, status = change.strip().partition(":")
+
+        if status not in statuses:
+            raise ValueError(f"Invalid status '{status}' in schedule, must be one of: {', '.join(statuses)}")
+
+        schedule.append((float(seconds), statuses[status]))
+
+    return schedule
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Serves a local stand-in for TikTok with fake users")
+    parser.add_argument("--host", default="127.0.0.1", help="Host to listen on. Default: 127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on. Default: 8080")
+    parser.add_argument(
+        "--user",
+        action="append",
+        default=[],
+        dest="users",
+        help="A user, with an optional schedule, e.g., 'alice' (always live) or 'bob=0:offline,30:live,600:offline'"
+    )
+    parser.add_argument("--period", type=float, default=None, help="Repeat the schedules every this many seconds")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before each response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of responses that fail with 503")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="Share of requests whose connection is dropped without a response")
+    parser.add_argument("--waf-rate", type=float, default=0.0, help="Share of pages that are WAF challenges")
+    parser.add_argument("--link-ttl", type=float, default=None, help="Seconds before a stream link expires")
+    parser.add_argument("--segment-duration", type=float, default=2.0, help="Duration of each segment, in seconds. Default: 2")
+    parser.add_argument("--bitrate-scale", type=float, default=1.0, help="Scales the size of the segments. Default: 1")
+    args = parser.parse_args(argv)
+
+    server = FakeTikTokServer(
+        args.port,
+        args.host,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        drop_rate=args.drop_rate,
+        waf_rate=args.waf_rate,
+        link_ttl=args.link_ttl,
+        segment_duration=args.segment_duration,
+        bitrate_scale=args.bitrate_scale
+    )
+
+    for user in args.users:
+        username, _, schedule = user.partition("=")
+        server.add_user(username, parse_schedule(schedule) if schedule else [(0, LiveStatus.LIVE)], args.period)
+
+    console.print(f"Serving on [b]{server.base_url}[/b], set [b]base_url[/b] to it in the config file. Press Ctrl+C to stop.")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
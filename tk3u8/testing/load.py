@@ -0,0 +1,447 @@
+"""
+Load harness that watches many synthetic users served by the local stand-in
+server, the same way the program polls and records them, and reports how
+well it keeps up. Run it with:
+
+    python -m tk3u8.testing.load --users 1000 --interval 30 --duration 300
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+import heapq
+import json
+import logging
+import math
+import multiprocessing
+from multiprocessing.connection import Connection
+import os
+import random
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from rich.table import Table
+from tk3u8.cli.console import console
+from tk3u8.constants import LiveStatus
+from tk3u8.core.recorder import HLSRecorder
+from tk3u8.core.stream_metadata_handler import StreamMetadataHandler
+from tk3u8.options_handler import OptionsHandler
+from tk3u8.paths_handler import PathsHandler
+from tk3u8.session.request_handler import RequestHandler
+from tk3u8.testing.fake_server import FakeTikTokServer
+from tk3u8.testing.process_stats import ProcessStats, get_process_stats, raise_open_files_limit
+
+
+logger = logging.getLogger(__name__)
+
+Schedule = List[Tuple[float, LiveStatus]]
+
+
+@dataclass
+class LoadReport:
+    """
+    Results of a load run. The resource usage is of the process running the
+    harness only, as the stand-in server runs in its own process.
+
+    Attributes:
+        users (int): Number of watched users.
+        duration (float): Seconds the users were polled for.
+        polls (int): Live status checks done.
+        poll_errors (int): Live status checks that failed.
+        polls_per_second (float): Live status checks done per second.
+        expected_polls_per_second (float): Checks per second needed for
+            checking every user once per interval.
+        detections (int): Times a user was seen going live.
+        detection_lag (Dict[str, float]): Percentiles (p50, p90, p99 and max)
+            of the seconds from a user going live until it was seen live.
+        recordings (int): Recordings started.
+        cpu_percent (float): CPU used, where 100 is a whole core.
+        cpu_ms_per_user_per_minute (float): CPU time used for each user per
+            minute, in milliseconds.
+        rss_bytes (int | None): Resident memory at the end of the run.
+        rss_bytes_per_user (float | None): Resident memory added by each user.
+        peak_fds (int | None): Most file descriptors open at once.
+        peak_sockets (int | None): Most sockets open at once.
+        peak_threads (int): Most threads running at once.
+    """
+    users: int
+    duration: float
+    polls: int
+    poll_errors: int
+    polls_per_second: float
+    expected_polls_per_second: float
+    detections: int
+    detection_lag: Dict[str, float]
+    recordings: int
+    cpu_percent: float
+    cpu_ms_per_user_per_minute: float
+    rss_bytes: Optional[int]
+    rss_bytes_per_user: Optional[float]
+    peak_fds: Optional[int]
+    peak_sockets: Optional[int]
+    peak_threads: int
+
+
+@dataclass
+class _WatchedUser:
+    username: str
+    go_live_times: List[float]
+    request_handler: RequestHandler
+    stream_metadata_handler: StreamMetadataHandler
+    was_live: bool = False
+    detected: List[float] = field(default_factory=list)
+
+
+class LoadHarness:
+    """
+    Watches the given number of synthetic users served by a stand-in server,
+    which runs in a separate process so its work isn't counted.
+
+    Like the program, each user has its own request handler and stream
+    metadata handler, and is checked again an interval after its previous
+    check finished. The checks are run by a pool of worker threads, and the
+    first checks are spread over the first interval.
+
+    Some of the users go live once at a random time during the run and stay
+    live for a while. The detection lag is measured from the moment they go
+    live until a check sees it. If recording is turned on, users seen live
+    are recorded with the native engine until they go offline, and are only
+    checked again after that.
+
+    Args:
+        users (int): Number of users to watch.
+        interval (float): Seconds between the checks of each user.
+        duration (float): Seconds to watch the users for.
+        workers (int): Number of worker threads running the checks.
+        live_share (float): Share of users that go live during the run.
+        live_duration (float): Seconds the users stay live.
+        record (bool): Whether to record the users that go live.
+        quality (str): Quality to record.
+        latency (float): Seconds the server waits before each response.
+        error_rate (float): Share of server responses that fail.
+        bitrate_scale (float): Scales the size of the segments.
+        seed (int): Seed for the schedules of the users.
+    """
+
+    def __init__(
+            self,
+            users: int,
+            interval: float = 30,
+            duration: float = 120,
+            workers: int = 64,
+            live_share: float = 0.1,
+            live_duration: float = 60,
+            record: bool = False,
+            quality: str = "sd",
+            latency: float = 0.0,
+            error_rate: float = 0.0,
+            bitrate_scale: float = 0.01,
+            seed: int = 0
+    ) -> None:
+        self._user_count = users
+        self._interval = interval
+        self._duration = duration
+        self._workers = workers
+        self._live_share = live_share
+        self._live_duration = live_duration
+        self._record = record
+        self._quality = quality
+        self._server_options: Dict[str, Any] = {"latency": latency, "error_rate": error_rate, "bitrate_scale": bitrate_scale}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._due: List[Tuple[float, int]] = []
+        self._wakeup = threading.Condition(self._lock)
+        self._users: List[_WatchedUser] = []
+        self._polls = 0
+        self._poll_errors = 0
+        self._recordings = 0
+        self._peak_stats: Optional[ProcessStats] = None
+        self._stop_sampling = threading.Event()
+
+    def run(self) -> LoadReport:
+        raise_open_files_limit()
+        schedules = self._build_schedules()
+
+        with tempfile.TemporaryDirectory(prefix="tk3u8-load-") as temp_dir:
+            paths_handler = PathsHandler(program_data_dir=temp_dir, downloads_dir=temp_dir)
+            options_handler = OptionsHandler(paths_handler)
+            stats_before = get_process_stats()
+
+            for username in schedules:
+                request_handler = RequestHandler(options_handler)
+                self._users.append(_WatchedUser(username, [], request_handler, StreamMetadataHandler(request_handler, options_handler)))
+
+            # The schedules start on a whole second, so the start time of
+            # the streams, which is in whole seconds, is exact
+            epoch = float(math.ceil(time.time()) + 2)
+            parent_conn, child_conn = multiprocessing.Pipe()
+            server_process = multiprocessing.Process(target=_serve, args=(child_conn, schedules, epoch, self._server_options), daemon=True)
+            server_process.start()
+
+            try:
+                options_handler.save_args_values(base_url=parent_conn.recv())
+
+                for user in self._users:
+                    user.go_live_times = [epoch + changed_at for changed_at, status in schedules[user.username] if status == LiveStatus.LIVE]
+
+                return self._run(epoch, temp_dir, stats_before)
+            finally:
+                parent_conn.close()
+                server_process.terminate()
+                server_process.join()
+
+    def _run(self, epoch: float, temp_dir: str, stats_before: ProcessStats) -> LoadReport:
+        self._due = [(epoch + self._random.uniform(0, self._interval), index) for index in range(len(self._users))]
+        heapq.heapify(self._due)
+
+        sampler = threading.Thread(target=self._sample_stats, daemon=True)
+        sampler.start()
+
+        while time.time() < epoch:
+            time.sleep(0.01)
+
+        started_at = time.time()
+        cpu_started_at = time.process_time()
+        ends_at = epoch + self._duration
+
+        with ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="tk3u8-load") as executor:
+            while True:
+                with self._wakeup:
+                    now = time.time()
+
+                    if now >= ends_at:
+                        break
+
+                    if not self._due or self._due[0][0] > now:
+                        next_due = self._due[0][0] if self._due else ends_at
+                        self._wakeup.wait(min(next_due, ends_at) - now)
+                        continue
+
+                    _, index = heapq.heappop(self._due)
+
+                executor.submit(self._poll, index, temp_dir)
+
+            with self._wakeup:
+                self._due.clear()
+
+        elapsed = time.time() - started_at
+        cpu_seconds = time.process_time() - cpu_started_at
+        self._stop_sampling.set()
+        sampler.join()
+
+        return self._build_report(elapsed, cpu_seconds, stats_before, get_process_stats())
+
+    def _poll(self, index: int, temp_dir: str) -> None:
+        user = self._users[index]
+        is_live = False
+
+        try:
+            user.stream_metadata_handler.refresh_data(user.username)
+            is_live = user.stream_metadata_handler.get_live_status() == LiveStatus.LIVE
+        except (Exception, SystemExit) as e:
+            logger.debug(f"Checking @{user.username} failed: {type(e).__name__}: {e}")
+
+            with self._lock:
+                self._poll_errors += 1
+
+        now = time.time()
+
+        with self._lock:
+            self._polls += 1
+
+        if is_live and not user.was_live:
+            user.detected.append(now)
+
+            if self._record:
+                threading.Thread(target=self._record_and_reschedule, args=(index, temp_dir), daemon=True).start()
+                user.was_live = True
+                return
+
+        user.was_live = is_live
+        self._schedule(index, now + self._interval)
+
+    def _record_and_reschedule(self, index: int, temp_dir: str) -> None:
+        user = self._users[index]
+
+        with self._lock:
+            self._recordings += 1
+
+        try:
+            stream_link = user.stream_metadata_handler.get_stream_link(self._quality, use_h265=False)
+            recorder = HLSRecorder(
+                user.request_handler.create_stream_session(),
+                os.path.join(temp_dir, f"{user.username}.ts"),
+                stream_link,
+                username=user.username
+            )
+            recorder.record()
+        except (Exception, SystemExit) as e:
+            logger.debug(f"Recording @{user.username} failed: {type(e).__name__}: {e}")
+
+        self._schedule(index, time.time() + self._interval)
+
+    def _schedule(self, index: int, due: float) -> None:
+        with self._wakeup:
+            heapq.heappush(self._due, (due, index))
+            self._wakeup.notify()
+
+    def _build_schedules(self) -> Dict[str, Schedule]:
+        """Picks the users that go live, and when they do. The rest of the
+        users stay offline."""
+        schedules = {}
+        digits = len(str(self._user_count))
+
+        for index in range(self._user_count):
+            schedule: Schedule = []
+
+            if self._random.random() < self._live_share:
+                went_live_at = float(int(self._random.uniform(0, max(self._duration - self._interval, 1))))
+                schedule = [(went_live_at, LiveStatus.LIVE), (went_live_at + self._live_duration, LiveStatus.OFFLINE)]
+
+            schedules[f"user_{index:0{digits}d}"] = schedule
+
+        return schedules
+
+    def _sample_stats(self) -> None:
+        while not self._stop_sampling.wait(1):
+            stats = get_process_stats()
+
+            if not self._peak_stats:
+                self._peak_stats = stats
+                continue
+
+            self._peak_stats = ProcessStats(
+                cpu_seconds=stats.cpu_seconds,
+                rss_bytes=_max_or_none(self._peak_stats.rss_bytes, stats.rss_bytes),
+                fds=_max_or_none(self._peak_stats.fds, stats.fds),
+                sockets=_max_or_none(self._peak_stats.sockets, stats.sockets),
+                threads=max(self._peak_stats.threads, stats.threads)
+            )
+
+    def _build_report(self, elapsed: float, cpu_seconds: float, stats_before: ProcessStats, stats_after: ProcessStats) -> LoadReport:
+        lags = sorted(
+            detected_at - went_live_at
+            for user in self._users
+            for went_live_at, detected_at in zip(user.go_live_times, user.detected)
+        )
+        peak_stats = self._peak_stats or stats_after
+        rss_bytes_per_user = None
+
+        if stats_before.rss_bytes is not None and stats_after.rss_bytes is not None:
+            rss_bytes_per_user = (stats_after.rss_bytes - stats_before.rss_bytes) / self._user_count
+
+        return LoadReport(
+            users=self._user_count,
+            duration=elapsed,
+            polls=self._polls,
+            poll_errors=self._poll_errors,
+            polls_per_second=self._polls / elapsed,
+            expected_polls_per_second=self._user_count / self._interval,
+            detections=len(lags),
+            detection_lag={
+                "p50": _get_percentile(lags, 50),
+                "p90": _get_percentile(lags, 90),
+                "p99": _get_percentile(lags, 99),
+                "max": lags[-1] if lags else 0.0
+            },
+            recordings=self._recordings,
+            cpu_percent=cpu_seconds / elapsed * 100,
+            cpu_ms_per_user_per_minute=cpu_seconds * 1000 / self._user_count / (elapsed / 60),
+            rss_bytes=stats_after.rss_bytes,
+            rss_bytes_per_user=rss_bytes_per_user,
+            peak_fds=_max_or_none(peak_stats.fds, stats_after.fds),
+            peak_sockets=_max_or_none(peak_stats.sockets, stats_after.sockets),
+            peak_threads=max(peak_stats.threads, stats_after.threads)
+        )
+
+
+def print_report(report: LoadReport) -> None:
+    table = Table("Metric", "Value")
+    table.add_row("Users", f"{report.users:,}")
+    table.add_row("Polls/s", f"{report.polls_per_second:,.1f} (needed: {report.expected_polls_per_second:,.1f})")
+    table.add_row("Poll errors", f"{report.poll_errors:,} of {report.polls:,}")
+    table.add_row(
+        "Detection lag",
+        f"p50 {report.detection_lag['p50']:.2f} s, p90 {report.detection_lag['p90']:.2f} s, "
+        f"p99 {report.detection_lag['p99']:.2f} s, max {report.detection_lag['max']:.2f} s ({report.detections} detections)"
+    )
+    table.add_row("Recordings", f"{report.recordings:,}")
+    table.add_row("CPU", f"{report.cpu_percent:.1f}% ({report.cpu_ms_per_user_per_minute:.2f} ms per user per minute)")
+
+    if report.rss_bytes is not None and report.rss_bytes_per_user is not None:
+        table.add_row("RSS", f"{report.rss_bytes / 2 ** 20:,.1f} MiB ({report.rss_bytes_per_user / 1024:,.1f} KiB per user)")
+
+    table.add_row("Peak fds / sockets", f"{report.peak_fds} / {report.peak_sockets}")
+    table.add_row("Peak threads", f"{report.peak_threads:,}")
+    console.print(table)
+
+
+def _serve(conn: Connection, schedules: Dict[str, Schedule], epoch: float, options: Dict[str, Any]) -> None:
+    """Runs the stand-in server in its own process, and sends its URL back
+    through the connection."""
+    raise_open_files_limit()
+    server = FakeTikTokServer(**options)
+
+    for username, schedule in schedules.items():
+        server.add_user(username, schedule, added_at=epoch)
+
+    conn.send(server.base_url)
+    server.serve_forever()
+
+
+def _get_percentile(values: List[float], percentile: float) -> float:
+    """Gets the percentile of the sorted values with the nearest-rank
+    method, or 0 if there are no values."""
+    if not values:
+        return 0.0
+
+    rank = math.ceil(percentile / 100 * len(values))
+    return values[max(rank, 1) - 1]
+
+
+def _max_or_none(a: Optional[int], b: Optional[int]) -> Optional[int]:
+    if a is None or b is None:
+        return a if b is None else b
+    return max(a, b)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Watches many synthetic users served by a local stand-in server, and reports how well it keeps up")
+    parser.add_argument("--users", type=int, default=100, help="Number of users to watch. Default: 100")
+    parser.add_argument("--interval", type=float, default=30, help="Seconds between the checks of each user. Default: 30")
+    parser.add_argument("--duration", type=float, default=120, help="Seconds to watch the users for. Default: 120")
+    parser.add_argument("--workers", type=int, default=64, help="Number of threads running the checks. Default: 64")
+    parser.add_argument("--live-share", type=float, default=0.1, help="Share of users that go live during the run. Default: 0.1")
+    parser.add_argument("--live-duration", type=float, default=60, help="Seconds the users stay live. Default: 60")
+    parser.add_argument("--record", action="store_true", help="Record the users that go live with the native engine")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the server waits before each response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of server responses that fail with 503")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the schedules of the users")
+    parser.add_argument("--report", help="Also write the report to this JSON file", default=None)
+    args = parser.parse_args(argv)
+
+    harness = LoadHarness(
+        args.users,
+        interval=args.interval,
+        duration=args.duration,
+        workers=args.workers,
+        live_share=args.live_share,
+        live_duration=args.live_duration,
+        record=args.record,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        seed=args.seed
+    )
+
+    with console.status(f"Watching {args.users:,} users for {args.duration:.0f} seconds..."):
+        report = harness.run()
+
+    print_report(report)
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as file:
+            json.dump(asdict(report), file, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+from functools import lru_cache
+import json
+import random
+import string
+import time
+from typing import Optional
+from tk3u8.constants import LiveStatus
+
+
+# Status codes used by the source for each live status
+LIVE_STATUS_CODES = {
+    LiveStatus.PREPARING_TO_GO_LIVE: 1,
+    LiveStatus.LIVE: 2,
+    LiveStatus.OFFLINE: 4
+}
+
+# Qualities offered by the source, with their resolution and bitrate
+SOURCE_QUALITIES = {
+    "origin": ("1080x1920", 4000000),
+    "uhd_60": ("1080x1920", 3500000),
+    "uhd": ("1080x1920", 3000000),
+    "hd_60": ("720x1280", 2200000),
+    "hd": ("720x1280", 1800000),
+    "ld": ("540x960", 1200000),
+    "sd": ("360x640", 800000)
+}
+
+DEFAULT_CDN_URL = "https://pull-hls-f16-va01.tiktokcdn.com"
+WAF_PAGE = "<!DOCTYPE html><html><head><title>Please wait...</title></head><body><p>Please wait...</p></body></html>"
+
+# Approximate sizes of the payloads served by the source, so parsing them
+# costs about the same as parsing the real ones
+API_PAYLOAD_SIZE = 30_000
+WEBPAGE_PAYLOAD_SIZE = 350_000
+
+
+def build_stream_links(username: str, cdn_url: str = DEFAULT_CDN_URL, expire: Optional[int] = None) -> dict[str, dict[str, str]]:
+    """
+    Builds the signed HLS links of each quality and codec, in the same shape
+    as the ones returned by Extractor.get_stream_links(), except that the key
+    "origin" is kept as is.
+    """
+    expire = expire if expire is not None else int(time.time()) + 7 * 24 * 3600
+    room = get_room_id(username)
+
+    return {
+        quality: {
+            codec: f"{cdn_url}/stage/stream-{room}_{codec}_{quality}/index.m3u8?expire={expire}&sign={_get_sign(username, quality, codec, expire)}"
+            for codec in ("h264", "h265")
+        }
+        for quality in SOURCE_QUALITIES
+    }
+
+
+def build_stream_data(username: str, codec: str, stream_links: dict[str, dict[str, str]]) -> str:
+    """Builds the 'stream_data' JSON string of the given codec, which is
+    how the source embeds the stream data into the room payload."""
+    data = {}
+
+    for quality, (resolution, bitrate) in SOURCE_QUALITIES.items():
+        link = stream_links[quality][codec]
+        sdk_params = {
+            "VCodec": codec,
+            "vbitrate": bitrate,
+            "resolution": resolution,
+            "gop": 4,
+            "vfps": 60 if quality.endswith("_60") else 30,
+            "stream_suffix": quality,
+            "default_resolution": quality,
+            "bitrate_list": [bitrate, bitrate // 2]
+        }
+
+        data[quality] = {
+            "main": {
+                "flv": link.replace("/index.m3u8", ".flv"),
+                "hls": link,
+                "cmaf": "",
+                "dash": "",
+                "lls": "",
+                "tsl": "",
+                "tile": "",
+                "sdk_params": json.dumps(sdk_params, separators=(",", ":"))
+            }
+        }
+
+    stream_data = {
+        "common": {
+            "session_id": f"{get_room_id(username)}-{codec}",
+            "rule_ids": json.dumps({"ab_version_trace": [], "sched": {"result": {"hit": "default", "cdn": 16}}}),
+            "user_count": 0,
+            "score": 0,
+            "common_sdk_params": {}
+        },
+        "data": data
+    }
+
+    return json.dumps(stream_data, separators=(",", ":"))
+
+
+def build_room(
+        username: str,
+        live_status: LiveStatus = LiveStatus.LIVE,
+        start_time: Optional[int] = None,
+        cdn_url: str = DEFAULT_CDN_URL,
+        expire: Optional[int] = None
+) -> dict:
+    """
+    Builds the user and room info of a user, which is shared by the API
+    payload and the SIGI_STATE of the live page. The stream data is only
+    included while the user is live.
+    """
+    room_id = get_room_id(username)
+    status = LIVE_STATUS_CODES[live_status]
+    live_room: dict = {
+        "coverUrl": f"https://p16-webcast.tiktokcdn.com/img/{room_id}~tplv-obj.image",
+        "title": f"{username} is live!",
+        "startTime": start_time or 0,
+        "status": status,
+        "liveRoomStats": {"userCount": 0, "enterCount": 0},
+        "liveRoomMode": 0,
+        "multiStreamScene": 0,
+        "gameTagDetail": {"displayName": "", "gameTagId": 0}
+    }
+
+    if live_status == LiveStatus.LIVE:
+        stream_links = build_stream_links(username, cdn_url, expire)
+        live_room["streamData"] = {"pull_data": {"options": {"qualities": list(SOURCE_QUALITIES)}, "stream_data": build_stream_data(username, "h264", stream_links)}}
+        live_room["hevcStreamData"] = {"pull_data": {"options": {"qualities": list(SOURCE_QUALITIES)}, "stream_data": build_stream_data(username, "h265", stream_links)}}
+
+    user = {
+        "id": str(int(room_id) // 7),
+        "uniqueId": username,
+        "nickname": username.replace("_", " ").title(),
+        "avatarThumb": f"https://p16-sign-va.tiktokcdn.com/avatar/{room_id}~c5_100x100.jpeg",
+        "avatarMedium": f"https://p16-sign-va.tiktokcdn.com/avatar/{room_id}~c5_720x720.jpeg",
+        "avatarLarger": f"https://p16-sign-va.tiktokcdn.com/avatar/{room_id}~c5_1080x1080.jpeg",
+        "signature": "",
+        "verified": False,
+        "secUid": _get_filler(username, 76, string.ascii_letters + string.digits + "-_"),
+        "secret": False,
+        "roomId": room_id if live_status != LiveStatus.OFFLINE else "",
+        "status": status
+    }
+
+    return {"user": user, "liveRoom": live_room}
+
+
+def build_api_payload(
+        username: str,
+        live_status: LiveStatus = LiveStatus.LIVE,
+        start_time: Optional[int] = None,
+        cdn_url: str = DEFAULT_CDN_URL,
+        expire: Optional[int] = None,
+        exists: bool = True,
+        size: int = API_PAYLOAD_SIZE
+) -> str:
+    """Builds the JSON served by the 'api-live/user/room' endpoint, padded
+    with filler room info up to about the given size."""
+    if not exists:
+        return json.dumps({"data": {}, "extra": {"now": int(time.time() * 1000)}, "message": "user_not_found", "statusCode": 19881007})
+
+    payload: dict = {
+        "data": build_room(username, live_status, start_time, cdn_url, expire),
+        "extra": {"now": int(time.time() * 1000)},
+        "message": "",
+        "statusCode": 0
+    }
+    payload["data"]["liveRoom"]["roomInfoExtras"] = _build_filler_entries("api", _round_size(size - len(json.dumps(payload))))
+
+    return json.dumps(payload, separators=(",", ":"), ensure_ascii=False)
+
+
+def build_webpage_payload(
+        username: str,
+        live_status: LiveStatus = LiveStatus.LIVE,
+        start_time: Optional[int] = None,
+        cdn_url: str = DEFAULT_CDN_URL,
+        expire: Optional[int] = None,
+        exists: bool = True,
+        size: int = WEBPAGE_PAYLOAD_SIZE
+) -> str:
+    """
+    Builds the HTML of the '/@user/live' page, with the room info in the
+    SIGI_STATE script tag. Like the real page, most of it is made of
+    stylesheets, scripts and other app state, which are padded with filler
+    up to about the given size.
+    """
+    sigi_state: dict = {
+        "AppContext": {"appContext": {"language": "en", "region": "US", "wid": _get_filler(username, 19, string.digits)}},
+        "SEOState": {"canonical": f"https://www.tiktok.com/@{username}/live"},
+        "CurrentUserList": {"currentUser": {}}
+    }
+
+    if exists:
+        sigi_state["LiveRoom"] = {
+            "liveRoomUserInfo": build_room(username, live_status, start_time, cdn_url, expire),
+            "loadingState": {"getRecommendLive": 1, "getUserInfo": 1, "getUserStat": 1},
+            "needLogin": False,
+            "showLiveGift": False
+        }
+
+    sigi_state_json = json.dumps(sigi_state, separators=(",", ":"), ensure_ascii=False)
+    head = (
+        f"<!DOCTYPE html><html lang=\"en\"><head><meta charset=\"utf-8\"><title>{username} is LIVE | TikTok</title>"
+        f"<link rel=\"canonical\" href=\"https://www.tiktok.com/@{username}/live\">"
+    )
+    body = f"<body><div id=\"app\"></div><script id=\"SIGI_STATE\" type=\"application/json\">{sigi_state_json}</script>"
+    filler_size = _round_size(size - len(head) - len(body))
+
+    # Roughly a third of the page is stylesheets, and the rest is inline
+    # scripts of the app state, like in the real page
+    style = _build_style_filler(filler_size // 3)
+    scripts = json.dumps(_build_filler_entries("webpage", filler_size - len(style)), separators=(",", ":"))
+
+    return (
+        f"{head}<style>{style}</style></head>{body}"
+        f"<script id=\"__UNIVERSAL_DATA_FOR_REHYDRATION__\" type=\"application/json\">{scripts}</script>"
+        "</body></html>"
+    )
+
+
+def get_room_id(username: str) -> str:
+    """Gets the ID of the live room of the user, which is the same for
+    every payload of the user."""
+    return str(random.Random(username).randrange(7 * 10 ** 18, 8 * 10 ** 18))
+
+
+@lru_cache(maxsize=16)
+def _build_filler_entries(seed: str, size: int) -> list[dict]:
+    """
+    Builds a list of filler entries whose JSON takes up about the given
+    size in bytes. The filler doesn't depend on the user, so it's cached
+    and shared by the payloads of all users, as building it takes longer
+    than building the rest of the payload. The returned list must not be
+    modified.
+    """
+    rng = random.Random(seed)
+    entries: list[dict] = []
+    total = 0
+
+    while total < size:
+        entry = {
+            "id": str(rng.randrange(10 ** 18, 10 ** 19)),
+            "name": "".join(rng.choices(string.ascii_letters, k=12)),
+            "url": "https://p16-webcast.tiktokcdn.com/img/" + "".join(rng.choices(string.ascii_lowercase + string.digits, k=40)),
+            "enabled": rng.random() < 0.5,
+            "weight": rng.randrange(1000)
+        }
+        entries.append(entry)
+        total += len(json.dumps(entry)) + 1
+
+    return entries
+
+
+@lru_cache(maxsize=4)
+def _build_style_filler(size: int) -> str:
+    return _get_filler("style", size, string.ascii_lowercase + "{}:;-#0123456789 ")
+
+
+def _round_size(size: int) -> int:
+    """Rounds the size of the filler to the nearest kilobyte, so payloads of
+    about the same size share the same cached filler."""
+    return max(round(size, -3), 0)
+
+
+def _get_filler(seed: str, size: int, alphabet: str) -> str:
+    return "".join(random.Random(seed).choices(alphabet, k=size))
+
+
+def _get_sign(username: str, quality: str, codec: str, expire: int) -> str:
+    return _get_filler(f"{username}-{quality}-{codec}-{expire}", 32, "0123456789abcdef")
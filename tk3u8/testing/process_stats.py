@@ -0,0 +1,87 @@
+from dataclasses import dataclass
+import os
+import threading
+import time
+from typing import Optional
+
+
+@dataclass
+class ProcessStats:
+    """
+    Resource usage of the current process at some point in time. Stats that
+    can't be read on the current platform are None, as they are read from
+    '/proc', which is only available on Linux.
+
+    Attributes:
+        cpu_seconds (float): CPU time used so far, by all threads.
+        rss_bytes (int | None): Resident memory.
+        fds (int | None): Open file descriptors, including sockets.
+        sockets (int | None): Open sockets.
+        threads (int): Running Python threads.
+    """
+    cpu_seconds: float
+    rss_bytes: Optional[int]
+    fds: Optional[int]
+    sockets: Optional[int]
+    threads: int
+
+
+def get_process_stats() -> ProcessStats:
+    fds, sockets = _count_fds_and_sockets()
+
+    return ProcessStats(
+        cpu_seconds=time.process_time(),
+        rss_bytes=_get_rss_bytes(),
+        fds=fds,
+        sockets=sockets,
+        threads=threading.active_count()
+    )
+
+
+def raise_open_files_limit() -> Optional[int]:
+    """Raises the soft limit of open files to the hard limit, as watching
+    many users keeps a connection open for each of them. Returns the new
+    limit, or None if there's no such limit on the current platform."""
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+
+    if soft == hard:
+        return soft
+
+    try:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ValueError, OSError):
+        return soft
+
+    return hard
+
+
+def _get_rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm", "r") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _count_fds_and_sockets() -> tuple[Optional[int], Optional[int]]:
+    try:
+        fds = os.listdir("/proc/self/fd")
+    except OSError:
+        return None, None
+
+    sockets = 0
+    for fd in fds:
+        try:
+            if os.readlink(f"/proc/self/fd/{fd}").startswith("socket:"):
+                sockets += 1
+        except OSError:
+            # The file descriptor was closed in the meantime, e.g., the one
+            # used for listing the directory
+            continue
+
+    return len(fds), sockets
@@ -0,0 +1,442 @@
+"""
+Soak test that runs the program against the local stand-in server for
+simulated days on an accelerated clock, and checks that its resource usage
+stays flat. Run it with:
+
+    python -m tk3u8.testing.soak --days 2 --factor 500
+"""
+import argparse
+from dataclasses import dataclass, field
+import functools
+import logging
+import multiprocessing
+from multiprocessing.connection import Connection
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import weakref
+from typing import Any, Dict, List, Optional
+import requests
+from rich.table import Table
+from yt_dlp import YoutubeDL
+from tk3u8.cli.console import console
+from tk3u8.constants import Engine, LiveStatus
+from tk3u8.core.downloader import Downloader
+from tk3u8.core.stream_metadata_handler import StreamMetadataHandler
+from tk3u8.options_handler import OptionsHandler
+from tk3u8.paths_handler import PathsHandler
+from tk3u8.session.request_handler import RequestHandler
+from tk3u8.testing.clock import AcceleratedClock
+from tk3u8.testing.fake_server import FakeTikTokServer
+from tk3u8.testing.process_stats import get_process_stats, raise_open_files_limit
+
+
+logger = logging.getLogger(__name__)
+
+SOAK_USERNAME = "soak_user"
+
+# How much each resource may grow between the start and the end of the
+# steady state of the run before it counts as a leak
+DEFAULT_ALLOWED_GROWTH: Dict[str, float] = {
+    "rss_bytes": 32 * 2 ** 20,
+    "fds": 8,
+    "sockets": 8,
+    "threads": 4,
+    "sessions": 2,
+    "pooled_connections": 4,
+    "ytdlp_instances": 1
+}
+
+
+@dataclass
+class SoakSample:
+    """
+    Resource usage of the watcher process at some point of the run.
+
+    Attributes:
+        elapsed (float): Simulated seconds since the run started.
+        rss_bytes (int | None): Resident memory.
+        fds (int | None): Open file descriptors, including sockets.
+        sockets (int | None): Open sockets.
+        threads (int): Running threads.
+        sessions (int): 'requests.Session' objects that are still alive.
+        pooled_connections (int): Connections kept in the pools of these
+            sessions.
+        ytdlp_instances (int): 'YoutubeDL' objects that are still alive.
+        recordings (int): Recordings started so far.
+        is_watching (bool): Whether the program is still watching the user.
+    """
+    elapsed: float
+    rss_bytes: Optional[int]
+    fds: Optional[int]
+    sockets: Optional[int]
+    threads: int
+    sessions: int
+    pooled_connections: int
+    ytdlp_instances: int
+    recordings: int
+    is_watching: bool
+
+
+@dataclass
+class ResourceGrowth:
+    name: str
+    first: float
+    last: float
+    allowed: float
+
+    @property
+    def growth(self) -> float:
+        return self.last - self.first
+
+    @property
+    def passed(self) -> bool:
+        return self.growth <= self.allowed
+
+
+@dataclass
+class SoakReport:
+    """
+    Attributes:
+        simulated_seconds (float): Simulated duration of the run.
+        real_seconds (float): Real duration of the run.
+        samples (List[SoakSample]): Resource usage over the run.
+        growths (List[ResourceGrowth]): Growth of each resource over the
+            steady state of the run.
+        recordings (int): Recordings started during the run.
+        error (str | None): Why the run failed, other than a leak.
+    """
+    simulated_seconds: float
+    real_seconds: float
+    samples: List[SoakSample] = field(default_factory=list)
+    growths: List[ResourceGrowth] = field(default_factory=list)
+    recordings: int = 0
+    error: Optional[str] = None
+
+    @property
+    def passed(self) -> bool:
+        return self.error is None and all(growth.passed for growth in self.growths)
+
+
+class SoakTest:
+    """
+    Runs the program with 'wait_until_live' and 'force_redownload' on, the
+    way it's left running for days, against a user of the stand-in server
+    that goes live and offline on a repeating schedule. The program, the
+    server and the sampling all run on the same accelerated clock, so days
+    pass in minutes.
+
+    The program runs in its own process, which reports its resource usage
+    every sample interval. The first part of the samples is skipped as the
+    warmup, where caches and pools fill up. The rest is the steady state,
+    and the median of its first third is compared with the median of its
+    last third, so a single spike doesn't count as a leak.
+
+    Args:
+        days (float): Simulated days to run for.
+        factor (float): How many times faster than real time the clock runs.
+        engine (str): Engine used for recording.
+        live_hours (float): Hours the user stays live in each cycle.
+        offline_hours (float): Hours the user stays offline in each cycle.
+        timeout (int): Seconds between the live status checks.
+        sample_interval (float): Simulated seconds between the samples.
+        segment_duration (float): Duration of each segment, in seconds.
+        error_rate (float): Share of server responses that fail with 503.
+        drop_rate (float): Share of server connections that are dropped,
+            which makes the program re-initialize its session.
+        warmup (float): Share of the samples skipped as the warmup.
+        allowed_growth (Dict[str, float] | None): Overrides how much each
+            resource may grow.
+    """
+
+    def __init__(
+            self,
+            days: float = 1,
+            factor: float = 500,
+            engine: str = Engine.NATIVE.value,
+            live_hours: float = 10,
+            offline_hours: float = 2,
+            timeout: int = 30,
+            sample_interval: float = 1800,
+            segment_duration: float = 4,
+            error_rate: float = 0.001,
+            drop_rate: float = 0.001,
+            warmup: float = 0.25,
+            allowed_growth: Optional[Dict[str, float]] = None
+    ) -> None:
+        self._duration = days * 86400
+        self._factor = factor
+        self._engine = engine
+        self._live_seconds = live_hours * 3600
+        self._offline_seconds = offline_hours * 3600
+        self._timeout = timeout
+        self._sample_interval = sample_interval
+        self._server_options: Dict[str, Any] = {
+            "segment_duration": segment_duration,
+            "error_rate": error_rate,
+            "drop_rate": drop_rate,
+            "bitrate_scale": 0.01
+        }
+        self._warmup = warmup
+        self._allowed_growth = {**DEFAULT_ALLOWED_GROWTH, **(allowed_growth or {})}
+
+    def run(self) -> SoakReport:
+        clock = AcceleratedClock(self._factor)
+        schedule = [(0.0, LiveStatus.LIVE), (self._live_seconds, LiveStatus.OFFLINE)]
+        period = self._live_seconds + self._offline_seconds
+
+        server_conn, server_child_conn = multiprocessing.Pipe()
+        server_process = multiprocessing.Process(
+            target=_serve,
+            args=(server_child_conn, clock, schedule, period, self._server_options),
+            daemon=True
+        )
+        server_process.start()
+
+        watcher_conn, watcher_child_conn = multiprocessing.Pipe()
+        watcher_process: Optional[multiprocessing.Process] = None
+        report = SoakReport(self._duration, 0)
+        started_at = time.monotonic()
+
+        try:
+            base_url = server_conn.recv()
+            watcher_process = multiprocessing.Process(
+                target=_watch,
+                args=(watcher_child_conn, clock, base_url, self._engine, self._timeout, self._sample_interval),
+                daemon=True
+            )
+            watcher_process.start()
+
+            while clock.get_elapsed() < self._duration:
+                if watcher_conn.poll(0.1):
+                    report.samples.append(watcher_conn.recv())
+                elif not watcher_process.is_alive():
+                    report.error = f"The watcher process exited with code {watcher_process.exitcode}"
+                    break
+        finally:
+            for process in (watcher_process, server_process):
+                if process:
+                    process.terminate()
+                    process.join()
+
+        report.real_seconds = time.monotonic() - started_at
+
+        if report.samples:
+            report.recordings = report.samples[-1].recordings
+
+            if not report.samples[-1].is_watching and not report.error:
+                report.error = "The program stopped watching the user"
+
+        if not report.error:
+            report.growths = self._get_growths(report.samples)
+
+            if not report.growths:
+                report.error = "Not enough samples were taken"
+
+        return report
+
+    def _get_growths(self, samples: List[SoakSample]) -> List[ResourceGrowth]:
+        steady_samples = samples[int(len(samples) * self._warmup):]
+        third = len(steady_samples) // 3
+
+        if third < 1:
+            return []
+
+        growths = []
+
+        for name, allowed in self._allowed_growth.items():
+            values = [getattr(sample, name) for sample in steady_samples]
+
+            if any(value is None for value in values):
+                continue
+
+            growths.append(ResourceGrowth(
+                name,
+                statistics.median(values[:third]),
+                statistics.median(values[-third:]),
+                allowed
+            ))
+
+        return growths
+
+
+def _serve(conn: Connection, clock: AcceleratedClock, schedule: List, period: float, options: Dict[str, Any]) -> None:
+    server = FakeTikTokServer(clock=clock, **options)
+    server.add_user(SOAK_USERNAME, schedule, period, added_at=clock.started_at)
+
+    conn.send(server.base_url)
+    server.serve_forever()
+
+
+def _watch(conn: Connection, clock: AcceleratedClock, base_url: str, engine: str, timeout: int, sample_interval: float) -> None:
+    """Runs the program in this process, and sends a sample of its resource
+    usage through the connection every sample interval."""
+    _silence_output()
+    raise_open_files_limit()
+    sessions = _track_instances(requests.Session)
+    ytdlp_instances = _track_instances(YoutubeDL)
+
+    with tempfile.TemporaryDirectory(prefix="tk3u8-soak-") as temp_dir:
+        paths_handler = PathsHandler(program_data_dir=temp_dir, downloads_dir=temp_dir)
+        options_handler = OptionsHandler(paths_handler)
+        options_handler.save_args_values(
+            base_url=base_url,
+            wait_until_live=True,
+            force_redownload=True,
+            timeout=timeout,
+            engine=engine
+        )
+        request_handler = RequestHandler(options_handler)
+        stream_metadata_handler = StreamMetadataHandler(request_handler, options_handler, clock)
+        downloader = Downloader(paths_handler, stream_metadata_handler, options_handler, request_handler, clock)
+
+        def watch() -> None:
+            stream_metadata_handler.initialize_data(SOAK_USERNAME)
+            downloader.download("sd")
+
+        watcher = threading.Thread(target=watch, daemon=True)
+        watcher.start()
+
+        while True:
+            clock.sleep(sample_interval)
+            sample = _take_sample(
+                clock,
+                os.path.join(temp_dir, SOAK_USERNAME),
+                list(sessions),
+                len(ytdlp_instances),
+                watcher.is_alive()
+            )
+            conn.send(sample)
+
+
+def _track_instances(cls: type) -> weakref.WeakSet:
+    """Keeps track of the instances of the class that are still alive.
+
+    This is used instead of looking for them through 'gc.get_objects()',
+    which briefly references every object, including the tuples that other
+    threads are still building, and makes building them fail."""
+    instances: weakref.WeakSet = weakref.WeakSet()
+    original_init = getattr(cls, "__init__")
+
+    @functools.wraps(original_init)
+    def __init__(self: Any, *args: Any, **kwargs: Any) -> None:
+        original_init(self, *args, **kwargs)
+        instances.add(self)
+
+    setattr(cls, "__init__", __init__)
+
+    return instances
+
+
+def _take_sample(
+        clock: AcceleratedClock,
+        user_download_dir: str,
+        sessions: List[requests.Session],
+        ytdlp_instances: int,
+        is_watching: bool
+) -> SoakSample:
+    stats = get_process_stats()
+
+    try:
+        recordings = sum(1 for name in os.listdir(user_download_dir) if name.endswith(".meta.json"))
+    except OSError:
+        recordings = 0
+
+    return SoakSample(
+        elapsed=clock.get_elapsed(),
+        rss_bytes=stats.rss_bytes,
+        fds=stats.fds,
+        sockets=stats.sockets,
+        threads=stats.threads,
+        sessions=len(sessions),
+        pooled_connections=sum(_count_pooled_connections(session) for session in sessions),
+        ytdlp_instances=ytdlp_instances,
+        recordings=recordings,
+        is_watching=is_watching
+    )
+
+
+def _count_pooled_connections(session: requests.Session) -> int:
+    count = 0
+
+    for adapter in session.adapters.values():
+        pools = getattr(adapter, "poolmanager", None)
+        if pools is None:
+            continue
+
+        for key in list(pools.pools.keys()):
+            pool = pools.pools.get(key)
+            queue = getattr(getattr(pool, "pool", None), "queue", None)
+
+            if queue is not None:
+                count += sum(1 for connection in list(queue) if connection is not None)
+
+    return count
+
+
+def _silence_output() -> None:
+    """Discards the output of the program and yt-dlp, as nobody is there to
+    watch it."""
+    devnull = open(os.devnull, "w")
+    os.dup2(devnull.fileno(), sys.stdout.fileno())
+    os.dup2(devnull.fileno(), sys.stderr.fileno())
+    console.file = devnull
+
+
+def print_report(report: SoakReport) -> None:
+    days = report.simulated_seconds / 86400
+    console.print(f"Simulated {days:.1f} day(s) in {report.real_seconds:.0f} seconds, with {report.recordings} recording(s) and {len(report.samples)} sample(s).")
+
+    if report.growths:
+        table = Table("Resource", "Start", "End", "Growth", "Allowed", "Result")
+
+        for growth in report.growths:
+            table.add_row(
+                growth.name,
+                f"{growth.first:,.0f}",
+                f"{growth.last:,.0f}",
+                f"{growth.growth:+,.0f}",
+                f"{growth.allowed:,.0f}",
+                "[green]flat[/green]" if growth.passed else "[red]growing[/red]"
+            )
+
+        console.print(table)
+
+    if report.error:
+        console.print(f"[red]Failed:[/red] {report.error}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Runs the program for simulated days, and checks that its resource usage stays flat")
+    parser.add_argument("--days", type=float, default=1, help="Simulated days to run for. Default: 1")
+    parser.add_argument("--factor", type=float, default=500, help="How many times faster than real time the clock runs. Default: 500")
+    parser.add_argument("--engine", choices=[engine.value for engine in Engine], default=Engine.NATIVE.value, help="Engine used for recording. Default: native")
+    parser.add_argument("--live-hours", type=float, default=10, help="Hours the user stays live in each cycle. Default: 10")
+    parser.add_argument("--offline-hours", type=float, default=2, help="Hours the user stays offline in each cycle. Default: 2")
+    parser.add_argument("--sample-interval", type=float, default=1800, help="Simulated seconds between the samples. Default: 1800")
+    args = parser.parse_args(argv)
+
+    soak_test = SoakTest(
+        args.days,
+        args.factor,
+        engine=args.engine,
+        live_hours=args.live_hours,
+        offline_hours=args.offline_hours,
+        sample_interval=args.sample_interval
+    )
+
+    # No spinner here, as the processes started by the test would inherit it
+    # and fail to show their own live displays
+    console.print(f"Simulating {args.days:g} day(s)...")
+    report = soak_test.run()
+
+    print_report(report)
+
+    return 0 if report.passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())